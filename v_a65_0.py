@@ -1,15 +1,26 @@
 import cshogi
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 #              python v_a65_0.py
 from                  v_a65_0_eval.edit import EvaluationEdit
+from                  v_a65_0_eval.edit_log import EvaluationEditLog
 from                  v_a65_0_eval.kk import EvaluationKkTable
 from                  v_a65_0_eval.kp import EvaluationKpTable
+from                  v_a65_0_eval.move_index_file import EvaluationMoveIndexFile
 from                  v_a65_0_eval.pk import EvaluationPkTable
 from                  v_a65_0_eval.pp import EvaluationPpTable
+from                  v_a65_0_eval.table_array import EvaluationTableArray
+from                  v_a65_0_misc.alpha_beta_search import AlphaBetaSearch
 from                  v_a65_0_misc.choice_best_move import ChoiceBestMove
 from                  v_a65_0_misc.game_result_document import GameResultDocument
-from                  v_a65_0_misc.lib import Turn, Move, MoveHelper, BoardHelper
+from                  v_a65_0_misc.lib import Turn, BoardHelper
+from                  v_a65_0_misc.mate_solver import MateSolver
+from                  v_a65_0_misc.policy_cache import PolicyCache
+from                  v_a65_0_misc.time_manager import TimeManager
+from                  v_a65_0_misc.usi_reader import UsiCommandReader
 engine_version_str = "v_a65_0"
 
 
@@ -22,6 +33,97 @@ engine_version_str = "v_a65_0"
 max_move_number = 512
 """手数上限"""
 
+table_mode_in_usi_engine = 'memory'
+"""ＵＳＩエンジンとして動かすときの、評価値テーブル・ファイルの持ち方。
+'memory' - ファイル全体をメモリーに読み込む。読み込んだ後はファイルを開いたままにしないので、学習部が対局中にファイルを置き換えられる
+'mmap_read' - ファイルを読取専用でメモリーマップする。起動が速く、同じマシンの複数のエンジンでページキャッシュを共有する。評価値テーブルは変更できない。
+    対局の間ずっとファイルをマップしたままなので、 Windows では学習部がファイルを置き換えられない（保存に失敗する）。
+    学習部を同時に動かさないときだけ使うこと。 Windows 以外では、学習部が変更したページを直に上書きすると対局中でもマップした中身が変わる（版が変わるので、方策のキャッシュは使い直さない）
+'mmap_copy' - ファイルを書込時コピーでメモリーマップする。変更はこのプロセスの中だけで、保存するまでファイルは変わらない
+'shared_read' - 評価値テーブル・サーバー（ `v_a65_0_main_table_server.py` ）の共有メモリーを読取専用で使う。コピーしないのでメモリーを食わない。
+    学習部が 'shared_write' なら、学習の変更がすぐ見える。サーバーが動いていなければ 'mmap_read' と同じ
+'procedural' - 評価値テーブル・ファイルを使わず、学習で変えていない関係の値はハッシュから求め、学習で変えた関係だけを `*_sparse.bin` ファイルから読む。
+    起動はすぐ終わる。学習部も 'procedural' にすること
+"""
+
+table_mode_in_learn = 'mmap_copy'
+"""学習部の、評価値テーブル・ファイルの持ち方。
+'mmap_copy' - ファイルを書込時コピーでメモリーマップする。変更は、チェックポイントで保存するまでこのプロセスの中だけ
+'shared_write' - 評価値テーブル・サーバーの共有メモリーに書き込む。 'shared_read' の将棋エンジンや自己対局に、変更がすぐ見える。
+    共有メモリーに書き込むのは学習部１つだけにすること。サーバーが動いていなければ 'mmap_copy' と同じ
+'procedural' - 学習で変えた関係だけを `*_sparse.bin` ファイルへ保存する。ファイルの大きさは学習で変えた関係の数に比例する。
+    評価値テーブル・ファイル（密な形式）が欲しければ `v_a65_0_main_convert.py` の export で書き出す
+"""
+
+edit_log_mode_in_usi_engine = 'read'
+"""ＵＳＩエンジンとして動かすときの、評価値テーブルの編集ログの使い方。
+None - 使わない
+'read' - usinewgame の読込時に、学習部が追記した編集ログを再生する。再生した変更はファイルへ保存しない
+"""
+
+is_lazy_loading_in_usi_engine = True
+"""ＵＳＩエンジンとして動かすときに、評価値テーブルを手番ごとに遅延読込するか？
+真なら、自分の手番の評価値テーブルだけを position のときに読み込み、相手の手番のものは使うまで読み込まない。
+起動と usinewgame の読込の時間とメモリーがおよそ半分になる。 selfmatch は両方の手番を使うので、両方とも読み込まれる
+"""
+
+max_workers_for_loading_tables = 8
+"""評価値テーブル［0:先手, 1:後手］８つを読み込むスレッドの数。 1 なら１つずつ順に読み込む
+"""
+
+table_codec_for_new_file = 'raw'
+"""評価値テーブル・ファイルを新しく作るとき（ヘッダーの無い旧形式のファイルを保存し直すときも）の本体の符号化。
+既にあるファイルは、そのファイルの符号化のまま保存する。符号化を変えるには `v_a65_0_main_convert.py` を使う
+'raw' - 無圧縮。メモリーマップできる。変更したページだけを上書き保存できる
+'zlib' - zlib で圧縮する。ファイルは小さくなるが、メモリーマップできず、保存は毎回ファイル全体を書き直す
+'lzma' - lzma で圧縮する。 zlib より小さくなることが多いが、圧縮、展開に時間がかかる
+"""
+
+policy_cache_size = 4096
+"""局面ごとの方策（ランク付けされた指し手一覧）を覚えておく局面の数。 0 なら覚えない。
+学習で同じ局面を何度も評価するときに数え直さずに済む。評価値テーブルが変われば、その局面は数え直す
+"""
+
+reply_set_mode_in_usi_engine = 'generate'
+"""ＵＳＩエンジンとして動かすときの、着手ごとの応手（相手の合法手）の作り方。
+'generate' - 着手ごとに、１手指して、相手の合法手を全部作って、１手戻す
+'exact' - １手パスした局面の相手の合法手を１回だけ作り、着手ごとには差分を当てる。差分で求められない着手は 'generate' と同じ。応手は 'generate' と同じになる
+'approximate' - 全ての着手に差分だけを当てる。王手、ピン、玉の逃げ場などを見ないので、応手が 'generate' と少し違う（数％）が、速い
+"""
+
+reply_set_mode_in_learn = 'generate'
+"""学習部の、着手ごとの応手の作り方。 'generate', 'exact', 'approximate' のいずれか。 reply_set_mode_in_usi_engine を参照
+"""
+
+search_mode_in_usi_engine = 'alphabeta'
+"""ＵＳＩエンジンとして動かすときの、 go での指し手の選び方。
+'alphabeta' - 反復深化のアルファ・ベータ探索で、持ち時間の中で読む。根と、根から AlphaBetaSearch.policy_ply 手目までの局面では、
+    評価値テーブルで数えた階位の良い順に指し手を読み、評価値には駒の損得に、指した手の方策の評価値（関係の有りの数と総数から求める）を足す
+'policy' - 好手・悪手の一番良い階位から、ランダムに１つ選ぶ。時間は使わない。学習した評価値テーブルだけで指し手を選ぶ
+"""
+
+max_search_depth = 64
+"""反復深化の深さの上限"""
+
+search_margin_milliseconds = 300
+"""go で考えるとき、通信の遅れなどに備えて、使わずに残しておくミリ秒"""
+
+expected_number_of_remaining_moves = 40
+"""go で考えるとき、自分があと何手指すと見込むか。持ち時間の残りをこれで割って、１手に使う時間の目安にする"""
+
+thinking_milliseconds_without_time_control = 1000
+"""時間の指定が無い go で考えるミリ秒"""
+
+transposition_table_size = 2000000
+"""置換表に覚えておく局面の数の上限。 go のときに、これを超えていれば全て捨てる"""
+
+mate_solver_max_nodes_in_go = 10000
+"""go で、指し手を選ぶ前に詰将棋を解くときに調べる局面の数の上限（ 1 万局面で 0.1 秒ぐらい）。 0 なら解かない（１手詰めだけ見る）
+"""
+
+mate_solver_table_size = 2000000
+"""go mate で詰将棋を解くときに、置換表に覚える局面の数の上限。超えたら checkmate timeout を返す"""
+
 
 ########################################
 # 有名な定数
@@ -38,43 +140,113 @@ max_move_number = 512
 class Kifuwarabe():
     """きふわらべ"""
 
-    def __init__(self):
-        """初期化"""
+    def __init__(
+            self,
+            table_mode='memory',
+            edit_log_mode=None,
+            table_codec='raw',
+            is_lazy_loading=False,
+            reply_set_mode='generate',
+            search_mode='policy'):
+        """初期化
+
+        Parameters
+        ----------
+        table_mode : str
+            評価値テーブル・ファイルの持ち方。 'memory', 'mmap_read', 'mmap_copy', 'shared_read', 'shared_write', 'procedural' のいずれか
+        edit_log_mode : str
+            評価値テーブルの編集ログの使い方。
+            None - 使わない
+            'write' - 変更をログへ追記し、評価値テーブル・ファイルの保存時にログを空にする（学習部）
+            'read' - 読込時にログを再生するだけ。再生した変更はファイルへ保存しない（対局中のエンジン）
+        table_codec : str
+            評価値テーブル・ファイルを新しく作るときの本体の符号化。 'raw', 'zlib', 'lzma' のいずれか
+        is_lazy_loading : bool
+            真なら、評価値テーブルを手番ごとに、初めて使うときに読み込む（対局中のエンジン）。偽なら、両方の手番を読み込む（学習部）
+        reply_set_mode : str
+            着手ごとの応手の作り方。 'generate', 'exact', 'approximate' のいずれか
+        search_mode : str
+            go での指し手の選び方。 'policy', 'alphabeta' のいずれか
+        """
 
         # 盤
         self._board = cshogi.Board()
 
+        # 評価値テーブルの編集ログ
+        if edit_log_mode is None:
+            self._edit_log_obj = None
+
+        elif edit_log_mode in ['write', 'read']:
+            self._edit_log_obj = EvaluationEditLog(
+                    engine_version_str=engine_version_str,
+                    is_writable=edit_log_mode == 'write')
+
+        else:
+            raise ValueError(f"unexpected edit log mode:{edit_log_mode}")
+
         # ＫＬ評価値テーブル　[0:先手, 1:後手]
-        self._evaluation_kl_table_obj_array = [
-            EvaluationKkTable(
-                    engine_version_str=engine_version_str),
-            EvaluationKkTable(
-                    engine_version_str=engine_version_str),
-        ]
+        self._evaluation_kl_table_obj_array = EvaluationTableArray(
+                table_obj_list=[
+                    EvaluationKkTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                    EvaluationKkTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                ],
+                is_lazy_loading=is_lazy_loading)
 
         # ＫＱ評価値テーブル　[0:先手, 1:後手]
-        self._evaluation_kq_table_obj_array = [
-            EvaluationKpTable(
-                    engine_version_str=engine_version_str),
-            EvaluationKpTable(
-                    engine_version_str=engine_version_str),
-        ]
+        self._evaluation_kq_table_obj_array = EvaluationTableArray(
+                table_obj_list=[
+                    EvaluationKpTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                    EvaluationKpTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                ],
+                is_lazy_loading=is_lazy_loading)
 
         # ＰＬ評価値テーブル　[0:先手, 1:後手]
-        self._evaluation_pl_table_obj_array = [
-            EvaluationPkTable(
-                    engine_version_str=engine_version_str),
-            EvaluationPkTable(
-                    engine_version_str=engine_version_str),
-        ]
+        self._evaluation_pl_table_obj_array = EvaluationTableArray(
+                table_obj_list=[
+                    EvaluationPkTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                    EvaluationPkTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                ],
+                is_lazy_loading=is_lazy_loading)
 
         # ＰＱ評価値テーブル　[0:先手, 1:後手]
-        self._evaluation_pq_table_obj_array = [
-            EvaluationPpTable(
-                    engine_version_str=engine_version_str),
-            EvaluationPpTable(
-                    engine_version_str=engine_version_str),
-        ]
+        self._evaluation_pq_table_obj_array = EvaluationTableArray(
+                table_obj_list=[
+                    EvaluationPpTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                    EvaluationPpTable(
+                            engine_version_str=engine_version_str,
+                            table_mode=table_mode,
+                            edit_log_obj=self._edit_log_obj,
+                            codec=table_codec),
+                ],
+                is_lazy_loading=is_lazy_loading)
 
         # 自分の手番
         self._my_turn = None
@@ -86,6 +258,41 @@ class Kifuwarabe():
         # TODO 探索部の choice_best_move では使ってるが、学習部の weaken, strongthen では使ってないので、全ての箇所で共通の処理になるようにしたい
         self._tier_resolution = 10
 
+        # 指し手のインデックスのリストを読み込む（無ければ作る）スレッド。 usi で始めて、 isready で待つ
+        self._move_index_thread = None
+
+        # 探索のスレッド。 go で始めて、 bestmove を出力したら終わる
+        self._search_thread = None
+
+        # 探索のスレッドで使っている探索と、持ち時間の管理
+        self._search = None
+        self._time_manager = None
+
+        # 探索のスレッドで解いている詰将棋。解いていなければ None
+        self._mate_solver = None
+
+        # これがセットされるまで、探索のスレッドは bestmove を出力しない（先読み中は ponderhit か stop を待つ）
+        self._bestmove_release_event = threading.Event()
+        self._bestmove_release_event.set()
+
+        # 置換表。先読みした結果を次の go でも使う
+        self._transposition_table = {}
+
+        # ＵＳＩループが行っているコマンドの通し番号と、最後に読んだ stop 、 quit の通し番号。
+        # 行っているコマンドより後に stop か quit を読んでいれば、中断する
+        self._command_serial_number = 0
+        self._cancel_serial_number = 0
+
+        # 局面ごとの方策のキャッシュ
+        self._policy_cache = PolicyCache(
+                max_size=policy_cache_size)
+
+        # 着手ごとの応手の作り方
+        self._reply_set_mode = reply_set_mode
+
+        # go での指し手の選び方
+        self._search_mode = search_mode
+
 
     @property
     def board(self):
@@ -109,6 +316,39 @@ class Kifuwarabe():
         return self._tier_resolution
 
 
+    @property
+    def policy_cache(self):
+        """局面ごとの方策のキャッシュ"""
+        return self._policy_cache
+
+
+    @property
+    def reply_set_mode(self):
+        """着手ごとの応手の作り方。 'generate', 'exact', 'approximate' のいずれか"""
+        return self._reply_set_mode
+
+
+    @reply_set_mode.setter
+    def reply_set_mode(self, value):
+        # 作り方が変われば、覚えている方策は数え方が違うので捨てる
+        if self._reply_set_mode != value:
+            self._policy_cache.clear()
+
+        self._reply_set_mode = value
+
+
+    @property
+    def search_mode(self):
+        """go での指し手の選び方。 'policy', 'alphabeta' のいずれか"""
+        return self._search_mode
+
+
+    @property
+    def edit_log_obj(self):
+        """評価値テーブルの編集ログ。使わないなら None"""
+        return self._edit_log_obj
+
+
     @property
     def evaluation_kl_table_obj_array(self):
         """ＫＬ評価値テーブル　[0:先手, 1:後手]"""
@@ -133,12 +373,35 @@ class Kifuwarabe():
         return self._evaluation_pq_table_obj_array
 
 
-    def usi_loop(self):
-        """ＵＳＩループ"""
+    def usi_loop(
+            self,
+            input_function=input):
+        """ＵＳＩループ
+
+        標準入力は UsiCommandReader のスレッドで読むので、時間のかかるコマンドを行っている間も stop 、 quit 、 isready を受け取れる
+
+        Parameters
+        ----------
+        input_function : function
+            １行読む関数。テストでは差し替える
+        """
+        # 通し番号は読取りごとに 1 から振り直すので、前のＵＳＩループの中断は忘れる
+        self._command_serial_number = 0
+        self._cancel_serial_number = 0
+
+        usi_command_reader = UsiCommandReader(
+                kifuwarabe=self,
+                input_function=input_function)
+        usi_command_reader.start()
 
         while True:
-            result_str = self.usi_sequence(
-                    command_str=input())
+            (self._command_serial_number, command_str) = usi_command_reader.get()
+
+            try:
+                result_str = self.usi_sequence(
+                        command_str=command_str)
+            finally:
+                usi_command_reader.done()
 
             if result_str == 'quit':
                 break
@@ -176,6 +439,16 @@ class Kifuwarabe():
             head = head_tail[0]
             tail = head_tail[1]
 
+        # 探索のスレッドが動いている間に受け取れるのは、 stop 、 ponderhit 、 isready だけ。
+        # それ以外のコマンドが来たら、探索を止めてから行う
+        if self.is_searching():
+            if head == 'isready':
+                print('readyok', flush=True)
+                return ''
+
+            elif head not in ['stop', 'ponderhit']:
+                self.stop_search()
+
         # USIエンジン握手
         if head == 'usi':
             self.usi()
@@ -197,12 +470,17 @@ class Kifuwarabe():
         # 思考開始～最善手返却
         elif head == 'go':
             self.go(
+                    cmd_tail=tail,
                     is_debug=is_debug)
 
         # 中断
         elif head == 'stop':
             self.stop()
 
+        # 先読みしていた手を相手が指した
+        elif head == 'ponderhit':
+            self.ponderhit()
+
         # 対局終了
         elif head == 'gameover':
             self.gameover(
@@ -242,22 +520,36 @@ class Kifuwarabe():
         # 指定の着手の評価値テーブルについて、関連がある箇所を（適当に選んで）、それを関連が無いようにする。
         # これによって、その着手のポリシー値は下がる
         #       code: weaken 5i5h
+        #       code: weaken 5i5h 7g7f
         elif head == 'weaken':
-            (result_str, result_comment) = self.weaken(
-                    cmd_tail=tail,
-                    is_debug=is_debug)
+            # 指し手を並べれば、続けて行う。 stop が来たら、そこで止める
+            for move_u in tail.split() or ['']:
+                if self.is_cancelled:
+                    print(f"[weaken] cancelled")
+                    break
+
+                (result_str, result_comment) = self.weaken(
+                        cmd_tail=move_u,
+                        is_debug=is_debug)
 
-            print(f"[weaken] result=`{result_str}`  comment={result_comment}")
+                print(f"[weaken] result=`{result_str}`  comment={result_comment}")
 
         # 指定の着手の評価値テーブルについて、関連がある箇所を（適当に選んで）、それを関連が有るようにする。
         # これによって、その着手のポリシー値は上がる
         #       code: strengthen 5i5h
+        #       code: strengthen 5i5h 7g7f
         elif head == 'strengthen':
-            (result_str, result_comment) = self.strengthen(
-                    cmd_tail=tail,
-                    is_debug=is_debug)
+            # 指し手を並べれば、続けて行う。 stop が来たら、そこで止める
+            for move_u in tail.split() or ['']:
+                if self.is_cancelled:
+                    print(f"[strengthen] cancelled")
+                    break
+
+                (result_str, result_comment) = self.strengthen(
+                        cmd_tail=move_u,
+                        is_debug=is_debug)
 
-            print(f"[strengthen] result=`{result_str}`  result_comment:{result_comment}")
+                print(f"[strengthen] result=`{result_str}`  result_comment:{result_comment}")
 
         # プレイアウト
         #       code: playout
@@ -316,6 +608,14 @@ class Kifuwarabe():
             print(f"[usi protocol > usi] '{file_name}' file not found.  ex:{ex}")
             raise
 
+        # 指し手のインデックスのリストは、 isready を待つ間に別スレッドで読み込む。最初の go で時間を使わないように
+        if self._move_index_thread is None:
+            self._move_index_thread = threading.Thread(
+                    target=EvaluationMoveIndexFile.load_or_build,
+                    kwargs={'engine_version_str': engine_version_str},
+                    daemon=True)
+            self._move_index_thread.start()
+
         print(f'id name {engine_name}')
         print(f'id author Muzudho')
         print('usiok', flush=True)
@@ -323,6 +623,14 @@ class Kifuwarabe():
 
     def isready(self):
         """対局準備"""
+
+        # 別スレッドで読み込んでいる指し手のインデックスのリストがあれば、読み終わるのを待つ
+        if self._move_index_thread is not None:
+            self._move_index_thread.join()
+
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから応答する
+        self.swap_reloaded_eval_all_tables()
+
         print('readyok', flush=True)
 
 
@@ -331,6 +639,8 @@ class Kifuwarabe():
             is_debug=False):
         """（変更があれば）ＫＬ評価値テーブル［0:先手, 1:後手］の保存
 
+        遅延読込で、まだ読み込んでいない評価値テーブルは、変更も無いので、読み込まずに飛ばす
+
         Parameters
         ----------
         is_debug : bool
@@ -340,67 +650,132 @@ class Kifuwarabe():
             turn_index = Turn.to_index(turn)
 
             # ＫＬ
-            if self._evaluation_kl_table_obj_array[turn_index].mm_table_obj.is_file_modified:
+            if not self._evaluation_kl_table_obj_array.is_loaded(turn_index):
+                print(f"[{datetime.datetime.now()}] kl file not loaded.  turn:{Turn.to_string(turn)}", flush=True)
+
+            elif self._evaluation_kl_table_obj_array[turn_index].mm_table_obj.is_file_modified:
                 print(f"[{datetime.datetime.now()}] kl file save...  turn:{Turn.to_string(turn)}", flush=True)
-                self._evaluation_kl_table_obj_array[turn_index].save_kk_evaluation_table_file(
+                self._evaluation_kl_table_obj_array[turn_index].save_evaluation_table_file(
                         is_debug=is_debug)
 
             else:
                 print(f"[{datetime.datetime.now()}] kl file not changed.  turn:{Turn.to_string(turn)}", flush=True)
 
             # ＫＱ
-            if self._evaluation_kq_table_obj_array[turn_index].mm_table_obj.is_file_modified:
+            if not self._evaluation_kq_table_obj_array.is_loaded(turn_index):
+                print(f"[{datetime.datetime.now()}] kq file not loaded.  turn:{Turn.to_string(turn)}", flush=True)
+
+            elif self._evaluation_kq_table_obj_array[turn_index].mm_table_obj.is_file_modified:
                 print(f"[{datetime.datetime.now()}] kq file save...  turn:{Turn.to_string(turn)}", flush=True)
-                self._evaluation_kq_table_obj_array[turn_index].save_kp_evaluation_table_file(
+                self._evaluation_kq_table_obj_array[turn_index].save_evaluation_table_file(
                         is_debug=is_debug)
 
             else:
                 print(f"[{datetime.datetime.now()}] kq file not changed.  turn:{Turn.to_string(turn)}", flush=True)
 
             # ＰＬ
-            if self._evaluation_pl_table_obj_array[turn_index].mm_table_obj.is_file_modified:
+            if not self._evaluation_pl_table_obj_array.is_loaded(turn_index):
+                print(f"[{datetime.datetime.now()}] pl file not loaded.  turn:{Turn.to_string(turn)}", flush=True)
+
+            elif self._evaluation_pl_table_obj_array[turn_index].mm_table_obj.is_file_modified:
                 print(f"[{datetime.datetime.now()}] pl file save...  turn:{Turn.to_string(turn)}", flush=True)
-                self._evaluation_pl_table_obj_array[turn_index].save_pk_evaluation_table_file(
+                self._evaluation_pl_table_obj_array[turn_index].save_evaluation_table_file(
                         is_debug=is_debug)
 
             else:
                 print(f"[{datetime.datetime.now()}] pl file not changed.  turn:{Turn.to_string(turn)}", flush=True)
 
             # ＰＱ
-            if self._evaluation_pq_table_obj_array[turn_index].mm_table_obj.is_file_modified:
+            if not self._evaluation_pq_table_obj_array.is_loaded(turn_index):
+                print(f"[{datetime.datetime.now()}] pp file not loaded.  turn:{Turn.to_string(turn)}", flush=True)
+
+            elif self._evaluation_pq_table_obj_array[turn_index].mm_table_obj.is_file_modified:
                 print(f"[{datetime.datetime.now()}] pp file save...  turn:{Turn.to_string(turn)}", flush=True)
-                self._evaluation_pq_table_obj_array[turn_index].save_pp_evaluation_table_file(
+                self._evaluation_pq_table_obj_array[turn_index].save_evaluation_table_file(
                         is_debug=is_debug)
 
             else:
                 print(f"[{datetime.datetime.now()}] pp file not changed.  turn:{Turn.to_string(turn)}", flush=True)
 
+        # 全ての評価値テーブル・ファイルを保存したので、編集ログを空にする
+        if self._edit_log_obj is not None and self._edit_log_obj.is_writable:
+            self._edit_log_obj.checkpoint()
+
 
     def load_eval_all_tables(
-            self):
+            self,
+            is_background=False):
+        """評価値テーブル［0:先手, 1:後手］の読込
+
+        ８つの評価値テーブルは互いに関係ないので、スレッド・プールで並行に読み込み、読み終えたものから報告する。
+        読込はファイルの読込とバイト列のコピーがほとんどで、その間は他のスレッドも動ける
+
+        読み込んだ後にファイルが変わっていなければ、読み直さない。
+        遅延読込なら、まだ読み込んでいない手番は読み込まない（初めて使うときに読み込む）
+
+        Parameters
+        ----------
+        is_background : bool
+            真なら、変わったファイルは別スレッドで読み込み、 swap_reloaded_eval_all_tables() で差し替える。それまでは今の評価値テーブルを使う
+        """
         print(f"[{datetime.datetime.now()}] [kifuwarabe > load eval all tables] start...")
 
-        """評価値テーブル［0:先手, 1:後手］の読込"""
-        for turn in [cshogi.BLACK, cshogi.WHITE]:
-            turn_index = Turn.to_index(turn)
+        def load_one_table(table_name, table_obj, turn):
+            start = time.perf_counter()
+            table_obj.load_on_usinewgame(
+                    turn=turn,
+                    is_background=is_background)
+            return (table_name, turn, time.perf_counter() - start)
 
-            # ＫＬ
-            self._evaluation_kl_table_obj_array[turn_index].load_on_usinewgame(
-                    turn=turn)
+        start = time.perf_counter()
+        sum_seconds = 0
 
-            # ＫＱ
-            self._evaluation_kq_table_obj_array[turn_index].load_on_usinewgame(
-                    turn=turn)
+        with ThreadPoolExecutor(max_workers=max_workers_for_loading_tables) as executor:
+            future_list = []
 
-            # ＰＬ
-            self._evaluation_pl_table_obj_array[turn_index].load_on_usinewgame(
-                    turn=turn)
+            for turn in [cshogi.BLACK, cshogi.WHITE]:
+                turn_index = Turn.to_index(turn)
+
+                for (table_name, table_obj_array) in [
+                        ('kl', self._evaluation_kl_table_obj_array),   # ＫＬ
+                        ('kq', self._evaluation_kq_table_obj_array),   # ＫＱ
+                        ('pl', self._evaluation_pl_table_obj_array),   # ＰＬ
+                        ('pq', self._evaluation_pq_table_obj_array)]:  # ＰＱ
+
+                    if table_obj_array.is_lazy_loading and not table_obj_array.is_loaded(turn_index):
+                        print(f"[{datetime.datetime.now()}] [kifuwarabe > load eval all tables] {table_name} not loaded yet. load it on first access.  turn:{Turn.to_string(turn)}", flush=True)
+                        continue
+
+                    future_list.append(executor.submit(load_one_table, table_name, table_obj_array.table_obj_list[turn_index], turn))
+
+            # 読み終えたものから報告する。読めなかったときは、その例外を投げ上げる
+            for future in as_completed(future_list):
+                (table_name, turn, seconds) = future.result()
+                sum_seconds += seconds
+                print(f"[{datetime.datetime.now()}] [kifuwarabe > load eval all tables] {table_name} loaded.  turn:{Turn.to_string(turn)}  {seconds:.3f} sec", flush=True)
+
+        wall_clock_seconds = time.perf_counter() - start
+
+        # 順に読み込んだときに掛かったであろう時間は、１つずつの時間の合計とみなす
+        print(f"[{datetime.datetime.now()}] [kifuwarabe > load eval all tables] finished.  wall clock:{wall_clock_seconds:.3f} sec  sequential (sum of each table):{sum_seconds:.3f} sec  saved:{sum_seconds - wall_clock_seconds:.3f} sec  workers:{max_workers_for_loading_tables}")
+
+
+    def swap_reloaded_eval_all_tables(self):
+        """別スレッドで読み込んでいる評価値テーブル［0:先手, 1:後手］があれば、読み終えるのを待って差し替えます
 
-            # ＰＰ
-            self._evaluation_pq_table_obj_array[turn_index].load_on_usinewgame(
-                    turn=turn)
+        評価値テーブルを使う前に呼び出すこと。
+        別スレッドのログ出力が bestmove などの応答に割り込まないよう、応答を出力するより前に呼び出すこと
+        """
+        for table_obj_array in [
+                self._evaluation_kl_table_obj_array,
+                self._evaluation_kq_table_obj_array,
+                self._evaluation_pl_table_obj_array,
+                self._evaluation_pq_table_obj_array]:
 
-        print(f"[{datetime.datetime.now()}] [kifuwarabe > load eval all tables] finished")
+            # まだ読み込んでいない手番を、ここで読み込むことはしない
+            for table_obj in table_obj_array.table_obj_list:
+                table_obj.swap_reloaded_table(
+                        is_wait=True)
 
 
     def load_game_result_file(
@@ -429,8 +804,9 @@ class Kifuwarabe():
             デバッグモードか？
         """
 
-        # 評価値テーブルの読込
-        self.load_eval_all_tables()
+        # 評価値テーブルの読込。前の対局から変わったファイルだけを別スレッドで読み直し、その間に対局を始める
+        self.load_eval_all_tables(
+                is_background=True)
 
         # 全ての評価値テーブル［0:先手, 1:後手］の（変更があれば）保存
         self.save_eval_all_tables(
@@ -497,18 +873,36 @@ class Kifuwarabe():
         if is_debug:
             print(f"[kifuwarabe > position] my turn is {Turn.to_string(self._my_turn)}")
 
+        # 遅延読込なら、 go で考え始める前に、自分の手番の評価値テーブルを読み込んでおく
+        my_turn_index = Turn.to_index(self._my_turn)
+        for table_obj_array in [
+                self._evaluation_kl_table_obj_array,
+                self._evaluation_kq_table_obj_array,
+                self._evaluation_pl_table_obj_array,
+                self._evaluation_pq_table_obj_array]:
+            table_obj_array[my_turn_index]
+
 
     def go(
             self,
+            cmd_tail='',
             is_debug=False):
         """思考開始～最善手返却
 
         Parameters
         ----------
+        cmd_tail : str
+            go コマンドの引数。例： 'btime 60000 wtime 50000 byoyomi 10000'
         is_debug : bool
             デバッグモードか？
         """
 
+        # 前の探索のスレッドが残っていれば、終わらせる
+        self.stop_search()
+
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
+
         if is_debug:
             # 自分の手番と、局面の手番が一致なら自分のターン
             if self._board.turn == self._my_turn:
@@ -516,19 +910,143 @@ class Kifuwarabe():
             else:
                 print(f"[{datetime.datetime.now()}] [kifuwarabe > go] opponent turn.  board turn:{Turn.to_string(self._board.turn)}  my turn:{Turn.to_string(self._my_turn)}")
 
+        # 詰将棋を解く
+        if 'mate' in TimeManager.parse_go_arguments(cmd_tail):
+            self.go_mate(
+                    cmd_tail=cmd_tail)
+            return
+
+        self._time_manager = TimeManager(
+                turn=self._board.turn,
+                cmd_tail=cmd_tail,
+                margin_milliseconds=search_margin_milliseconds,
+                expected_number_of_remaining_moves=expected_number_of_remaining_moves,
+                thinking_milliseconds_without_time_control=thinking_milliseconds_without_time_control)
+
+        # 先読み中か、時間の制限が無ければ、読み終わっても ponderhit か stop が来るまで bestmove を返さない
+        if self._time_manager.is_pondering or self._time_manager.is_infinite:
+            self._bestmove_release_event.clear()
+        else:
+            self._bestmove_release_event.set()
+
+        if self._search_mode == 'alphabeta':
+            # 置換表は、先読みの結果を使えるように go をまたいで持っておく。大きくなりすぎたら捨てる
+            if transposition_table_size < len(self._transposition_table):
+                self._transposition_table.clear()
+
+            self._search = AlphaBetaSearch(
+                    kifuwarabe=self,
+                    time_manager=self._time_manager,
+                    max_depth=max_search_depth,
+                    transposition_table=self._transposition_table)
+
+        # 別スレッドで考えて、その間も stop や ponderhit を受け取る
+        self._search_thread = threading.Thread(
+                target=self.think_and_print_bestmove,
+                kwargs={'is_debug': is_debug},
+                daemon=True)
+        self._search_thread.start()
+
+
+    def go_mate(
+            self,
+            cmd_tail):
+        """go mate 。別スレッドで詰将棋を解いて、 checkmate を返す。その間も stop を受け取る
+
+        Parameters
+        ----------
+        cmd_tail : str
+            go コマンドの引数。例： 'mate 5000' 、 'mate infinite'
+        """
+        self._time_manager = TimeManager(
+                turn=self._board.turn,
+                cmd_tail=cmd_tail,
+                margin_milliseconds=search_margin_milliseconds,
+                expected_number_of_remaining_moves=expected_number_of_remaining_moves,
+                thinking_milliseconds_without_time_control=thinking_milliseconds_without_time_control)
+
+        self._mate_solver = MateSolver(
+                board=self._board,
+                time_manager=self._time_manager,
+                max_table_size=mate_solver_table_size)
+
+        # 解き終わったら、 stop を待たずに checkmate を返す
+        self._bestmove_release_event.set()
+
+        self._search_thread = threading.Thread(
+                target=self.solve_mate_and_print_checkmate,
+                daemon=True)
+        self._search_thread.start()
+
+
+    def solve_mate_and_print_checkmate(self):
+        """詰将棋を解いて、 checkmate を出力します"""
+        mate_solver = self._mate_solver
+        start_seconds = time.perf_counter()
+
+        (result_str, mate_move_id_list) = mate_solver.solve()
+
+        elapsed_seconds = time.perf_counter() - start_seconds
+        nps = int(mate_solver.nodes / elapsed_seconds) if 0 < elapsed_seconds else 0
+        print(f"info time {int(elapsed_seconds * 1000)} nodes {mate_solver.nodes} nps {nps} hashfull {min(1000, mate_solver.table_size * 1000 // mate_solver_table_size)}", flush=True)
+
+        if result_str == 'mate':
+            print(f"checkmate {' '.join([cshogi.move_to_usi(move_id) for move_id in mate_move_id_list])}", flush=True)
+        else:
+            print(f"checkmate {result_str}", flush=True)
+
+
+    def think_and_print_bestmove(
+            self,
+            is_debug=False):
+        """考えて、 bestmove を出力します
+
+        Parameters
+        ----------
+        is_debug : bool
+            デバッグモードか？
+        """
+        (best_move_str, ponder_move_str) = self.think(
+                is_debug=is_debug)
+
+        # 先読み中なら、 ponderhit か stop を待つ
+        self._bestmove_release_event.wait()
+
+        if ponder_move_str is None:
+            print(f'bestmove {best_move_str}', flush=True)
+        else:
+            print(f'bestmove {best_move_str} ponder {ponder_move_str}', flush=True)
+
+
+    def think(
+            self,
+            is_debug=False):
+        """最善手を考えます
+
+        Parameters
+        ----------
+        is_debug : bool
+            デバッグモードか？
+
+        Returns
+        -------
+        best_move_str : str
+            最善手。 'resign' 、 'win' もある
+        ponder_move_str : str
+            相手の手番で先読みする、相手の指し手。無ければ None
+        """
+
         if self._board.is_game_over():
             """投了局面時"""
 
             # 投了
-            print(f'bestmove resign', flush=True)
-            return
+            return ('resign', None)
 
         if self._board.is_nyugyoku():
             """入玉宣言局面時"""
 
             # 勝利宣言
-            print(f'bestmove win', flush=True)
-            return
+            return ('win', None)
 
         #
         # (2024-06-17 mon)
@@ -550,9 +1068,41 @@ class Kifuwarabe():
 
                 best_move = cshogi.move_to_usi(matemove)
                 print('info score mate 1 pv {}'.format(best_move), flush=True)
-                print(f'bestmove {best_move}', flush=True)
-                return
+                return (best_move, None)
 
+        # 長手数の詰めを、調べる局面の数を決めて解く
+        if 0 < mate_solver_max_nodes_in_go:
+            self._mate_solver = MateSolver(
+                    board=self._board,
+                    max_nodes=mate_solver_max_nodes_in_go,
+                    time_manager=self._time_manager)
+
+            (mate_result_str, mate_move_id_list) = self._mate_solver.solve()
+            mate_nodes = self._mate_solver.nodes
+            self._mate_solver = None
+
+            if mate_result_str == 'mate':
+                print(f"info depth {len(mate_move_id_list)} nodes {mate_nodes} score mate {len(mate_move_id_list)} pv {' '.join([cshogi.move_to_usi(move_id) for move_id in mate_move_id_list])}", flush=True)
+
+                # 読み筋の２手目を、相手の手番で先読みする
+                if self._search_mode == 'alphabeta' and 2 <= len(mate_move_id_list):
+                    return (cshogi.move_to_usi(mate_move_id_list[0]), cshogi.move_to_usi(mate_move_id_list[1]))
+
+                return (cshogi.move_to_usi(mate_move_id_list[0]), None)
+
+
+        # 持ち時間の中で読む
+        if self._search_mode == 'alphabeta':
+            (best_move_id, _, pv_list) = self._search.search()
+
+            if best_move_id is None:
+                return ('resign', None)
+
+            # 読み筋の２手目を、相手の手番で先読みする
+            if 2 <= len(pv_list):
+                return (cshogi.move_to_usi(best_move_id), cshogi.move_to_usi(pv_list[1]))
+
+            return (cshogi.move_to_usi(best_move_id), None)
 
         # くじを引く（投了のケースは対応済みなので、ここで対応しなくていい）
         best_move_str = ChoiceBestMove.choice_best_move(
@@ -560,13 +1110,74 @@ class Kifuwarabe():
                 kifuwarabe=self,
                 is_debug=is_debug)
 
-        print(f"info depth 0 seldepth 0 time 1 nodes 0 score cp 0 string I'm feeling luckey!")
-        print(f'bestmove {best_move_str}', flush=True)
+        return (best_move_str, None)
 
 
     def stop(self):
-        """中断"""
-        print('bestmove resign', flush=True)
+        """中断。読み終わったところまでの最善手を返す"""
+        self.stop_search()
+
+
+    def ponderhit(self):
+        """先読みしていた手を相手が指した。ここから持ち時間を使って考え、読み終われば bestmove を返す"""
+        if self._time_manager is not None:
+            self._time_manager.ponderhit()
+
+        self._bestmove_release_event.set()
+
+
+    def stop_search(self):
+        """探索のスレッドがあれば、止めて、 bestmove を出力し終わるのを待ちます"""
+        if self._search_thread is None:
+            return
+
+        if self._search is not None:
+            self._search.stop()
+
+        mate_solver = self._mate_solver
+        if mate_solver is not None:
+            mate_solver.stop()
+
+        self._bestmove_release_event.set()
+        self._search_thread.join()
+
+        self._search_thread = None
+        self._search = None
+        self._time_manager = None
+        self._mate_solver = None
+
+
+    def cancel(
+            self,
+            serial_number):
+        """中断を知らせます。 UsiCommandReader のスレッドから、 stop 、 quit を読んだときに呼ばれる
+
+        Parameters
+        ----------
+        serial_number : int
+            stop 、 quit の通し番号。これより前に読んだコマンドを中断する
+        """
+        self._cancel_serial_number = serial_number
+
+        # 探索中なら、すぐに止める（ bestmove は stop の処理で返す）
+        search = self._search
+        if search is not None:
+            search.stop()
+
+        mate_solver = self._mate_solver
+        if mate_solver is not None:
+            mate_solver.stop()
+
+
+    @property
+    def is_cancelled(self):
+        """行っているコマンドを中断するか？　時間のかかるコマンドは、これを見て、すぐに戻る"""
+        return self._command_serial_number < self._cancel_serial_number
+
+
+    def is_searching(self):
+        """探索のスレッドが動いているか？"""
+        return self._search_thread is not None and self._search_thread.is_alive()
 
 
     def gameover(
@@ -672,6 +1283,9 @@ class Kifuwarabe():
             デバッグか？
         """
 
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
+
         # 自分の手番と、局面の手番が一致なら自分のターン
         if self._board.turn == self._my_turn:
             print(f"[kifuwarabe > policy] my turn.  board turn:{Turn.to_string(self._board.turn)}  my turn:{Turn.to_string(self._my_turn)}")
@@ -753,31 +1367,25 @@ class Kifuwarabe():
             print(f"relation command must be move.  ex:`relation 7g7f`  cmd_tail:`{cmd_tail}`")
             return
 
-        move_u = cmd_tail
-
-        move_obj = Move.from_usi(move_u)
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
 
-        k_sq = BoardHelper.get_king_square(self._board)
-
-        # 自玉の指し手か？
-        is_king_move = MoveHelper.is_king(k_sq, move_obj)
+        move_u = cmd_tail
 
-        # 着手と応手をキー、関係の有無を値とする辞書を作成します
-        (k_blackright_l_blackright_index_to_relation_exists_dictionary,
-         k_blackright_q_blackright_index_to_relation_exists_dictionary,
-         p_blackright_l_blackright_index_to_relation_exists_dictionary,
-         p_blackright_q_blackright_index_to_relation_exists_dictionary) = ChoiceBestMove.select_f_blackright_o_blackright_index_to_relation_exists(
-                strict_move_obj=Move.from_usi(move_u),
-                is_king_move=is_king_move,
-                board=self._board,
-                kifuwarabe=self._kifuwarabe)
+        # 着手と応手の関係のインデックスをキー、関係の有無を値とする辞書を作成します
+        (f_blackright_l_blackright_index_to_relation_exists_dictionary,
+         f_blackright_q_blackright_index_to_relation_exists_dictionary,
+         # 自玉の指し手か？
+         is_king_move) = ChoiceBestMove.get_relation_exists_dictionary_tuple(
+                f_strict_move_id=self._board.move_from_usi(move_u),
+                kifuwarabe=self)
 
         #
         # 表示
         #
         if is_king_move:
             # ＫＬ
-            for k_blackright_l_blackright_index, relation_exists in k_blackright_l_blackright_index_to_relation_exists_dictionary.items():
+            for k_blackright_l_blackright_index, relation_exists in f_blackright_l_blackright_index_to_relation_exists_dictionary.items():
 
                 k_blackright_move_obj, l_blackright_move_obj = EvaluationKkTable.build_k_blackright_l_blackright_moves_by_kl_index(
                         k_blackright_l_blackright_index=k_blackright_l_blackright_index)
@@ -785,7 +1393,7 @@ class Kifuwarabe():
                 print(f"  turn:{Turn.to_string(self._board.turn)}  k_blackright_l_blackright_index:{k_blackright_l_blackright_index:7}  K:{k_blackright_move_obj.as_usi:5}  L:{l_blackright_move_obj.as_usi:5}  relation_exists:{relation_exists}")
 
             # ＫＱ
-            for k_blackright_q_blackright_index, relation_exists in k_blackright_q_blackright_index_to_relation_exists_dictionary.items():
+            for k_blackright_q_blackright_index, relation_exists in f_blackright_q_blackright_index_to_relation_exists_dictionary.items():
 
                 k_blackright_move_obj, black_q_move_obj = EvaluationKpTable.build_k_blackright_p_blackright_moves_by_kp_index(
                         k_blackright_p_blackright_index=k_blackright_q_blackright_index)
@@ -794,7 +1402,7 @@ class Kifuwarabe():
 
         else:
             # ＰＬ
-            for p_blackright_l_blackright_index, relation_exists in p_blackright_l_blackright_index_to_relation_exists_dictionary.items():
+            for p_blackright_l_blackright_index, relation_exists in f_blackright_l_blackright_index_to_relation_exists_dictionary.items():
 
                 display_black_p_move_obj, display_black_l_move_obj = EvaluationPkTable.build_p_blackright_k_blackright_moves_by_pk_index(
                         p_blackright_k_blackright_index=p_blackright_l_blackright_index)
@@ -802,7 +1410,7 @@ class Kifuwarabe():
                 print(f"  turn:{Turn.to_string(self._board.turn)}  p_blackright_l_blackright_index:{p_blackright_l_blackright_index:7}  P:{display_black_p_move_obj.as_usi:5}  L:{display_black_l_move_obj.as_usi:5}  relation_exists:{relation_exists}")
 
             # ＰＱ
-            for p_blackright_q_blackright_index, relation_exists in p_blackright_q_blackright_index_to_relation_exists_dictionary.items():
+            for p_blackright_q_blackright_index, relation_exists in f_blackright_q_blackright_index_to_relation_exists_dictionary.items():
 
                 display_black_p_move_obj, display_black_q_move_obj = EvaluationPpTable.build_p1_blackright_p2_blackright_moves_by_p1p2_index(
                         p1_blackright_p2_blackright_index=p_blackright_q_blackright_index)
@@ -834,6 +1442,9 @@ class Kifuwarabe():
                 print(f"[{datetime.datetime.now()}] [weaken] weaken command must be 1 move.  ex:`weaken 5i5h`  cmd_tail:`{cmd_tail}`")
             return ('failed', 'コマンドがおかしい')
 
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
+
         return EvaluationEdit(
                 kifuwarabe=self
         ).weaken(
@@ -865,6 +1476,9 @@ class Kifuwarabe():
                 print(f"[{datetime.datetime.now()}] [strengthen] strengthen command must be 1 move.  ex:`strengthen 5i5h`  cmd_tail:`{cmd_tail}`")
             return ('failed', 'コマンドがおかしい')
 
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
+
         return EvaluationEdit(
                 kifuwarabe=self
         ).strengthen(
@@ -894,9 +1508,12 @@ class Kifuwarabe():
         Returns
         -------
         reason : str
-            'max_move', 'resign', 'nyugyoku_win', 'max_playout_depth'
+            'max_move', 'resign', 'nyugyoku_win', 'max_playout_depth', 'cancelled'
         """
 
+        # 別スレッドで読み込んでいる評価値テーブルがあれば、差し替えてから使う
+        self.swap_reloaded_eval_all_tables()
+
         # 学習中以外はログを出したい
         if not is_in_learn:
             print(f'[{datetime.datetime.now()}] [playout] start...')
@@ -907,6 +1524,10 @@ class Kifuwarabe():
         def playout_local():
             for _playout_depth in range(0, max_playout_depth):
 
+                # stop か quit が来た
+                if self.is_cancelled:
+                    return 'cancelled'
+
                 # 手数上限
                 if max_move_number <= self._board.move_number:
                     return 'max_move'
@@ -921,16 +1542,16 @@ class Kifuwarabe():
 
                 # （評価値テーブルの内容だけで対局したい用途で使う想定なので）プレイアウト中は１手詰めルーチンを使わない
 
-                # くじを引く（投了のケースは対応済みなので、ここで対応しなくていい）
-                best_move_str = ChoiceBestMove.choice_best_move(
+                # くじを引く（投了のケースは対応済みなので、ここで対応しなくていい）。ＵＳＩ形式の符号にはしない
+                best_move_id = ChoiceBestMove.choice_best_move_id(
                         legal_moves=list(self._board.legal_moves),
                         kifuwarabe=self)
 
                 if is_debug:
-                    print(f"[{datetime.datetime.now()}] [playout] best_move:{best_move_str:5}")
+                    print(f"[{datetime.datetime.now()}] [playout] best_move:{cshogi.move_to_usi(best_move_id):5}")
 
                 # 一手指す
-                self._board.push_usi(best_move_str)
+                self._board.push(best_move_id)
 
 
             # プレイアウト深さ上限
@@ -985,8 +1606,8 @@ class Kifuwarabe():
 
         self.isready()
 
-        # 無限ループ
-        while True:
+        # stop か quit が来るまで繰り返す
+        while not self.is_cancelled:
 
             self.usinewgame()
 
@@ -996,11 +1617,17 @@ class Kifuwarabe():
             (result_str, reason) = self.playout(
                     is_debug=is_debug)
 
+            # 途中で止めた対局は、結果に残さない
+            if reason == 'cancelled':
+                break
+
             self.gameover(
                     cmd_tail=result_str)
 
             print(f"[{datetime.datetime.now()}] [selfmatch] repeat")
 
+        print(f"[{datetime.datetime.now()}] [selfmatch] cancelled")
+
 
 ########################################
 # スクリプト実行時
@@ -1012,7 +1639,13 @@ if __name__ == '__main__':
     #print(f"cshogi.BLACK:{cshogi.BLACK}  cshogi.WHITE:{cshogi.WHITE}")
 
     try:
-        kifuwarabe = Kifuwarabe()
+        kifuwarabe = Kifuwarabe(
+                table_mode=table_mode_in_usi_engine,
+                edit_log_mode=edit_log_mode_in_usi_engine,
+                table_codec=table_codec_for_new_file,
+                is_lazy_loading=is_lazy_loading_in_usi_engine,
+                reply_set_mode=reply_set_mode_in_usi_engine,
+                search_mode=search_mode_in_usi_engine)
         kifuwarabe.usi_loop()
 
     except Exception as err:
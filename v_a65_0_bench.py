@@ -0,0 +1,1032 @@
+import cshogi
+import datetime
+import numpy as np
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# python v_a65_0_bench.py
+from     v_a65_0 import engine_version_str, Kifuwarabe
+from     v_a65_0_eval.facade import EvaluationFacade
+from     v_a65_0_eval.k import EvaluationKMove
+from     v_a65_0_eval.lib import EvaluationLib
+from     v_a65_0_eval.p import EvaluationPMove
+from     v_a65_0_eval.table_header import EvaluationTableHeader
+from     v_a65_0_misc.choice_best_move import ChoiceBestMove
+from     v_a65_0_misc.lib import FileName, Turn, Move, MoveHelper, BoardHelper, EvalutionMmTable
+from     v_a65_0_misc.mate_solver import MateSolver
+from     v_a65_0_misc.reply_set import ReplySetEngine
+from     v_a65_0_misc.sub_usi import SubUsi
+
+
+########################################
+# ベンチマーク用のデータ
+########################################
+
+def get_table_kind_list():
+    """評価値テーブルの種類と、その縦横のサイズの一覧
+
+    Returns
+    -------
+    list<(str, int, int)>
+        （ファイル名に使う種類、指し手Ａのサイズ、指し手Ｂのサイズ）
+    """
+    return [
+        ('kk', EvaluationKMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+        ('kp', EvaluationKMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size()),
+        ('pk', EvaluationPMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+        ('pp', EvaluationPMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size()),
+    ]
+
+
+def get_bench_file(
+        kind,
+        turn,
+        a_move_size,
+        b_move_size):
+    """ベンチマークに使う評価値テーブル・ファイル名と、そのヘッダー。
+    学習済みのファイルがあればそれを使い、無ければ一時フォルダーにランダムなファイルを作ります
+
+    Parameters
+    ----------
+    kind : str
+        'kk', 'kp', 'pk', 'pp'
+    turn : int
+        手番
+    a_move_size : int
+        指し手Ａのサイズ
+    b_move_size : int
+        指し手Ｂのサイズ
+
+    Returns
+    -------
+    file_name_obj : FileName
+        ファイル名オブジェクト
+    header_obj : EvaluationTableHeader
+        ヘッダー
+    """
+    header_obj = EvaluationTableHeader(
+            kind=kind,
+            turn=turn,
+            a_move_size=a_move_size,
+            b_move_size=b_move_size)
+
+    file_name_obj = FileName(
+            file_stem=f'data[{engine_version_str}]_n1_eval_{kind}_{Turn.to_string(turn)}',
+            file_extension='.bin')
+
+    if os.path.isfile(file_name_obj.base_name):
+        return (file_name_obj, header_obj)
+
+    file_name_obj = FileName(
+            file_stem=os.path.join(tempfile.gettempdir(), f'bench[{engine_version_str}]_n1_eval_{kind}_{Turn.to_string(turn)}'),
+            file_extension='.bin')
+
+    if not os.path.isfile(file_name_obj.base_name):
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=file_name_obj,
+                table_as_array=EvaluationLib.create_random_evaluation_table_as_array(
+                        a_move_size=a_move_size,
+                        b_move_size=b_move_size),
+                header_obj=header_obj)
+
+    return (file_name_obj, header_obj)
+
+
+########################################
+# 読込
+########################################
+
+def unpack_bytes_to_bit_list(
+        one_file_binary):
+    """バイト列を、大きな桁から順に１ビットずつ並べたリストに展開します。当初の方法と比べるのに使う
+
+    Parameters
+    ----------
+    one_file_binary : bytes
+        評価値テーブル・ファイルの中身
+
+    Returns
+    -------
+    bit_list : list<int>
+        0 か 1 のリスト。長さはバイト数の８倍
+    """
+    return np.unpackbits(np.frombuffer(one_file_binary, dtype=np.uint8)).tolist()
+
+
+def legacy_read_bit_list(
+        file_name_obj):
+    """v_a65_0 当初の、１バイトずつ読み込む方法（比較用）
+
+    当初のコードは８ビット目を `one_byte_num//2` としていたが、それは `one_byte_num % 2` の書き間違いなので、ここでは直してある。
+    ヘッダーがあれば読み飛ばす
+    """
+    table_as_array = []
+
+    with open(file_name_obj.base_name, 'rb') as f:
+
+        if EvaluationTableHeader.has_magic(f.read(EvaluationTableHeader.header_size)):
+            f.seek(EvaluationTableHeader.header_size)
+        else:
+            f.seek(0)
+
+        one_byte_binary = f.read(1)
+
+        while one_byte_binary:
+            one_byte_num = int.from_bytes(one_byte_binary, signed=False)
+
+            table_as_array.append(one_byte_num//128 % 2)
+            table_as_array.append(one_byte_num// 64 % 2)
+            table_as_array.append(one_byte_num// 32 % 2)
+            table_as_array.append(one_byte_num// 16 % 2)
+            table_as_array.append(one_byte_num//  8 % 2)
+            table_as_array.append(one_byte_num//  4 % 2)
+            table_as_array.append(one_byte_num//  2 % 2)
+            table_as_array.append(one_byte_num      % 2)
+
+            one_byte_binary = f.read(1)
+
+    return table_as_array
+
+
+def bench_load():
+    """評価値テーブル・ファイルの読込速度を、当初の方法と比べます"""
+
+    for turn in [cshogi.BLACK, cshogi.WHITE]:
+        for (kind, a_move_size, b_move_size) in get_table_kind_list():
+            (file_name_obj, header_obj) = get_bench_file(
+                    kind=kind,
+                    turn=turn,
+                    a_move_size=a_move_size,
+                    b_move_size=b_move_size)
+
+            start = time.perf_counter()
+            expected = legacy_read_bit_list(file_name_obj)
+            legacy_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            actual = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+            bulk_seconds = time.perf_counter() - start
+
+            if expected != unpack_bytes_to_bit_list(actual):
+                raise ValueError(f"[bench load] table contents not match. kind:{kind}  turn:{Turn.to_string(turn)}")
+
+            print(f"[{datetime.datetime.now()}] [bench load] {kind}_{Turn.to_string(turn):5}  bits:{len(actual) * 8:9}  legacy:{legacy_seconds:8.3f} sec  bulk:{bulk_seconds:8.3f} sec  x{legacy_seconds / max(bulk_seconds, 1e-9):7.1f}", flush=True)
+
+
+########################################
+# メモリー使用量、アクセス速度
+########################################
+
+class LegacyBitListTable():
+    """v_a65_0 当初の、１関係を１つの int として並べたリストのテーブル（比較用）"""
+
+
+    def __init__(
+            self,
+            table_as_array):
+        self._table_as_array = table_as_array
+
+
+    def get_bit_by_index(
+            self,
+            index):
+        return self._table_as_array[index]
+
+
+    def set_bit_by_index(
+            self,
+            index,
+            bit):
+        is_changed = self._table_as_array[index] != bit
+        self._table_as_array[index] = bit
+        return (is_changed, '')
+
+
+def measure_allocated_bytes(
+        create):
+    """関数が確保したメモリーのバイト数を測ります
+
+    Parameters
+    ----------
+    create : function
+        測りたいオブジェクトを作る関数
+
+    Returns
+    -------
+    obj : object
+        作ったオブジェクト
+    allocated_bytes : int
+        確保したバイト数
+    """
+    tracemalloc.start()
+    obj = create()
+    (allocated_bytes, _peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (obj, allocated_bytes)
+
+
+def bench_memory():
+    """評価値テーブルのメモリー使用量を、当初の方法と比べます"""
+
+    for turn in [cshogi.BLACK, cshogi.WHITE]:
+        for (kind, a_move_size, b_move_size) in get_table_kind_list():
+            (file_name_obj, header_obj) = get_bench_file(
+                    kind=kind,
+                    turn=turn,
+                    a_move_size=a_move_size,
+                    b_move_size=b_move_size)
+
+            (legacy_table, legacy_bytes) = measure_allocated_bytes(
+                    lambda: LegacyBitListTable(legacy_read_bit_list(file_name_obj)))
+
+            (packed_table, packed_bytes) = measure_allocated_bytes(
+                    lambda: EvalutionMmTable(
+                            file_name_obj=file_name_obj,
+                            table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj),
+                            is_file_modified=False))
+
+            print(f"[{datetime.datetime.now()}] [bench memory] {kind}_{Turn.to_string(turn):5}  legacy:{legacy_bytes:11,} bytes  packed:{packed_bytes:11,} bytes (table:{sys.getsizeof(packed_table.table_as_array):11,} bytes)  x{legacy_bytes / max(packed_bytes, 1):7.1f}", flush=True)
+
+
+def bench_access():
+    """評価値テーブルのビットの読み書きの速度を、当初の方法と比べます"""
+
+    number_of_access = 1_000_000
+
+    for (kind, a_move_size, b_move_size) in get_table_kind_list():
+        (file_name_obj, header_obj) = get_bench_file(
+                kind=kind,
+                turn=cshogi.BLACK,
+                a_move_size=a_move_size,
+                b_move_size=b_move_size)
+
+        legacy_table = LegacyBitListTable(legacy_read_bit_list(file_name_obj))
+        packed_table = EvalutionMmTable(
+                file_name_obj=file_name_obj,
+                table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj),
+                is_file_modified=False)
+
+        index_list = [random.randrange(0, a_move_size * b_move_size) for _ in range(0, number_of_access)]
+        bit_list = [random.randint(0,1) for _ in range(0, number_of_access)]
+
+        # 読取
+        for (name, table) in [('legacy', legacy_table), ('packed', packed_table)]:
+            start = time.perf_counter()
+            for index in index_list:
+                table.get_bit_by_index(index)
+            seconds = time.perf_counter() - start
+            print(f"[{datetime.datetime.now()}] [bench access] {kind}  {name}  get:{seconds:8.3f} sec  {seconds / number_of_access * 1e9:8.1f} ns/access", flush=True)
+
+        # 書込
+        for (name, table) in [('legacy', legacy_table), ('packed', packed_table)]:
+            start = time.perf_counter()
+            for (index, bit) in zip(index_list, bit_list):
+                table.set_bit_by_index(index, bit)
+            seconds = time.perf_counter() - start
+            print(f"[{datetime.datetime.now()}] [bench access] {kind}  {name}  set:{seconds:8.3f} sec  {seconds / number_of_access * 1e9:8.1f} ns/access", flush=True)
+
+        # 同じ書込をしたので、同じ中身になっているはず
+        for index in index_list:
+            if legacy_table.get_bit_by_index(index) != packed_table.get_bit_by_index(index):
+                raise ValueError(f"[bench access] table contents not match. kind:{kind}  index:{index}")
+
+
+########################################
+# 保存
+########################################
+
+def legacy_save_bit_list(
+        file_name_obj,
+        table_as_array):
+    """v_a65_0 当初の、１ビットずつ詰めて１バイトずつ書き出す方法（比較用）。元のファイルの削除とリネームは行わない"""
+
+    with open(file_name_obj.temporary_base_name, 'wb') as f:
+
+        length = 0
+        sum = 0
+
+        for bit in table_as_array:
+            sum *= 2
+            sum += bit
+            length += 1
+
+            if 8 <= length:
+                f.write(sum.to_bytes(1))
+                sum = 0
+                length = 0
+
+        if 0 < length and length < 8:
+            while length < 8:
+                sum *= 2
+                length += 1
+
+            f.write(sum.to_bytes(1))
+
+
+def bench_save():
+    """評価値テーブル・ファイルの保存速度を、当初の方法と比べます"""
+
+    for (kind, a_move_size, b_move_size) in get_table_kind_list():
+        (file_name_obj, header_obj) = get_bench_file(
+                kind=kind,
+                turn=cshogi.BLACK,
+                a_move_size=a_move_size,
+                b_move_size=b_move_size)
+
+        table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+        bit_list = unpack_bytes_to_bit_list(table_as_array)
+
+        # 一時フォルダーにコピーして、そちらを保存先にする
+        save_file_name_obj = FileName(
+                file_stem=os.path.join(tempfile.gettempdir(), f'bench_save[{engine_version_str}]_n1_eval_{kind}'),
+                file_extension='.bin')
+
+        start = time.perf_counter()
+        legacy_save_bit_list(save_file_name_obj, bit_list)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=save_file_name_obj,
+                table_as_array=table_as_array,
+                header_obj=header_obj)
+        bulk_seconds = time.perf_counter() - start
+
+        with open(save_file_name_obj.base_name, 'rb') as f:
+            if f.read()[EvaluationTableHeader.header_size:] != table_as_array:
+                raise ValueError(f"[bench save] table contents not match. kind:{kind}")
+
+        os.remove(save_file_name_obj.base_name)
+
+        print(f"[{datetime.datetime.now()}] [bench save] {kind}  legacy:{legacy_seconds:8.3f} sec  bulk (with fsync):{bulk_seconds:8.3f} sec", flush=True)
+
+
+def bench_patch():
+    """数十ビットだけ変えたときの保存を、ファイル全体の置き換えと、変更したページだけの上書きとで比べます"""
+
+    number_of_edits = 50
+
+    for (kind, a_move_size, b_move_size) in get_table_kind_list():
+        (file_name_obj, header_obj) = get_bench_file(
+                kind=kind,
+                turn=cshogi.BLACK,
+                a_move_size=a_move_size,
+                b_move_size=b_move_size)
+
+        # 一時フォルダーにコピーして、そちらを保存先にする
+        save_file_name_obj = FileName(
+                file_stem=os.path.join(tempfile.gettempdir(), f'bench_patch[{engine_version_str}]_n1_eval_{kind}'),
+                file_extension='.bin')
+
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=save_file_name_obj,
+                table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj),
+                header_obj=header_obj)
+
+        for is_incremental in [False, True]:
+            mm_table_obj = EvalutionMmTable(
+                    file_name_obj=save_file_name_obj,
+                    table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(save_file_name_obj, header_obj),
+                    is_file_modified=False,
+                    header_obj=header_obj)
+
+            for _ in range(0, number_of_edits):
+                index = random.randrange(0, a_move_size * b_move_size)
+                mm_table_obj.set_bit_by_index(index, 1 - mm_table_obj.get_bit_by_index(index))
+
+            number_of_dirty_pages = len(mm_table_obj.dirty_page_set)
+            expected = mm_table_obj.table_as_array[:]
+
+            start = time.perf_counter()
+            EvaluationLib.save_mm_table(
+                    mm_table_obj=mm_table_obj,
+                    is_incremental=is_incremental)
+            seconds = time.perf_counter() - start
+
+            with open(save_file_name_obj.base_name, 'rb') as f:
+                if f.read()[EvaluationTableHeader.header_size:] != expected:
+                    raise ValueError(f"[bench patch] table contents not match. kind:{kind}")
+
+            if is_incremental and number_of_dirty_pages * mm_table_obj.dirty_page_size * 2 < len(expected):
+                written_bytes = number_of_dirty_pages * mm_table_obj.dirty_page_size
+            else:
+                written_bytes = len(expected)
+
+            print(f"[{datetime.datetime.now()}] [bench patch] {kind}  incremental:{str(is_incremental):5}  edits:{number_of_edits}  dirty pages:{number_of_dirty_pages:4}  written:{written_bytes:9,} bytes  {seconds:8.4f} sec", flush=True)
+
+        os.remove(save_file_name_obj.base_name)
+
+
+########################################
+# 起動
+########################################
+
+def bench_startup():
+    """評価値テーブル・ファイルの持ち方ごとに、全テーブルの準備にかかる時間と、最初の読取の速度を比べます"""
+
+    number_of_access = 100_000
+
+    for table_mode in ['memory', 'mmap_read', 'mmap_copy']:
+        mm_table_obj_list = []
+
+        start = time.perf_counter()
+        for turn in [cshogi.BLACK, cshogi.WHITE]:
+            for (kind, a_move_size, b_move_size) in get_table_kind_list():
+                (file_name_obj, header_obj) = get_bench_file(
+                        kind=kind,
+                        turn=turn,
+                        a_move_size=a_move_size,
+                        b_move_size=b_move_size)
+
+                mm_table_obj_list.append((
+                        a_move_size * b_move_size,
+                        EvalutionMmTable(
+                                file_name_obj=file_name_obj,
+                                table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(
+                                        file_name_obj=file_name_obj,
+                                        header_obj=header_obj,
+                                        table_mode=table_mode),
+                                is_file_modified=False)))
+        load_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for (bit_size, mm_table_obj) in mm_table_obj_list:
+            for _ in range(0, number_of_access):
+                mm_table_obj.get_bit_by_index(random.randrange(0, bit_size))
+        access_seconds = time.perf_counter() - start
+
+        for (_bit_size, mm_table_obj) in mm_table_obj_list:
+            mm_table_obj.close()
+
+        print(f"[{datetime.datetime.now()}] [bench startup] {table_mode:9}  load:{load_seconds:8.3f} sec  get:{access_seconds / (number_of_access * len(mm_table_obj_list)) * 1e9:8.1f} ns/access", flush=True)
+
+
+def bench_codec():
+    """評価値テーブル・ファイルの本体の符号化ごとに、圧縮率と保存、読込の速さを測ります
+
+    学習済みのファイルがあればその中身を、無ければランダムな中身（ほとんど縮まない）を使う。
+    比べるため、１６関係に１つだけ 1 が立った疎な中身でも測る
+    """
+
+    for (kind, a_move_size, b_move_size) in get_table_kind_list():
+        (file_name_obj, header_obj) = get_bench_file(
+                kind=kind,
+                turn=cshogi.BLACK,
+                a_move_size=a_move_size,
+                b_move_size=b_move_size)
+
+        data_table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+
+        # 疎な中身。 0b1000_0000, 0b0000_0000 の繰り返しに、ところどころランダムなビットを混ぜる
+        sparse_table_as_array = bytearray(b'\x80\x00' * (len(data_table_as_array) // 2 + 1))[:len(data_table_as_array)]
+        for _ in range(0, len(sparse_table_as_array) // 64):
+            sparse_table_as_array[random.randrange(0, len(sparse_table_as_array))] |= 1 << random.randrange(0, 8)
+
+        save_file_name_obj = FileName(
+                file_stem=os.path.join(tempfile.gettempdir(), f'bench_codec[{engine_version_str}]_n1_eval_{kind}'),
+                file_extension='.bin')
+
+        for (data_name, table_as_array) in [('data', data_table_as_array), ('sparse', sparse_table_as_array)]:
+            for codec in ['raw', 'zlib', 'lzma']:
+                save_header_obj = EvaluationTableHeader(
+                        kind=kind,
+                        turn=cshogi.BLACK,
+                        a_move_size=a_move_size,
+                        b_move_size=b_move_size,
+                        codec=codec)
+
+                start = time.perf_counter()
+                EvaluationLib.save_evaluation_table_file(
+                        file_name_obj=save_file_name_obj,
+                        table_as_array=table_as_array,
+                        header_obj=save_header_obj)
+                save_seconds = time.perf_counter() - start
+
+                file_size = os.path.getsize(save_file_name_obj.base_name)
+
+                start = time.perf_counter()
+                actual = EvaluationLib.read_evaluation_table_as_array_from_file(save_file_name_obj, save_header_obj)
+                load_seconds = time.perf_counter() - start
+
+                if actual != table_as_array:
+                    raise ValueError(f"[bench codec] table contents not match. kind:{kind}  data:{data_name}  codec:{codec}")
+
+                os.remove(save_file_name_obj.base_name)
+
+                megabytes = len(table_as_array) / (1024 * 1024)
+                print(f"[{datetime.datetime.now()}] [bench codec] {kind}  {data_name:6}  {codec:4}  file:{file_size:9,} bytes  ratio:{len(table_as_array) / file_size:6.2f}  save:{save_seconds:7.3f} sec ({megabytes / max(save_seconds, 1e-9):8.1f} MiB/s)  load:{load_seconds:7.3f} sec ({megabytes / max(load_seconds, 1e-9):8.1f} MiB/s)", flush=True)
+
+
+########################################
+# 指し手のインデックス
+########################################
+
+def bench_move_index():
+    """cshogi の指し手の整数から評価値テーブルのインデックスを求める速さを、指し手オブジェクトを辿る当初の方法と、平らなリストを引く方法で比べます"""
+
+    number_of_repeat = 1_000
+
+    # 平らなリストは、初回に作る時間も測っておく
+    start = time.perf_counter()
+    k_move16_to_index_list_tuple = EvaluationKMove.get_move16_to_blackright_index_list_tuple()
+    p_move16_to_index_list_tuple = EvaluationPMove.get_move16_to_blackright_index_list_tuple()
+    print(f"[{datetime.datetime.now()}] [bench move index] build flat lists:{time.perf_counter() - start:8.3f} sec", flush=True)
+
+    board = cshogi.Board()
+
+    for position_sfen in [
+            'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+            'l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1']:
+        board.set_sfen(position_sfen)
+        k_sq = BoardHelper.get_king_square(board)
+        shall_white_to_black = board.turn == cshogi.WHITE
+        move_id_list = list(board.legal_moves)
+
+        # 当初の方法
+        start = time.perf_counter()
+        for _ in range(0, number_of_repeat):
+            for move_id in move_id_list:
+                move_obj = Move.from_usi(cshogi.move_to_usi(move_id))
+                blackright_move_obj = Move.from_move_obj(
+                        f_strict_move_obj=move_obj,
+                        shall_white_to_black=shall_white_to_black,
+                        use_only_right_side=True)
+
+                if MoveHelper.is_king(k_sq, move_obj):
+                    EvaluationKMove.get_blackright_index_by_k_move(blackright_move_obj)
+                else:
+                    EvaluationPMove.get_blackright_index_by_p_move(blackright_move_obj)
+        chain_seconds = time.perf_counter() - start
+
+        # 平らなリスト
+        start = time.perf_counter()
+        k_move16_to_index_list = k_move16_to_index_list_tuple[1 if shall_white_to_black else 0]
+        p_move16_to_index_list = p_move16_to_index_list_tuple[1 if shall_white_to_black else 0]
+        for _ in range(0, number_of_repeat):
+            for move_id in move_id_list:
+                if cshogi.move_from(move_id) == k_sq and not cshogi.move_is_drop(move_id):
+                    k_move16_to_index_list[move_id & 0xffff]
+                else:
+                    p_move16_to_index_list[move_id & 0xffff]
+        flat_seconds = time.perf_counter() - start
+
+        number_of_lookup = number_of_repeat * len(move_id_list)
+        print(f"[{datetime.datetime.now()}] [bench move index] moves:{len(move_id_list):3}  chain:{chain_seconds / number_of_lookup * 1e9:8.1f} ns/move  flat:{flat_seconds / number_of_lookup * 1e9:8.1f} ns/move  x{chain_seconds / flat_seconds:6.1f}", flush=True)
+
+
+########################################
+# ＵＳＩエンジンの起動
+########################################
+
+usi_startup_budget_seconds = 1.0
+"""`python v_a65_0.py` を起動してから usiok が返るまでの時間の予算"""
+
+
+def read_until_usi_response(
+        process,
+        response_str):
+    """ＵＳＩエンジンの標準出力を、指定の応答の行まで読み飛ばします"""
+    while True:
+        line = process.stdout.readline()
+
+        if line == '':
+            raise ValueError(f"[bench usi startup] engine exited before `{response_str}`")
+
+        if line.strip() == response_str:
+            return
+
+
+def bench_usi_startup():
+    """`python v_a65_0.py` を起動してから usiok 、 readyok が返るまでの時間を測ります
+
+    指し手のインデックス・ファイルが無い１回目（作って保存する）と、有る２回目（読み込むだけ）を測る。
+    usiok までの時間が予算 usi_startup_budget_seconds を超えたらエラーにする
+    """
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+
+    # 指し手のインデックス・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーで起動する
+    working_directory = tempfile.mkdtemp()
+    engine_name_base_name = f"{engine_version_str}_engine_name.txt"
+    shutil.copyfile(
+            src=os.path.join(script_directory, engine_name_base_name),
+            dst=os.path.join(working_directory, engine_name_base_name))
+
+    for trial_name in ['cold', 'warm']:
+        start = time.perf_counter()
+
+        process = subprocess.Popen(
+                [sys.executable, os.path.join(script_directory, 'v_a65_0.py')],
+                cwd=working_directory,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                text=True,
+                encoding='utf-8')
+
+        try:
+            process.stdin.write("usi\n")
+            process.stdin.flush()
+            read_until_usi_response(process, 'usiok')
+            usiok_seconds = time.perf_counter() - start
+
+            process.stdin.write("isready\n")
+            process.stdin.flush()
+            read_until_usi_response(process, 'readyok')
+            readyok_seconds = time.perf_counter() - start
+
+            process.stdin.write("quit\n")
+            process.stdin.flush()
+            process.wait(timeout=10)
+
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+        print(f"[{datetime.datetime.now()}] [bench usi startup] {trial_name}  usiok:{usiok_seconds:7.3f} sec  readyok:{readyok_seconds:7.3f} sec  budget:{usi_startup_budget_seconds:7.3f} sec", flush=True)
+
+        if usi_startup_budget_seconds < usiok_seconds:
+            raise ValueError(f"[bench usi startup] usiok is over budget.  trial:{trial_name}  usiok:{usiok_seconds:.3f} sec  budget:{usi_startup_budget_seconds:.3f} sec")
+
+
+########################################
+# 指し手オブジェクト
+########################################
+
+class LegacyMove():
+    """v_a65_0 当初の、属性の辞書を持ち、毎回作り、 as_usi も毎回作る指し手（比較用）"""
+
+
+    number_of_created = 0
+    """作ったオブジェクトの数"""
+
+
+    def __init__(
+            self,
+            srcloc,
+            dstsq,
+            promoted):
+        LegacyMove.number_of_created += 1
+        self._srcloc = srcloc
+        self._dstsq = dstsq
+        self._promoted = promoted
+
+
+    @staticmethod
+    def from_usi(move_as_usi):
+        return LegacyMove(
+                srcloc=SubUsi.code_to_srcloc(code=move_as_usi[0: 2]),
+                dstsq=SubUsi.srcloc_to_sq(SubUsi.code_to_srcloc(code=move_as_usi[2: 4])),
+                promoted=4 < len(move_as_usi))
+
+
+    @staticmethod
+    def from_move_obj(
+            f_strict_move_obj,
+            shall_white_to_black,
+            use_only_right_side=False):
+        # 変形は Move と同じ計算をして、当初と同じく新しいオブジェクトを作る
+        move_obj = Move.from_src_dst_pro(
+                srcloc=f_strict_move_obj._srcloc,
+                dstsq=f_strict_move_obj._dstsq,
+                promoted=f_strict_move_obj._promoted,
+                is_rotate=shall_white_to_black,
+                use_only_right_side=use_only_right_side)
+        return LegacyMove(
+                srcloc=move_obj.srcloc,
+                dstsq=move_obj.dstsq,
+                promoted=move_obj.promoted)
+
+
+    @property
+    def as_usi(self):
+        return f"{SubUsi.srcloc_to_code(self._srcloc)}{SubUsi.sq_to_code(self._dstsq)}{SubUsi.promotion_to_code(self._promoted)}"
+
+
+def bench_move():
+    """応手の一覧を作るときと同じ指し手オブジェクトの使い方で、当初の指し手と、インターンした指し手の速さと、作ったオブジェクトの数とバイト数を比べます"""
+
+    number_of_repeat = 200
+
+    board = cshogi.Board()
+    move_u_list = []
+    for position_sfen in [
+            'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+            'l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1']:
+        board.set_sfen(position_sfen)
+        move_u_list.extend([cshogi.move_to_usi(move_id) for move_id in board.legal_moves])
+
+    def work(move_class):
+        move_u_set = set()
+        for _ in range(0, number_of_repeat):
+            for move_u in move_u_list:
+                move_obj = move_class.from_usi(move_u)
+                blackright_move_obj = move_class.from_move_obj(
+                        f_strict_move_obj=move_obj,
+                        shall_white_to_black=True,
+                        use_only_right_side=True)
+                move_u_set.add(blackright_move_obj.as_usi)
+        return move_u_set
+
+    for (name, move_class) in [('legacy', LegacyMove), ('interned', Move)]:
+        # １回目はインターンの辞書を作るので、測らない
+        work(move_class)
+
+        start = time.perf_counter()
+        work(move_class)
+        seconds = time.perf_counter() - start
+
+        # 作ったオブジェクトの数。インターンした指し手は、辞書に増えた数
+        number_of_created = LegacyMove.number_of_created + len(Move._packed_to_move_obj)
+        work(move_class)
+        number_of_created = LegacyMove.number_of_created + len(Move._packed_to_move_obj) - number_of_created
+
+        # オブジェクト１つのバイト数。属性の辞書があればそれも足す
+        move_obj = move_class.from_usi('7g7f')
+        object_bytes = sys.getsizeof(move_obj) + (sys.getsizeof(move_obj.__dict__) if hasattr(move_obj, '__dict__') else 0)
+
+        number_of_move = number_of_repeat * len(move_u_list)
+        print(f"[{datetime.datetime.now()}] [bench move] {name:8}  {seconds / number_of_move * 1e9:8.1f} ns/move  created:{number_of_created / number_of_move:5.2f} objects/move  ({number_of_created * object_bytes / number_of_move:7.1f} bytes/move, {object_bytes:4} bytes/object)", flush=True)
+
+
+########################################
+# 全ての合法手をまとめた方策
+########################################
+
+def select_ranked_f_strict_move_id_set_one_by_one(
+        legal_moves,
+        kifuwarabe):
+    """着手を１つずつ、まとめて数える方法に渡して階位に分けます。 numpy の演算を着手の数だけ繰り返したときの速さ（比較用）"""
+    ranked_strict_move_id_set_list = [set() for _ in range(0, kifuwarabe.tier_resolution)]
+
+    for strict_move_id in legal_moves:
+        (positive_of_relation_array,
+         total_of_relation_array) = ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                f_strict_move_id_list=[strict_move_id],
+                kifuwarabe=kifuwarabe)
+        positive_of_relation = int(positive_of_relation_array[0])
+        total_of_relation = int(total_of_relation_array[0])
+
+        (ranking_th, _) = EvaluationFacade.get_tier_th(
+                positive_of_relation=positive_of_relation,
+                total_of_relation=total_of_relation,
+                tier_resolution=kifuwarabe.tier_resolution)
+
+        ranked_strict_move_id_set_list[ranking_th - 1].add(strict_move_id)
+
+    return ranked_strict_move_id_set_list
+
+
+def select_ranked_f_strict_move_id_set_by_batch_without_cache(
+        legal_moves,
+        kifuwarabe):
+    """まとめて数えて階位に分けます。 PolicyCache に覚えたものを引かずに数えるように、先に捨てる（比較用）"""
+    kifuwarabe.policy_cache.clear()
+
+    return ChoiceBestMove.select_ranked_f_strict_move_id_set_by_batch(
+            legal_moves=legal_moves,
+            kifuwarabe=kifuwarabe)
+
+
+def bench_batch():
+    """序盤、中盤、終盤の局面で、全ての合法手を階位に分ける速さを、１手ずつ数える方法と、まとめて数える方法で比べます"""
+
+    number_of_repeat = 20
+
+    kifuwarabe = Kifuwarabe(
+            table_mode='memory')
+    kifuwarabe.load_eval_all_tables()
+
+    for (phase_name, position_str) in [
+            ('opening', 'startpos'),
+            ('middle', 'startpos moves 7g7f 3c3d 8h2b+ 3a2b 2g2f 8c8d B*5e 8d8e 5i4h'),
+            ('middle', 'sfen l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1'),
+            # 持ち駒が多く、打つ手が多い
+            ('endgame', 'sfen 6k1l/5g3/5pnp1/6p1p/7P1/9/5PP1P/6SK1/7NL b RB2G2S2N2L10Prbgs 1')]:
+        kifuwarabe.position(position_str)
+        move_id_list = list(kifuwarabe.board.legal_moves)
+
+        seconds_list = []
+        ranked_strict_move_id_set_list_list = []
+
+        for select_function in [
+                select_ranked_f_strict_move_id_set_one_by_one,
+                select_ranked_f_strict_move_id_set_by_batch_without_cache]:
+
+            # １回目は指し手のインデックスのリストなどを作るので、測らない
+            ranked_strict_move_id_set_list_list.append(select_function(
+                    legal_moves=move_id_list,
+                    kifuwarabe=kifuwarabe))
+
+            start = time.perf_counter()
+            for _ in range(0, number_of_repeat):
+                select_function(
+                        legal_moves=move_id_list,
+                        kifuwarabe=kifuwarabe)
+            seconds_list.append((time.perf_counter() - start) / number_of_repeat)
+
+        # assert
+        if ranked_strict_move_id_set_list_list[0] != ranked_strict_move_id_set_list_list[1]:
+            raise ValueError(f"[bench batch] ranked sets are different.  position:{position_str}")
+
+        print(f"[{datetime.datetime.now()}] [bench batch] {phase_name:7}  moves:{len(move_id_list):3}  one by one:{seconds_list[0] * 1e3:8.3f} ms/position  batch:{seconds_list[1] * 1e3:8.3f} ms/position  x{seconds_list[0] / seconds_list[1]:5.1f}", flush=True)
+
+
+########################################
+# 応手の一覧の作り方
+########################################
+
+def bench_reply_set():
+    """序盤、中盤、終盤の局面で、着手ごとの応手の一覧を作る速さと、数えた関係の有りの数と総数の違いを、作り方ごとに比べます"""
+
+    number_of_repeat = 50
+
+    kifuwarabe = Kifuwarabe(
+            table_mode='memory')
+    kifuwarabe.load_eval_all_tables()
+
+    for (phase_name, position_str) in [
+            ('opening', 'startpos'),
+            ('middle', 'startpos moves 7g7f 3c3d 8h2b+ 3a2b 2g2f 8c8d B*5e 8d8e 5i4h'),
+            ('middle', 'sfen l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1'),
+            # 持ち駒が多く、打つ手が多い
+            ('endgame', 'sfen 6k1l/5g3/5pnp1/6p1p/7P1/9/5PP1P/6SK1/7NL b RB2G2S2N2L10Prbgs 1')]:
+        kifuwarabe.position(position_str)
+        move_id_list = list(kifuwarabe.board.legal_moves)
+
+        result_list = []
+
+        for reply_set_mode in ReplySetEngine.mode_list:
+            kifuwarabe.reply_set_mode = reply_set_mode
+
+            # １回目は表などを作るので、測らない
+            ReplySetEngine.create_o_move16_array_and_f_position_array(
+                    board=kifuwarabe.board,
+                    f_strict_move_id_list=move_id_list,
+                    mode=reply_set_mode)
+            ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                    f_strict_move_id_list=move_id_list,
+                    kifuwarabe=kifuwarabe)
+
+            start = time.perf_counter()
+            for _ in range(0, number_of_repeat):
+                (o_move16_array, _) = ReplySetEngine.create_o_move16_array_and_f_position_array(
+                        board=kifuwarabe.board,
+                        f_strict_move_id_list=move_id_list,
+                        mode=reply_set_mode)
+            reply_set_seconds = (time.perf_counter() - start) / number_of_repeat
+
+            # 方策のキャッシュを通さずに、関係を数えるところまで測る
+            start = time.perf_counter()
+            for _ in range(0, number_of_repeat):
+                (positive_of_relation_array,
+                 total_of_relation_array) = ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                        f_strict_move_id_list=move_id_list,
+                        kifuwarabe=kifuwarabe)
+            count_seconds = (time.perf_counter() - start) / number_of_repeat
+
+            (ranking_th_array, _) = EvaluationFacade.get_tier_th_array(
+                    positive_of_relation_array=positive_of_relation_array,
+                    total_of_relation_array=total_of_relation_array,
+                    tier_resolution=kifuwarabe.tier_resolution)
+
+            result_list.append((reply_set_mode, len(o_move16_array), reply_set_seconds, count_seconds, total_of_relation_array, ranking_th_array))
+
+        kifuwarabe.reply_set_mode = 'generate'
+
+        (_, _, generate_reply_set_seconds, _, expected_total_of_relation_array, expected_ranking_th_array) = result_list[0]
+
+        for (reply_set_mode, number_of_reply, reply_set_seconds, count_seconds, total_of_relation_array, ranking_th_array) in result_list:
+            # 総数の違いの割合と、階位が同じ着手の割合
+            total_error_rate = np.abs(total_of_relation_array - expected_total_of_relation_array).sum() / max(1, expected_total_of_relation_array.sum())
+            same_tier_rate = (ranking_th_array == expected_ranking_th_array).mean() if 0 < len(move_id_list) else 1.0
+
+            print(f"[{datetime.datetime.now()}] [bench reply set] {phase_name:7}  moves:{len(move_id_list):3}  mode:{reply_set_mode:11}  replies:{number_of_reply:5}  reply set:{reply_set_seconds * 1e3:7.3f} ms/position (x{generate_reply_set_seconds / reply_set_seconds:4.2f})  count:{count_seconds * 1e3:7.3f} ms/position  total error:{total_error_rate:.3f}  same tier:{same_tier_rate:.3f}", flush=True)
+
+
+########################################
+# 詰将棋
+########################################
+
+def create_endgame_board_list(
+        number_of_games,
+        seed):
+    """駒を取る手を多めに選ぶランダムな対局で、終盤らしい局面（王手されていないもの）を作ります"""
+    random.seed(seed)
+    board_list = []
+
+    for _ in range(0, number_of_games):
+        board = cshogi.Board()
+
+        for _ in range(0, random.randint(60, 160)):
+            if board.is_game_over():
+                break
+
+            move_id_list = list(board.legal_moves)
+            capture_move_id_list = [move_id for move_id in move_id_list if cshogi.move_cap(move_id) != 0]
+
+            if 0 < len(capture_move_id_list) and random.random() < 0.7:
+                board.push(random.choice(capture_move_id_list))
+            else:
+                board.push(random.choice(move_id_list))
+
+        if not board.is_game_over() and not board.is_check():
+            board_list.append(board)
+
+    return board_list
+
+
+def bench_mate_solver():
+    """ランダムな終盤の局面で詰将棋を解き、調べる局面の数の上限ごとに、何手詰めまで解けるかと、速さを測ります。
+    cshogi の mate_move （５手詰めまで）が詰みを見つけた局面を、解き損ねた数も数える"""
+
+    board_list = create_endgame_board_list(
+            number_of_games=200,
+            seed=1)
+
+    # cshogi の探索で、５手以内の詰みがある局面
+    short_mate_index_set = set([index for (index, board) in enumerate(board_list) if board.mate_move_in_1ply() or board.mate_move(3) or board.mate_move(5)])
+
+    for max_nodes in [1000, 10000, 100000]:
+        result_count_dictionary = {'mate': 0, 'nomate': 0, 'timeout': 0}
+        mate_length_list = []
+        missed_short_mate_count = 0
+        total_nodes = 0
+
+        start = time.perf_counter()
+        for (index, board) in enumerate(board_list):
+            mate_solver = MateSolver(
+                    board=board,
+                    max_nodes=max_nodes)
+            (result_str, mate_move_id_list) = mate_solver.solve()
+            total_nodes += mate_solver.nodes
+
+            result_count_dictionary[result_str] += 1
+            if result_str == 'mate':
+                mate_length_list.append(len(mate_move_id_list))
+
+            elif index in short_mate_index_set:
+                missed_short_mate_count += 1
+
+        seconds = time.perf_counter() - start
+
+        mate_length_str = '  '.join([f"{length}手:{mate_length_list.count(length)}" for length in sorted(set(mate_length_list))])
+        print(f"[{datetime.datetime.now()}] [bench mate solver] max nodes:{max_nodes:6}  positions:{len(board_list)}  mate:{result_count_dictionary['mate']:3}  nomate:{result_count_dictionary['nomate']:3}  timeout:{result_count_dictionary['timeout']:3}  missed short mate:{missed_short_mate_count}/{len(short_mate_index_set)}  {seconds / len(board_list) * 1e3:8.3f} ms/position  {int(total_nodes / seconds)} nodes/sec", flush=True)
+        print(f"[{datetime.datetime.now()}] [bench mate solver]     mate length  {mate_length_str}", flush=True)
+
+
+########################################
+# スクリプト実行時
+########################################
+
+if __name__ == '__main__':
+    """スクリプト実行時"""
+
+    line = input('bench name?')
+
+    if line == 'load':
+        bench_load()
+
+    elif line == 'memory':
+        bench_memory()
+
+    elif line == 'access':
+        bench_access()
+
+    elif line == 'save':
+        bench_save()
+
+    elif line == 'patch':
+        bench_patch()
+
+    elif line == 'startup':
+        bench_startup()
+
+    elif line == 'codec':
+        bench_codec()
+
+    elif line == 'move_index':
+        bench_move_index()
+
+    elif line == 'usi_startup':
+        bench_usi_startup()
+
+    elif line == 'move':
+        bench_move()
+
+    elif line == 'batch':
+        bench_batch()
+
+    elif line == 'reply_set':
+        bench_reply_set()
+
+    elif line == 'mate_solver':
+        bench_mate_solver()
+
+    else:
+        print("please input bench name 'load', 'memory', 'access', 'save', 'patch', 'startup', ...")
@@ -12,12 +12,6 @@ class DebugPlan():
     evaluation_edit_weaken = False
     evaluation_edit_strengthen = False
 
-    #####
-    # G #
-    #####
-    get_number_of_connection_for_kl_kq = False
-    get_number_of_connection_for_pl_pq = False
-
     #####
     # L #
     #####
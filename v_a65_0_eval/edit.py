@@ -90,20 +90,22 @@ class EvaluationEdit():
         # 投了局面時、入玉宣言局面時、１手詰めは省略
 
         move_obj = Move.from_usi(move_u)
+        f_strict_move_id = self._kifuwarabe.board.move_from_usi(move_u)
 
-        # 自駒と敵玉に対する関係の辞書
+        # 関係が陽性の総数と、関係の総数。局面の方策を数えてあれば（ PolicyCache ）、数え直さない
+        (positive_of_relation,
+         total_of_relation) = ChoiceBestMove.get_positive_and_total_of_relation_by_policy(
+                f_strict_move_id=f_strict_move_id,
+                kifuwarabe=self._kifuwarabe)
+
+        # 自駒と敵玉に対する関係の辞書。関係を変えるのに使うので、この着手の分だけ作る
         (black_f_black_l_index_to_relation_exists_dictionary,
          # 自駒と敵兵に対する関係の辞書
          black_f_black_q_index_to_relation_exists_dictionary,
          # 玉の指し手か？
-         is_king_move,
-         # 関係が陽性の総数
-         positive_of_relation,
-         # 関係の総数
-         total_of_relation) = ChoiceBestMove.get_summary(
-                f_strict_move_obj=move_obj,
-                kifuwarabe=self._kifuwarabe,
-                is_debug=is_debug)
+         is_king_move) = ChoiceBestMove.get_relation_exists_dictionary_tuple(
+                f_strict_move_id=f_strict_move_id,
+                kifuwarabe=self._kifuwarabe)
 
         # assert: 与えた着手が変わってないか調べる
         if is_king_move:
@@ -506,20 +508,22 @@ class EvaluationEdit():
         # 投了局面時、入玉宣言局面時、１手詰めは省略
 
         move_obj = Move.from_usi(move_u)
+        f_strict_move_id = self._kifuwarabe.board.move_from_usi(move_u)
+
+        # 関係が陽性の総数と、関係の総数。局面の方策を数えてあれば（ PolicyCache ）、数え直さない
+        (positive_of_relation,
+         total_of_relation) = ChoiceBestMove.get_positive_and_total_of_relation_by_policy(
+                f_strict_move_id=f_strict_move_id,
+                kifuwarabe=self._kifuwarabe)
 
-        # 自駒と敵玉に対する関係の辞書
+        # 自駒と敵玉に対する関係の辞書。関係を変えるのに使うので、この着手の分だけ作る
         (black_f_black_l_index_to_relation_exists_dictionary,
          # 自駒と敵兵に対する関係の辞書
          black_f_black_q_index_to_relation_exists_dictionary,
          # 玉の指し手か？
-         is_king_move,
-         # 関係が陽性の総数
-         positive_of_relation,
-         # 関係の総数
-         total_of_relation) = ChoiceBestMove.get_summary(
-                f_strict_move_obj=move_obj,
-                kifuwarabe=self._kifuwarabe,
-                is_debug=is_debug)
+         is_king_move) = ChoiceBestMove.get_relation_exists_dictionary_tuple(
+                f_strict_move_id=f_strict_move_id,
+                kifuwarabe=self._kifuwarabe)
 
         # assert: 与えた着手が変わってないか調べる
         if is_king_move:
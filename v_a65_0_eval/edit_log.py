@@ -0,0 +1,242 @@
+import os
+import datetime
+import struct
+import zlib
+
+from v_a65_0_eval.table_header import EvaluationTableHeader
+from v_a65_0_misc.lib import FileName, Turn
+
+
+class EvaluationEditLog():
+    """評価値テーブルの編集ログ
+
+    weaken, strengthen で変えたビットを、１件５バイトのレコードとしてファイルの末尾へ追記していく。
+    評価値テーブル・ファイル全体を書き直すのはチェックポイントのときだけにして、そのときにログを空にする。
+    読込時は、チェックポイントの評価値テーブル・ファイルを読んでから、ログを先頭から再生する
+
+    レコードの形式
+
+        1 byte : (テーブル番号 << 2) | (手番インデックス << 1) | ビット。テーブル番号は EvaluationTableHeader と同じ
+        4 bytes : ビットのインデックス（リトルエンディアン）
+
+    レコードは「そのビットを何にしたか」なので、同じログを何回再生しても結果は同じ
+    """
+
+
+    _record_format = '<BI'
+    """レコードの形式"""
+
+    _record_size = struct.calcsize(_record_format)
+    """レコードのバイト数"""
+
+
+    def __init__(
+            self,
+            engine_version_str,
+            is_writable):
+        """初期化
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジンのバージョン
+        is_writable : bool
+            真なら、ログへ追記し、チェックポイントでログを空にする（学習部）。
+            偽なら、ログを再生するだけ（対局中のエンジン）
+        """
+        self._file_name_obj = FileName(
+                file_stem=f'data[{engine_version_str}]_n1_eval_edit_log',
+                file_extension='.bin')
+        self._is_writable = is_writable
+
+        # 追記用に開いたファイル
+        self._append_file = None
+
+
+    @property
+    def file_name_obj(self):
+        """ファイル名オブジェクト"""
+        return self._file_name_obj
+
+
+    @property
+    def is_writable(self):
+        """ログへ追記するなら真"""
+        return self._is_writable
+
+
+    def get_replay_identity(
+            self,
+            kind,
+            turn):
+        """指定の評価値テーブルについて、再生するレコードの素性。読み込んだ後に、他のプロセスがそのテーブルのレコードを追記したか調べるのに使う
+
+        他のテーブルのレコードの追記や、チェックポイントでログを空にしたことでは変わらない。
+        追記する側では、ログの中身はメモリー上の評価値テーブルに反映済みなので、常に None
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+
+        Returns
+        -------
+        replay_identity : tuple
+            （レコード数、それらのレコードの CRC-32 ）
+        """
+        if self._is_writable:
+            return None
+
+        record_list = self.get_record_list_of_table(
+                kind=kind,
+                turn=turn)
+
+        return (len(record_list), zlib.crc32(struct.pack(f'<{len(record_list) * 2}I', *[value for record in record_list for value in record])))
+
+
+    def append(
+            self,
+            kind,
+            turn,
+            index,
+            bit):
+        """ビットを変えたことをログへ追記します
+
+        プロセスが落ちても失わないよう、１件ごとにＯＳへ渡します
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+        index : int
+            ビットのインデックス
+        bit : int
+            0 か 1
+        """
+        if not self._is_writable:
+            raise ValueError(f"[evaluation edit log > append] read only edit log. file:`{self._file_name_obj.base_name}`")
+
+        if self._append_file is None:
+            self._append_file = open(self._file_name_obj.base_name, 'ab')
+
+            # 書きかけのレコードが末尾に残っていれば切り捨てる。そのまま追記すると、以降のレコードがずれる
+            file_size = self._append_file.tell()
+            if file_size % EvaluationEditLog._record_size != 0:
+                self._append_file.truncate(file_size - file_size % EvaluationEditLog._record_size)
+
+        self._append_file.write(struct.pack(
+                EvaluationEditLog._record_format,
+                (EvaluationTableHeader.to_table_id(kind) << 2) | (Turn.to_index(turn) << 1) | bit,
+                index))
+        self._append_file.flush()
+
+
+    def read_record_list(self):
+        """ログの全てのレコードを読み込みます
+
+        Returns
+        -------
+        record_list : list<(int, int, int, int)>
+            （テーブル番号、手番インデックス、ビットのインデックス、ビット）のリスト。
+            末尾の書きかけのレコードは含まない
+        """
+        if not os.path.isfile(self._file_name_obj.base_name):
+            return []
+
+        with open(self._file_name_obj.base_name, 'rb') as f:
+            log_binary = f.read()
+
+        # 書きかけのレコードは読まない
+        log_binary = log_binary[:len(log_binary) - len(log_binary) % EvaluationEditLog._record_size]
+
+        return [(header >> 2, (header >> 1) & 1, index, header & 1)
+                for (header, index) in struct.iter_unpack(EvaluationEditLog._record_format, log_binary)]
+
+
+    def get_record_list_of_table(
+            self,
+            kind,
+            turn):
+        """ログの中の、指定の評価値テーブルのレコードを読み込みます
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+
+        Returns
+        -------
+        record_list : list<(int, int)>
+            （ビットのインデックス、ビット）のリスト
+        """
+        table_id = EvaluationTableHeader.to_table_id(kind)
+        turn_index = Turn.to_index(turn)
+
+        return [(index, bit) for (record_table_id, record_turn_index, index, bit) in self.read_record_list()
+                if record_table_id == table_id and record_turn_index == turn_index]
+
+
+    def replay(
+            self,
+            kind,
+            turn,
+            mm_table_obj):
+        """ログの中の、指定の評価値テーブルのレコードを再生します
+
+        追記する側（学習部）では、再生した変更は次のチェックポイントで保存されるよう、変更として記録します。
+        再生するだけの側（対局中のエンジン）では、メモリー上の評価値テーブルだけに反映して、ファイルへは保存しません
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+        mm_table_obj : EvalutionMmTable
+            評価値テーブル
+
+        Returns
+        -------
+        number_of_records : int
+            再生したレコード数
+        """
+        record_list = self.get_record_list_of_table(
+                kind=kind,
+                turn=turn)
+
+        if len(record_list) < 1:
+            return 0
+
+        for (index, bit) in record_list:
+            if self._is_writable:
+                mm_table_obj.set_bit_by_index(index, bit)
+            else:
+                mm_table_obj.overlay_bit_by_index(index, bit)
+
+        print(f"[{datetime.datetime.now()}] replayed `{self._file_name_obj.base_name}` file. kind:{kind}  turn:{Turn.to_string(turn)}  records:{len(record_list)}", flush=True)
+        return len(record_list)
+
+
+    def checkpoint(self):
+        """全ての評価値テーブル・ファイルを保存し終えたので、ログを空にします
+
+        評価値テーブル・ファイルの保存が途中で止まっても、ログが残っていれば次の読込で再生される
+        """
+        if not self._is_writable:
+            raise ValueError(f"[evaluation edit log > checkpoint] read only edit log. file:`{self._file_name_obj.base_name}`")
+
+        if self._append_file is not None:
+            self._append_file.close()
+            self._append_file = None
+
+        with open(self._file_name_obj.base_name, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+        print(f"[{datetime.datetime.now()}] checkpoint `{self._file_name_obj.base_name}` file. log cleared", flush=True)
@@ -1,3 +1,4 @@
+import numpy as np
 from decimal import Decimal, ROUND_HALF_UP
 
 from v_a65_0_debug_plan import DebugPlan
@@ -107,3 +108,38 @@ class EvaluationFacade():
             print(f"[choice best move]  ranking_th:{ranking_th}  positive_of_relation:{positive_of_relation}  total_of_relation:{total_of_relation}  policy_rate:{policy_rate}  policy_rate_rev:{policy_rate_rev}  ranking_resolution_threshold:{ranking_resolution_threshold}")
 
         return (ranking_th, policy_rate)
+
+
+    @staticmethod
+    def get_tier_th_array(
+            positive_of_relation_array,
+            total_of_relation_array,
+            tier_resolution):
+        """好手悪手の階位を、着手の配列でまとめて求めます。
+        get_tier_th() と同じ浮動小数点数の計算を numpy で行うので、階位は１つずつ求めたものと一致する
+
+        positive_of_relation_array : numpy.ndarray
+            挙手数の配列
+        total_of_relation_array : numpy.ndarray
+            議席数の配列
+        tier_resolution : int
+            階位の階数
+
+        Returns
+        -------
+        ranking_th_array : numpy.ndarray
+            階位の配列
+        policy_rate_array : numpy.ndarray
+            ポリシー率の配列
+        """
+
+        # ポリシー率。議席数が０なら 1.0 （０で割らないように、議席数は１以上にしてから割る）
+        policy_rate_array = np.where(
+                0 < total_of_relation_array,
+                positive_of_relation_array / np.maximum(total_of_relation_array, 1),
+                1.0)
+
+        # 補ポリシー率を解像度で切り捨て除算したものが階位
+        ranking_th_array = ((1 - policy_rate_array) // (1 / tier_resolution)).astype(np.int64)
+
+        return (ranking_th_array, policy_rate_array)
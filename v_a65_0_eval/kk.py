@@ -1,13 +1,10 @@
-import os
-import datetime
-
-from v_a65_0_eval.lib import EvaluationLib
 from v_a65_0_eval.k import EvaluationKMove
-from v_a65_0_misc.lib import FileName, Turn, Move, EvalutionMmTable
+from v_a65_0_eval.table_base import EvaluationTableBase
+from v_a65_0_misc.lib import Move
 from v_a65_0_misc.sub_usi import SubUsi
 
 
-class EvaluationKkTable():
+class EvaluationKkTable(EvaluationTableBase):
     """ＫＫ評価値テーブル"""
 
 
@@ -106,83 +103,22 @@ class EvaluationKkTable():
 
     def __init__(
             self,
-            engine_version_str):
+            engine_version_str,
+            table_mode='memory',
+            edit_log_obj=None,
+            codec='raw'):
         """初期化
 
-        Parameters
-        ----------
-        engine_version_str : str
-            将棋エンジンのバージョン
-        """
-        self._engine_version_str = engine_version_str
-        self._mm_table_obj = None
-
-
-    @property
-    def mm_table_obj(self):
-        """評価値テーブル"""
-        return self._mm_table_obj
-
-
-    def load_on_usinewgame(
-            self,
-            turn):
-        """ＫＫ評価値テーブル読込
-
-        Parameters
-        ----------
-        turn : int
-            手番
-        """
-        file_name_obj = FileName(
-                file_stem=f'data[{self._engine_version_str}]_n1_eval_kk_{Turn.to_string(turn)}',
-                file_extension='.bin'
-        )
-
-        print(f"[{datetime.datetime.now()}] check  `{file_name_obj.base_name}` file exists...", flush=True)
-        is_file_exists = os.path.isfile(file_name_obj.base_name)
-
-        if is_file_exists:
-            # 読込
-            table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(
-                    file_name_obj=file_name_obj)
-        else:
-            table_as_array = None
-
-
-        # ファイルが存在しないとき
-        if table_as_array is None:
-            table_as_array = EvaluationLib.create_random_evaluation_table_as_array(
-                    a_move_size=EvaluationKMove.get_serial_number_size(),
-                    b_move_size=EvaluationKMove.get_serial_number_size())
-            is_file_modified = True     # 新規作成だから
-
-        else:
-            is_file_modified = False
-
-
-        self._mm_table_obj = EvalutionMmTable(
-                file_name_obj=file_name_obj,
-                table_as_array=table_as_array,
-                is_file_modified=is_file_modified)
-
-
-    def save_kk_evaluation_table_file(
-            self,
-            is_debug=False):
-        """ファイルへの保存
-
-        Parameters
-        ----------
-        is_debug : bool
-            デバッグモードか？
-
-        保存するかどうかは先に判定しておくこと
+        引数は EvaluationTableBase.__init__() を参照
         """
-        EvaluationLib.save_evaluation_table_file(
-                file_name_obj=self.mm_table_obj.file_name_obj,
-                table_as_array=self.mm_table_obj.table_as_array,
-                is_debug=is_debug)
+        super().__init__(
+                kind='kk',
+                a_move_size=EvaluationKMove.get_serial_number_size(),
+                b_move_size=EvaluationKMove.get_serial_number_size(),
+                engine_version_str=engine_version_str,
+                table_mode=table_mode,
+                edit_log_obj=edit_log_obj,
+                codec=codec)
 
 
     def get_relation_exists_by_index(
@@ -204,6 +140,25 @@ class EvaluationKkTable():
                 index=k_blackright_l_blackright_index)
 
 
+    def get_relation_exists_array_by_index_array(
+            self,
+            k_blackright_l_blackright_index_array):
+        """配列のインデックスの配列を受け取って、関係の有無の配列を返します
+
+        Parameters
+        ----------
+        k_blackright_l_blackright_index_array : numpy.ndarray
+            配列のインデックスの配列
+
+        Returns
+        -------
+        bit_array : numpy.ndarray
+            0 か 1 の配列
+        """
+        return self._mm_table_obj.get_bits_by_index_array(
+                index_array=k_blackright_l_blackright_index_array)
+
+
     #set_relation_exsits_by_kl_moves
     def set_relation_exsits_by_black_k_black_l_moves(
             self,
@@ -237,51 +192,20 @@ class EvaluationKkTable():
         if SubUsi.is_drop_by_srcloc(l_blackright_move_obj.srcloc):
             raise ValueError(f"[evaluation kk table > set relation exists by kl moves > l] 玉の指し手で打なのはおかしい。 black_l_move_obj.srcloc_u:{SubUsi.srcloc_to_code(l_blackright_move_obj.srcloc)}  black_l_move_obj:{l_blackright_move_obj.dump()}")
 
+        f_blackright_o_blackright_index = EvaluationKkTable.get_black_k_black_l_index(
+                k_blackright_move_obj=k_blackright_move_obj,
+                l_blackright_move_obj=l_blackright_move_obj)
+
         (is_changed, result_comment) = self._mm_table_obj.set_bit_by_index(
-                f_blackright_o_blackright_index=EvaluationKkTable.get_black_k_black_l_index(
-                        k_blackright_move_obj=k_blackright_move_obj,
-                        l_blackright_move_obj=l_blackright_move_obj),
+                f_blackright_o_blackright_index=f_blackright_o_blackright_index,
                 bit=bit)
 
-        return (is_changed, result_comment)
-
+        # 変更したら、編集ログへ追記する
+        if is_changed and self._edit_log_obj is not None and self._edit_log_obj.is_writable:
+            self._edit_log_obj.append(
+                    kind='kk',
+                    turn=self._turn,
+                    index=f_blackright_o_blackright_index,
+                    bit=bit)
 
-    #create_relation_exists_dictionary_by_k_move_and_l_moves
-    #select_kl_index_and_relation_exists
-    def select_k_blackright_l_blackright_index_and_relation_exists(
-            self,
-            k_blackright_move_obj,
-            l_blackright_move_u_set):
-        """自玉の指し手と、敵玉の応手のリストを受け取ると、すべての関係の有無を辞書に入れて返します
-        ＫＫ評価値テーブル用
-
-        Parameters
-        ----------
-        k_blackright_move_obj : Move
-            自玉の着手（先手視点、右辺使用）
-        l_blackright_move_u_set : List<str>
-            敵玉の応手のリスト（先手視点、右辺使用）
-
-        Returns
-        -------
-        - relations : Dictionary<int, int>
-            キー：　ＫＫ評価値テーブルのインデックス
-            値　：　関係の有無
-        """
-
-        relations = {}
-
-        for l_blackright_move_u in l_blackright_move_u_set:
-
-            l_blackright_move_obj = Move.from_usi(l_blackright_move_u)
-
-            k_blackright_l_blackright_index = EvaluationKkTable.get_black_k_black_l_index(
-                    k_blackright_move_obj=k_blackright_move_obj,
-                    l_blackright_move_obj=l_blackright_move_obj)
-
-            relation_bit = self.get_relation_exists_by_index(
-                    k_blackright_l_blackright_index=k_blackright_l_blackright_index)
-
-            relations[k_blackright_l_blackright_index] = relation_bit
-
-        return relations
+        return (is_changed, result_comment)
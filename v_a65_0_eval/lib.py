@@ -1,72 +1,507 @@
 import os
+import contextlib
 import datetime
+import lzma
+import mmap
 import random
+import struct
 import time
+import zlib
+
+from v_a65_0_eval.table_header import EvaluationTableHeader
 
 
 class EvaluationLib():
     """評価関数テーブル用ライブラリー"""
 
 
+    stream_chunk_size = 1024 * 1024
+    """圧縮、展開のときに１回に扱うバイト数。メモリーの使用量を、評価値テーブル１つ分＋このくらいに抑える"""
+
+    stale_lock_seconds = 600.0
+    """これより古いロック・ファイルは、書き換えの途中で止まったプロセスの残りとみなして消す"""
+
+
     @staticmethod
     def read_evaluation_table_as_array_from_file(
-            file_name_obj):
+            file_name_obj,
+            header_obj,
+            table_mode='memory',
+            is_journal_recovery=False):
         """評価値テーブル・ファイルの読込
 
+        ファイルのヘッダーが、読みたい評価値テーブルのものか確かめてから読み込み、本体の CRC-32 も確かめる。
+        ヘッダーの無い旧形式のファイルは、大きさだけ確かめる
+
+        本体の符号化はファイルのヘッダーに従い、 header_obj の codec もそれに合わせる（次の保存で同じ符号化を使うため）。
+        圧縮したファイルはメモリーマップできないので、 table_mode によらずメモリーへ展開する
+
         Parameters
         ----------
         file_name_obj : FileName
             ファイル名オブジェクト
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー。種類、手番、指し手Ａ、Ｂのサイズを確かめるのに使う。
+            ヘッダーのあるファイルなら、 codec をファイルの符号化に書き換える
+        table_mode : str
+            'memory' - ファイル全体をメモリーに読み込む
+            'mmap_read' - ファイルを読取専用でメモリーマップする。書込はできない
+            'mmap_copy' - ファイルを書込時コピーでメモリーマップする。書込はこのプロセスの中だけに反映され、ファイルは変わらない
+            'shared_read', 'shared_write' - 評価値テーブル・サーバーの共有メモリーにつなげなかったときに、ここへ来る。
+                それぞれ 'mmap_read', 'mmap_copy' として読む
+        is_journal_recovery : bool
+            真なら、前回の上書き保存が途中で止まって残ったジャーナルを、読む前にファイルへ反映する。
+            ファイルを書き換えるプロセス（学習部など）だけが真にすること。
+            読むだけのプロセスは、ファイルは変えず、読み込んだ中身にだけジャーナルを当てる（メモリーマップせずにメモリーへ読む）
+
+        Returns
+        -------
+        table_as_array : bytearray or memoryview
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）。メモリーマップしたときは、その本体部分の memoryview
         """
 
-        # ロードする。数分ほどかかる
-        print(f"[{datetime.datetime.now()}] read   `{file_name_obj.base_name}` file ...", flush=True)
+        if table_mode not in ['memory', 'mmap_read', 'mmap_copy', 'shared_read', 'shared_write']:
+            raise ValueError(f"unexpected table mode:{table_mode}")
 
-        table_as_array = []
+        # 評価値テーブル・サーバーが動いていないときは、ファイルをメモリーマップする
+        if table_mode == 'shared_read':
+            table_mode = 'mmap_read'
 
-        # 読込失敗時は、リトライを１０回は行いたい
-        max_try = 10
-        for retry in range(0,max_try):
+        elif table_mode == 'shared_write':
+            table_mode = 'mmap_copy'
 
-            try:
-                with open(file_name_obj.base_name, 'rb') as f:
+        # 保存側は変更したページをファイルへ直に上書きするので、上書きの途中を読まないように、読み終えるまでロックしておく
+        with EvaluationLib.lock_evaluation_table_file(file_name_obj):
 
-                    one_byte_binary = f.read(1)
+            # 前回の上書き保存が途中で止まっていたら、ジャーナルから続きを書く
+            if is_journal_recovery:
+                EvaluationLib.recover_evaluation_table_file_from_journal(
+                        file_name_obj=file_name_obj)
 
-                    while one_byte_binary:
-                        one_byte_num = int.from_bytes(one_byte_binary, signed=False)
+            # 読むだけのプロセスは、ファイルは書き換えず、読んだ中身にジャーナルを当てる
+            elif os.path.isfile(file_name_obj.journal_base_name):
+                page_list = EvaluationLib.read_journal_page_list(
+                        file_name_obj=file_name_obj)
 
-                        # 大きな桁から、リストに追加していきます
-                        table_as_array.append(one_byte_num//128 % 2)
-                        table_as_array.append(one_byte_num// 64 % 2)
-                        table_as_array.append(one_byte_num// 32 % 2)
-                        table_as_array.append(one_byte_num// 16 % 2)
-                        table_as_array.append(one_byte_num//  8 % 2)
-                        table_as_array.append(one_byte_num//  4 % 2)
-                        table_as_array.append(one_byte_num//  2 % 2)
-                        table_as_array.append(one_byte_num//      2)
+                if page_list is not None:
+                    return EvaluationLib.read_evaluation_table_as_array_with_journal(
+                            file_name_obj=file_name_obj,
+                            header_obj=header_obj,
+                            page_list=page_list)
 
-                        one_byte_binary = f.read(1)
+            return EvaluationLib._read_evaluation_table_as_array_from_file_locked(
+                    file_name_obj=file_name_obj,
+                    header_obj=header_obj,
+                    table_mode=table_mode)
 
-                print(f"[{datetime.datetime.now()}] loaded `{file_name_obj.base_name}` file. evaluation table size: {len(table_as_array)}", flush=True)
 
-                # リトライのループを抜ける
-                break
+    @staticmethod
+    def _read_evaluation_table_as_array_from_file_locked(
+            file_name_obj,
+            header_obj,
+            table_mode):
+        """評価値テーブル・ファイルの読込。ロックは呼び出し側で取っておくこと
 
-            # （機械学習の実行中にアクセスすると）評価値ファイルが存在しない瞬間はある
-            #FileNotFoundError
-            except Exception as ex:
+        引数と戻り値は read_evaluation_table_as_array_from_file() を参照。 table_mode は 'memory', 'mmap_read', 'mmap_copy' のいずれか
+        """
 
-                # 次にループを抜けるタイミングなら、例外を投げ上げる
-                if max_try <= retry + 1:
-                    raise
+        # ヘッダーとファイルの大きさを確かめる。すぐ終わる
+        (body_offset, file_header_obj) = EvaluationLib.verify_evaluation_table_file_header(
+                file_name_obj=file_name_obj,
+                header_obj=header_obj)
+
+        if file_header_obj is not None:
+            body_crc32 = file_header_obj.body_crc32
+            header_obj.codec = file_header_obj.codec
+
+        # ヘッダーの無い旧形式のファイルは無圧縮。 header_obj の codec は変えず、次の保存でその符号化にする
+        else:
+            body_crc32 = None
+
+        codec = 'raw' if file_header_obj is None else file_header_obj.codec
+
+        if codec != 'raw' and table_mode != 'memory':
+            print(f"[{datetime.datetime.now()}] `{file_name_obj.base_name}` file is compressed ({codec}). it cannot be mapped, so read it into memory", flush=True)
+            table_mode = 'memory'
 
-                # ３０～５９秒後にリトライする
+        if table_mode == 'memory':
+            # ロードする
+            print(f"[{datetime.datetime.now()}] read   `{file_name_obj.base_name}` file ...", flush=True)
+
+            # 保存側はファイルを os.replace() で置き換えるか、ロックしてから上書きするので、ファイルが存在しない瞬間は無い。リトライは不要
+            with open(file_name_obj.base_name, 'rb') as f:
+                f.seek(body_offset)
+
+                # １バイトずつではなく、ファイル全体を１回で読み込む
+                # ビットへは展開せず、ファイルと同じ並びのまま持つ
+                if codec == 'raw':
+                    table_as_array = bytearray(f.read())
+
+                # 圧縮したファイル全体は読み込まず、少しずつ読んでは展開する
                 else:
-                    seconds = random.randint(30,60)
-                    print(f"[{datetime.datetime.now()}] [evaluation lib > read evaluation table as array from file] failed to read `{file_name_obj.base_name}` file. wait for {seconds} seconds before retrying. ex:{ex}")
-                    time.sleep(seconds)
-                    continue
+                    table_as_array = EvaluationLib.decompress_evaluation_table_body(
+                            file_obj=f,
+                            file_name_obj=file_name_obj,
+                            codec=codec,
+                            table_size=header_obj.table_size)
+
+            print(f"[{datetime.datetime.now()}] loaded `{file_name_obj.base_name}` file. evaluation table size: {len(table_as_array) * 8}", flush=True)
+
+        else:
+            table_as_array = EvaluationLib.map_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    body_offset=body_offset,
+                    is_read_only=table_mode == 'mmap_read')
+
+        # 本体が壊れていないか、CRC-32 を確かめる
+        if body_crc32 is not None:
+            actual_crc32 = EvaluationTableHeader.compute_crc32(table_as_array)
+
+            if actual_crc32 != body_crc32:
+                if isinstance(table_as_array, memoryview):
+                    mapped_file = table_as_array.obj
+                    table_as_array.release()
+                    mapped_file.close()
+
+                raise ValueError(f"[evaluation lib > read evaluation table as array from file] `{file_name_obj.base_name}` file is broken. crc32 expected:0x{body_crc32:08x}  actual:0x{actual_crc32:08x}")
+
+        return table_as_array
+
+
+    @staticmethod
+    def get_file_identity(
+            file_name_obj):
+        """評価値テーブル・ファイルの素性。読み込んだ後にファイルが変わったか調べるのに使う
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+
+        Returns
+        -------
+        file_identity : tuple
+            （更新日時（ナノ秒）、バイト数、ヘッダーの CRC-32 ）。ヘッダーの無い旧形式のファイルなら CRC-32 は None 。
+            ファイルが無ければ None
+        """
+        try:
+            stat_result = os.stat(file_name_obj.base_name)
+
+            with open(file_name_obj.base_name, 'rb') as f:
+                head_binary = f.read(EvaluationTableHeader.header_size)
+
+        except FileNotFoundError:
+            return None
+
+        if EvaluationTableHeader.has_magic(head_binary):
+            body_crc32 = EvaluationTableHeader.from_binary(head_binary).body_crc32
+        else:
+            body_crc32 = None
+
+        return (stat_result.st_mtime_ns, stat_result.st_size, body_crc32)
+
+
+    @staticmethod
+    def is_mm_table_up_to_date(
+            mm_table_obj,
+            file_name_obj,
+            edit_log_obj):
+        """読み込んだ後に、ファイルも編集ログも変わっておらず、メモリー上に未保存の変更も無ければ真。読み直さなくてよい
+
+        Parameters
+        ----------
+        mm_table_obj : EvalutionMmTable
+            読み込んである評価値テーブル。まだ読み込んでいなければ None
+        file_name_obj : FileName
+            これから読み込むファイル名オブジェクト
+        edit_log_obj : EvaluationEditLog
+            編集ログ。使わないなら None
+        """
+        if mm_table_obj is None or mm_table_obj.is_file_modified:
+            return False
+
+        if mm_table_obj.file_name_obj.base_name != file_name_obj.base_name:
+            return False
+
+        # 評価値テーブル・サーバーの共有メモリーなら、学習部の変更がそのまま見えているので、読み直さなくてよい
+        if mm_table_obj.is_shared:
+            return True
+
+        # 手続き的に生成する評価値テーブルは、上書きのファイルを見る
+        if mm_table_obj.is_procedural:
+            file_name_obj = mm_table_obj.sparse_file_name_obj
+
+        if mm_table_obj.file_identity is None:
+            return False
+
+        if edit_log_obj is None:
+            edit_log_identity = None
+        else:
+            edit_log_identity = edit_log_obj.get_replay_identity(
+                    kind=mm_table_obj.header_obj.kind,
+                    turn=mm_table_obj.header_obj.turn)
+
+        return (mm_table_obj.file_identity == EvaluationLib.get_file_identity(file_name_obj)
+                and mm_table_obj.edit_log_identity == edit_log_identity)
+
+
+    @staticmethod
+    def read_evaluation_table_as_array_with_journal(
+            file_name_obj,
+            header_obj,
+            page_list):
+        """上書きの途中で止まったファイルを、メモリーへ読み込んでからジャーナルを当てます。ファイルは変えません
+
+        ジャーナルは無圧縮のファイルにしか作らないので、ヘッダーも本体もファイル上の位置のまま当てられる
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー
+        page_list : list<(int, bytes)>
+            ジャーナルの（ファイル先頭からの位置、中身）のリスト
+
+        Returns
+        -------
+        table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）
+        """
+        print(f"[{datetime.datetime.now()}] read   `{file_name_obj.base_name}` file with `{file_name_obj.journal_base_name}` file. the file is left to the writer ...", flush=True)
+
+        with open(file_name_obj.base_name, 'rb') as f:
+            file_binary = bytearray(f.read())
+
+        for (offset, page_binary) in page_list:
+            file_binary[offset:offset + len(page_binary)] = page_binary
+
+        (body_offset, file_header_obj) = EvaluationLib.verify_evaluation_table_head_binary(
+                file_name_obj=file_name_obj,
+                header_obj=header_obj,
+                head_binary=file_binary[:EvaluationTableHeader.header_size],
+                file_size=len(file_binary))
+
+        table_as_array = file_binary[body_offset:]
+
+        if file_header_obj is None or file_header_obj.codec != 'raw' or EvaluationTableHeader.compute_crc32(table_as_array) != file_header_obj.body_crc32:
+            raise ValueError(f"[evaluation lib > read evaluation table as array with journal] `{file_name_obj.base_name}` file is broken even with `{file_name_obj.journal_base_name}` file")
+
+        header_obj.codec = file_header_obj.codec
+
+        print(f"[{datetime.datetime.now()}] loaded `{file_name_obj.base_name}` file. evaluation table size: {len(table_as_array) * 8}  journal pages:{len(page_list)}", flush=True)
+        return table_as_array
+
+
+    @staticmethod
+    def verify_evaluation_table_file_header(
+            file_name_obj,
+            header_obj):
+        """評価値テーブル・ファイルのヘッダーと大きさを確かめます
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー
+
+        Returns
+        -------
+        body_offset : int
+            ファイルの先頭から本体までのバイト数
+        file_header_obj : EvaluationTableHeader
+            ファイルから読んだヘッダー。ヘッダーの無い旧形式のファイルなら None
+        """
+        file_size = os.path.getsize(file_name_obj.base_name)
+
+        with open(file_name_obj.base_name, 'rb') as f:
+            head_binary = f.read(EvaluationTableHeader.header_size)
+
+        return EvaluationLib.verify_evaluation_table_head_binary(
+                file_name_obj=file_name_obj,
+                header_obj=header_obj,
+                head_binary=head_binary,
+                file_size=file_size)
+
+
+    @staticmethod
+    def verify_evaluation_table_head_binary(
+            file_name_obj,
+            header_obj,
+            head_binary,
+            file_size):
+        """ファイルの先頭のバイト列と、ファイルの大きさから、ヘッダーと大きさを確かめます
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト。エラーメッセージに使う
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー
+        head_binary : bytes
+            ファイルの先頭 header_size バイト
+        file_size : int
+            ファイルの大きさ
+
+        Returns
+        -------
+        body_offset : int
+            ファイルの先頭から本体までのバイト数
+        file_header_obj : EvaluationTableHeader
+            ファイルから読んだヘッダー。ヘッダーの無い旧形式のファイルなら None
+        """
+
+        # ヘッダーの無い旧形式のファイル。大きさしか確かめられない
+        if not EvaluationTableHeader.has_magic(head_binary):
+            if file_size != header_obj.table_size:
+                raise ValueError(f"[evaluation lib > verify evaluation table file header] `{file_name_obj.base_name}` file has no header and unexpected size. expected:{header_obj.table_size}  actual:{file_size}")
+
+            print(f"[{datetime.datetime.now()}] `{file_name_obj.base_name}` file has no header (legacy format). it will have a header when saved next time", flush=True)
+            return (0, None)
+
+        file_header_obj = EvaluationTableHeader.from_binary(head_binary)
+
+        header_obj.verify(
+                actual_header_obj=file_header_obj,
+                file_name_obj=file_name_obj)
+
+        # 圧縮していれば、本体の大きさは展開してみるまで分からない
+        if (file_header_obj.codec == 'raw' and file_header_obj.body_size != header_obj.table_size) or file_size != EvaluationTableHeader.header_size + file_header_obj.body_size:
+            raise ValueError(f"[evaluation lib > verify evaluation table file header] `{file_name_obj.base_name}` file is broken. codec:{file_header_obj.codec}  body size expected:{header_obj.table_size}  header:{file_header_obj.body_size}  file size:{file_size}")
+
+        return (EvaluationTableHeader.header_size, file_header_obj)
+
+
+    @staticmethod
+    def create_compressor(
+            codec):
+        """本体を少しずつ圧縮するオブジェクトを作ります
+
+        Parameters
+        ----------
+        codec : str
+            'zlib', 'lzma'
+        """
+        if codec == 'zlib':
+            return zlib.compressobj()
+
+        if codec == 'lzma':
+            return lzma.LZMACompressor()
+
+        raise ValueError(f"[evaluation lib > create compressor] unexpected codec:{codec}")
+
+
+    @staticmethod
+    def create_decompressor(
+            codec):
+        """本体を少しずつ展開するオブジェクトを作ります
+
+        Parameters
+        ----------
+        codec : str
+            'zlib', 'lzma'
+        """
+        if codec == 'zlib':
+            return zlib.decompressobj()
+
+        if codec == 'lzma':
+            return lzma.LZMADecompressor()
+
+        raise ValueError(f"[evaluation lib > create decompressor] unexpected codec:{codec}")
+
+
+    @staticmethod
+    def decompress_evaluation_table_body(
+            file_obj,
+            file_name_obj,
+            codec,
+            table_size):
+        """圧縮した本体を、ファイルから少しずつ読みながら展開します
+
+        Parameters
+        ----------
+        file_obj : file
+            本体の先頭まで読み進めたファイル
+        file_name_obj : FileName
+            ファイル名オブジェクト。エラー・メッセージ用
+        codec : str
+            'zlib', 'lzma'
+        table_size : int
+            展開後のバイト数
+
+        Returns
+        -------
+        table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）
+        """
+        table_as_array = bytearray(table_size)
+        position = 0
+        decompressor = EvaluationLib.create_decompressor(codec)
+
+        try:
+            while True:
+                compressed_binary = file_obj.read(EvaluationLib.stream_chunk_size)
+                if not compressed_binary:
+                    break
+
+                piece = decompressor.decompress(compressed_binary)
+
+                if table_size < position + len(piece):
+                    raise ValueError(f"[evaluation lib > decompress evaluation table body] `{file_name_obj.base_name}` file is broken. body is larger than {table_size} bytes")
+
+                table_as_array[position:position + len(piece)] = piece
+                position += len(piece)
+
+        except (zlib.error, lzma.LZMAError) as ex:
+            raise ValueError(f"[evaluation lib > decompress evaluation table body] `{file_name_obj.base_name}` file is broken. codec:{codec}  ex:{ex}") from ex
+
+        if not decompressor.eof or position != table_size:
+            raise ValueError(f"[evaluation lib > decompress evaluation table body] `{file_name_obj.base_name}` file is broken. codec:{codec}  body size expected:{table_size}  actual:{position}  end of stream:{decompressor.eof}")
+
+        return table_as_array
+
+
+    @staticmethod
+    def map_evaluation_table_file(
+            file_name_obj,
+            body_offset,
+            is_read_only):
+        """評価値テーブル・ファイルをメモリーマップする
+
+        ファイルの中身はプロセスへコピーせず、ＯＳのページキャッシュを複数のプロセスで共有する
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        body_offset : int
+            ファイルの先頭から本体までのバイト数
+        is_read_only : bool
+            真なら読取専用。偽なら書込時コピー（書込はファイルへ反映しない）
+
+        Returns
+        -------
+        table_as_array : memoryview
+            メモリーマップの本体部分。１ビットを１関係として詰めたバイト列（ビッグエンディアン）。
+            マップは table_as_array.obj
+        """
+
+        if is_read_only:
+            access = mmap.ACCESS_READ
+        else:
+            access = mmap.ACCESS_COPY
+
+        print(f"[{datetime.datetime.now()}] map    `{file_name_obj.base_name}` file ...", flush=True)
+
+        # マップした後はファイルを閉じてもよい
+        with open(file_name_obj.base_name, 'rb') as f:
+            mapped_file = mmap.mmap(f.fileno(), 0, access=access)
+
+        # マップの開始位置はページの境界でなければいけないので、ファイル全体をマップして、ヘッダーの後ろを切り出す
+        table_as_array = memoryview(mapped_file)[body_offset:]
+
+        print(f"[{datetime.datetime.now()}] mapped `{file_name_obj.base_name}` file. evaluation table size: {len(table_as_array) * 8}  read only:{is_read_only}", flush=True)
 
         return table_as_array
 
@@ -83,18 +518,20 @@ class EvaluationLib():
             指し手Ａのサイズ
         b_move_size : int
             指し手Ｂのサイズ
+
+        Returns
+        -------
+        new_table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）。末端の１バイトに余りのビットを含む
         """
 
-        # ダミーデータを入れる。１分ほどかかる
+        # ダミーデータを入れる
         print(f"[{datetime.datetime.now()}] make random evaluation table in memory... (a_move_size:{a_move_size} b_move_size:{b_move_size})", flush=True)
 
-        new_table_as_array = []
-
-        for _index in range(0, a_move_size * b_move_size):
-            # 値は 0, 1 の２値
-            new_table_as_array.append(random.randint(0,1))
+        # 値は 0, 1 の２値なので、ランダムなバイト列で８関係ずつ埋める
+        new_table_as_array = bytearray(random.randbytes((a_move_size * b_move_size + 7) // 8))
 
-        print(f"[{datetime.datetime.now()}] random evaluation table maked in memory. (size:{len(new_table_as_array)})", flush=True)
+        print(f"[{datetime.datetime.now()}] random evaluation table maked in memory. (size:{len(new_table_as_array) * 8})", flush=True)
         return new_table_as_array
 
 
@@ -102,17 +539,22 @@ class EvaluationLib():
     def save_evaluation_table_file(
             file_name_obj,
             table_as_array,
+            header_obj,
             is_debug=False):
         """ファイルへ保存します
 
+        本体の符号化は header_obj の codec に従う。圧縮するときは、少しずつ圧縮しては書き出す
+
         保存するかどうかは先に判定しておくこと
 
         Parameters
         ----------
         file_name_obj : FileName
             ファイル名オブジェクト
-        table_as_array : []
-            配列
+        table_as_array : bytearray or memoryview
+            １ビットを１関係として詰めたバイト列
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
         is_debug : bool
             デバッグモードか？
         """
@@ -120,71 +562,509 @@ class EvaluationLib():
         if is_debug:
             print(f"[{datetime.datetime.now()}] save {file_name_obj.temporary_base_name} file ...", flush=True)
 
+        # 他のプロセスの上書き保存や読込と重ならないように、ロックしてから書く
+        with EvaluationLib.lock_evaluation_table_file(file_name_obj):
+            EvaluationLib.write_evaluation_table_file_and_replace(
+                    file_name_obj=file_name_obj,
+                    table_as_array=table_as_array,
+                    header_obj=header_obj,
+                    is_debug=is_debug)
+
+
+    @staticmethod
+    def write_evaluation_table_file_and_replace(
+            file_name_obj,
+            table_as_array,
+            header_obj,
+            is_debug=False):
+        """一時ファイルへ書き出してから、ファイルを置き換えます。ロックは呼び出し側で取っておくこと
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        table_as_array : bytearray or memoryview
+            １ビットを１関係として詰めたバイト列
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        is_debug : bool
+            デバッグモードか？
+        """
+
         # ファイルにバイナリ形式で出力する
         with open(file_name_obj.temporary_base_name, 'wb') as f:
 
-            length = 0
-            sum = 0
+            # 既にバイト列に詰めてあるので、ヘッダーの後ろに１回で書き出す
+            if header_obj.codec == 'raw':
+                f.write(header_obj.to_binary(
+                        body_size=len(table_as_array),
+                        body_crc32=EvaluationTableHeader.compute_crc32(table_as_array)))
+                f.write(table_as_array)
 
-            for bit in table_as_array:
-                if bit==0:
-                    # byte型配列に変換して書き込む
-                    # 1 byte の数 0
-                    sum *= 2
-                    sum += 0
-                    length += 1
-                else:
-                    # 1 byte の数 1
-                    sum *= 2
-                    sum += 1
-                    length += 1
-
-                if 8 <= length:
-                    # 整数型を、１バイトのバイナリーに変更
-                    f.write(sum.to_bytes(1))
-                    sum = 0
-                    length = 0
-
-            # 末端にはみ出た１バイト
-            if 0 < length and length < 8:
-                while length < 8:
-                    sum *= 2
-                    length += 1
-
-                f.write(sum.to_bytes(1))
-
-        # 読込失敗時は、リトライを１０回は行いたい
+            # 圧縮後の大きさは書き終えるまで分からないので、ヘッダーの場所を空けておき、最後に書く
+            else:
+                f.write(bytes(EvaluationTableHeader.header_size))
+
+                body_size = 0
+                compressor = EvaluationLib.create_compressor(header_obj.codec)
+
+                with memoryview(table_as_array) as view:
+                    for offset in range(0, len(view), EvaluationLib.stream_chunk_size):
+                        body_size += f.write(compressor.compress(view[offset:offset + EvaluationLib.stream_chunk_size]))
+
+                body_size += f.write(compressor.flush())
+
+                f.seek(0)
+                f.write(header_obj.to_binary(
+                        body_size=body_size,
+                        body_crc32=EvaluationTableHeader.compute_crc32(table_as_array)))
+
+            # 置き換える前に、中身をディスクまで書き出しておく
+            f.flush()
+            os.fsync(f.fileno())
+
+        EvaluationLib.replace_evaluation_table_file_with_temporary_file(
+                file_name_obj=file_name_obj,
+                is_debug=is_debug)
+
+
+    @staticmethod
+    def replace_evaluation_table_file_with_temporary_file(
+            file_name_obj,
+            is_debug=False):
+        """書き終えた一時ファイルで、ファイルを置き換えます
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        is_debug : bool
+            デバッグモードか？
+        """
+        if is_debug:
+            print(f"[{datetime.datetime.now()}] replace {file_name_obj.base_name} file with {file_name_obj.temporary_base_name} file...", flush=True)
+
+        # 元のファイルを消してからリネームするのではなく、一気に置き換える。読む側からは、古いファイルか新しいファイルのどちらかが必ず見える
+        # ただし Windows では、他のプロセスが元のファイルを開いている間は置き換えられないので、少し待ってやり直す
         max_try = 10
         for retry in range(0,max_try):
 
             try:
-                if is_debug:
-                    print(f"[{datetime.datetime.now()}] remove ./{file_name_obj.base_name} file...", flush=True)
-
-                os.remove(
-                        path=f'./{file_name_obj.base_name}')
-
-            # ファイルが見つからないのは好都合なので無視します
-            except FileNotFoundError:
-                pass
+                os.replace(
+                        src=file_name_obj.temporary_base_name,
+                        dst=file_name_obj.base_name)
+                break
 
-            # ファイルが使用中かも。削除できないならリネームできないので困る
             except PermissionError as ex:
 
                 # 次にループを抜けるタイミングなら、例外を投げ上げる
                 if max_try <= retry + 1:
                     raise
 
-                # ３０～５９秒後にリトライする
+                # 0.1, 0.2, 0.3, ... 秒後にリトライする
                 else:
-                    seconds = random.randint(30,60)
-                    print(f"[{datetime.datetime.now()}] [evaluation lib > save evaluation table file] failed to remove `{file_name_obj.base_name}` file. wait for {seconds} seconds before retrying. ex:{ex}")
+                    seconds = 0.1 * (retry + 1)
+                    print(f"[{datetime.datetime.now()}] [evaluation lib > replace evaluation table file] failed to replace `{file_name_obj.base_name}` file. wait for {seconds:.1f} seconds before retrying. ex:{ex}")
                     time.sleep(seconds)
                     continue
 
+
+    @staticmethod
+    def convert_evaluation_table_file(
+            file_name_obj,
+            header_obj,
+            codec,
+            is_debug=False):
+        """評価値テーブル・ファイルの本体の符号化を変えて、保存し直します
+
+        そのファイルを読み書きしているエンジンが無いときに使うこと
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        codec : str
+            新しい符号化。 'raw', 'zlib', 'lzma'
+        is_debug : bool
+            デバッグモードか？
+
+        Returns
+        -------
+        old_codec : str
+            元の符号化。ヘッダーの無い旧形式のファイルなら 'raw'
+        """
+        # ヘッダーの無い旧形式のファイルは無圧縮。ヘッダーのあるファイルなら、読込で codec がファイルの符号化に書き換わる
+        header_obj.codec = 'raw'
+
+        table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(
+                file_name_obj=file_name_obj,
+                header_obj=header_obj,
+                is_journal_recovery=True)
+
+        old_codec = header_obj.codec
+        header_obj.codec = codec
+
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=file_name_obj,
+                table_as_array=table_as_array,
+                header_obj=header_obj,
+                is_debug=is_debug)
+
+        print(f"[{datetime.datetime.now()}] converted `{file_name_obj.base_name}` file. codec:{old_codec} --> {codec}  file size:{os.path.getsize(file_name_obj.base_name)}", flush=True)
+        return old_codec
+
+
+    @staticmethod
+    def save_mm_table(
+            mm_table_obj,
+            is_incremental=True,
+            is_debug=False):
+        """評価値テーブルをファイルへ保存します
+
+        変更したページが分かっていて、それが少なければ、そのページとヘッダーだけをファイルへ直に上書きします（書くのはキロバイト単位）。
+        そうでなければ、ファイル全体を書き出してから置き換えます。
+        どちらもロックしてから書くので、ロックを取って読む他のプロセスには、書きかけのファイルは見えない
+
+        手続き的に生成する評価値テーブルは、上書きだけを保存します
+
+        保存するかどうかは先に判定しておくこと
+
+        Parameters
+        ----------
+        mm_table_obj : EvalutionMmTable or EvaluationProceduralTable
+            評価値テーブル
+        is_incremental : bool
+            偽なら、常にファイル全体を置き換える
+        is_debug : bool
+            デバッグモードか？
+        """
+        if mm_table_obj.is_procedural:
+            mm_table_obj.save_file(
+                    is_debug=is_debug)
+            return
+
+        file_name_obj = mm_table_obj.file_name_obj
+        table_as_array = mm_table_obj.table_as_array
+        dirty_page_set = mm_table_obj.dirty_page_set
+        page_size = mm_table_obj.dirty_page_size
+
+        # 変更したページだけ上書きできるか？
+        #
+        #   ファイルとの違いが分かっていて、ファイルの大きさも変わっておらず、
+        #   上書きする量がファイルの半分に満たないとき
+        #   ヘッダーの無い旧形式のファイルは、大きさが合わないので、ファイル全体を置き換える
+        #   圧縮したファイルは、ページの位置がファイル上の位置と対応しないので、ファイル全体を置き換える
+        #
+        if (is_incremental
+                and mm_table_obj.header_obj.codec == 'raw'
+                and mm_table_obj.is_dirty_page_tracked
+                and os.path.isfile(file_name_obj.base_name)
+                and os.path.getsize(file_name_obj.base_name) == EvaluationTableHeader.header_size + len(table_as_array)
+                and len(dirty_page_set) * page_size * 2 < len(table_as_array)):
+
+            # 書込時コピーのメモリーマップのままでよい。変更したページはこのプロセスの複製で、ファイルへ書く中身と同じ
+            EvaluationLib.patch_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    table_as_array=table_as_array,
+                    header_obj=mm_table_obj.header_obj,
+                    dirty_page_set=dirty_page_set,
+                    page_size=page_size,
+                    is_debug=is_debug)
+
+        else:
+            # ファイルをメモリーマップしたままでは置き換えられないので、メモリーへ移す
+            mm_table_obj.release_file_mapping()
+
+            EvaluationLib.save_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    table_as_array=mm_table_obj.table_as_array,
+                    header_obj=mm_table_obj.header_obj,
+                    is_debug=is_debug)
+
+        # 保存した後のファイルの素性を覚えておけば、次の対局で読み直さずに済む
+        mm_table_obj.mark_as_saved(
+                file_identity=EvaluationLib.get_file_identity(file_name_obj))
+
+
+    @staticmethod
+    def patch_evaluation_table_file(
+            file_name_obj,
+            table_as_array,
+            header_obj,
+            dirty_page_set,
+            page_size,
+            is_debug=False):
+        """変更したページだけを、ファイルへ反映します
+
+        途中で止まってもやり直せるように、先に上書きする内容をジャーナル・ファイルへ書き出してから反映します。
+        ジャーナル・ファイルの書き出しの途中で止まったなら、ファイルは変わっていません
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        table_as_array : bytearray or memoryview
+            １ビットを１関係として詰めたバイト列
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー。 CRC-32 が変わるので、ヘッダーも上書きする
+        dirty_page_set : set<int>
+            変更したページの番号の集合
+        page_size : int
+            ページの大きさ（バイト）
+        is_debug : bool
+            デバッグモードか？
+        """
+
+        journal_binary = EvaluationLib.build_journal(
+                table_as_array=table_as_array,
+                header_obj=header_obj,
+                dirty_page_set=dirty_page_set,
+                page_size=page_size)
+
         if is_debug:
-            print(f"[{datetime.datetime.now()}] rename {file_name_obj.temporary_base_name} file to {file_name_obj.base_name}...", flush=True)
+            print(f"[{datetime.datetime.now()}] write {file_name_obj.journal_base_name} file. pages:{len(dirty_page_set)}  bytes:{len(journal_binary)}", flush=True)
+
+        with EvaluationLib.lock_evaluation_table_file(file_name_obj):
+            with open(file_name_obj.journal_base_name, 'wb') as f:
+                f.write(journal_binary)
+                f.flush()
+                os.fsync(f.fileno())
+
+            EvaluationLib.apply_journal_to_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    journal_binary=journal_binary,
+                    is_debug=is_debug)
+
+
+    @staticmethod
+    def build_journal(
+            table_as_array,
+            header_obj,
+            dirty_page_set,
+            page_size):
+        """ヘッダーと、変更したページの中身を並べたジャーナルを作ります
 
-        os.rename(
-                src=file_name_obj.temporary_base_name,
-                dst=file_name_obj.base_name)
+        ジャーナルの形式
+
+            'KWJN', ページ数 (4 bytes),
+            ページ数だけ繰り返す { ファイル先頭からの位置 (8 bytes), 長さ (4 bytes), 中身 },
+            ここまでの CRC-32 (4 bytes)
+
+            数はリトルエンディアン。ヘッダーも、ファイル先頭からの位置 0 のページとして入れる
+
+        Parameters
+        ----------
+        table_as_array : bytearray or memoryview
+            １ビットを１関係として詰めたバイト列
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        dirty_page_set : set<int>
+            変更したページの番号の集合
+        page_size : int
+            ページの大きさ（バイト）
+
+        Returns
+        -------
+        journal_binary : bytearray
+            ジャーナル・ファイルの中身
+        """
+        header_binary = header_obj.to_binary(
+                body_size=len(table_as_array),
+                body_crc32=EvaluationTableHeader.compute_crc32(table_as_array))
+
+        journal_binary = bytearray(b'KWJN')
+        journal_binary += struct.pack('<I', 1 + len(dirty_page_set))
+
+        journal_binary += struct.pack('<QI', 0, len(header_binary))
+        journal_binary += header_binary
+
+        for page_index in sorted(dirty_page_set):
+            offset = page_index * page_size
+            page_binary = table_as_array[offset:offset + page_size]
+            journal_binary += struct.pack('<QI', EvaluationTableHeader.header_size + offset, len(page_binary))
+            journal_binary += page_binary
+
+        journal_binary += struct.pack('<I', zlib.crc32(journal_binary))
+        return journal_binary
+
+
+    @staticmethod
+    def parse_journal(
+            journal_binary):
+        """ジャーナルを読み取ります
+
+        Parameters
+        ----------
+        journal_binary : bytes
+            ジャーナル・ファイルの中身
+
+        Returns
+        -------
+        page_list : list<(int, bytes)>
+            （ファイル先頭からの位置、中身）のリスト。ジャーナルが書きかけなら None
+        """
+
+        # 書きかけのジャーナルは、ヘッダーや末尾の CRC-32 が合わない
+        if len(journal_binary) < 12 or journal_binary[:4] != b'KWJN':
+            return None
+
+        (expected_crc,) = struct.unpack_from('<I', journal_binary, len(journal_binary) - 4)
+        if zlib.crc32(journal_binary[:-4]) != expected_crc:
+            return None
+
+        (number_of_pages,) = struct.unpack_from('<I', journal_binary, 4)
+        position = 8
+        page_list = []
+
+        for _ in range(0, number_of_pages):
+            (offset, length) = struct.unpack_from('<QI', journal_binary, position)
+            position += 12
+            page_list.append((offset, journal_binary[position:position + length]))
+            position += length
+
+        return page_list
+
+
+    @staticmethod
+    def apply_journal_to_evaluation_table_file(
+            file_name_obj,
+            journal_binary,
+            is_debug=False):
+        """ジャーナルの内容をファイルへ反映して、ジャーナル・ファイルを削除します。ロックは呼び出し側で取っておくこと
+
+        変更したページをファイルへ直に上書きし、ヘッダーは最後に書く。
+        ロックを取って読む他のプロセスが、上書きの途中のファイルを見ることはない。
+        メモリーマップしたままのプロセスには、ヘッダーが書き換わったところで版が変わって見える（ EvalutionMmTable.version ）。
+        同じジャーナルを何回反映しても結果は同じなので、途中で止まっても最初からやり直せばよい
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        journal_binary : bytes
+            ジャーナル・ファイルの中身
+        is_debug : bool
+            デバッグモードか？
+        """
+        page_list = EvaluationLib.parse_journal(journal_binary)
+
+        # 書きかけのジャーナルなら、ファイルは変わっていないので、ジャーナルを捨てるだけ
+        if page_list is not None:
+            with open(file_name_obj.base_name, 'r+b') as f:
+                # 本体のページを書いてから、ヘッダー（位置 0 ）を書く
+                for (offset, page_binary) in sorted(page_list, key=lambda page: page[0] == 0):
+                    f.seek(offset)
+                    f.write(page_binary)
+
+                # ジャーナルを消す前に、ディスクまで書き出しておく
+                f.flush()
+                os.fsync(f.fileno())
+
+            if is_debug:
+                print(f"[{datetime.datetime.now()}] patched {file_name_obj.base_name} file. pages:{len(page_list)}", flush=True)
+
+        # 既に他のプロセスが消していてもよい
+        try:
+            os.remove(file_name_obj.journal_base_name)
+        except FileNotFoundError:
+            pass
+
+
+    @staticmethod
+    def recover_evaluation_table_file_from_journal(
+            file_name_obj):
+        """ジャーナル・ファイルが残っていれば、その内容をファイルへ反映します
+
+        ファイルを書き換えるプロセスだけが、ロックを取ってから呼ぶこと
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        """
+        try:
+            with open(file_name_obj.journal_base_name, 'rb') as f:
+                journal_binary = f.read()
+        except FileNotFoundError:
+            return
+
+        print(f"[{datetime.datetime.now()}] recover `{file_name_obj.base_name}` file from `{file_name_obj.journal_base_name}` file ...", flush=True)
+
+        EvaluationLib.apply_journal_to_evaluation_table_file(
+                file_name_obj=file_name_obj,
+                journal_binary=journal_binary)
+
+
+    @staticmethod
+    def read_journal_page_list(
+            file_name_obj):
+        """ジャーナル・ファイルを読み取ります
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+
+        Returns
+        -------
+        page_list : list<(int, bytes)>
+            （ファイル先頭からの位置、中身）のリスト。ジャーナル・ファイルが無いか、書きかけなら None
+        """
+        try:
+            with open(file_name_obj.journal_base_name, 'rb') as f:
+                journal_binary = f.read()
+        except FileNotFoundError:
+            return None
+
+        return EvaluationLib.parse_journal(journal_binary)
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def lock_evaluation_table_file(
+            file_name_obj):
+        """ファイルを書き換えたり読んだりしている間、ロック・ファイルを作って、他のプロセスが同時に書き換えないようにします
+
+        ロック・ファイルが既にあれば、消えるまで待つ。 stale_lock_seconds より古いロック・ファイルは、止まったプロセスの残りとみなして消す
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名オブジェクト
+        """
+        lock_base_name = file_name_obj.lock_base_name
+
+        while True:
+            try:
+                # 無ければ作る、を１回で行う。あれば例外
+                fd = os.open(lock_base_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+
+            except FileExistsError:
+                try:
+                    lock_age = time.time() - os.path.getmtime(lock_base_name)
+                except FileNotFoundError:
+                    continue
+
+                if EvaluationLib.stale_lock_seconds < lock_age:
+                    print(f"[{datetime.datetime.now()}] [evaluation lib > lock evaluation table file] remove stale `{lock_base_name}` file. age:{lock_age:.1f} seconds", flush=True)
+                    try:
+                        os.remove(lock_base_name)
+                    except FileNotFoundError:
+                        pass
+                    continue
+
+                time.sleep(0.1)
+
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield
+
+        finally:
+            try:
+                os.remove(lock_base_name)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,204 @@
+import array
+import datetime
+import os
+import struct
+import sys
+import zlib
+
+from v_a65_0_eval.k import EvaluationKMove
+from v_a65_0_eval.p import EvaluationPMove
+from v_a65_0_misc.lib import FileName
+
+
+class EvaluationMoveIndexFile():
+    """指し手のインデックス・ファイル
+
+    cshogi の指し手の整数の下位16bit（move16）から、玉と兵の指し手のインデックス（先手視点、右辺使用）を引く平らなリスト４つ
+    （玉／兵 × 回転しない／１８０°回転する）を保存しておくファイル。
+    リストを一から作ると 0.3 秒ほどかかるが、ファイルから読めば数ミリ秒で済む
+
+    ファイルの先頭の 16 バイトがヘッダー。数はリトルエンディアン
+
+        4 bytes : マジック・ナンバー 'KWMI'
+        2 bytes : 形式のバージョン
+        2 bytes : 玉の指し手の数
+        2 bytes : 兵の指し手の数
+        2 bytes : 予約
+        4 bytes : 玉と兵の指し手のインデックスの辞書の CRC-32 。辞書の作り方が変わったら作り直す
+
+    ヘッダーの後ろに、玉（回転しない）、玉（回転する）、兵（回転しない）、兵（回転する）の順に、 65536 個の符号付き 2 バイト整数が続く
+    """
+
+
+    magic = b'KWMI'
+    """マジック・ナンバー"""
+
+    format_version = 1
+    """形式のバージョン"""
+
+    _header_format = '<4sHHHHI'
+    """ヘッダーの形式"""
+
+    header_size = struct.calcsize(_header_format)
+    """ヘッダーのバイト数"""
+
+    _list_size = 0x10000
+    """リスト１つの要素数"""
+
+
+    @staticmethod
+    def get_file_name_obj(
+            engine_version_str):
+        """ファイル名
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジン・バージョン文字列
+        """
+        return FileName(
+                file_stem=f'data[{engine_version_str}]_move_index',
+                file_extension='.bin')
+
+
+    @staticmethod
+    def get_dictionary_crc32():
+        """玉と兵の指し手のインデックスの辞書の CRC-32 。辞書を作るのは数ミリ秒で済む"""
+        (_, k_index_to_srcsq_dstsq_dictionary) = EvaluationKMove.get_srcsq_to_dstsq_blackright_index_dictionary_tuple()
+        (_, _, _, p_index_to_srcloc_dstsq_promotion_dictionary) = EvaluationPMove.get_src_lists_to_dstsq_blackright_index_dictionary_tuple()
+
+        crc32 = zlib.crc32(repr(sorted(k_index_to_srcsq_dstsq_dictionary.items())).encode())
+        return zlib.crc32(repr(sorted(p_index_to_srcloc_dstsq_promotion_dictionary.items())).encode(), crc32)
+
+
+    @staticmethod
+    def read_file(
+            file_name_obj):
+        """ファイルを読み込んで、指し手のインデックスのリストを返します
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名
+
+        Returns
+        -------
+        (k_move16_to_blackright_index_list_tuple,
+         p_move16_to_blackright_index_list_tuple)
+            ファイルが無いか、今の辞書と合わなければ None
+        """
+        if not os.path.isfile(file_name_obj.base_name):
+            return None
+
+        with open(file_name_obj.base_name, 'rb') as f:
+            data = f.read()
+
+        list_byte_size = EvaluationMoveIndexFile._list_size * 2
+
+        if len(data) != EvaluationMoveIndexFile.header_size + 4 * list_byte_size:
+            print(f"[{datetime.datetime.now()}] [evaluation move index file > read file] unexpected file size.  file:`{file_name_obj.base_name}`  size:{len(data)}", flush=True)
+            return None
+
+        (magic,
+         format_version,
+         k_size,
+         p_size,
+         _reserved,
+         dictionary_crc32) = struct.unpack_from(EvaluationMoveIndexFile._header_format, data, 0)
+
+        if (magic != EvaluationMoveIndexFile.magic or
+                format_version != EvaluationMoveIndexFile.format_version or
+                k_size != EvaluationKMove.get_serial_number_size() or
+                p_size != EvaluationPMove.get_serial_number_size() or
+                dictionary_crc32 != EvaluationMoveIndexFile.get_dictionary_crc32()):
+            print(f"[{datetime.datetime.now()}] [evaluation move index file > read file] file is out of date.  file:`{file_name_obj.base_name}`", flush=True)
+            return None
+
+        index_list_list = []
+        for i in range(0, 4):
+            start = EvaluationMoveIndexFile.header_size + i * list_byte_size
+            index_array = array.array('h')
+            index_array.frombytes(data[start: start + list_byte_size])
+
+            if sys.byteorder != 'little':
+                index_array.byteswap()
+
+            index_list_list.append(index_array.tolist())
+
+        return ((index_list_list[0], index_list_list[1]),
+                (index_list_list[2], index_list_list[3]))
+
+
+    @staticmethod
+    def save_file(
+            file_name_obj,
+            k_move16_to_blackright_index_list_tuple,
+            p_move16_to_blackright_index_list_tuple):
+        """ファイルへ保存します
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            ファイル名
+        k_move16_to_blackright_index_list_tuple : tuple
+            玉の指し手のインデックスのリスト［0:回転しない, 1:１８０°回転する］
+        p_move16_to_blackright_index_list_tuple : tuple
+            兵の指し手のインデックスのリスト［0:回転しない, 1:１８０°回転する］
+        """
+        with open(file_name_obj.temporary_base_name, 'wb') as f:
+            f.write(struct.pack(
+                    EvaluationMoveIndexFile._header_format,
+                    EvaluationMoveIndexFile.magic,
+                    EvaluationMoveIndexFile.format_version,
+                    EvaluationKMove.get_serial_number_size(),
+                    EvaluationPMove.get_serial_number_size(),
+                    0,
+                    EvaluationMoveIndexFile.get_dictionary_crc32()))
+
+            for index_list in [*k_move16_to_blackright_index_list_tuple, *p_move16_to_blackright_index_list_tuple]:
+                index_array = array.array('h', index_list)
+
+                if sys.byteorder != 'little':
+                    index_array.byteswap()
+
+                f.write(index_array.tobytes())
+
+        # 読む側からは、古いファイルか新しいファイルのどちらかが必ず見える
+        os.replace(
+                src=file_name_obj.temporary_base_name,
+                dst=file_name_obj.base_name)
+
+
+    @staticmethod
+    def load_or_build(
+            engine_version_str):
+        """ファイルがあれば読み込み、無ければ（古ければ）指し手のインデックスのリストを作ってファイルへ保存します。
+        どちらの場合も、 EvaluationKMove と EvaluationPMove のリストはこの後すぐに使える
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジン・バージョン文字列
+        """
+        file_name_obj = EvaluationMoveIndexFile.get_file_name_obj(
+                engine_version_str=engine_version_str)
+
+        index_list_tuple_tuple = EvaluationMoveIndexFile.read_file(
+                file_name_obj=file_name_obj)
+
+        if index_list_tuple_tuple is not None:
+            (k_move16_to_blackright_index_list_tuple,
+             p_move16_to_blackright_index_list_tuple) = index_list_tuple_tuple
+
+            EvaluationKMove.set_move16_to_blackright_index_list_tuple(k_move16_to_blackright_index_list_tuple)
+            EvaluationPMove.set_move16_to_blackright_index_list_tuple(p_move16_to_blackright_index_list_tuple)
+            return
+
+        print(f"[{datetime.datetime.now()}] [evaluation move index file > load or build] build move index lists...", flush=True)
+
+        EvaluationMoveIndexFile.save_file(
+                file_name_obj=file_name_obj,
+                k_move16_to_blackright_index_list_tuple=EvaluationKMove.get_move16_to_blackright_index_list_tuple(),
+                p_move16_to_blackright_index_list_tuple=EvaluationPMove.get_move16_to_blackright_index_list_tuple())
+
+        print(f"[{datetime.datetime.now()}] [evaluation move index file > load or build] saved `{file_name_obj.base_name}` file", flush=True)
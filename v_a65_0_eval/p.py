@@ -1,3 +1,6 @@
+import numpy as np
+
+from v_a65_0_misc.lib import Move
 from v_a65_0_misc.sub_usi import SubUsi
 
 
@@ -123,6 +126,13 @@ class EvaluationPMove():
     _blackright_index_to_srcloc_dstsq_promotion_dictionary = None
     """通しインデックスを渡すと、移動元、移動先、成りか、を返す辞書"""
 
+    _move16_to_blackright_index_list_tuple = None
+    """cshogi の指し手の整数の下位16bit（move16）を添え字とし、兵の指し手のインデックス（先手視点、右辺使用）を値とする平らなリスト［0:回転しない, 1:１８０°回転する］。
+    兵の指し手にならない添え字の値は -1"""
+
+    _move16_to_blackright_index_array_tuple = None
+    """get_move16_to_blackright_index_list_tuple() と同じ値の numpy の配列［0:回転しない, 1:１８０°回転する］。指し手をまとめて引くのに使う"""
+
 
     @staticmethod
     def get_serial_number_size():
@@ -376,6 +386,123 @@ class EvaluationPMove():
                 clazz._blackright_index_to_srcloc_dstsq_promotion_dictionary)
 
 
+    @classmethod
+    def get_move16_to_blackright_index_list_tuple(clazz):
+        """cshogi の指し手の整数の下位16bit（move16）を添え字とし、兵の指し手のインデックス（先手視点、右辺使用）を値とする平らなリストを返します。
+        初回アクセス時はテーブル生成に時間がかかります
+
+        指し手の整数から、 cshogi.move_to_usi() → Move.from_usi() → Move.from_move_obj() → get_blackright_index_by_p_move() と辿るのと同じ値を、リストを１回引くだけで求められる
+
+        Returns
+        -------
+        (move16_to_blackright_index_list_for_not_rotate,
+         move16_to_blackright_index_list_for_rotate)
+            Move.from_move_obj() の shall_white_to_black が偽のときと、真のときのリスト。兵の指し手にならない添え字の値は -1
+        """
+
+        # 未生成なら生成（重い処理は１回だけ）
+        if clazz._move16_to_blackright_index_list_tuple is None:
+            (srcsq_to_dstsq_to_blackright_index_for_npsi_dictionary,
+             srcsq_to_dstsq_to_blackright_index_for_psi_dictionary,
+             srcdrop_to_dstsq_blackright_index,
+             _) = clazz.get_src_lists_to_dstsq_blackright_index_dictionary_tuple()
+
+            move16_to_blackright_index_list_list = []
+
+            for shall_white_to_black in [False, True]:
+                move16_to_blackright_index_list = [-1] * 0x10000
+
+                for move16, move_u in SubUsi.get_move16_to_usi_dictionary().items():
+                    p_blackright_move_obj = Move.from_move_obj(
+                            f_strict_move_obj=Move.from_usi(move_u),
+                            shall_white_to_black=shall_white_to_black,
+                            use_only_right_side=True)
+
+                    # 打つ手
+                    if SubUsi.is_drop_by_srcloc(p_blackright_move_obj.srcloc):
+                        src_to_dstsq_to_index_dictionary = srcdrop_to_dstsq_blackright_index
+
+                    # 成る手
+                    elif p_blackright_move_obj.promoted:
+                        src_to_dstsq_to_index_dictionary = srcsq_to_dstsq_to_blackright_index_for_psi_dictionary
+
+                    # 成らない手
+                    else:
+                        src_to_dstsq_to_index_dictionary = srcsq_to_dstsq_to_blackright_index_for_npsi_dictionary
+
+                    dstsq_to_index_dictionary = src_to_dstsq_to_index_dictionary.get(p_blackright_move_obj.srcloc)
+                    if dstsq_to_index_dictionary is None:
+                        continue
+
+                    p_index = dstsq_to_index_dictionary.get(p_blackright_move_obj.dstsq)
+                    if p_index is not None:
+                        move16_to_blackright_index_list[move16] = p_index
+
+                move16_to_blackright_index_list_list.append(move16_to_blackright_index_list)
+
+            clazz._move16_to_blackright_index_list_tuple = tuple(move16_to_blackright_index_list_list)
+
+        return clazz._move16_to_blackright_index_list_tuple
+
+
+    @staticmethod
+    def get_blackright_index_by_move16(
+            move16,
+            shall_white_to_black):
+        """cshogi の指し手の整数の下位16bit（move16）を指定すると、兵の指し手のインデックス（先手視点、右辺使用）を返す。
+        ループの中で何度も引くときは、 get_move16_to_blackright_index_list_tuple() のリストを取り出してから引く方が速い
+
+        Parameters
+        ----------
+        move16 : int
+            cshogi の指し手の整数の下位16bit。 move_id & 0xffff
+        shall_white_to_black : bool
+            評価値テーブルは先手用しかないので、後手なら指し手を１８０°回転させて先手の向きに合わせるか？
+
+        Returns
+        -------
+            - 兵の指し手のインデックス。兵の指し手にならなければ -1
+        """
+        return EvaluationPMove.get_move16_to_blackright_index_list_tuple()[1 if shall_white_to_black else 0][move16]
+
+
+    @classmethod
+    def get_move16_to_blackright_index_array_tuple(clazz):
+        """get_move16_to_blackright_index_list_tuple() と同じ値を、 numpy の配列で返します。
+        指し手の整数の配列を添え字にして、兵の指し手のインデックスを１回でまとめて引ける
+
+        Returns
+        -------
+        (move16_to_blackright_index_array_for_not_rotate,
+         move16_to_blackright_index_array_for_rotate)
+            Move.from_move_obj() の shall_white_to_black が偽のときと、真のときの配列。兵の指し手にならない添え字の値は -1
+        """
+
+        # 未生成なら生成
+        if clazz._move16_to_blackright_index_array_tuple is None:
+            clazz._move16_to_blackright_index_array_tuple = tuple(
+                    np.array(move16_to_blackright_index_list, dtype=np.int64) for move16_to_blackright_index_list in clazz.get_move16_to_blackright_index_list_tuple())
+
+        return clazz._move16_to_blackright_index_array_tuple
+
+
+    @classmethod
+    def set_move16_to_blackright_index_list_tuple(
+            clazz,
+            move16_to_blackright_index_list_tuple):
+        """ファイルから読み込んだ平らなリストを設定します。 EvaluationMoveIndexFile から使う
+
+        Parameters
+        ----------
+        move16_to_blackright_index_list_tuple : tuple
+            get_move16_to_blackright_index_list_tuple() と同じ形のリスト［0:回転しない, 1:１８０°回転する］
+        """
+        clazz._move16_to_blackright_index_list_tuple = move16_to_blackright_index_list_tuple
+
+        # numpy の配列は、次に使うときに作り直す
+        clazz._move16_to_blackright_index_array_tuple = None
+
+
     #get_index_by_p_move
     @staticmethod
     def get_blackright_index_by_p_move(
@@ -1,12 +1,9 @@
-import os
-import datetime
-
-from v_a65_0_eval.lib import EvaluationLib
 from v_a65_0_eval.p import EvaluationPMove
-from v_a65_0_misc.lib import FileName, Turn, Move, EvalutionMmTable
+from v_a65_0_eval.table_base import EvaluationTableBase
+from v_a65_0_misc.lib import Move
 
 
-class EvaluationPpTable():
+class EvaluationPpTable(EvaluationTableBase):
     """ＰＰ評価値テーブル"""
 
     #get_index_of_pp_table
@@ -107,82 +104,22 @@ p2_blackright_move_obj:{p2_blackright_move_obj.as_usi:5}
 
     def __init__(
             self,
-            engine_version_str):
+            engine_version_str,
+            table_mode='memory',
+            edit_log_obj=None,
+            codec='raw'):
         """初期化
 
-        Parameters
-        ----------
-        engine_version_str : str
-            将棋エンジンのバージョン
-        """
-        self._engine_version_str = engine_version_str
-        self._mm_table_obj = None
-
-
-    @property
-    def mm_table_obj(self):
-        """評価値テーブル"""
-        return self._mm_table_obj
-
-
-    def load_on_usinewgame(
-            self,
-            turn):
-        """ＰＰ評価値テーブル読込
-
-        Parameters
-        ----------
-        turn : int
-            手番
-        """
-        file_name_obj = FileName(
-                file_stem=f'data[{self._engine_version_str}]_n1_eval_pp_{Turn.to_string(turn)}',
-                file_extension='.bin')
-
-        print(f"[{datetime.datetime.now()}] check  `{file_name_obj.base_name}` file exists...", flush=True)
-        is_file_exists = os.path.isfile(file_name_obj.base_name)
-
-        if is_file_exists:
-            # 読込
-            table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(
-                    file_name_obj=file_name_obj)
-        else:
-            table_as_array = None
-
-
-        # ファイルが存在しないとき
-        if table_as_array is None:
-            table_as_array = EvaluationLib.create_random_evaluation_table_as_array(
-                    a_move_size=EvaluationPMove.get_serial_number_size(),
-                    b_move_size=EvaluationPMove.get_serial_number_size())
-            is_file_modified = True     # 新規作成だから
-
-        else:
-            is_file_modified = False
-
-
-        self._mm_table_obj = EvalutionMmTable(
-                file_name_obj=file_name_obj,
-                table_as_array=table_as_array,
-                is_file_modified=is_file_modified)
-
-
-    def save_pp_evaluation_table_file(
-            self,
-            is_debug=False):
-        """ファイルへの保存
-
-        Parameters
-        ----------
-        is_debug : bool
-            デバッグモードか？
-
-        保存するかどうかは先に判定しておくこと
+        引数は EvaluationTableBase.__init__() を参照
         """
-        EvaluationLib.save_evaluation_table_file(
-                file_name_obj=self.mm_table_obj.file_name_obj,
-                table_as_array=self.mm_table_obj.table_as_array,
-                is_debug=is_debug)
+        super().__init__(
+                kind='pp',
+                a_move_size=EvaluationPMove.get_serial_number_size(),
+                b_move_size=EvaluationPMove.get_serial_number_size(),
+                engine_version_str=engine_version_str,
+                table_mode=table_mode,
+                edit_log_obj=edit_log_obj,
+                codec=codec)
 
 
     # 使ってない？
@@ -229,6 +166,25 @@ p2_blackright_move_obj:{p2_blackright_move_obj.as_usi:5}
                 index=p1_blackright_p2_blackright_index)
 
 
+    def get_relation_exists_array_by_index_array(
+            self,
+            p1_blackright_p2_blackright_index_array):
+        """配列のインデックスの配列を受け取って、関係の有無の配列を返します
+
+        Parameters
+        ----------
+        p1_blackright_p2_blackright_index_array : numpy.ndarray
+            配列のインデックスの配列
+
+        Returns
+        -------
+        bit_array : numpy.ndarray
+            0 か 1 の配列
+        """
+        return self._mm_table_obj.get_bits_by_index_array(
+                index_array=p1_blackright_p2_blackright_index_array)
+
+
     #set_relation_exists_by_pp_moves
     def set_relation_exists_by_black_p_black_p_moves(
             self,
@@ -251,47 +207,20 @@ p2_blackright_move_obj:{p2_blackright_move_obj.as_usi:5}
         is_changed : bool
             変更が有ったか？
         """
-        (is_changed, result_comment) = self._mm_table_obj.set_bit_by_index(
-                f_blackright_o_blackright_index=EvaluationPpTable.get_blackright_p1_blackright_p2_index(
-                        p1_blackright_move_obj=p1_blackright_move_obj,
-                        p2_blackright_move_obj=p2_blackright_move_obj),
-                bit=bit)
-
-        return (is_changed, result_comment)
-
-
-    #select_pp_index_and_relation_exists
-    def select_blackright_p_blackright_p_index_and_relation_exists(
-            self,
-            p1_blackright_move_obj,
-            p2_blackright_move_u_set):
-        """兵１の指し手と、兵２の応手のリストを受け取ると、すべての関係の有無を辞書に入れて返します
-        ＰＰ評価値テーブル用
-
-        Parameters
-        ----------
-        p1_blackright_move_obj : Move
-            兵１の着手（先手視点、右辺使用）
-        p2_black_move_u_set : List<str>
-            兵２の応手のリスト（先手視点、右辺使用）
-
-        Returns
-        -------
-        - relations : Dictionary<int, int>
-            キー：　ＰＰ評価値テーブルのインデックス
-            値　：　関係の有無
-        """
-
-        relations = {}
-
-        for p2_blackright_move_u in p2_blackright_move_u_set:
-            p1_blackright_p2_blackright_index = EvaluationPpTable.get_blackright_p1_blackright_p2_index(
+        f_blackright_o_blackright_index = EvaluationPpTable.get_blackright_p1_blackright_p2_index(
                 p1_blackright_move_obj=p1_blackright_move_obj,
-                p2_blackright_move_obj=Move.from_usi(p2_blackright_move_u))
+                p2_blackright_move_obj=p2_blackright_move_obj)
 
-            relation_bit = self.get_relation_exists_by_index(
-                    p1_blackright_p2_blackright_index=p1_blackright_p2_blackright_index)
+        (is_changed, result_comment) = self._mm_table_obj.set_bit_by_index(
+                f_blackright_o_blackright_index=f_blackright_o_blackright_index,
+                bit=bit)
 
-            relations[p1_blackright_p2_blackright_index] = relation_bit
+        # 変更したら、編集ログへ追記する
+        if is_changed and self._edit_log_obj is not None and self._edit_log_obj.is_writable:
+            self._edit_log_obj.append(
+                    kind='pp',
+                    turn=self._turn,
+                    index=f_blackright_o_blackright_index,
+                    bit=bit)
 
-        return relations
+        return (is_changed, result_comment)
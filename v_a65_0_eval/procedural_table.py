@@ -0,0 +1,534 @@
+import datetime
+import os
+import struct
+import numpy as np
+
+from v_a65_0_eval.lib import EvaluationLib
+from v_a65_0_eval.table_header import EvaluationTableHeader
+from v_a65_0_misc.lib import FileName, Turn, EvalutionMmTable
+
+
+class EvaluationProceduralTable():
+    """手続き的に生成する評価値テーブル
+
+    学習で変えていない関係の値は持たず、（テーブルの種類、手番、インデックス）のハッシュから毎回求める。
+    学習で変えた関係だけを、上書きとして辞書に持つ。
+    新しく作るときはランダムな値を作らなくてよく、ファイルの大きさも学習で変えた関係の数に比例する
+
+    EvalutionMmTable と同じように使える。
+    ファイルは評価値テーブル・ファイルの幹に `_sparse` を付けたもので、ヘッダーの後ろに、上書きを１件５バイトでインデックス順に並べる
+
+        4 bytes : 関係のインデックス（リトルエンディアン）
+        1 byte  : ビット値
+    """
+
+
+    seed = 0x4B5746
+    """ハッシュの種。変えると、学習で変えていない関係の値が全て変わる"""
+
+    _record_format = '<IB'
+    """上書き１件の形式"""
+
+    _record_size = struct.calcsize(_record_format)
+    """上書き１件のバイト数"""
+
+    _golden_gamma = 0x9E3779B97F4A7C15
+    """ハッシュでインデックスに掛ける数"""
+
+    _mask64 = 0xFFFFFFFFFFFFFFFF
+    """６４ビットに切り詰めるマスク"""
+
+
+    @staticmethod
+    def _mix64(value):
+        """６４ビットの値をかき混ぜます（ splitmix64 の仕上げ）"""
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & EvaluationProceduralTable._mask64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & EvaluationProceduralTable._mask64
+        return value ^ (value >> 31)
+
+
+    @staticmethod
+    def get_seed_key(
+            kind,
+            turn):
+        """評価値テーブルごとのハッシュの種
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+        """
+        return EvaluationProceduralTable._mix64(
+                EvaluationProceduralTable.seed * 8 + EvaluationTableHeader.to_table_id(kind) * 2 + Turn.to_index(turn))
+
+
+    @staticmethod
+    def get_default_bit(
+            seed_key,
+            index):
+        """学習で変えていない関係のビット値
+
+        Parameters
+        ----------
+        seed_key : int
+            get_seed_key() の値
+        index : int
+            関係のインデックス
+
+        Returns
+        -------
+        bit : int
+            0 か 1
+        """
+        value = (seed_key + (index + 1) * EvaluationProceduralTable._golden_gamma) & EvaluationProceduralTable._mask64
+        return EvaluationProceduralTable._mix64(value) >> 63
+
+
+    @staticmethod
+    def create_default_table_as_array(
+            seed_key,
+            bit_count):
+        """学習で変えていない関係のビット値を、まとめてバイト列に詰めます。 get_default_bit() と同じ値になる
+
+        Parameters
+        ----------
+        seed_key : int
+            get_seed_key() の値
+        bit_count : int
+            関係の数
+
+        Returns
+        -------
+        table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）
+        """
+        # 大きな桁から８つずつ詰める
+        return bytearray(np.packbits(EvaluationProceduralTable._create_default_bit_array(
+                seed_key=seed_key,
+                start_index=0,
+                bit_count=bit_count)).tobytes())
+
+
+    @staticmethod
+    def _create_default_bit_array(
+            seed_key,
+            start_index,
+            bit_count):
+        """学習で変えていない関係のビット値を、 numpy の 0, 1 の配列で返します
+
+        Parameters
+        ----------
+        seed_key : int
+            get_seed_key() の値
+        start_index : int
+            先頭の関係のインデックス
+        bit_count : int
+            関係の数
+        """
+        return EvaluationProceduralTable._create_default_bit_array_by_index_array(
+                seed_key=seed_key,
+                index_array=np.arange(start_index, start_index + bit_count, dtype=np.uint64))
+
+
+    @staticmethod
+    def _create_default_bit_array_by_index_array(
+            seed_key,
+            index_array):
+        """学習で変えていない関係のビット値を、インデックスの配列の並びで、 numpy の 0, 1 の配列で返します
+
+        Parameters
+        ----------
+        seed_key : int
+            get_seed_key() の値
+        index_array : numpy.ndarray
+            関係のインデックスの配列
+        """
+        # 符号なし６４ビットの掛け算、足し算は、桁あふれしても下の６４ビットが残る
+        value_array = (index_array.astype(np.uint64) + np.uint64(1)) * np.uint64(EvaluationProceduralTable._golden_gamma) + np.uint64(seed_key)
+        value_array = (value_array ^ (value_array >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        value_array = (value_array ^ (value_array >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        value_array = value_array ^ (value_array >> np.uint64(31))
+
+        # 一番上の桁をビット値とする
+        return (value_array >> np.uint64(63)).astype(np.uint8)
+
+
+    @staticmethod
+    def get_sparse_file_name_obj(
+            file_name_obj):
+        """上書きを保存するファイルの名前
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            評価値テーブル・ファイルの名前
+        """
+        return FileName(
+                file_stem=f'{file_name_obj.file_stem}_sparse',
+                file_extension=file_name_obj.file_extension)
+
+
+    @staticmethod
+    def read_file(
+            file_name_obj,
+            header_obj,
+            edit_log_identity=None):
+        """上書きのファイルを読み込みます。ファイルが無ければ、上書きの無い評価値テーブルにします
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            評価値テーブル・ファイルの名前。上書きのファイルの名前は、これに `_sparse` を付けたもの
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー
+        edit_log_identity : tuple
+            読み込んだ後に再生する編集ログの素性。 EvaluationEditLog.get_replay_identity() を参照
+
+        Returns
+        -------
+        procedural_table_obj : EvaluationProceduralTable
+            手続き的に生成する評価値テーブル
+        """
+        sparse_file_name_obj = EvaluationProceduralTable.get_sparse_file_name_obj(file_name_obj)
+        file_identity = EvaluationLib.get_file_identity(sparse_file_name_obj)
+        override_dic = {}
+
+        if file_identity is not None:
+            print(f"[{datetime.datetime.now()}] read   `{sparse_file_name_obj.base_name}` file ...", flush=True)
+
+            with open(sparse_file_name_obj.base_name, 'rb') as f:
+                actual_header_obj = EvaluationTableHeader.from_binary(f.read(EvaluationTableHeader.header_size))
+                header_obj.verify(
+                        actual_header_obj=actual_header_obj,
+                        file_name_obj=sparse_file_name_obj)
+
+                body_binary = f.read()
+
+            if (len(body_binary) != actual_header_obj.body_size
+                    or len(body_binary) % EvaluationProceduralTable._record_size != 0
+                    or EvaluationTableHeader.compute_crc32(body_binary) != actual_header_obj.body_crc32):
+                raise ValueError(f"[evaluation procedural table > read file] `{sparse_file_name_obj.base_name}` file is broken. body size expected:{actual_header_obj.body_size}  actual:{len(body_binary)}")
+
+            for (index, bit) in struct.iter_unpack(EvaluationProceduralTable._record_format, body_binary):
+                override_dic[index] = bit
+
+            print(f"[{datetime.datetime.now()}] loaded `{sparse_file_name_obj.base_name}` file. overrides:{len(override_dic)}", flush=True)
+
+        else:
+            print(f"[{datetime.datetime.now()}] `{sparse_file_name_obj.base_name}` file not found. start with no overrides", flush=True)
+
+        return EvaluationProceduralTable(
+                file_name_obj=file_name_obj,
+                header_obj=header_obj,
+                override_dic=override_dic,
+                file_identity=file_identity,
+                edit_log_identity=edit_log_identity)
+
+
+    def __init__(
+            self,
+            file_name_obj,
+            header_obj,
+            override_dic=None,
+            file_identity=None,
+            edit_log_identity=None):
+        """初期化
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            評価値テーブル・ファイルの名前。密な形式へ書き出すときに使う
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        override_dic : dict
+            学習で変えた関係のインデックスと、そのビット値
+        file_identity : tuple
+            読み込んだときの上書きのファイルの素性。 EvaluationLib.get_file_identity() を参照
+        edit_log_identity : tuple
+            読み込んだときに再生した編集ログの素性。 EvaluationEditLog.get_replay_identity() を参照
+        """
+        self._file_name_obj = file_name_obj
+        self._sparse_file_name_obj = EvaluationProceduralTable.get_sparse_file_name_obj(file_name_obj)
+        self._header_obj = header_obj
+        self._override_dic = {} if override_dic is None else override_dic
+        self._file_identity = file_identity
+        self._edit_log_identity = edit_log_identity
+        self._seed_key = EvaluationProceduralTable.get_seed_key(header_obj.kind, header_obj.turn)
+        self._is_file_modified = False
+        self._serial_number = EvalutionMmTable.issue_serial_number()
+        self._generation = 0
+
+
+    @property
+    def file_name_obj(self):
+        """評価値テーブル・ファイルの名前"""
+        return self._file_name_obj
+
+
+    @property
+    def sparse_file_name_obj(self):
+        """上書きを保存するファイルの名前"""
+        return self._sparse_file_name_obj
+
+
+    @property
+    def header_obj(self):
+        """評価値テーブルのヘッダー"""
+        return self._header_obj
+
+
+    @property
+    def override_dic(self):
+        """学習で変えた関係のインデックスと、そのビット値"""
+        return self._override_dic
+
+
+    @property
+    def is_file_modified(self):
+        """上書きが変わって、保存されていなければ真"""
+        return self._is_file_modified
+
+
+    @property
+    def file_identity(self):
+        """読み込んだとき、または保存したときの上書きのファイルの素性"""
+        return self._file_identity
+
+
+    @property
+    def edit_log_identity(self):
+        """読み込んだときに再生した編集ログの素性"""
+        return self._edit_log_identity
+
+
+    @property
+    def generation(self):
+        """世代番号。評価値テーブルが変わると増える"""
+        return self._generation
+
+
+    @property
+    def version(self):
+        """版。（オブジェクトの通し番号, 世代番号）。 EvalutionMmTable.version と同じ"""
+        return (self._serial_number, self._generation)
+
+
+    @property
+    def is_procedural(self):
+        """手続き的に生成する評価値テーブルなので真"""
+        return True
+
+
+    @property
+    def is_file_mapped(self):
+        """ファイルをメモリーマップしないので偽"""
+        return False
+
+
+    @property
+    def is_shared(self):
+        """共有メモリーを使わないので偽"""
+        return False
+
+
+    @property
+    def is_read_only(self):
+        """書き込めるので偽"""
+        return False
+
+
+    def release_file_mapping(self):
+        """ファイルをメモリーマップしないので、何もしません"""
+        pass
+
+
+    def close(self):
+        """閉じるものは無いので、何もしません"""
+        pass
+
+
+    def get_bit_by_index(
+            self,
+            index,
+            is_debug=False):
+        """インデックスを受け取ってビット値を返します
+
+        Parameters
+        ----------
+        index : int
+            ビットのインデックス
+
+        Returns
+        -------
+        bit : int
+            0 or 1
+        """
+        bit = self._override_dic.get(index)
+
+        if bit is not None:
+            return bit
+
+        # get_default_bit() と同じ計算。探索中に何度も呼ばれるので、関数呼出しを省いて書き下す
+        value = (self._seed_key + (index + 1) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+        return (value ^ (value >> 31)) >> 63
+
+
+    def get_bits_by_index_array(
+            self,
+            index_array):
+        """インデックスの配列を受け取って、ビット値の配列を返します。 EvalutionMmTable.get_bits_by_index_array() と同じ
+
+        Parameters
+        ----------
+        index_array : numpy.ndarray
+            ビットのインデックスの配列（整数）
+
+        Returns
+        -------
+        bit_array : numpy.ndarray
+            0 か 1 の配列（ numpy.uint8 ）
+        """
+        bit_array = EvaluationProceduralTable._create_default_bit_array_by_index_array(
+                seed_key=self._seed_key,
+                index_array=index_array)
+
+        # 上書きがあれば、その位置だけ差し替える
+        if 0 < len(self._override_dic):
+            override_index_array = np.fromiter(self._override_dic.keys(), dtype=np.int64, count=len(self._override_dic))
+            for position in np.flatnonzero(np.isin(index_array, override_index_array)).tolist():
+                bit_array[position] = self._override_dic[int(index_array[position])]
+
+        return bit_array
+
+
+    def set_bit_by_index(
+            self,
+            f_blackright_o_blackright_index,
+            bit,
+            is_debug=False):
+        """インデックスを受け取ってビット値を設定します
+
+        ハッシュから求まる値に戻したときは、上書きを消す
+
+        Parameters
+        ----------
+        f_blackright_o_blackright_index : int
+            ビットのインデックス。着手、応手ともに先手の視点
+        bit : int
+            0 か 1
+        is_debug : bool
+            デバッグか？
+
+        Returns
+        -------
+        is_changed : bool
+            変更が有ったか？
+        result_comment : str
+            変更できなかった場合の説明
+        """
+        old_bit = self.get_bit_by_index(f_blackright_o_blackright_index)
+
+        if old_bit == bit:
+            return (False, f'old_bit:{old_bit}  bit:{bit}')
+
+        self.overlay_bit_by_index(
+                index=f_blackright_o_blackright_index,
+                bit=bit)
+
+        self._is_file_modified = True
+        return (True, '')
+
+
+    def overlay_bit_by_index(
+            self,
+            index,
+            bit):
+        """ビット値を設定します。変更としては記録せず、ファイルへは保存されません
+
+        Parameters
+        ----------
+        index : int
+            ビットのインデックス
+        bit : int
+            0 か 1
+        """
+        if bit == EvaluationProceduralTable.get_default_bit(self._seed_key, index):
+            self._override_dic.pop(index, None)
+
+        else:
+            self._override_dic[index] = bit
+
+        self._generation += 1
+
+
+    def to_table_as_array(self):
+        """密な形式（１ビットを１関係として詰めたバイト列）へ書き出します
+
+        Returns
+        -------
+        table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列（ビッグエンディアン）
+        """
+        table_as_array = EvaluationProceduralTable.create_default_table_as_array(
+                seed_key=self._seed_key,
+                bit_count=self._header_obj.a_move_size * self._header_obj.b_move_size)
+
+        for (index, bit) in self._override_dic.items():
+            byte_index = index // 8
+            mask = 0x80 >> (index % 8)
+
+            if bit == 1:
+                table_as_array[byte_index] |= mask
+            else:
+                table_as_array[byte_index] &= ~mask & 0xFF
+
+        return table_as_array
+
+
+    def save_file(
+            self,
+            is_debug=False):
+        """上書きをファイルへ保存します。評価値テーブル・ファイルと同じく、書き終えてから置き換える
+
+        Parameters
+        ----------
+        is_debug : bool
+            デバッグモードか？
+        """
+        body_binary = b''.join(
+                struct.pack(EvaluationProceduralTable._record_format, index, bit)
+                for (index, bit) in sorted(self._override_dic.items()))
+
+        # 本体は上書きのレコードの並び。圧縮はしない
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=self._sparse_file_name_obj,
+                table_as_array=body_binary,
+                header_obj=EvaluationTableHeader(
+                        kind=self._header_obj.kind,
+                        turn=self._header_obj.turn,
+                        a_move_size=self._header_obj.a_move_size,
+                        b_move_size=self._header_obj.b_move_size),
+                is_debug=is_debug)
+
+        print(f"[{datetime.datetime.now()}] saved  `{self._sparse_file_name_obj.base_name}` file. overrides:{len(self._override_dic)}  file size:{os.path.getsize(self._sparse_file_name_obj.base_name)}", flush=True)
+
+        self.mark_as_saved(
+                file_identity=EvaluationLib.get_file_identity(self._sparse_file_name_obj))
+
+
+    def mark_as_saved(
+            self,
+            file_identity=None):
+        """ファイルへ保存したので、変更の記録を消します
+
+        Parameters
+        ----------
+        file_identity : tuple
+            保存した後の上書きのファイルの素性
+        """
+        self._file_identity = file_identity
+        self._is_file_modified = False
@@ -0,0 +1,266 @@
+import datetime
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+from v_a65_0_eval.table_header import EvaluationTableHeader
+from v_a65_0_misc.lib import FileName, Turn
+
+
+class EvaluationSharedTable():
+    """共有メモリーに置いた評価値テーブル
+
+    評価値テーブル・サーバー（ v_a65_0_main_table_server.py ）が、評価値テーブル・ファイルを共有メモリーへ読み込んでおく。
+    将棋エンジンや自己対局のプロセスは、それを読取専用でそのまま使う（コピーしない）。
+    学習部は書込ありで使い、ビットを変えるたびに世代番号を１つ増やす。読む側は世代番号で、学習が進んだことが分かる
+
+    共有メモリーの中の形式
+
+        32 bytes : 評価値テーブル・ファイルと同じヘッダー。種類、手番、サイズを確かめるのに使う（ CRC-32 はサーバーが読み込んだときのもの）
+        8 bytes  : 世代番号（リトルエンディアン）
+        24 bytes : 予約
+        本体     : １ビットを１関係として詰めたバイト列（ビッグエンディアン）
+
+    書き込むのは１つのプロセス（学習部）だけとすること
+    """
+
+
+    _generation_format = '<Q'
+    """世代番号の形式"""
+
+    _generation_offset = EvaluationTableHeader.header_size
+    """共有メモリーの先頭から世代番号までのバイト数"""
+
+    body_offset = 64
+    """共有メモリーの先頭から本体までのバイト数"""
+
+    _created_segment_name_set = set()
+    """このプロセスで作った共有メモリーの名前"""
+
+
+    @staticmethod
+    def get_segment_name(
+            engine_version_str,
+            kind,
+            turn):
+        """共有メモリーの名前
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジンのバージョン
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+        """
+        return f'kw_{engine_version_str}_{kind}_{Turn.to_string(turn)}'
+
+
+    @staticmethod
+    def create(
+            engine_version_str,
+            header_obj,
+            table_as_array):
+        """共有メモリーを作り、評価値テーブルを書き込みます。評価値テーブル・サーバーが使う
+
+        前のサーバーが残した同じ名前の共有メモリーがあれば、大きさが合えばそれを使い直す
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジンのバージョン
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        table_as_array : bytearray
+            １ビットを１関係として詰めたバイト列
+
+        Returns
+        -------
+        shared_table_obj : EvaluationSharedTable
+            共有メモリーに置いた評価値テーブル
+        """
+        segment_name = EvaluationSharedTable.get_segment_name(engine_version_str, header_obj.kind, header_obj.turn)
+        segment_size = EvaluationSharedTable.body_offset + header_obj.table_size
+
+        try:
+            shared_memory_obj = shared_memory.SharedMemory(
+                    name=segment_name,
+                    create=True,
+                    size=segment_size)
+
+        except FileExistsError:
+            print(f"[{datetime.datetime.now()}] [evaluation shared table > create] `{segment_name}` shared memory already exists. reuse it", flush=True)
+            shared_memory_obj = shared_memory.SharedMemory(
+                    name=segment_name)
+
+            if shared_memory_obj.size < segment_size:
+                shared_memory_obj.close()
+                raise ValueError(f"[evaluation shared table > create] `{segment_name}` shared memory is too small. expected:{segment_size}  actual:{shared_memory_obj.size}")
+
+        EvaluationSharedTable._created_segment_name_set.add(segment_name)
+
+        shared_table_obj = EvaluationSharedTable(
+                shared_memory_obj=shared_memory_obj,
+                header_obj=header_obj,
+                is_writable=True,
+                is_owner=True)
+
+        shared_memory_obj.buf[:EvaluationTableHeader.header_size] = header_obj.to_binary(
+                body_size=header_obj.table_size,
+                body_crc32=EvaluationTableHeader.compute_crc32(table_as_array))
+        shared_table_obj.table_as_array[:] = table_as_array
+        shared_table_obj.increment_generation()
+
+        print(f"[{datetime.datetime.now()}] [evaluation shared table > create] `{segment_name}` shared memory created. evaluation table size: {header_obj.table_size * 8}", flush=True)
+        return shared_table_obj
+
+
+    @staticmethod
+    def attach(
+            engine_version_str,
+            header_obj,
+            is_writable):
+        """評価値テーブル・サーバーが作った共有メモリーにつなぎます
+
+        Parameters
+        ----------
+        engine_version_str : str
+            将棋エンジンのバージョン
+        header_obj : EvaluationTableHeader
+            読みたい評価値テーブルのヘッダー。種類、手番、サイズを確かめるのに使う
+        is_writable : bool
+            真なら書込あり（学習部）。偽なら読取専用
+
+        Returns
+        -------
+        shared_table_obj : EvaluationSharedTable
+            共有メモリーに置いた評価値テーブル。サーバーが動いていなければ None
+        """
+        segment_name = EvaluationSharedTable.get_segment_name(engine_version_str, header_obj.kind, header_obj.turn)
+
+        try:
+            shared_memory_obj = shared_memory.SharedMemory(
+                    name=segment_name)
+
+        except FileNotFoundError:
+            return None
+
+        # つないだだけのプロセスが終わるときに、共有メモリーを消されないようにする（ POSIX ）。消すのはサーバーだけ。
+        # 同じプロセスで作ったものは、作ったときの登録を残しておく
+        if os.name == 'posix' and segment_name not in EvaluationSharedTable._created_segment_name_set:
+            resource_tracker.unregister(shared_memory_obj._name, 'shared_memory')
+
+        actual_header_obj = EvaluationTableHeader.from_binary(shared_memory_obj.buf[:EvaluationTableHeader.header_size])
+
+        try:
+            header_obj.verify(
+                    actual_header_obj=actual_header_obj,
+                    file_name_obj=FileName(
+                            file_stem=segment_name,
+                            file_extension=''))
+
+        except ValueError:
+            shared_memory_obj.close()
+            raise
+
+        print(f"[{datetime.datetime.now()}] [evaluation shared table > attach] `{segment_name}` shared memory attached. writable:{is_writable}", flush=True)
+
+        return EvaluationSharedTable(
+                shared_memory_obj=shared_memory_obj,
+                header_obj=header_obj,
+                is_writable=is_writable,
+                is_owner=False)
+
+
+    def __init__(
+            self,
+            shared_memory_obj,
+            header_obj,
+            is_writable,
+            is_owner):
+        """初期化
+
+        Parameters
+        ----------
+        shared_memory_obj : shared_memory.SharedMemory
+            共有メモリー
+        header_obj : EvaluationTableHeader
+            評価値テーブルのヘッダー
+        is_writable : bool
+            真なら書込あり
+        is_owner : bool
+            真なら、この共有メモリーを作ったサーバー。 unlink() で消す
+        """
+        self._shared_memory_obj = shared_memory_obj
+        self._header_obj = header_obj
+        self._is_writable = is_writable
+        self._is_owner = is_owner
+
+        # 本体部分。コピーはしない
+        table_as_array = shared_memory_obj.buf[EvaluationSharedTable.body_offset:EvaluationSharedTable.body_offset + header_obj.table_size]
+
+        if not is_writable:
+            readonly_table_as_array = table_as_array.toreadonly()
+            table_as_array.release()
+            table_as_array = readonly_table_as_array
+
+        self._table_as_array = table_as_array
+
+
+    @property
+    def name(self):
+        """共有メモリーの名前"""
+        return self._shared_memory_obj.name
+
+
+    @property
+    def table_as_array(self):
+        """本体部分の memoryview 。読取専用でつないだなら、書き込めない"""
+        return self._table_as_array
+
+
+    @property
+    def is_writable(self):
+        """書込ありなら真"""
+        return self._is_writable
+
+
+    @property
+    def generation(self):
+        """世代番号。学習部がビットを変えるたびに増える"""
+        return struct.unpack_from(
+                EvaluationSharedTable._generation_format,
+                self._shared_memory_obj.buf,
+                EvaluationSharedTable._generation_offset)[0]
+
+
+    def increment_generation(self):
+        """世代番号を１つ増やします。書込ありのときだけ"""
+        if not self._is_writable:
+            raise ValueError(f"[evaluation shared table > increment generation] read only shared memory:`{self.name}`")
+
+        struct.pack_into(
+                EvaluationSharedTable._generation_format,
+                self._shared_memory_obj.buf,
+                EvaluationSharedTable._generation_offset,
+                self.generation + 1)
+
+
+    def close(self):
+        """このプロセスから共有メモリーを切り離します。共有メモリーは残る"""
+        if self._table_as_array is not None:
+            self._table_as_array.release()
+            self._table_as_array = None
+
+        self._shared_memory_obj.close()
+
+
+    def unlink(self):
+        """共有メモリーを消します。サーバーだけが、全て終わったときに呼び出す"""
+        if not self._is_owner:
+            raise ValueError(f"[evaluation shared table > unlink] not owner of shared memory:`{self.name}`")
+
+        self.close()
+        self._shared_memory_obj.unlink()
+        EvaluationSharedTable._created_segment_name_set.discard(self.name)
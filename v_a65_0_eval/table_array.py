@@ -0,0 +1,83 @@
+import cshogi
+import datetime
+import threading
+
+
+class EvaluationTableArray():
+    """評価値テーブル［0:先手, 1:後手］の組
+
+    遅延読込なら、その手番の評価値テーブルは、 [turn_index] で初めて取り出したときに読み込む。
+    対局中のエンジンは自分の手番の評価値テーブルしか使わないので、起動も usinewgame も、メモリーも、およそ半分で済む
+    """
+
+
+    def __init__(
+            self,
+            table_obj_list,
+            is_lazy_loading=False):
+        """初期化
+
+        Parameters
+        ----------
+        table_obj_list : list
+            評価値テーブル　[0:先手, 1:後手]
+        is_lazy_loading : bool
+            真なら遅延読込
+        """
+        self._table_obj_list = table_obj_list
+        self._is_lazy_loading = is_lazy_loading
+
+        # 別スレッドの読込と、２つのスレッドが同時に初めて取り出したときに、２回読み込まないようにする
+        self._lock = threading.Lock()
+
+
+    def __getitem__(
+            self,
+            turn_index):
+        """評価値テーブルを取り出します。遅延読込で、まだ読み込んでいなければ、この場で読み込む
+
+        Parameters
+        ----------
+        turn_index : int
+            0:先手, 1:後手
+        """
+        table_obj = self._table_obj_list[turn_index]
+
+        if table_obj.mm_table_obj is None and self._is_lazy_loading:
+            with self._lock:
+                if table_obj.mm_table_obj is None:
+                    turn = [cshogi.BLACK, cshogi.WHITE][turn_index]
+                    print(f"[{datetime.datetime.now()}] [evaluation table array > get item] load on first access.  turn_index:{turn_index}", flush=True)
+                    table_obj.load_on_usinewgame(
+                            turn=turn)
+
+        return table_obj
+
+
+    def __len__(self):
+        return len(self._table_obj_list)
+
+
+    @property
+    def is_lazy_loading(self):
+        """遅延読込なら真"""
+        return self._is_lazy_loading
+
+
+    @property
+    def table_obj_list(self):
+        """評価値テーブル　[0:先手, 1:後手] 。読み込んでいないものも、読み込まずにそのまま返す"""
+        return self._table_obj_list
+
+
+    def is_loaded(
+            self,
+            turn_index):
+        """その手番の評価値テーブルを読み込んであれば真
+
+        Parameters
+        ----------
+        turn_index : int
+            0:先手, 1:後手
+        """
+        return self._table_obj_list[turn_index].mm_table_obj is not None
@@ -0,0 +1,302 @@
+import datetime
+
+from v_a65_0_eval.lib import EvaluationLib
+from v_a65_0_eval.procedural_table import EvaluationProceduralTable
+from v_a65_0_eval.shared_table import EvaluationSharedTable
+from v_a65_0_eval.table_header import EvaluationTableHeader
+from v_a65_0_eval.table_reloader import EvaluationTableReloader
+from v_a65_0_misc.lib import FileName, Turn, EvalutionMmTable
+
+
+class EvaluationTableBase():
+    """ＫＫ、ＫＰ、ＰＫ、ＰＰ評価値テーブルに共通する、読込、差し替え、保存
+
+    評価値テーブルは、指し手Ａ（着手）を行、指し手Ｂ（応手）を列とする。
+    インデックスは 指し手Ａのインデックス * 指し手Ｂのサイズ + 指し手Ｂのインデックス 。
+    指し手とインデックスの対応は、それぞれの評価値テーブルのクラスに書く
+    """
+
+
+    def __init__(
+            self,
+            kind,
+            a_move_size,
+            b_move_size,
+            engine_version_str,
+            table_mode='memory',
+            edit_log_obj=None,
+            codec='raw'):
+        """初期化
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp' のいずれか。ファイル名、ヘッダー、編集ログに使う
+        a_move_size : int
+            指し手Ａ（着手）の通し番号の数。評価値テーブルの行数
+        b_move_size : int
+            指し手Ｂ（応手）の通し番号の数。評価値テーブルの列数
+        engine_version_str : str
+            将棋エンジンのバージョン
+        table_mode : str
+            評価値テーブル・ファイルの持ち方。 'memory', 'mmap_read', 'mmap_copy', 'shared_read', 'shared_write', 'procedural' のいずれか。
+            'shared_read' は評価値テーブル・サーバーの共有メモリーを読取専用で、 'shared_write' は書込ありで使う。
+            'procedural' は評価値テーブル・ファイルを使わず、ハッシュから値を求め、学習で変えた関係だけを持つ（ EvaluationProceduralTable ）。
+            それ以外は EvaluationLib.read_evaluation_table_as_array_from_file() を参照
+        edit_log_obj : EvaluationEditLog
+            編集ログ。使わないなら None
+        codec : str
+            評価値テーブル・ファイルを新しく作るとき（ヘッダーの無い旧形式のファイルを保存し直すときも）の本体の符号化。 'raw', 'zlib', 'lzma' のいずれか。
+            ヘッダーのあるファイルを読んだときは、そのファイルの符号化のまま保存する
+        """
+        self._kind = kind
+        self._a_move_size = a_move_size
+        self._b_move_size = b_move_size
+        self._engine_version_str = engine_version_str
+        self._table_mode = table_mode
+        self._edit_log_obj = edit_log_obj
+        self._codec = codec
+        self._turn = None
+        self._mm_table_obj = None
+
+        # 別スレッドで読み込んでいる評価値テーブル
+        self._reloader_obj = None
+
+
+    @property
+    def mm_table_obj(self):
+        """評価値テーブル"""
+        return self._mm_table_obj
+
+
+    def load_on_usinewgame(
+            self,
+            turn,
+            is_background=False):
+        """評価値テーブル読込
+
+        前の読込から、ファイルも編集ログも変わっておらず、未保存の変更も無ければ、読み直さない
+
+        Parameters
+        ----------
+        turn : int
+            手番
+        is_background : bool
+            真なら、別スレッドで読み込む。読み終えるまでは今の評価値テーブルを使い、 swap_reloaded_table() で差し替える。
+            まだ読み込んでいないときと、未保存の変更があるときは、この場で読み込む
+        """
+        file_name_obj = FileName(
+                file_stem=f'data[{self._engine_version_str}]_n1_eval_{self._kind}_{Turn.to_string(turn)}',
+                file_extension='.bin'
+        )
+
+        # 前の対局で別スレッドの読込を始めていれば、先に差し替えておく
+        self.swap_reloaded_table(
+                is_wait=True)
+
+        if EvaluationLib.is_mm_table_up_to_date(
+                mm_table_obj=self._mm_table_obj,
+                file_name_obj=file_name_obj,
+                edit_log_obj=self._edit_log_obj):
+            print(f"[{datetime.datetime.now()}] `{file_name_obj.base_name}` file not changed since loaded. skip reloading", flush=True)
+            return
+
+        if is_background and self._mm_table_obj is not None and not self._mm_table_obj.is_file_modified:
+            print(f"[{datetime.datetime.now()}] `{file_name_obj.base_name}` file or its edit log changed. reload it in background", flush=True)
+            self._reloader_obj = EvaluationTableReloader(
+                    file_name_obj=file_name_obj,
+                    build_function=lambda: self._build_mm_table(
+                            turn=turn,
+                            file_name_obj=file_name_obj))
+            return
+
+        mm_table_obj = self._build_mm_table(
+                turn=turn,
+                file_name_obj=file_name_obj)
+
+        # 前の対局でファイルをメモリーマップしていれば閉じる
+        if self._mm_table_obj is not None:
+            self._mm_table_obj.close()
+
+        self._turn = turn
+        self._mm_table_obj = mm_table_obj
+
+
+    def swap_reloaded_table(
+            self,
+            is_wait=False):
+        """別スレッドで読み終えた評価値テーブルがあれば、今の評価値テーブルと差し替えます
+
+        Parameters
+        ----------
+        is_wait : bool
+            真なら、読込が終わるのを待つ。偽なら、まだ読み込んでいる途中のときは何もしない
+
+        Returns
+        -------
+        is_swapped : bool
+            差し替えたら真
+        """
+        if self._reloader_obj is None or (not is_wait and not self._reloader_obj.is_finished):
+            return False
+
+        mm_table_obj = self._reloader_obj.take_table()
+        self._reloader_obj = None
+
+        # 読めなかったときは、今の評価値テーブルを使い続ける
+        if mm_table_obj is None:
+            return False
+
+        self._mm_table_obj.close()
+        self._turn = mm_table_obj.header_obj.turn
+        self._mm_table_obj = mm_table_obj
+
+        print(f"[{datetime.datetime.now()}] swapped `{mm_table_obj.file_name_obj.base_name}` file", flush=True)
+        return True
+
+
+    def _build_mm_table(
+            self,
+            turn,
+            file_name_obj):
+        """ファイルから評価値テーブルを読み込み、編集ログを再生します。ファイルが無ければランダムに作ります
+
+        評価値テーブル・サーバーの共有メモリーを使うときは、ファイルは読まずに共有メモリーにつなぐ
+
+        別スレッドからも呼び出すので、 self の状態は変えない
+
+        Parameters
+        ----------
+        turn : int
+            手番
+        file_name_obj : FileName
+            ファイル名オブジェクト
+
+        Returns
+        -------
+        mm_table_obj : EvalutionMmTable
+            評価値テーブル
+        """
+        # ファイルのヘッダー。読込時には、ファイルがこの評価値テーブルのものか確かめるのに使う
+        header_obj = EvaluationTableHeader(
+                kind=self._kind,
+                turn=turn,
+                a_move_size=self._a_move_size,
+                b_move_size=self._b_move_size,
+                codec=self._codec)
+
+        # 評価値テーブル・サーバーの共有メモリーを使うとき
+        if self._table_mode in ['shared_read', 'shared_write']:
+            shared_table_obj = EvaluationSharedTable.attach(
+                    engine_version_str=self._engine_version_str,
+                    header_obj=header_obj,
+                    is_writable=self._table_mode == 'shared_write')
+
+            if shared_table_obj is not None:
+                mm_table_obj = EvalutionMmTable(
+                        file_name_obj=file_name_obj,
+                        table_as_array=shared_table_obj.table_as_array,
+                        is_file_modified=False,
+                        header_obj=header_obj,
+                        shared_table_obj=shared_table_obj)
+
+                # 学習部は、チェックポイントより後の変更を編集ログから再生して、共有メモリーへ反映する。
+                # 読むだけのプロセスは、学習部が反映したものが見えるので再生しない
+                if self._edit_log_obj is not None and shared_table_obj.is_writable:
+                    self._edit_log_obj.replay(
+                            kind=self._kind,
+                            turn=turn,
+                            mm_table_obj=mm_table_obj)
+
+                return mm_table_obj
+
+            print(f"[{datetime.datetime.now()}] `{file_name_obj.base_name}` shared memory not found. table server is not running? read the file instead", flush=True)
+
+        # 読み込む前の素性を覚えておく。読んでいる途中に変わったなら、次の対局で読み直すことになる
+        if self._edit_log_obj is not None:
+            edit_log_identity = self._edit_log_obj.get_replay_identity(
+                    kind=self._kind,
+                    turn=turn)
+        else:
+            edit_log_identity = None
+
+        # 手続き的に生成する評価値テーブルを使うとき。評価値テーブル・ファイルは読まない
+        if self._table_mode == 'procedural':
+            mm_table_obj = EvaluationProceduralTable.read_file(
+                    file_name_obj=file_name_obj,
+                    header_obj=header_obj,
+                    edit_log_identity=edit_log_identity)
+
+            if self._edit_log_obj is not None:
+                self._edit_log_obj.replay(
+                        kind=self._kind,
+                        turn=turn,
+                        mm_table_obj=mm_table_obj)
+
+            return mm_table_obj
+
+        print(f"[{datetime.datetime.now()}] check  `{file_name_obj.base_name}` file exists...", flush=True)
+        file_identity = EvaluationLib.get_file_identity(file_name_obj)
+
+        if file_identity is not None:
+            # ジャーナルを反映するのは、ファイルを書き換えるプロセス（学習部など）だけ
+            is_writer = self._table_mode in ['mmap_copy', 'shared_write'] or (self._edit_log_obj is not None and self._edit_log_obj.is_writable)
+
+            # 読込
+            table_as_array = EvaluationLib.read_evaluation_table_as_array_from_file(
+                    file_name_obj=file_name_obj,
+                    header_obj=header_obj,
+                    table_mode=self._table_mode,
+                    is_journal_recovery=is_writer)
+        else:
+            table_as_array = None
+
+
+        # ファイルが存在しないとき
+        if table_as_array is None:
+            table_as_array = EvaluationLib.create_random_evaluation_table_as_array(
+                    a_move_size=header_obj.a_move_size,
+                    b_move_size=header_obj.b_move_size)
+            is_file_modified = True     # 新規作成だから
+
+        else:
+            is_file_modified = False
+
+
+        mm_table_obj = EvalutionMmTable(
+                file_name_obj=file_name_obj,
+                table_as_array=table_as_array,
+                is_file_modified=is_file_modified,
+                header_obj=header_obj,
+                file_identity=file_identity,
+                edit_log_identity=edit_log_identity)
+
+        # チェックポイントより後の変更を、編集ログから再生する
+        if self._edit_log_obj is not None:
+            self._edit_log_obj.replay(
+                    kind=self._kind,
+                    turn=turn,
+                    mm_table_obj=mm_table_obj)
+
+        return mm_table_obj
+
+
+    def save_evaluation_table_file(
+            self,
+            is_incremental=True,
+            is_debug=False):
+        """ファイルへの保存
+
+        Parameters
+        ----------
+        is_incremental : bool
+            真なら、変更したページが少なければそのページだけ上書きする。偽なら、ファイル全体を置き換える
+        is_debug : bool
+            デバッグモードか？
+
+        保存するかどうかは先に判定しておくこと
+        """
+        EvaluationLib.save_mm_table(
+                mm_table_obj=self.mm_table_obj,
+                is_incremental=is_incremental,
+                is_debug=is_debug)
@@ -0,0 +1,295 @@
+import cshogi
+import struct
+import zlib
+
+from v_a65_0_misc.lib import Turn
+
+
+class EvaluationTableHeader():
+    """評価値テーブル・ファイルのヘッダー
+
+    ファイルの先頭の 32 バイト。数はリトルエンディアン
+
+        4 bytes : マジック・ナンバー 'KWEV'
+        2 bytes : 形式のバージョン
+        2 bytes : ヘッダーのバイト数
+        1 byte  : テーブル番号。 0:KL(kk), 1:KQ(kp), 2:PL(pk), 3:PQ(pp)
+        1 byte  : 手番インデックス。 0:先手, 1:後手
+        1 byte  : バイトの中のビットの並び。 0:大きな桁から（ビッグエンディアン）
+        1 byte  : 本体の符号化。 0:無圧縮, 1:zlib, 2:lzma
+        4 bytes : 指し手Ａのサイズ
+        4 bytes : 指し手Ｂのサイズ
+        8 bytes : ファイル上の本体のバイト数（圧縮していれば圧縮後）
+        4 bytes : 展開後の本体の CRC-32
+
+    ヘッダーの後ろに本体（１ビットを１関係として詰めたバイト列。符号化していればそれを圧縮したもの）が続く
+    """
+
+
+    magic = b'KWEV'
+    """マジック・ナンバー"""
+
+    format_version = 1
+    """形式のバージョン"""
+
+    _header_format = '<4sHHBBBBIIQI'
+    """ヘッダーの形式"""
+
+    header_size = struct.calcsize(_header_format)
+    """ヘッダーのバイト数"""
+
+    bit_order_msb_first = 0
+    """バイトの中のビットの並び。大きな桁から"""
+
+    _kind_to_table_id = {
+        'kk': 0,
+        'kp': 1,
+        'pk': 2,
+        'pp': 3,
+    }
+    """評価値テーブルの種類をテーブル番号へ"""
+
+    _table_id_to_kind = {table_id: kind for (kind, table_id) in _kind_to_table_id.items()}
+    """テーブル番号を評価値テーブルの種類へ"""
+
+    _codec_to_id = {
+        'raw': 0,
+        'zlib': 1,
+        'lzma': 2,
+    }
+    """本体の符号化を番号へ"""
+
+    _id_to_codec = {codec_id: codec for (codec, codec_id) in _codec_to_id.items()}
+    """番号を本体の符号化へ"""
+
+
+    @classmethod
+    def to_table_id(clazz, kind):
+        """評価値テーブルの種類をテーブル番号へ
+
+        Parameters
+        ----------
+        kind : str
+            'kk', 'kp', 'pk', 'pp'
+        """
+        return clazz._kind_to_table_id[kind]
+
+
+    @classmethod
+    def from_table_id(clazz, table_id):
+        """テーブル番号を評価値テーブルの種類へ"""
+        return clazz._table_id_to_kind[table_id]
+
+
+    def __init__(
+            self,
+            kind,
+            turn,
+            a_move_size,
+            b_move_size,
+            codec='raw',
+            body_size=None,
+            body_crc32=None):
+        """初期化
+
+        Parameters
+        ----------
+        kind : str
+            評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'
+        turn : int
+            手番
+        a_move_size : int
+            指し手Ａのサイズ
+        b_move_size : int
+            指し手Ｂのサイズ
+        codec : str
+            本体の符号化。 'raw', 'zlib', 'lzma'
+        body_size : int
+            ファイル上の本体のバイト数。ファイルから読んだときだけ
+        body_crc32 : int
+            展開後の本体の CRC-32 。ファイルから読んだときだけ
+        """
+        if codec not in EvaluationTableHeader._codec_to_id:
+            raise ValueError(f"[evaluation table header > init] unexpected codec:{codec}")
+
+        self._kind = kind
+        self._turn = turn
+        self._a_move_size = a_move_size
+        self._b_move_size = b_move_size
+        self._codec = codec
+        self._body_size = body_size
+        self._body_crc32 = body_crc32
+
+
+    @property
+    def kind(self):
+        """評価値テーブルの種類。 'kk', 'kp', 'pk', 'pp'"""
+        return self._kind
+
+
+    @property
+    def turn(self):
+        """手番"""
+        return self._turn
+
+
+    @property
+    def a_move_size(self):
+        """指し手Ａのサイズ"""
+        return self._a_move_size
+
+
+    @property
+    def b_move_size(self):
+        """指し手Ｂのサイズ"""
+        return self._b_move_size
+
+
+    @property
+    def codec(self):
+        """本体の符号化。 'raw', 'zlib', 'lzma'"""
+        return self._codec
+
+
+    @codec.setter
+    def codec(self, value):
+        """本体の符号化。ファイルを読んだときは、そのファイルの符号化に合わせる。次に保存するときもその符号化を使う"""
+        if value not in EvaluationTableHeader._codec_to_id:
+            raise ValueError(f"[evaluation table header > codec] unexpected codec:{value}")
+
+        self._codec = value
+
+
+    @property
+    def body_size(self):
+        """ファイル上の本体のバイト数"""
+        return self._body_size
+
+
+    @property
+    def body_crc32(self):
+        """展開後の本体の CRC-32"""
+        return self._body_crc32
+
+
+    @property
+    def table_size(self):
+        """メモリー上の評価値テーブルのバイト数"""
+        return (self._a_move_size * self._b_move_size + 7) // 8
+
+
+    def to_binary(
+            self,
+            body_size,
+            body_crc32):
+        """ヘッダーをバイト列にします
+
+        Parameters
+        ----------
+        body_size : int
+            ファイル上の本体のバイト数
+        body_crc32 : int
+            展開後の本体の CRC-32
+        """
+        return struct.pack(
+                EvaluationTableHeader._header_format,
+                EvaluationTableHeader.magic,
+                EvaluationTableHeader.format_version,
+                EvaluationTableHeader.header_size,
+                EvaluationTableHeader.to_table_id(self._kind),
+                Turn.to_index(self._turn),
+                EvaluationTableHeader.bit_order_msb_first,
+                EvaluationTableHeader._codec_to_id[self._codec],
+                self._a_move_size,
+                self._b_move_size,
+                body_size,
+                body_crc32)
+
+
+    @staticmethod
+    def has_magic(
+            head_binary):
+        """ファイルの先頭がヘッダーなら真。偽なら、ヘッダーの無い旧形式のファイル"""
+        return head_binary[:len(EvaluationTableHeader.magic)] == EvaluationTableHeader.magic
+
+
+    @staticmethod
+    def from_binary(
+            head_binary):
+        """ファイルの先頭のバイト列からヘッダーを読み取ります
+
+        Parameters
+        ----------
+        head_binary : bytes
+            ファイルの先頭 header_size バイト
+
+        Returns
+        -------
+        header_obj : EvaluationTableHeader
+            ヘッダー
+        """
+        if len(head_binary) < EvaluationTableHeader.header_size or not EvaluationTableHeader.has_magic(head_binary):
+            raise ValueError(f"[evaluation table header > from binary] not evaluation table header. head:{bytes(head_binary[:EvaluationTableHeader.header_size])}")
+
+        (_magic, format_version, header_size, table_id, turn_index, bit_order, codec_id, a_move_size, b_move_size, body_size, body_crc32) = struct.unpack_from(
+                EvaluationTableHeader._header_format,
+                head_binary)
+
+        if format_version != EvaluationTableHeader.format_version or header_size != EvaluationTableHeader.header_size:
+            raise ValueError(f"[evaluation table header > from binary] unsupported format. format_version:{format_version}  header_size:{header_size}")
+
+        if bit_order != EvaluationTableHeader.bit_order_msb_first:
+            raise ValueError(f"[evaluation table header > from binary] unsupported bit order:{bit_order}")
+
+        if table_id not in EvaluationTableHeader._table_id_to_kind or turn_index not in [0, 1] or codec_id not in EvaluationTableHeader._id_to_codec:
+            raise ValueError(f"[evaluation table header > from binary] broken header. table_id:{table_id}  turn_index:{turn_index}  codec_id:{codec_id}")
+
+        return EvaluationTableHeader(
+                kind=EvaluationTableHeader.from_table_id(table_id),
+                turn=[cshogi.BLACK, cshogi.WHITE][turn_index],
+                a_move_size=a_move_size,
+                b_move_size=b_move_size,
+                codec=EvaluationTableHeader._id_to_codec[codec_id],
+                body_size=body_size,
+                body_crc32=body_crc32)
+
+
+    def verify(
+            self,
+            actual_header_obj,
+            file_name_obj):
+        """ファイルから読んだヘッダーが、このヘッダーの評価値テーブルのものか確かめます
+
+        Parameters
+        ----------
+        actual_header_obj : EvaluationTableHeader
+            ファイルから読んだヘッダー
+        file_name_obj : FileName
+            ファイル名オブジェクト。エラー・メッセージ用
+        """
+        expected = (self._kind, self._turn, self._a_move_size, self._b_move_size)
+        actual = (actual_header_obj.kind, actual_header_obj.turn, actual_header_obj.a_move_size, actual_header_obj.b_move_size)
+
+        if expected != actual:
+            raise ValueError(f"[evaluation table header > verify] `{file_name_obj.base_name}` file is for another table. (kind, turn, a_move_size, b_move_size) expected:{expected}  actual:{actual}")
+
+
+    @staticmethod
+    def compute_crc32(
+            body_binary,
+            chunk_size=1024 * 1024):
+        """本体の CRC-32 を、少しずつ計算します
+
+        Parameters
+        ----------
+        body_binary : bytes or memoryview
+            本体
+        chunk_size : int
+            １回に計算するバイト数
+        """
+        crc = 0
+        with memoryview(body_binary) as view:
+            for offset in range(0, len(view), chunk_size):
+                crc = zlib.crc32(view[offset:offset + chunk_size], crc)
+
+        return crc
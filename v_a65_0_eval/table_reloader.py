@@ -0,0 +1,64 @@
+import datetime
+import threading
+
+
+class EvaluationTableReloader():
+    """評価値テーブルを別スレッドで読み込むための、もう１枚のバッファー
+
+    読み込んでいる間も、今の評価値テーブルをそのまま使える。
+    読み終えたら、呼び出し側のスレッドで take_table() して差し替える（ダブル・バッファ）
+    """
+
+
+    def __init__(
+            self,
+            file_name_obj,
+            build_function):
+        """初期化して、すぐ読込を始めます
+
+        Parameters
+        ----------
+        file_name_obj : FileName
+            読み込むファイル名オブジェクト。ログ用
+        build_function : function
+            評価値テーブル（ EvalutionMmTable ）を読み込んで返す関数。別スレッドで呼び出す
+        """
+        self._file_name_obj = file_name_obj
+        self._build_function = build_function
+        self._mm_table_obj = None
+
+        self._thread = threading.Thread(
+                target=self._run,
+                daemon=True)
+        self._thread.start()
+
+
+    def _run(self):
+        """別スレッドで読み込みます"""
+        try:
+            self._mm_table_obj = self._build_function()
+
+        # 読めなければ今の評価値テーブルを使い続ける。ファイルが変わったままなので、次の対局でまた読み直す
+        except Exception as ex:
+            print(f"[{datetime.datetime.now()}] [evaluation table reloader] failed to reload `{self._file_name_obj.base_name}` file. keep using the current table. ex:{ex}", flush=True)
+
+
+    @property
+    def is_finished(self):
+        """読込が終わっていれば真（失敗したときも）"""
+        return not self._thread.is_alive()
+
+
+    def take_table(self):
+        """読込が終わるのを待って、読み込んだ評価値テーブルを返します
+
+        Returns
+        -------
+        mm_table_obj : EvalutionMmTable
+            読み込んだ評価値テーブル。失敗したときは None
+        """
+        self._thread.join()
+
+        mm_table_obj = self._mm_table_obj
+        self._mm_table_obj = None
+        return mm_table_obj
@@ -59,3 +59,10 @@ class LearnConfigDocument():
     def short_mate_mode_relay_move_number(self):
         """短手数の詰めチェックモードでの指し継ぎ手数"""
         return self._document['short_mate_mode']['relay_move_number']
+
+
+    @property
+    def mate_solver_max_nodes(self):
+        """詰める方の学習で詰将棋を解くときに、調べる局面の数の上限。 0 なら解かない。
+        設定ファイルに `mate_solver` の表が無ければ 3000"""
+        return self._document.get('mate_solver', {}).get('max_nodes', 3000)
@@ -5,6 +5,7 @@ import random
 from v_a65_0_debug_plan import DebugPlan
 from v_a65_0_misc.choice_best_move import ChoiceBestMove
 from v_a65_0_misc.lib import Turn, BoardHelper
+from v_a65_0_misc.mate_solver import MateSolver
 
 
 class LearnGame():
@@ -62,6 +63,12 @@ class LearnGame():
         return random.randint(0,denominator) <= (numerator - 1)
 
 
+    def is_edit_log_writing(self):
+        """評価値テーブルの変更を編集ログへ追記しているなら真"""
+        edit_log_obj = self._kifuwarabe.edit_log_obj
+        return edit_log_obj is not None and edit_log_obj.is_writable
+
+
     def restore_end_position(self):
         """終局図の内部データに進める"""
 
@@ -181,8 +188,9 @@ class LearnGame():
             # コマメに保存する
             #
             #       全ての評価値テーブル［0:先手, 1:後手］の（変更があれば）保存
+            #       編集ログを書いているなら、変更は既にログに残っているので、ここでは保存しない
             #
-            if mate_th <=4 or mate_th % 20 == 1:
+            if not self.is_edit_log_writing() and (mate_th <=4 or mate_th % 20 == 1):
                 self._kifuwarabe.save_eval_all_tables(
                         is_debug=self._is_debug)
 
@@ -205,8 +213,9 @@ class LearnGame():
             # コマメに保存する
             #
             #       全ての評価値テーブル［0:先手, 1:後手］の（変更があれば）保存
+            #       編集ログを書いているなら、変更は既にログに残っているので、ここでは保存しない
             #
-            if mate_th <=4 or mate_th % 20 == 0:
+            if not self.is_edit_log_writing() and (mate_th <=4 or mate_th % 20 == 0):
                 self._kifuwarabe.save_eval_all_tables(
                         is_debug=self._is_debug)
 
@@ -217,13 +226,16 @@ class LearnGame():
         # -----
         #
 
-        # 全ての評価値テーブル［0:先手, 1:後手］の（変更があれば）保存
+        # 全ての評価値テーブル［0:先手, 1:後手］の（変更があれば）保存。編集ログを書いているなら、ここがチェックポイント
         self._kifuwarabe.save_eval_all_tables(
                 is_debug=self._is_debug)
 
         # 終局図の内部データに進める
         self.restore_end_position()
 
+        # 同じ局面を数え直さずに済んだ割合
+        print(f"[{datetime.datetime.now()}] [learn] policy cache  {self._kifuwarabe.policy_cache.get_statistics_str()}", flush=True)
+
         print(f"[{datetime.datetime.now()}] [learn] finished", flush=True)
 
 
@@ -299,6 +311,27 @@ class LearnGame():
 
         print(f'  累計：{number_of_all_moves_in_this_position}', flush=True)
 
+        #
+        # 詰める方は、問題局面の詰将棋を解いておく
+        # -----------------------------------
+        #
+        #       詰みがあれば、着手ごとに詰将棋を解けば、プレイアウトしなくても詰みを続ける手か、逃す手かが決まる
+        #
+        is_mate_at_problem = False
+        mate_solver_max_nodes = self._learn_config_document.mate_solver_max_nodes
+        if is_won_player_turn and 0 < mate_solver_max_nodes:
+            mate_solver = MateSolver(
+                    board=self._board,
+                    max_nodes=mate_solver_max_nodes)
+            (mate_result_str, mate_move_id_list) = mate_solver.solve()
+            is_mate_at_problem = mate_result_str == 'mate'
+
+            # 解けたかはログに出したい
+            if is_mate_at_problem:
+                print(f"[{datetime.datetime.now()}] [learn > at position]  mate_th:{mate_th}  詰将棋：{len(mate_move_id_list)}手詰め  nodes:{mate_solver.nodes}  {' '.join([cshogi.move_to_usi(move_id) for move_id in mate_move_id_list])}", flush=True)
+            else:
+                print(f"[{datetime.datetime.now()}] [learn > at position]  mate_th:{mate_th}  詰将棋：{mate_result_str}  nodes:{mate_solver.nodes}", flush=True)
+
         for tier, ranked_strict_move_u_set in enumerate(tiered_strict_move_u_set_list):
 
             if self._is_debug:
@@ -355,23 +388,51 @@ class LearnGame():
                 # プレイアウトの上限手数
                 move_number_of_end_of_playout = self._board.move_number + move_number_difference
 
+                #
+                # 問題局面に詰みがあれば、指した後の局面の詰将棋を解く（相手の手番で、どう逃げても詰むか）
+                #
+                mate_result_str = None
+                if is_mate_at_problem:
+                    (mate_result_str, mate_move_id_list) = MateSolver(
+                            board=self._board,
+                            max_nodes=mate_solver_max_nodes).solve(
+                                    is_attacker_turn=False)
+
+                # 解ければ、プレイアウトしない
+                if mate_result_str in ['mate', 'nomate']:
+                    result_str = mate_result_str
+                    reason = 'mate_solver'
+
                 #
                 # プレイアウトする
                 #
                 #       FIXME ランダムか、ポリシー評価値を有効にするか？どちらがいいか？
                 #
-                (result_str, reason) = self._kifuwarabe.playout(
-                        is_in_learn=True,
-                        # １手指した分引く
-                        max_playout_depth=move_number_difference)
+                else:
+                    (result_str, reason) = self._kifuwarabe.playout(
+                            is_in_learn=True,
+                            # １手指した分引く
+                            max_playout_depth=move_number_difference)
 
                 # 進捗ログを出したい
                 def log_progress(comment):
                     if DebugPlan.learn_at_position_log_progress():
                         print(f'[{datetime.datetime.now()}] [learn > at position] {tier:2}位  ({choice_num:3}/{number_of_all_moves_in_this_position:3})  {strict_move_u:5}  {result_str}  [(投了{self._move_number_at_end:3}手目) (巻戻し:{move_number_between_end_and_problem:3}) (学習局面:{move_number_at_problem:3}手目) (指継:{move_number_difference:3}手) (再投了:{self._board.move_number:3}手目 {Turn.to_kanji(self._board.turn)})]  {reason}  {comment}', flush=True)
 
+                # 詰将棋を解いた
+                if reason == 'mate_solver':
+                    # 詰みを続けた
+                    if result_str == 'mate':
+                        shall_1_weaken_2_strongthen = 2
+                        log_progress(f"[▲UP▲] 詰将棋を解いたら、{len(mate_move_id_list) + 1}手で詰んだ")
+
+                    # 詰みを逃した
+                    else:
+                        shall_1_weaken_2_strongthen = 1
+                        log_progress(f"[▼DOWN▼] 詰将棋を解いたら、詰みを逃していた")
+
                 # どちらかが投了した
-                if reason == 'resign':
+                elif reason == 'resign':
                     # 負けた（問題局面と投了局面の手番が同じ）
                     if turn_at_problem == self._board.turn:
                         shall_1_weaken_2_strongthen = 1
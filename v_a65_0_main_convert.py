@@ -0,0 +1,109 @@
+import cshogi
+import datetime
+import os
+
+# python v_a65_0_main_convert.py
+from     v_a65_0 import engine_version_str, table_codec_for_new_file
+from     v_a65_0_eval.k import EvaluationKMove
+from     v_a65_0_eval.lib import EvaluationLib
+from     v_a65_0_eval.p import EvaluationPMove
+from     v_a65_0_eval.procedural_table import EvaluationProceduralTable
+from     v_a65_0_eval.table_header import EvaluationTableHeader
+from     v_a65_0_misc.lib import FileName, Turn
+
+
+def convert_all_evaluation_table_files(
+        codec):
+    """全ての評価値テーブル・ファイルの本体の符号化を変えて、保存し直します
+
+    将棋エンジンも学習部も止めてから使うこと
+
+    Parameters
+    ----------
+    codec : str
+        新しい符号化。 'raw', 'zlib', 'lzma'
+    """
+    for turn in [cshogi.BLACK, cshogi.WHITE]:
+        for (kind, a_move_size, b_move_size) in [
+                ('kk', EvaluationKMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+                ('kp', EvaluationKMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size()),
+                ('pk', EvaluationPMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+                ('pp', EvaluationPMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size())]:
+
+            file_name_obj = FileName(
+                    file_stem=f'data[{engine_version_str}]_n1_eval_{kind}_{Turn.to_string(turn)}',
+                    file_extension='.bin')
+
+            if not os.path.isfile(file_name_obj.base_name):
+                print(f"[{datetime.datetime.now()}] [convert] `{file_name_obj.base_name}` file not found. skip", flush=True)
+                continue
+
+            EvaluationLib.convert_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    header_obj=EvaluationTableHeader(
+                            kind=kind,
+                            turn=turn,
+                            a_move_size=a_move_size,
+                            b_move_size=b_move_size),
+                    codec=codec)
+
+
+def export_all_procedural_tables(
+        codec):
+    """手続き的に生成する評価値テーブル（ 'procedural' ）を全て、評価値テーブル・ファイル（密な形式）へ書き出します
+
+    既にある評価値テーブル・ファイルは置き換える
+
+    Parameters
+    ----------
+    codec : str
+        書き出すファイルの本体の符号化。 'raw', 'zlib', 'lzma'
+    """
+    for turn in [cshogi.BLACK, cshogi.WHITE]:
+        for (kind, a_move_size, b_move_size) in [
+                ('kk', EvaluationKMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+                ('kp', EvaluationKMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size()),
+                ('pk', EvaluationPMove.get_serial_number_size(), EvaluationKMove.get_serial_number_size()),
+                ('pp', EvaluationPMove.get_serial_number_size(), EvaluationPMove.get_serial_number_size())]:
+
+            file_name_obj = FileName(
+                    file_stem=f'data[{engine_version_str}]_n1_eval_{kind}_{Turn.to_string(turn)}',
+                    file_extension='.bin')
+
+            header_obj = EvaluationTableHeader(
+                    kind=kind,
+                    turn=turn,
+                    a_move_size=a_move_size,
+                    b_move_size=b_move_size,
+                    codec=codec)
+
+            procedural_table_obj = EvaluationProceduralTable.read_file(
+                    file_name_obj=file_name_obj,
+                    header_obj=header_obj)
+
+            EvaluationLib.save_evaluation_table_file(
+                    file_name_obj=file_name_obj,
+                    table_as_array=procedural_table_obj.to_table_as_array(),
+                    header_obj=header_obj)
+
+            print(f"[{datetime.datetime.now()}] [export] exported `{file_name_obj.base_name}` file. overrides:{len(procedural_table_obj.override_dic)}  codec:{codec}", flush=True)
+
+
+########################################
+# スクリプト実行時
+########################################
+
+if __name__ == '__main__':
+    """スクリプト実行時"""
+
+    line = input('codec? (raw, zlib, lzma) or export?')
+
+    if line in ['raw', 'zlib', 'lzma']:
+        convert_all_evaluation_table_files(codec=line)
+
+    # 手続き的に生成する評価値テーブルを、密な形式へ書き出す
+    elif line == 'export':
+        export_all_procedural_tables(codec=table_codec_for_new_file)
+
+    else:
+        print("please input codec 'raw', 'zlib', 'lzma' or 'export'")
@@ -4,7 +4,7 @@ import time
 import random
 
 # python v_a65_0_main_learn.py
-from     v_a65_0 import Kifuwarabe, engine_version_str
+from     v_a65_0 import Kifuwarabe, engine_version_str, reply_set_mode_in_learn, table_codec_for_new_file, table_mode_in_learn
 from     v_a65_0_misc.game_result_document import GameResultDocument
 from     v_a65_0_learn.game import LearnGame
 from     v_a65_0_learn.config_document import LearnConfigDocument
@@ -170,7 +170,12 @@ if __name__ == '__main__':
     #print(f"cshogi.BLACK:{cshogi.BLACK}  cshogi.WHITE:{cshogi.WHITE}")
 
     try:
-        kifuwarabe = Kifuwarabe()
+        # 学習中の変更は、編集ログへ追記しつつ、チェックポイントで保存するまでこのプロセスの中（または評価値テーブル・サーバーの共有メモリー）だけに留める
+        kifuwarabe = Kifuwarabe(
+                table_mode=table_mode_in_learn,
+                edit_log_mode='write',
+                table_codec=table_codec_for_new_file,
+                reply_set_mode=reply_set_mode_in_learn)
         print(kifuwarabe.board)
 
         learning_framework = LearningFramework()
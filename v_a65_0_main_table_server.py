@@ -0,0 +1,94 @@
+import cshogi
+import datetime
+
+# python v_a65_0_main_table_server.py
+from     v_a65_0 import engine_version_str
+from     v_a65_0_eval.kk import EvaluationKkTable
+from     v_a65_0_eval.kp import EvaluationKpTable
+from     v_a65_0_eval.pk import EvaluationPkTable
+from     v_a65_0_eval.pp import EvaluationPpTable
+from     v_a65_0_eval.shared_table import EvaluationSharedTable
+
+
+class EvaluationTableServer():
+    """評価値テーブル・サーバー
+
+    評価値テーブル・ファイル８つを共有メモリーへ読み込んでおく。
+    同じマシンで動かす将棋エンジン、自己対局、学習部は、ファイルを読まずに、この共有メモリーにつなぐ（ 'shared_read', 'shared_write' ）。
+    エンジンの数が増えても、評価値テーブルはメモリーに１つ分しか要らない
+
+    サーバーを止めると共有メモリーは消える。既につないでいるプロセスは、切り離すまで古い共有メモリーを使い続けるので、
+    サーバーを起動し直したら、将棋エンジンや学習部も起動し直すこと
+    """
+
+
+    def __init__(self):
+        # 共有メモリーに置いた評価値テーブルのリスト
+        self._shared_table_obj_list = []
+
+
+    def start_server(self):
+        """評価値テーブル・ファイルを全て読み込んで、共有メモリーに置きます"""
+
+        print(f"[{datetime.datetime.now()}] [table server > start server] start...", flush=True)
+
+        for turn in [cshogi.BLACK, cshogi.WHITE]:
+            for table_class in [EvaluationKkTable, EvaluationKpTable, EvaluationPkTable, EvaluationPpTable]:
+                # ファイル全体をメモリーに読み込む。ファイルが無ければランダムに作る
+                table_obj = table_class(
+                        engine_version_str=engine_version_str,
+                        table_mode='memory')
+                table_obj.load_on_usinewgame(
+                        turn=turn)
+
+                mm_table_obj = table_obj.mm_table_obj
+
+                self._shared_table_obj_list.append(EvaluationSharedTable.create(
+                        engine_version_str=engine_version_str,
+                        header_obj=mm_table_obj.header_obj,
+                        table_as_array=mm_table_obj.table_as_array))
+
+        print(f"[{datetime.datetime.now()}] [table server > start server] finished", flush=True)
+
+
+    def print_generations(self):
+        """共有メモリーごとの世代番号を表示します。学習部が書き込むと増える"""
+        for shared_table_obj in self._shared_table_obj_list:
+            print(f"[{datetime.datetime.now()}] [table server > print generations] {shared_table_obj.name:30}  generation:{shared_table_obj.generation}", flush=True)
+
+
+    def stop_server(self):
+        """共有メモリーを全て消します"""
+        for shared_table_obj in self._shared_table_obj_list:
+            shared_table_obj.unlink()
+
+        self._shared_table_obj_list = []
+        print(f"[{datetime.datetime.now()}] [table server > stop server] shared memory unlinked", flush=True)
+
+
+########################################
+# スクリプト実行時
+########################################
+
+if __name__ == '__main__':
+    """スクリプト実行時"""
+
+    table_server = EvaluationTableServer()
+
+    try:
+        table_server.start_server()
+
+        while True:
+            line = input('command? (generation, quit)')
+
+            if line == 'generation':
+                table_server.print_generations()
+
+            elif line == 'quit':
+                break
+
+            else:
+                print("please input command 'generation' or 'quit'")
+
+    finally:
+        table_server.stop_server()
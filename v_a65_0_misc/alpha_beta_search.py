@@ -0,0 +1,694 @@
+import cshogi
+import random
+import time
+
+from v_a65_0_misc.choice_best_move import ChoiceBestMove
+
+
+class SearchAborted(Exception):
+    """時間切れか、中断で、探索を打ち切った"""
+    pass
+
+
+class AlphaBetaSearch():
+    """反復深化のアルファ・ベータ探索
+
+    根の指し手は、好手・悪手の階位（ ChoiceBestMove ）の良い順に並べ、同じ階位の中はランダムに並べる。
+    根より下の指し手は、置換表の指し手、駒を取る手（取る駒が高く、取る駒が安い順）、キラー手、その他の順に並べ、
+    根から policy_ply 手目までの局面では、その他の指し手を階位の良い順に並べる。
+
+    評価値は駒の損得（持ち駒も同じ値）に、根から policy_ply 手目までの局面で指した手の方策の評価値（関係の有りの数と総数から求める）を足したもの。
+    方策を数えるには１局面で数ミリ秒かかるので、浅い局面だけで数え、数えたものは PolicyCache で次の深さ、次の go でも使う。
+    末端では駒を取る手だけを読み（静止探索）、王手されていれば全ての応手を読む。
+    千日手は 0 、連続王手の千日手は勝ち負けとする
+    """
+
+
+    mate_value = 30000
+    """詰みの評価値。 n 手で詰むなら mate_value - n"""
+
+    infinite_value = 32000
+    """どの評価値よりも大きな値"""
+
+    max_quiescence_ply = 8
+    """静止探索で、反復深化の深さより何手先まで読むか"""
+
+    node_interval_for_time_check = 256
+    """何局面ごとに、時間切れと中断を確かめるか"""
+
+    policy_ply = 2
+    """根から何手目の局面まで（根は 0 手目。この手数は含まない）方策を数えて、指し手の並べ替えと評価値に使うか"""
+
+    max_policy_value = 45
+    """方策の評価値の上限。着手と応手の関係が全て有りなら +max_policy_value 、全て無しなら -max_policy_value"""
+
+    piece_value_list = [0, 90, 315, 405, 495, 855, 990, 540, 0, 540, 540, 540, 540, 945, 1395]
+    """駒の種類（ cshogi.PAWN など）を添え字とする、駒の価値"""
+
+    _exact_flag = 0
+    """置換表の評価値が、ちょうどの値"""
+
+    _lower_flag = 1
+    """置換表の評価値が、下限（ベータ・カット）"""
+
+    _upper_flag = 2
+    """置換表の評価値が、上限（どの指し手もアルファを超えなかった）"""
+
+
+    def __init__(
+            self,
+            kifuwarabe,
+            time_manager,
+            max_depth,
+            transposition_table=None):
+        """初期化
+
+        Parameters
+        ----------
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+        time_manager : TimeManager
+            持ち時間の管理
+        max_depth : int
+            反復深化の深さの上限
+        transposition_table : dict
+            置換表。先読みした結果を次の go でも使うなら、同じ辞書を渡す。 None なら新しく作る
+        """
+        self._kifuwarabe = kifuwarabe
+        self._board = kifuwarabe.board
+        self._time_manager = time_manager
+        self._max_depth = max_depth
+
+        self._nodes = 0
+        self._seldepth = 0
+        self._is_stopped = False
+
+        # 置換表。キーは局面のハッシュ。値は（残りの深さ, 評価値, 評価値の種類, 最善手）
+        self._transposition_table = {} if transposition_table is None else transposition_table
+
+        # 手数ごとの、キラー手２つ
+        self._killer_move_list_list = []
+
+        # 手数ごとの読み筋
+        self._pv_list_list = []
+
+        # 静止探索を打ち切る手数
+        self._max_ply = 0
+
+        # 方策を数えた局面の数
+        self._policy_nodes = 0
+
+
+    @property
+    def nodes(self):
+        """探索した局面の数"""
+        return self._nodes
+
+
+    @property
+    def policy_nodes(self):
+        """方策を数えた局面の数（ PolicyCache に有ったものも含む）"""
+        return self._policy_nodes
+
+
+    def stop(self):
+        """探索を止めます。別スレッドから呼んでもよい。読み終わった深さの最善手が残る"""
+        self._is_stopped = True
+
+
+    @staticmethod
+    def get_material_gain(move_id):
+        """その指し手で、指した側が得する駒の価値
+
+        駒を取れば、相手の盤上の駒がなくなり、自分の持ち駒が増える。成れば、成った分だけ価値が上がる
+
+        Parameters
+        ----------
+        move_id : int
+            cshogi の指し手の整数。 legal_moves から得たもの（取った駒の情報を含む）
+        """
+        gain = 0
+
+        captured_piece_type = cshogi.move_cap(move_id)
+        if captured_piece_type != 0:
+            hand_piece_type = captured_piece_type - 8 if cshogi.PROM_PAWN <= captured_piece_type else captured_piece_type
+            gain += AlphaBetaSearch.piece_value_list[captured_piece_type] + AlphaBetaSearch.piece_value_list[hand_piece_type]
+
+        if cshogi.move_is_promotion(move_id):
+            piece_type = cshogi.move_from_piece_type(move_id)
+            gain += AlphaBetaSearch.piece_value_list[piece_type + 8] - AlphaBetaSearch.piece_value_list[piece_type]
+
+        return gain
+
+
+    @staticmethod
+    def evaluate_material(board):
+        """手番から見た、駒の損得
+
+        Parameters
+        ----------
+        board : Board
+            局面
+        """
+        black_value = 0
+
+        for piece in board.pieces:
+            if piece == 0:
+                continue
+
+            if piece < 16:
+                black_value += AlphaBetaSearch.piece_value_list[piece]
+            else:
+                black_value -= AlphaBetaSearch.piece_value_list[piece - 16]
+
+        (black_hand_list, white_hand_list) = board.pieces_in_hand
+        for (piece_type, black_count, white_count) in zip(
+                [cshogi.PAWN, cshogi.LANCE, cshogi.KNIGHT, cshogi.SILVER, cshogi.GOLD, cshogi.BISHOP, cshogi.ROOK],
+                black_hand_list,
+                white_hand_list):
+            black_value += AlphaBetaSearch.piece_value_list[piece_type] * (black_count - white_count)
+
+        if board.turn == cshogi.BLACK:
+            return black_value
+
+        return -black_value
+
+
+    @staticmethod
+    def get_policy_value(
+            positive_of_relation,
+            total_of_relation):
+        """方策の評価値。着手と応手の関係の有りの割合が高いほど大きい
+
+        Parameters
+        ----------
+        positive_of_relation : int
+            関係が有りの数
+        total_of_relation : int
+            関係の総数。 0 なら（応手が無ければ） 0 を返す
+        """
+        if total_of_relation < 1:
+            return 0
+
+        return (AlphaBetaSearch.max_policy_value * (2 * positive_of_relation - total_of_relation)) // total_of_relation
+
+
+    @staticmethod
+    def add_policy_value(
+            value,
+            policy_value):
+        """評価値に方策の評価値を足します。詰みの評価値は、手数が変わらないようにそのまま返す"""
+        if AlphaBetaSearch.mate_value - 1000 <= abs(value):
+            return value
+
+        return value + policy_value
+
+
+    def get_policy(
+            self,
+            move_id_list):
+        """今の局面の、指し手ごとの階位と方策の評価値
+
+        Parameters
+        ----------
+        move_id_list : list<int>
+            今の局面の合法手
+
+        Returns
+        -------
+        move_id_to_tier_dictionary : dict
+            指し手と、階位（ 0 が一番良い）の辞書
+        move_id_to_policy_value_dictionary : dict
+            指し手と、方策の評価値の辞書
+        """
+        self._policy_nodes += 1
+
+        (positive_of_relation_array,
+         total_of_relation_array,
+         ranked_strict_move_id_set_list) = ChoiceBestMove.get_policy_by_batch(
+                legal_moves=move_id_list,
+                kifuwarabe=self._kifuwarabe)
+
+        move_id_to_tier_dictionary = {}
+        for (tier_index, ranked_strict_move_id_set) in enumerate(ranked_strict_move_id_set_list):
+            for move_id in ranked_strict_move_id_set:
+                move_id_to_tier_dictionary[move_id] = tier_index
+
+        move_id_to_policy_value_dictionary = {
+                move_id: AlphaBetaSearch.get_policy_value(positive_of_relation, total_of_relation)
+                for (move_id, positive_of_relation, total_of_relation) in zip(
+                        move_id_list,
+                        positive_of_relation_array.tolist(),
+                        total_of_relation_array.tolist())}
+
+        return (move_id_to_tier_dictionary, move_id_to_policy_value_dictionary)
+
+
+    @staticmethod
+    def to_usi_score_str(value):
+        """評価値を、ＵＳＩの info の score の文字列にします。詰みなら手数で表す"""
+        if AlphaBetaSearch.mate_value - 1000 <= value:
+            return f"mate {AlphaBetaSearch.mate_value - value}"
+
+        if value <= -AlphaBetaSearch.mate_value + 1000:
+            return f"mate -{AlphaBetaSearch.mate_value + value}"
+
+        return f"cp {value}"
+
+
+    def create_root_move_list(
+            self,
+            legal_move_id_list,
+            move_id_to_tier_dictionary):
+        """根の指し手を、好手・悪手の階位の良い順に並べます。同じ階位の中はランダムに並べる"""
+        root_move_list = list(legal_move_id_list)
+        random.shuffle(root_move_list)
+
+        # 並べ替えは安定なので、同じ階位の中はランダムな順のまま
+        root_move_list.sort(key=lambda move_id: move_id_to_tier_dictionary[move_id])
+
+        return root_move_list
+
+
+    def search(self):
+        """反復深化で探索します。深さを１つ読み終わるごとに info を出力する
+
+        Returns
+        -------
+        best_move_id : int
+            最善手。合法手が無ければ None
+        best_value : int
+            最善手の評価値
+        pv_list : list<int>
+            読み筋
+        """
+        # info の time と nps は、先読みの時間も含めて測る
+        start_seconds = time.perf_counter()
+
+        legal_move_id_list = list(self._board.legal_moves)
+
+        if len(legal_move_id_list) < 1:
+            return (None, -AlphaBetaSearch.mate_value, [])
+
+        (move_id_to_tier_dictionary,
+         move_id_to_policy_value_dictionary) = self.get_policy(legal_move_id_list)
+
+        root_move_list = self.create_root_move_list(
+                legal_move_id_list=legal_move_id_list,
+                move_id_to_tier_dictionary=move_id_to_tier_dictionary)
+        root_material = AlphaBetaSearch.evaluate_material(self._board)
+
+        # １つも読み終わらなければ、一番良い階位の指し手を指す
+        best_move_id = root_move_list[0]
+        best_value = 0
+        pv_list = [best_move_id]
+
+        for depth in range(1, self._max_depth + 1):
+            iteration_start_seconds = time.perf_counter() - start_seconds
+            self._max_ply = depth + AlphaBetaSearch.max_quiescence_ply
+            self._killer_move_list_list = [[None, None] for _ in range(0, self._max_ply + 1)]
+            self._pv_list_list = [[] for _ in range(0, self._max_ply + 2)]
+
+            try:
+                best_value = self.search_root(
+                        depth=depth,
+                        root_move_list=root_move_list,
+                        move_id_to_policy_value_dictionary=move_id_to_policy_value_dictionary,
+                        material=root_material)
+
+            except SearchAborted:
+                break
+
+            pv_list = self.extend_pv_by_transposition_table(
+                    pv_list=self._pv_list_list[0],
+                    max_length=depth)
+            best_move_id = pv_list[0]
+
+            # 次の深さは、今の最善手から読む。他の指し手は階位の順のまま
+            root_move_list.remove(best_move_id)
+            root_move_list.insert(0, best_move_id)
+
+            elapsed_seconds = time.perf_counter() - start_seconds
+            elapsed_milliseconds = int(elapsed_seconds * 1000)
+            nps = int(self._nodes / elapsed_seconds) if 0 < elapsed_seconds else 0
+            print(f"info depth {depth} seldepth {self._seldepth} time {elapsed_milliseconds} nodes {self._nodes} nps {nps} score {AlphaBetaSearch.to_usi_score_str(best_value)} pv {' '.join([cshogi.move_to_usi(move_id) for move_id in pv_list])}", flush=True)
+
+            # 指し手が１つしかないか、詰みが見つかれば、深く読んでも変わらない
+            if len(root_move_list) == 1 or AlphaBetaSearch.mate_value - 1000 <= abs(best_value):
+                break
+
+            if not self._time_manager.can_start_next_iteration(
+                    last_iteration_seconds=elapsed_seconds - iteration_start_seconds):
+                break
+
+        return (best_move_id, best_value, pv_list)
+
+
+    def extend_pv_by_transposition_table(
+            self,
+            pv_list,
+            max_length):
+        """置換表で打ち切った読み筋を、置換表の最善手をたどって伸ばします
+
+        Parameters
+        ----------
+        pv_list : list<int>
+            読み筋
+        max_length : int
+            この長さまで伸ばす
+        """
+        extended_pv_list = list(pv_list)
+
+        for move_id in extended_pv_list:
+            self._board.push(move_id)
+
+        # 同じ局面に戻ったら止める
+        key_set = {self._board.zobrist_hash()}
+
+        while len(extended_pv_list) < max_length:
+            entry = self._transposition_table.get(self._board.zobrist_hash())
+
+            if entry is None or entry[3] is None or not self._board.is_legal(entry[3]):
+                break
+
+            self._board.push(entry[3])
+            extended_pv_list.append(entry[3])
+
+            key = self._board.zobrist_hash()
+            if key in key_set:
+                break
+            key_set.add(key)
+
+        for _ in extended_pv_list:
+            self._board.pop()
+
+        return extended_pv_list
+
+
+    def search_root(
+            self,
+            depth,
+            root_move_list,
+            move_id_to_policy_value_dictionary,
+            material):
+        """根の局面を探索します。読み筋は self._pv_list_list[0] に入る
+
+        Parameters
+        ----------
+        depth : int
+            深さ
+        root_move_list : list<int>
+            根の指し手。この順に読む
+        move_id_to_policy_value_dictionary : dict
+            根の指し手と、方策の評価値の辞書
+        material : int
+            手番から見た、駒の損得
+        """
+        alpha = -AlphaBetaSearch.infinite_value
+        beta = AlphaBetaSearch.infinite_value
+
+        for move_id in root_move_list:
+            self._pv_list_list[1] = []
+            policy_value = move_id_to_policy_value_dictionary[move_id]
+
+            # 指した手の方策の評価値を足すので、窓もその分ずらす
+            self._board.push(move_id)
+            try:
+                value = AlphaBetaSearch.add_policy_value(
+                        value=-self.search_node(
+                                depth=depth - 1,
+                                alpha=-beta + policy_value,
+                                beta=-alpha + policy_value,
+                                ply=1,
+                                material=-(material + AlphaBetaSearch.get_material_gain(move_id))),
+                        policy_value=policy_value)
+            finally:
+                self._board.pop()
+
+            if alpha < value:
+                alpha = value
+                self._pv_list_list[0] = [move_id] + self._pv_list_list[1]
+
+        return alpha
+
+
+    def count_node(self, ply):
+        """局面を１つ数えます。時間切れか中断なら SearchAborted を投げる"""
+        self._nodes += 1
+
+        if self._seldepth < ply:
+            self._seldepth = ply
+
+        if self._nodes % AlphaBetaSearch.node_interval_for_time_check == 0:
+            if self._is_stopped or self._time_manager.is_time_up():
+                self._is_stopped = True
+                raise SearchAborted()
+
+
+    def get_ordered_move_list(
+            self,
+            move_id_list,
+            ply,
+            hash_move_id=None,
+            move_id_to_tier_dictionary=None):
+        """指し手を、置換表の指し手、駒を取る手（取る駒が高く、取る駒が安い順）、キラー手、その他の順に並べます。
+        階位の辞書を渡せば、その他の指し手を階位の良い順に並べる"""
+
+        killer_move_list = self._killer_move_list_list[ply] if ply < len(self._killer_move_list_list) else []
+        piece_value_list = AlphaBetaSearch.piece_value_list
+
+        def get_order_key(move_id):
+            if move_id == hash_move_id:
+                return -100000
+
+            captured_piece_type = cshogi.move_cap(move_id)
+            if captured_piece_type != 0:
+                return -10000 - piece_value_list[captured_piece_type] * 16 + piece_value_list[cshogi.move_from_piece_type(move_id)] // 16
+
+            if move_id in killer_move_list:
+                return -1000
+
+            if move_id_to_tier_dictionary is not None:
+                return move_id_to_tier_dictionary[move_id]
+
+            return 0
+
+        return sorted(move_id_list, key=get_order_key)
+
+
+    def search_node(
+            self,
+            depth,
+            alpha,
+            beta,
+            ply,
+            material):
+        """根より下の局面を、ネガマックスのアルファ・ベータ法で探索します
+
+        Parameters
+        ----------
+        depth : int
+            残りの深さ
+        alpha : int
+            下限
+        beta : int
+            上限
+        ply : int
+            根からの手数
+        material : int
+            手番から見た、駒の損得
+        """
+        self._pv_list_list[ply] = []
+
+        # 千日手
+        repetition = self._board.is_draw(16)
+        if repetition == cshogi.REPETITION_DRAW:
+            return 0
+        elif repetition == cshogi.REPETITION_WIN:
+            return AlphaBetaSearch.mate_value - ply
+        elif repetition == cshogi.REPETITION_LOSE:
+            return -AlphaBetaSearch.mate_value + ply
+
+        if depth <= 0:
+            return self.search_quiescence(
+                    alpha=alpha,
+                    beta=beta,
+                    ply=ply,
+                    material=material)
+
+        self.count_node(ply)
+
+        # 置換表を引く。詰みの評価値は、この局面からの手数にして覚えている
+        key = self._board.zobrist_hash()
+        entry = self._transposition_table.get(key)
+        hash_move_id = None
+
+        if entry is not None:
+            (entry_depth, entry_value, entry_flag, hash_move_id) = entry
+            entry_value = self.from_transposition_table_value(entry_value, ply)
+
+            if depth <= entry_depth:
+                if (entry_flag == AlphaBetaSearch._exact_flag or
+                        (entry_flag == AlphaBetaSearch._lower_flag and beta <= entry_value) or
+                        (entry_flag == AlphaBetaSearch._upper_flag and entry_value <= alpha)):
+                    if hash_move_id is not None:
+                        self._pv_list_list[ply] = [hash_move_id]
+                    return entry_value
+
+        move_id_list = list(self._board.legal_moves)
+
+        # 指す手が無ければ詰み
+        if len(move_id_list) < 1:
+            return -AlphaBetaSearch.mate_value + ply
+
+        # 浅い局面では、方策を数えて、指し手の並べ替えと評価値に使う
+        if ply < AlphaBetaSearch.policy_ply:
+            (move_id_to_tier_dictionary,
+             move_id_to_policy_value_dictionary) = self.get_policy(move_id_list)
+        else:
+            move_id_to_tier_dictionary = None
+            move_id_to_policy_value_dictionary = None
+
+        original_alpha = alpha
+        best_value = -AlphaBetaSearch.infinite_value
+        best_move_id = None
+
+        for move_id in self.get_ordered_move_list(move_id_list, ply, hash_move_id, move_id_to_tier_dictionary):
+            policy_value = 0 if move_id_to_policy_value_dictionary is None else move_id_to_policy_value_dictionary[move_id]
+
+            self._board.push(move_id)
+            try:
+                value = AlphaBetaSearch.add_policy_value(
+                        value=-self.search_node(
+                                depth=depth - 1,
+                                alpha=-beta + policy_value,
+                                beta=-alpha + policy_value,
+                                ply=ply + 1,
+                                material=-(material + AlphaBetaSearch.get_material_gain(move_id))),
+                        policy_value=policy_value)
+            finally:
+                self._board.pop()
+
+            if best_value < value:
+                best_value = value
+                best_move_id = move_id
+
+                if alpha < value:
+                    alpha = value
+                    self._pv_list_list[ply] = [move_id] + self._pv_list_list[ply + 1]
+
+                    if beta <= alpha:
+                        # 駒を取らない手でベータ・カットしたら、キラー手として覚える
+                        if cshogi.move_cap(move_id) == 0:
+                            killer_move_list = self._killer_move_list_list[ply]
+                            if killer_move_list[0] != move_id:
+                                killer_move_list[1] = killer_move_list[0]
+                                killer_move_list[0] = move_id
+                        break
+
+        if beta <= best_value:
+            flag = AlphaBetaSearch._lower_flag
+        elif best_value <= original_alpha:
+            flag = AlphaBetaSearch._upper_flag
+        else:
+            flag = AlphaBetaSearch._exact_flag
+
+        self._transposition_table[key] = (depth, self.to_transposition_table_value(best_value, ply), flag, best_move_id)
+
+        return best_value
+
+
+    def search_quiescence(
+            self,
+            alpha,
+            beta,
+            ply,
+            material):
+        """末端の局面を、駒を取る手だけで探索します（静止探索）。王手されていれば全ての応手を読む
+
+        Parameters
+        ----------
+        alpha : int
+            下限
+        beta : int
+            上限
+        ply : int
+            根からの手数
+        material : int
+            手番から見た、駒の損得
+        """
+        self.count_node(ply)
+
+        self._pv_list_list[ply] = []
+        is_check = self._board.is_check()
+
+        if is_check:
+            move_id_list = list(self._board.legal_moves)
+
+            # 指す手が無ければ詰み
+            if len(move_id_list) < 1:
+                return -AlphaBetaSearch.mate_value + ply
+
+            best_value = -AlphaBetaSearch.infinite_value
+
+        else:
+            # 何も取らずに止めてもよい
+            best_value = material
+            if beta <= best_value:
+                return best_value
+
+            if alpha < best_value:
+                alpha = best_value
+
+            move_id_list = [move_id for move_id in self._board.legal_moves if cshogi.move_cap(move_id) != 0]
+
+        # 深すぎれば、駒の損得で止める
+        if self._max_ply <= ply:
+            return material
+
+        for move_id in self.get_ordered_move_list(move_id_list, ply):
+            self._board.push(move_id)
+            try:
+                value = -self.search_quiescence(
+                        alpha=-beta,
+                        beta=-alpha,
+                        ply=ply + 1,
+                        material=-(material + AlphaBetaSearch.get_material_gain(move_id)))
+            finally:
+                self._board.pop()
+
+            if best_value < value:
+                best_value = value
+
+                if alpha < value:
+                    alpha = value
+                    self._pv_list_list[ply] = [move_id] + self._pv_list_list[ply + 1]
+
+                    if beta <= alpha:
+                        break
+
+        return best_value
+
+
+    @staticmethod
+    def to_transposition_table_value(value, ply):
+        """詰みの評価値を、根からの手数ではなく、この局面からの手数にして置換表に入れます"""
+        if AlphaBetaSearch.mate_value - 1000 <= value:
+            return value + ply
+
+        if value <= -AlphaBetaSearch.mate_value + 1000:
+            return value - ply
+
+        return value
+
+
+    @staticmethod
+    def from_transposition_table_value(value, ply):
+        """置換表の詰みの評価値を、根からの手数に戻します"""
+        if AlphaBetaSearch.mate_value - 1000 <= value:
+            return value - ply
+
+        if value <= -AlphaBetaSearch.mate_value + 1000:
+            return value + ply
+
+        return value
@@ -1,458 +1,376 @@
 import cshogi
 import datetime
+import numpy as np
 import random
 
 # python v_a65_0.py
 from     v_a65_0_debug_plan import DebugPlan
-from     v_a65_0_eval.kk import EvaluationKkTable
-from     v_a65_0_eval.kp import EvaluationKpTable
-from     v_a65_0_eval.pk import EvaluationPkTable
-from     v_a65_0_eval.pp import EvaluationPpTable
+from     v_a65_0_eval.k import EvaluationKMove
+from     v_a65_0_eval.p import EvaluationPMove
 from     v_a65_0_eval.facade import EvaluationFacade
-from     v_a65_0_misc.lib import Turn, MoveHelper, BoardHelper, Move
+from     v_a65_0_misc.lib import Turn, BoardHelper
+from     v_a65_0_misc.reply_set import ReplySetEngine
 
 
 class ChoiceBestMove():
     """最善の着手を選ぶ"""
 
 
-    #select_fo_index_to_relation_exists
     @staticmethod
-    def select_f_blackright_o_blackright_index_to_relation_exists(
-            f_strict_move_obj,
-            is_king_move,
-            board,
+    def get_table_version_tuple(
             kifuwarabe):
-        """１つの着手と全ての応手をキー、関係の有無を値とする辞書を作成します
+        """現局面の手番で使う評価値テーブル４つ（ＫＬ、ＫＱ、ＰＬ、ＰＱ）の版。どれかのビットを変えるか、読み直して差し替えると変わる
 
         Parameters
         ----------
-        f_strict_move_obj : Move
-            着手
-        is_king_move : bool
-            自玉の指し手か？
-        board : Board
-            局面
         kifuwarabe : Kifuwarabe
             きふわらべ
 
         Returns
         -------
-        k_blackright_l_blackright_index_to_relation_exists_dic
-            自玉の着手と、敵玉の応手の関係の有無を格納した辞書
-        k_blackright_q_blackright_index_to_relation_exists_dic
-            自玉の着手と、敵兵の応手の関係の有無を格納した辞書
-        p_blackright_l_blackright_index_to_relation_exists_dic
-            自兵の着手と、敵玉の応手の関係の有無を格納した辞書
-        p_blackright_q_blackright_index_to_relation_exists_dic
-            自兵の着手と、敵兵の応手の関係の有無を格納した辞書
+        table_version_tuple : tuple
+            EvalutionMmTable.version の組
         """
+        turn_index = Turn.to_index(kifuwarabe.board.turn)
 
-        # assert
-        # 着手は後手か？
-        is_white = board.turn == cshogi.WHITE
+        return (kifuwarabe.evaluation_kl_table_obj_array[turn_index].mm_table_obj.version,
+                kifuwarabe.evaluation_kq_table_obj_array[turn_index].mm_table_obj.version,
+                kifuwarabe.evaluation_pl_table_obj_array[turn_index].mm_table_obj.version,
+                kifuwarabe.evaluation_pq_table_obj_array[turn_index].mm_table_obj.version)
 
-        # 応手の一覧を作成
-        l_strict_move_u_set, q_strict_move_u_set = BoardHelper.create_counter_move_u_set(
-                board=board,
-                f_strict_move_obj=f_strict_move_obj)
-
-        # （先手視点，右辺使用）に変更
-        f_blackright_move_obj = Move.from_move_obj(
-                f_strict_move_obj=f_strict_move_obj,
-                # 先手の指し手になるよう調整します
-                shall_white_to_black=board.turn==cshogi.WHITE,
-                # 指し手の元位置が、右辺を使うように左右反転します
-                use_only_right_side=True)
-
-        # （先手視点，右辺使用）に変更
-        l_blackright_move_u_set = set()
-        for l_strict_move_u in l_strict_move_u_set:
-            l_blackright_move_u_set.add(Move.from_move_obj(
-                    f_strict_move_obj=Move.from_usi(l_strict_move_u),
-                    # 先手の指し手になるよう調整します
-                    shall_white_to_black=board.turn==cshogi.WHITE,
-                    use_only_right_side=True).as_usi)
-
-        # （先手視点，右辺使用）に変更
-        q_blackright_move_u_set = set()
-        for q_strict_move_u in q_strict_move_u_set:
-            q_blackright_move_u_set.add(Move.from_move_obj(
-                    f_strict_move_obj=Move.from_usi(q_strict_move_u),
-                    # 先手の指し手になるよう調整します
-                    shall_white_to_black=board.turn==cshogi.BLACK,
-                    use_only_right_side=True).as_usi)
-
-        if is_king_move:
 
-            #
-            # ＫＬ
-            #
+    @staticmethod
+    def get_relation_exists_array_by_batch(
+            f_strict_move_id_list,
+            kifuwarabe):
+        """局面の全ての着手について、着手と全ての応手の関係と、その関係の有無を、まとめて引きます
 
-            # 自玉の着手と、敵玉の応手の一覧から、ＫＬテーブルのインデックスと、関係の有無を格納した辞書を作成
-            k_blackright_l_blackright_index_to_relation_exists_dic = kifuwarabe.evaluation_kl_table_obj_array[Turn.to_index(board.turn)].select_k_blackright_l_blackright_index_and_relation_exists(
-                    k_blackright_move_obj=f_blackright_move_obj,
-                    l_blackright_move_u_set=l_blackright_move_u_set)
-
-            # assert
-            for k_blackright_l_blackright_index, relation_exists in k_blackright_l_blackright_index_to_relation_exists_dic.items():
-                assert_k_blackright_move_obj, assert_l_blackright_move_obj = EvaluationKkTable.build_k_blackright_l_blackright_moves_by_kl_index(
-                        k_blackright_l_blackright_index=k_blackright_l_blackright_index)
-
-                if assert_k_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    print(board)
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > select fo index to relation exests > kl] 着手が変わっているエラー
-                                           手番（Ｋ）:{Turn.to_string(board.turn)}
-                                      元の指し手（Ｋ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｋ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｋ）:{assert_k_blackright_move_obj.as_usi:5}
-""")
+        （着手, 応手）の組を全部並べた numpy の配列を作り、評価値テーブル１つにつき１回の演算でビットを取り出す。
+        同じ着手の中で同じ関係は１つにまとめ、（評価値テーブルの番号, 着手の位置, 関係のインデックス）の順に並べて返す
 
-            #
-            # ＫＱ
-            #
+        Parameters
+        ----------
+        f_strict_move_id_list : list<int>
+            着手のリスト。 cshogi の指し手の整数
+        kifuwarabe : Kifuwarabe
+            きふわらべ
 
-            # 自玉の着手と、敵兵の応手の一覧から、ＫＱテーブルのインデックスと、関係の有無を格納した辞書を作成
-            k_blackright_q_blackright_index_to_relation_exists_dic = kifuwarabe.evaluation_kq_table_obj_array[Turn.to_index(board.turn)].select_k_blackright_p_blackright_index_and_relation_exists(
-                    k_blackright_move_obj=f_blackright_move_obj,
-                    p_blackright_move_u_set=q_blackright_move_u_set)
+        Returns
+        -------
+        table_no_array : numpy.ndarray
+            関係ごとの、評価値テーブルの番号　0:ＫＬ, 1:ＫＱ, 2:ＰＬ, 3:ＰＱ
+        f_position_array : numpy.ndarray
+            関係ごとの、着手の位置（ f_strict_move_id_list の添え字）
+        relation_index_array : numpy.ndarray
+            関係ごとの、評価値テーブルのインデックス（先手視点、右辺使用）
+        bit_array : numpy.ndarray
+            関係ごとの、関係の有無
+        """
+        board = kifuwarabe.board
+        turn_index = Turn.to_index(board.turn)
+        f_size = len(f_strict_move_id_list)
 
-            # assert
-            for k_blackright_q_blackright_index, relation_exists in k_blackright_q_blackright_index_to_relation_exists_dic.items():
-                assert_k_blackright_move_obj, assert_q_blackright_move_obj = EvaluationKpTable.build_k_blackright_p_blackright_moves_by_kp_index(
-                        k_blackright_p_blackright_index=k_blackright_q_blackright_index)
+        # 着手と敵玉の応手は、着手が後手なら１８０°回転する。敵兵の応手は、応手が後手なら（着手が先手なら）１８０°回転する
+        f_rotate_index = 1 if board.turn == cshogi.WHITE else 0
+        q_rotate_index = 1 - f_rotate_index
 
-                if assert_k_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    print(board)
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > select fo index to relation exests > kq] 着手が変わっているエラー
-                                           手番（Ｋ）:{Turn.to_string(board.turn)}
-                                      元の指し手（Ｋ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｋ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｋ）:{assert_k_blackright_move_obj.as_usi:5}
-""")
+        k_move16_to_blackright_index_array_tuple = EvaluationKMove.get_move16_to_blackright_index_array_tuple()
+        p_move16_to_blackright_index_array_tuple = EvaluationPMove.get_move16_to_blackright_index_array_tuple()
 
-            return (k_blackright_l_blackright_index_to_relation_exists_dic,
-                    k_blackright_q_blackright_index_to_relation_exists_dic,
-                    None,
-                    None)
+        # 自玉と敵玉のマス。着手で敵玉は動かない
+        k_sq = BoardHelper.get_king_square(board)
+        l_sq = board.king_square(cshogi.WHITE if board.turn == cshogi.BLACK else cshogi.BLACK)
 
-        else:
+        # 全ての着手の応手（ move16 ）と、その応手がどの着手のものかを並べる。作り方は ReplySetEngine を参照
+        (o_move16_array,
+         o_f_position_array) = ReplySetEngine.create_o_move16_array_and_f_position_array(
+                board=board,
+                f_strict_move_id_list=f_strict_move_id_list,
+                mode=kifuwarabe.reply_set_mode)
+
+        # 着手のインデックス（先手視点、右辺使用）。移動元が自玉のマスなら玉の指し手（打なら移動元は 81 以上なので、玉のマスと一致しない）
+        f_strict_move_id_array = np.array(f_strict_move_id_list, dtype=np.int64)
+        f_move16_array = f_strict_move_id_array & 0xffff
+        f_is_king_array = ((f_strict_move_id_array >> 7) & 0x7f) == k_sq
+        f_blackright_index_array = np.where(
+                f_is_king_array,
+                k_move16_to_blackright_index_array_tuple[f_rotate_index][f_move16_array],
+                p_move16_to_blackright_index_array_tuple[f_rotate_index][f_move16_array])
+
+        # 応手のインデックス（先手視点、右辺使用）
+        o_is_king_array = ((o_move16_array >> 7) & 0x7f) == l_sq
+        o_blackright_index_array = np.where(
+                o_is_king_array,
+                k_move16_to_blackright_index_array_tuple[f_rotate_index][o_move16_array],
+                p_move16_to_blackright_index_array_tuple[q_rotate_index][o_move16_array])
 
-            #
-            # ＰＬ
-            #
+        # assert
+        if (f_blackright_index_array < 0).any() or (o_blackright_index_array < 0).any():
+            raise ValueError(f"[{datetime.datetime.now()}] [choice best move > get relation exists array by batch] 評価値テーブルに無い指し手がある。 sfen:{board.sfen()}")
 
-            # 自兵の着手と、敵玉の応手の一覧から、ＰＬテーブルのインデックスと、関係の有無を格納した辞書を作成
-            p_blackright_l_blackright_index_to_relation_exists_dic = kifuwarabe.evaluation_pl_table_obj_array[Turn.to_index(board.turn)].select_p_blackright_k_blackright_index_and_relation_exists(
-                    p_blackright_move_obj=f_blackright_move_obj,
-                    k_blackright_move_u_set=l_blackright_move_u_set)
+        # 応手が１つも無ければ（全ての着手が詰み）、関係は無い
+        if len(o_move16_array) < 1:
+            empty_array = np.zeros(0, dtype=np.int64)
+            return (empty_array, empty_array, empty_array, np.zeros(0, dtype=np.uint8))
 
-            # assert
-            for p_blackright_l_blackright_index, relation_exists in p_blackright_l_blackright_index_to_relation_exists_dic.items():
-                assert_p_blackright_move_obj, assert_l_blackright_move_obj = EvaluationPkTable.build_p_blackright_k_blackright_moves_by_pk_index(
-                        p_blackright_k_blackright_index=p_blackright_l_blackright_index)
+        k_size = EvaluationKMove.get_serial_number_size()
+        p_size = EvaluationPMove.get_serial_number_size()
 
-                check_p_blackright_l_blackright_index = EvaluationPkTable.get_p_blackright_k_blackright_index(
-                        p_blackright_move_obj=assert_p_blackright_move_obj,
-                        k_blackright_move_obj=assert_l_blackright_move_obj)
+        # 評価値テーブルの番号　0:ＫＬ, 1:ＫＱ, 2:ＰＬ, 3:ＰＱ
+        table_obj_array_list = [
+                kifuwarabe.evaluation_kl_table_obj_array,
+                kifuwarabe.evaluation_kq_table_obj_array,
+                kifuwarabe.evaluation_pl_table_obj_array,
+                kifuwarabe.evaluation_pq_table_obj_array]
+        table_no_array = np.where(f_is_king_array[o_f_position_array], 0, 2) + np.where(o_is_king_array, 0, 1)
 
-                if p_blackright_l_blackright_index != check_p_blackright_l_blackright_index:
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > select fo index to relation exests > pl] インデックスから指し手を復元し、さらにインデックスに圧縮すると、元のインデックスに復元しなかったエラー
-      p_blackright_l_blackright_index:{        p_blackright_l_blackright_index:10}
-check_p_blackright_l_blackright_index:{check_p_blackright_l_blackright_index  :10}
-                   p_move_u:{assert_p_blackright_move_obj.as_usi:5}
-                   l_move_u:{assert_l_blackright_move_obj.as_usi:5}
-""")
+        # 関係のインデックスは「着手のインデックス * 応手の数 + 応手のインデックス」
+        relation_index_array = f_blackright_index_array[o_f_position_array] * np.where(o_is_king_array, k_size, p_size) + o_blackright_index_array
 
-            #
-            # ＰＱ
-            #
+        # （評価値テーブルの番号, 着手の位置, 関係のインデックス）を１つの整数にして並べ替える。一番大きなＰＱの関係の数を桁の単位にする
+        relation_size = p_size * p_size
+        key_array = np.sort((table_no_array * f_size + o_f_position_array) * relation_size + relation_index_array)
+
+        # 同じ着手の中で同じ関係は１つと数える。右辺に寄せると別の着手が同じインデックスになるので、着手の位置と組にして重複を除く。
+        # 並べ替えてあるので、隣と同じものを除けばよい（ np.unique() より速い）
+        is_first_array = np.empty(len(key_array), dtype=bool)
+        is_first_array[0] = True
+        np.not_equal(key_array[1:], key_array[:-1], out=is_first_array[1:])
+        unique_key_array = key_array[is_first_array]
 
-            # 自兵の着手と、敵兵の応手の一覧から、ＰＱテーブルのインデックスと、関係の有無を格納した辞書を作成
-            p_blackright_q_blackright_index_to_relation_exists_dic = kifuwarabe.evaluation_pq_table_obj_array[Turn.to_index(board.turn)].select_blackright_p_blackright_p_index_and_relation_exists(
-                    p1_blackright_move_obj=f_blackright_move_obj,
-                    p2_blackright_move_u_set=q_blackright_move_u_set)
+        unique_f_position_array = (unique_key_array // relation_size) % f_size
+        unique_relation_index_array = unique_key_array % relation_size
 
-            # assert
-            for blackright_p_black_q_index, relation_exists in p_blackright_q_blackright_index_to_relation_exists_dic.items():
-                assert_p_blackright_move_obj, assert_q_blackright_move_obj = EvaluationPpTable.build_p1_blackright_p2_blackright_moves_by_p1p2_index(
-                        p1_blackright_p2_blackright_index=blackright_p_black_q_index)
+        # 評価値テーブルの番号の順に並んでいるので、テーブルごとの範囲を１回ずつまとめて引く
+        table_start_list = np.searchsorted(unique_key_array, [table_no * f_size * relation_size for table_no in range(0, 5)]).tolist()
+        bit_array = np.zeros(len(unique_key_array), dtype=np.uint8)
 
-                if assert_p_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    print(board)
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > select fo index to relation exests > pq] 着手が変わっているエラー
-is_white  :{is_white}
-                                           手番（Ｐ）:{Turn.to_string(board.turn)}
-                                      元の指し手（Ｐ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｐ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｐ）:{assert_p_blackright_move_obj.as_usi:5}
-""")
+        for (table_no, table_obj_array) in enumerate(table_obj_array_list):
+            (start, end) = (table_start_list[table_no], table_start_list[table_no + 1])
 
-            return (None,
-                    None,
-                    p_blackright_l_blackright_index_to_relation_exists_dic,
-                    p_blackright_q_blackright_index_to_relation_exists_dic)
+            if start < end:
+                bit_array[start:end] = table_obj_array[turn_index].get_relation_exists_array_by_index_array(
+                        unique_relation_index_array[start:end])
+
+        return (unique_key_array // (f_size * relation_size),
+                unique_f_position_array,
+                unique_relation_index_array,
+                bit_array)
 
 
     @staticmethod
-    def get_number_of_connection_for_kl_kq(
-            k_blackright_l_blackright_index_to_relation_exists_dictionary,
-            k_blackright_q_blackright_index_to_relation_exists_dictionary,
-            is_debug=False):
-        """ＫＬとＫＱの関係が有るものの数
+    def get_positive_and_total_of_relation_array_by_batch(
+            f_strict_move_id_list,
+            kifuwarabe):
+        """局面の全ての着手について、着手と全ての応手の関係の有りの数と総数を、まとめて数えます
 
         Parameters
         ----------
-        k_blackright_l_blackright_index_to_relation_exists_dictionary : dict
-            ＫＬ
-        k_blackright_q_blackright_index_to_relation_exists_dictionary : dict
-            ＫＱ
-        is_debug : bool
-            デバッグモードか？
+        f_strict_move_id_list : list<int>
+            着手のリスト。 cshogi の指し手の整数
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+
+        Returns
+        -------
+        positive_of_relation_array : numpy.ndarray
+            着手ごとの、関係が有りの数
+        total_of_relation_array : numpy.ndarray
+            着手ごとの、関係の総数
         """
-        number_of_connection = 0
+        (_,
+         f_position_array,
+         _,
+         bit_array) = ChoiceBestMove.get_relation_exists_array_by_batch(
+                f_strict_move_id_list=f_strict_move_id_list,
+                kifuwarabe=kifuwarabe)
 
-        # ＫＬ
-        for relation_exists in k_blackright_l_blackright_index_to_relation_exists_dictionary.values():
-            if relation_exists == 1:
-                number_of_connection += 1
+        # 着手ごとに足し合わせる
+        f_size = len(f_strict_move_id_list)
+        positive_of_relation_array = np.bincount(f_position_array, weights=bit_array, minlength=f_size).astype(np.int64)
+        total_of_relation_array = np.bincount(f_position_array, minlength=f_size)
 
-        # ＫＱ
-        for relation_exists in k_blackright_q_blackright_index_to_relation_exists_dictionary.values():
-            if relation_exists == 1:
-                number_of_connection += 1
+        return (positive_of_relation_array, total_of_relation_array)
 
-        # デバッグ表示
-        if is_debug:
-            # ＫＬ
-            for k_blackright_l_blackright_index, relation_exists in k_blackright_l_blackright_index_to_relation_exists_dictionary.items():
-                if DebugPlan.get_number_of_connection_for_kl_kq:
-                    k_blackright_move_obj, black_l_move_obj = EvaluationKkTable.build_k_blackright_l_blackright_moves_by_kl_index(
-                            k_blackright_l_blackright_index=k_blackright_l_blackright_index)
-                    print(f"[{datetime.datetime.now()}] [get number of connection for kl kq > kl]  k_blackright_l_blackright_index:{k_blackright_l_blackright_index:7}  K:{k_blackright_move_obj.as_usi:5}  L:{black_l_move_obj.as_usi:5}  relation_exists:{relation_exists}")
 
-            # ＫＱ
-            for k_blackright_q_blackright_index, relation_exists in k_blackright_q_blackright_index_to_relation_exists_dictionary.items():
-                if DebugPlan.get_number_of_connection_for_kl_kq:
-                    k_blackright_move_obj, black_q_move_obj = EvaluationKpTable.build_k_blackright_p_blackright_moves_by_kp_index(
-                            k_blackright_p_blackright_index=k_blackright_q_blackright_index)
-                    print(f"[{datetime.datetime.now()}] [get number of connection for kl kq > kq]  k_blackright_q_blackright_index:{k_blackright_q_blackright_index:7}  K:{k_blackright_move_obj.as_usi:5}  Q:{black_q_move_obj.as_usi:5}  relation_exists:{relation_exists}")
+    @staticmethod
+    def get_relation_exists_dictionary_tuple(
+            f_strict_move_id,
+            kifuwarabe):
+        """１つの着手と全ての応手の関係の有無を、評価値テーブルのインデックスをキーとする辞書にします。
+        引き方は get_relation_exists_array_by_batch() と同じ
+
+        Parameters
+        ----------
+        f_strict_move_id : int
+            着手。 cshogi の指し手の整数
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+
+        Returns
+        -------
+        f_l_index_to_relation_exists_dictionary : dict
+            自駒の着手と、敵玉の応手の関係の有無。玉の指し手ならＫＬ、兵の指し手ならＰＬのインデックスがキー
+        f_q_index_to_relation_exists_dictionary : dict
+            自駒の着手と、敵兵の応手の関係の有無。玉の指し手ならＫＱ、兵の指し手ならＰＱのインデックスがキー
+        is_king_move : bool
+            自玉の指し手か？
+        """
+        (table_no_array,
+         _,
+         relation_index_array,
+         bit_array) = ChoiceBestMove.get_relation_exists_array_by_batch(
+                f_strict_move_id_list=[f_strict_move_id],
+                kifuwarabe=kifuwarabe)
 
-        return number_of_connection
+        f_l_index_to_relation_exists_dictionary = {}
+        f_q_index_to_relation_exists_dictionary = {}
+
+        # 評価値テーブルの番号が偶数なら敵玉（ＫＬ、ＰＬ）、奇数なら敵兵（ＫＱ、ＰＱ）の応手
+        for (table_no, relation_index, bit) in zip(table_no_array.tolist(), relation_index_array.tolist(), bit_array.tolist()):
+            if table_no % 2 == 0:
+                f_l_index_to_relation_exists_dictionary[relation_index] = bit
+            else:
+                f_q_index_to_relation_exists_dictionary[relation_index] = bit
+
+        # 打なら移動元は 81 以上なので、玉のマスと一致しない
+        is_king_move = cshogi.move_from(f_strict_move_id) == BoardHelper.get_king_square(kifuwarabe.board)
+
+        return (f_l_index_to_relation_exists_dictionary,
+                f_q_index_to_relation_exists_dictionary,
+                is_king_move)
 
 
     @staticmethod
-    def get_number_of_connection_for_pl_pq(
-            p_blackright_l_blackright_index_to_relation_exists_dictionary,
-            p_blackright_q_blackright_index_to_relation_exists_dictionary,
-            is_debug):
-        """ＰＬとＰＱの関係が有りのものの数
+    def get_policy_by_batch(
+            legal_moves,
+            kifuwarabe):
+        """局面の方策（着手ごとの関係の有りの数と総数と、ランク付けされた指し手一覧）を、全ての合法手をまとめて数えます
+
+        同じ局面を、評価値テーブルが変わってから数え直していなければ、 PolicyCache に覚えておいたものを使う
 
         Parameters
         ----------
-        p_blackright_l_blackright_index_to_relation_exists_dictionary : dict
-            ＫＬ
-        p_blackright_q_blackright_index_to_relation_exists_dictionary
-            ＫＱ
-        is_debug : bool
-            デバッグモードか？
+        legal_moves :
+            合法手
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+
+        Returns
+        -------
+        positive_of_relation_array : numpy.ndarray
+            着手ごとの、関係が有りの数。 legal_moves の順
+        total_of_relation_array : numpy.ndarray
+            着手ごとの、関係の総数。 legal_moves の順
+        ranked_strict_move_id_set_list : list[set()]
+            ランク付けされた指し手一覧
         """
-        number_of_connection = 0
+        ranked_strict_move_id_set_list = [set() for _ in range(0, kifuwarabe.tier_resolution)]
 
-        # ＰＬ
-        for relation_exists in p_blackright_l_blackright_index_to_relation_exists_dictionary.values():
-            if relation_exists == 1:
-                number_of_connection += 1
+        f_strict_move_id_list = list(legal_moves)
 
-        # ＰＱ
-        for relation_exists in p_blackright_q_blackright_index_to_relation_exists_dictionary.values():
-            if relation_exists == 1:
-                number_of_connection += 1
+        if len(f_strict_move_id_list) < 1:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), ranked_strict_move_id_set_list)
 
-        # デバッグ表示
-        if is_debug:
-            # ＰＬ
-            for p_blackright_l_blackright_index, relation_exists in p_blackright_l_blackright_index_to_relation_exists_dictionary.items():
-                if is_debug and DebugPlan.get_number_of_connection_for_pl_pq:
-                    p_blackright_move_obj, black_l_move_obj = EvaluationPkTable.build_p_blackright_k_blackright_moves_by_pk_index(
-                            p_blackright_k_blackright_index=p_blackright_l_blackright_index)
-                    print(f"[{datetime.datetime.now()}] [get number of connection for pl pq > pl]  p_blackright_l_blackright_index:{p_blackright_l_blackright_index:7}  P:{p_blackright_move_obj.as_usi:5}  L:{black_l_move_obj.as_usi:5}  relation_exists:{relation_exists}")
+        # 同じ局面を、評価値テーブルが変わってから数え直していなければ、覚えておいたものを使う
+        table_version_tuple = ChoiceBestMove.get_table_version_tuple(kifuwarabe)
+
+        cached_tuple = kifuwarabe.policy_cache.get(
+                board=kifuwarabe.board,
+                table_version_tuple=table_version_tuple,
+                f_strict_move_id_list=f_strict_move_id_list)
+
+        if cached_tuple is not None:
+            return cached_tuple
+
+        (positive_of_relation_array,
+         total_of_relation_array) = ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                f_strict_move_id_list=f_strict_move_id_list,
+                kifuwarabe=kifuwarabe)
 
-            # ＰＱ
-            for p_blackright_q_blackright_index, relation_exists in p_blackright_q_blackright_index_to_relation_exists_dictionary.items():
-                if is_debug and DebugPlan.get_number_of_connection_for_pl_pq:
-                    p_blackright_move_obj, black_q_move_obj = EvaluationPpTable.build_p1_blackright_p2_blackright_moves_by_p1p2_index(
-                            p1_blackright_p2_blackright_index=p_blackright_q_blackright_index)
-                    print(f"[{datetime.datetime.now()}] [get number of connection for pl pq > pq]  p_blackright_q_blackright_index:{p_blackright_q_blackright_index:7}  P:{p_blackright_move_obj.as_usi:5}  Q:{black_q_move_obj.as_usi:5}  relation_exists:{relation_exists}")
+        # 好手悪手の階位算出
+        (ranking_th_array, _) = EvaluationFacade.get_tier_th_array(
+                positive_of_relation_array=positive_of_relation_array,
+                total_of_relation_array=total_of_relation_array,
+                tier_resolution=kifuwarabe.tier_resolution)
 
-        return number_of_connection
+        # 1 から始まる数を、0 から始まる数に変換して配列のインデックスに使用
+        for (strict_move_id, ranking_th) in zip(f_strict_move_id_list, ranking_th_array.tolist()):
+            ranked_strict_move_id_set_list[ranking_th - 1].add(strict_move_id)
+
+        kifuwarabe.policy_cache.put(
+                board=kifuwarabe.board,
+                table_version_tuple=table_version_tuple,
+                f_strict_move_id_list=f_strict_move_id_list,
+                positive_of_relation_array=positive_of_relation_array,
+                total_of_relation_array=total_of_relation_array,
+                ranked_strict_move_id_set_list=ranked_strict_move_id_set_list)
+
+        return (positive_of_relation_array,
+                total_of_relation_array,
+                ranked_strict_move_id_set_list)
 
 
     @staticmethod
-    def get_summary(
-            f_strict_move_obj,
-            kifuwarabe,
-            is_debug=False):
-        """集計を取得
+    def get_positive_and_total_of_relation_by_policy(
+            f_strict_move_id,
+            kifuwarabe):
+        """１つの着手と全ての応手の関係の有りの数と総数を、局面の方策から引きます
+
+        局面の全ての合法手を get_policy_by_batch() で数える（ PolicyCache に覚えてあれば、数え直さない）
 
         Parameters
         ----------
-        f_strict_move_obj : Move
-            着手オブジェクト
+        f_strict_move_id : int
+            着手。 cshogi の指し手の整数。合法手であること
         kifuwarabe : Kifuwarabe
             きふわらべ
-        is_debug : bool
-            デバッグモードか？
 
         Returns
         -------
-        - p_blackright_l_blackright_index_to_relation_exists_dictionary
-        - p_blackright_q_blackright_index_to_relation_exists_dictionary
-        - is_king_move
-        - positive_of_relation
-        - total_of_relation
+        positive_of_relation : int
+            関係が有りの数
+        total_of_relation : int
+            関係の総数
         """
+        f_strict_move_id_list = list(kifuwarabe.board.legal_moves)
 
-        # 投了局面時、入玉宣言局面時、１手詰めは無視
+        (positive_of_relation_array,
+         total_of_relation_array,
+         _) = ChoiceBestMove.get_policy_by_batch(
+                legal_moves=f_strict_move_id_list,
+                kifuwarabe=kifuwarabe)
 
-        k_sq = BoardHelper.get_king_square(kifuwarabe.board)
+        f_position = f_strict_move_id_list.index(f_strict_move_id)
 
-        # 自玉の指し手か？
-        is_king_move = MoveHelper.is_king(k_sq, f_strict_move_obj)
+        return (int(positive_of_relation_array[f_position]),
+                int(total_of_relation_array[f_position]))
 
-        if is_king_move:
 
-            # １つの着手には、０～複数の着手がある木構造をしています。
-            # その木構造のパスをキーとし、そのパスが持つ有無のビット値を値とする辞書を作成します
-            (k_blackright_l_blackright_index_to_relation_exists_dictionary,
-             k_blackright_q_blackright_index_to_relation_exists_dictionary,
-             _,
-             _) = ChoiceBestMove.select_f_blackright_o_blackright_index_to_relation_exists(
-                    f_strict_move_obj=f_strict_move_obj,
-                    is_king_move=is_king_move,
-                    board=kifuwarabe.board,
-                    kifuwarabe=kifuwarabe)
+    @staticmethod
+    def select_ranked_f_strict_move_id_set_by_batch(
+            legal_moves,
+            kifuwarabe):
+        """ランク付けされた指し手一覧（好手、悪手）を、全ての合法手をまとめて数えて、 cshogi の指し手の整数で作成
 
-            # assert
-            for k_blackright_l_blackright_index, relation_exists in k_blackright_l_blackright_index_to_relation_exists_dictionary.items():
-                assert_k_blackright_move_obj, assert_l_blackright_move_obj = EvaluationKkTable.build_k_blackright_l_blackright_moves_by_kl_index(
-                        k_blackright_l_blackright_index=k_blackright_l_blackright_index)
-
-                f_blackright_move_obj = Move.from_move_obj(
-                        f_strict_move_obj=f_strict_move_obj,
-                        # 着手が後手なら反転
-                        shall_white_to_black=kifuwarabe.board.turn==cshogi.WHITE,
-                        use_only_right_side=True)
-
-                if assert_k_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > kl] 着手が変わっているエラー
-                                           手番（Ｋ）:{Turn.to_string(kifuwarabe.board.turn)}
-                                      元の指し手（Ｋ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｋ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｋ）:{assert_k_blackright_move_obj.as_usi:5}
-""")
-
-            # assert
-            for k_blackright_q_blackright_index, relation_exists in k_blackright_q_blackright_index_to_relation_exists_dictionary.items():
-                assert_k_blackright_move_obj, assert_q_blackright_move_obj = EvaluationKpTable.build_k_blackright_p_blackright_moves_by_kp_index(
-                        k_blackright_p_blackright_index=k_blackright_q_blackright_index)
-
-                f_blackright_move_obj = Move.from_move_obj(
-                        f_strict_move_obj=f_strict_move_obj,
-                        # 着手が後手なら反転
-                        shall_white_to_black=kifuwarabe.board.turn==cshogi.WHITE,
-                        use_only_right_side=True)
-
-                if assert_k_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > kq] 着手が変わっているエラー
-                                           手番（Ｋ）:{Turn.to_string(kifuwarabe.board.turn)}
-                                      元の指し手（Ｋ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｋ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｋ）:{assert_k_blackright_move_obj.as_usi:5}
-""")
-
-            # ＫＬとＫＱの関係数
-            total_of_relation = len(k_blackright_l_blackright_index_to_relation_exists_dictionary) + len(k_blackright_q_blackright_index_to_relation_exists_dictionary)
-            #print(f"[{datetime.datetime.now()}] [get summary > kl and kq]   total_of_relation:{total_of_relation}  =  len(k_blackright_l_blackright_index_to_relation_exists_dictionary):{len(k_blackright_l_blackright_index_to_relation_exists_dictionary)}  +  len(k_blackright_q_blackright_index_to_relation_exists_dictionary):{len(k_blackright_q_blackright_index_to_relation_exists_dictionary)}")
-
-            # ＫＬとＫＱの関係が有りのものの数
-            positive_of_relation = ChoiceBestMove.get_number_of_connection_for_kl_kq(
-                    k_blackright_l_blackright_index_to_relation_exists_dictionary,
-                    k_blackright_q_blackright_index_to_relation_exists_dictionary,
-                    is_debug=is_debug)
-
-            return (k_blackright_l_blackright_index_to_relation_exists_dictionary,
-                    k_blackright_q_blackright_index_to_relation_exists_dictionary,
-                    is_king_move,
-                    positive_of_relation,
-                    total_of_relation)
-
-        else:
-
-            # １つの着手には、０～複数の着手がある木構造をしています。
-            # その木構造のパスをキーとし、そのパスが持つ有無のビット値を値とする辞書を作成します
-            (_,
-             _,
-             p_blackright_l_blackright_index_to_relation_exists_dictionary,
-             p_blackright_q_blackright_index_to_relation_exists_dictionary) = ChoiceBestMove.select_f_blackright_o_blackright_index_to_relation_exists(
-                    f_strict_move_obj=f_strict_move_obj,
-                    is_king_move=is_king_move,
-                    board=kifuwarabe.board,
-                    kifuwarabe=kifuwarabe)
+        select_ranked_f_strict_move_id_set_facade() で１手ずつ数えたものと同じ階位になる
 
-            # assert
-            for p_blackright_l_blackright_index, relation_exists in p_blackright_l_blackright_index_to_relation_exists_dictionary.items():
-                assert_p_blackright_move_obj, assert_l_blackright_move_obj = EvaluationPkTable.build_p_blackright_k_blackright_moves_by_pk_index(
-                        p_blackright_k_blackright_index=p_blackright_l_blackright_index)
-
-                f_blackright_move_obj = Move.from_move_obj(
-                        f_strict_move_obj=f_strict_move_obj,
-                        # 着手が後手なら反転
-                        shall_white_to_black=kifuwarabe.board.turn==cshogi.WHITE,
-                        use_only_right_side=True)
-                
-                if assert_p_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > pl] 着手が変わっているエラー
-                                           手番（Ｐ）:{Turn.to_string(kifuwarabe.board.turn)}
-                                      元の指し手（Ｐ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｐ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｐ）:{assert_p_blackright_move_obj.as_usi:5}
-""")
-
-            # assert
-            for p_blackright_q_blackright_index, relation_exists in p_blackright_q_blackright_index_to_relation_exists_dictionary.items():
-                assert_p_blackright_move_obj, assert_q_blackright_move_obj = EvaluationPpTable.build_p1_blackright_p2_blackright_moves_by_p1p2_index(
-                        p1_blackright_p2_blackright_index=p_blackright_q_blackright_index)
-
-                f_blackright_move_obj = Move.from_move_obj(
-                        f_strict_move_obj=f_strict_move_obj,
-                        # 着手が後手なら反転
-                        shall_white_to_black=kifuwarabe.board.turn==cshogi.WHITE,
-                        use_only_right_side=True)
-
-                if assert_p_blackright_move_obj.as_usi != f_blackright_move_obj.as_usi:
-                    raise ValueError(f"""[{datetime.datetime.now()}] [choice best move > pq] 着手が変わっているエラー
-                                           手番（Ｐ）:{Turn.to_string(kifuwarabe.board.turn)}
-                                      元の指し手（Ｐ）:{f_strict_move_obj.as_usi:5}
-                     元の指し手　先手視点、右辺使用（Ｐ）:{f_blackright_move_obj.as_usi:5}
-１回インデックスに変換し、インデックスから指し手を復元（Ｐ）:{assert_p_blackright_move_obj.as_usi:5}
-""")
-
-            # ＰＬとＰＱの関係数
-            total_of_relation = len(p_blackright_l_blackright_index_to_relation_exists_dictionary) + len(p_blackright_q_blackright_index_to_relation_exists_dictionary)
-            #print(f"[{datetime.datetime.now()}] [get summary > pl and pq]  total_of_relation:{total_of_relation}  =  len(p_blackright_l_blackright_index_to_relation_exists_dictionary):{len(p_blackright_l_blackright_index_to_relation_exists_dictionary)}  +  len(p_blackright_q_blackright_index_to_relation_exists_dictionary):{len(p_blackright_q_blackright_index_to_relation_exists_dictionarydictionary)}")
-
-            # ＰＬとＰＱの関係が有りのものの数
-            positive_of_relation = ChoiceBestMove.get_number_of_connection_for_pl_pq(
-                    p_blackright_l_blackright_index_to_relation_exists_dictionary,
-                    p_blackright_q_blackright_index_to_relation_exists_dictionary,
-                    is_debug=is_debug)
-
-            return (p_blackright_l_blackright_index_to_relation_exists_dictionary,
-                    p_blackright_q_blackright_index_to_relation_exists_dictionary,
-                    is_king_move,
-                    positive_of_relation,
-                    total_of_relation)
+        Parameters
+        ----------
+        legal_moves :
+            合法手
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+
+        Returns
+        -------
+        ranked_strict_move_id_set_list : list[set()]
+        """
+        (_, _, ranked_strict_move_id_set_list) = ChoiceBestMove.get_policy_by_batch(
+                legal_moves=legal_moves,
+                kifuwarabe=kifuwarabe)
+
+        return ranked_strict_move_id_set_list
 
 
     @staticmethod
@@ -460,7 +378,7 @@ is_white  :{is_white}
             legal_moves,
             kifuwarabe,
             is_debug=False):
-        """ランク付けされた指し手一覧（好手、悪手）を作成
+        """ランク付けされた指し手一覧（好手、悪手）を、ＵＳＩ形式の符号で作成
 
         Parameters
         ----------
@@ -475,37 +393,63 @@ is_white  :{is_white}
         -------
         ranked_strict_move_u_set_list : list[set()]
         """
+        ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                legal_moves=legal_moves,
+                kifuwarabe=kifuwarabe,
+                is_debug=is_debug)
 
-        ranked_strict_move_u_set_list = []
+        return [{cshogi.move_to_usi(strict_move_id) for strict_move_id in ranked_strict_move_id_set} for ranked_strict_move_id_set in ranked_strict_move_id_set_list]
+
+
+    @staticmethod
+    def select_ranked_f_strict_move_id_set_facade(
+            legal_moves,
+            kifuwarabe,
+            is_debug=False):
+        """ランク付けされた指し手一覧（好手、悪手）を、 cshogi の指し手の整数で作成
+
+        Parameters
+        ----------
+        legal_moves :
+            合法手
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+        is_debug : bool
+            デバッグか？
+
+        Returns
+        -------
+        ranked_strict_move_id_set_list : list[set()]
+        """
+
+        # デバッグでなければ、全ての合法手をまとめて数える
+        if not is_debug:
+            return ChoiceBestMove.select_ranked_f_strict_move_id_set_by_batch(
+                    legal_moves=legal_moves,
+                    kifuwarabe=kifuwarabe)
+
+        ranked_strict_move_id_set_list = []
 
         # もし好手と悪手の２パターンなら tier_resolution は ２。
         # 配列のインデックスの小さい方がランクが上とする
         for i in range(0, kifuwarabe.tier_resolution):
-            ranked_strict_move_u_set_list.append(set())
+            ranked_strict_move_id_set_list.append(set())
 
         # デバッグ表示
         if is_debug and DebugPlan.select_ranked_f_strict_move_u_set_facade:
             print(f"[choice best move]  kifuwarabe.tier_resolution:{kifuwarabe.tier_resolution}")
 
-        for strict_move_id in legal_moves:
-            strict_move_u = cshogi.move_to_usi(strict_move_id)
-
-            # 着手オブジェクト
-            f_strict_move_obj = Move.from_usi(strict_move_u)
-
-            # 自駒と敵玉に対する関係の辞書
-            (black_f_black_l_index_to_relation_exists_dictionary,
-             # 自駒と敵兵に対する関係の辞書
-             black_f_black_q_index_to_relation_exists_dictionary,
-             # 玉の指し手か？
-             is_king_move,
-             # 関係が陽性の総数
-             positive_of_relation,
-             # 関係の総数
-             total_of_relation) = ChoiceBestMove.get_summary(
-                    f_strict_move_obj=f_strict_move_obj,
-                    kifuwarabe=kifuwarabe,
-                    is_debug=is_debug)
+        f_strict_move_id_list = list(legal_moves)
+
+        (positive_of_relation_array,
+         total_of_relation_array) = ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                f_strict_move_id_list=f_strict_move_id_list,
+                kifuwarabe=kifuwarabe)
+
+        for (strict_move_id, positive_of_relation, total_of_relation) in zip(
+                f_strict_move_id_list,
+                positive_of_relation_array.tolist(),
+                total_of_relation_array.tolist()):
 
             #
             # 好手悪手の階位算出
@@ -517,12 +461,12 @@ is_white  :{is_white}
 
 
             # 1 から始まる数を、0 から始まる数に変換して配列のインデックスに使用
-            target_strict_move_u_set = ranked_strict_move_u_set_list[ranking_th - 1]
-            target_strict_move_u_set.add(strict_move_u)
+            target_strict_move_id_set = ranked_strict_move_id_set_list[ranking_th - 1]
+            target_strict_move_id_set.add(strict_move_id)
 
             # デバッグ表示
             if is_debug and DebugPlan.select_ranked_f_strict_move_u_set_facade:
-                print(f"[choice best move]  strict_move_u:{strict_move_u}  policy_rate:{policy_rate}  ranking_th:{ranking_th}  positive_of_relation:{positive_of_relation}  total_of_relation:{total_of_relation}")
+                print(f"[choice best move]  strict_move_u:{cshogi.move_to_usi(strict_move_id)}  policy_rate:{policy_rate}  ranking_th:{ranking_th}  positive_of_relation:{positive_of_relation}  total_of_relation:{total_of_relation}")
 
 
         # デバッグ表示
@@ -531,21 +475,21 @@ is_white  :{is_white}
             for tier_th in range(0, kifuwarabe.tier_resolution):
 
                 print(f"[{datetime.datetime.now()}] [select ranked f move u set facade] ランク付けされた指し手一覧（{tier_th:2}位）")
-                target_strict_move_u_set = ranked_strict_move_u_set_list[tier_th]
+                target_strict_move_id_set = ranked_strict_move_id_set_list[tier_th]
 
-                for ranked_strict_move_u in target_strict_move_u_set:
-                    print(f"[{datetime.datetime.now()}] [select ranked f move u set facade]  {tier_th}位  strict_move:{ranked_strict_move_u:5}")
+                for ranked_strict_move_id in target_strict_move_id_set:
+                    print(f"[{datetime.datetime.now()}] [select ranked f move u set facade]  {tier_th}位  strict_move:{cshogi.move_to_usi(ranked_strict_move_id):5}")
 
 
-        return ranked_strict_move_u_set_list
+        return ranked_strict_move_id_set_list
 
 
     @staticmethod
-    def choice_best_move(
+    def choice_best_move_id(
             legal_moves,
             kifuwarabe,
             is_debug=False):
-        """最善の着手を選ぶ
+        """最善の着手を、 cshogi の指し手の整数で選ぶ
 
         Parameters
         ----------
@@ -555,22 +499,61 @@ is_white  :{is_white}
             評価値テーブルを持っている
         is_debug : bool
             デバッグモードか？
+
+        Returns
+        -------
+        best_move_id : int
+            最善の着手。合法手が無ければ None
         """
 
         # ランク付けされた指し手一覧
-        ranked_strict_move_u_set_list = ChoiceBestMove.select_ranked_f_strict_move_u_set_facade(
+        ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
                 legal_moves=legal_moves,
                 kifuwarabe=kifuwarabe,
                 is_debug=is_debug)
 
-        for ranked_strict_move_set in ranked_strict_move_u_set_list:
+        for ranked_strict_move_id_set in ranked_strict_move_id_set_list:
 
             # このランキングに候補手が無ければ、下のランキングへ
-            if len(ranked_strict_move_set) < 1:
+            if len(ranked_strict_move_id_set) < 1:
                 continue
 
-            # 候補手の中からランダムに選ぶ。USIの指し手の記法で返却
-            return random.choice(list(ranked_strict_move_set))
+            # 候補手の中からランダムに選ぶ
+            return random.choice(list(ranked_strict_move_id_set))
 
         # ここにくることはないはず
-        return "resign"
+        return None
+
+
+    @staticmethod
+    def choice_best_move(
+            legal_moves,
+            kifuwarabe,
+            is_debug=False):
+        """最善の着手を選ぶ
+
+        Parameters
+        ----------
+        legal_moves : list<int>
+            合法手のリスト : cshogi の指し手整数
+        kifuwarabe : Kifuwarabe
+            評価値テーブルを持っている
+        is_debug : bool
+            デバッグモードか？
+
+        Returns
+        -------
+        best_move_str : str
+            USIの指し手の記法。合法手が無ければ "resign"
+        """
+        best_move_id = ChoiceBestMove.choice_best_move_id(
+                legal_moves=legal_moves,
+                kifuwarabe=kifuwarabe,
+                is_debug=is_debug)
+
+        # ここにくることはないはず
+        if best_move_id is None:
+            return "resign"
+
+        # USIの指し手の記法で返却
+        return cshogi.move_to_usi(best_move_id)
@@ -1,5 +1,8 @@
 import cshogi
 import datetime
+import itertools
+import mmap
+import numpy as np
 
 from v_a65_0_misc.bit_ope import BitOpe
 from v_a65_0_misc.sub_usi import SubUsi
@@ -51,6 +54,18 @@ class FileName():
         return f'{self._file_stem}_temp{self._file_extension}'
 
 
+    @property
+    def journal_base_name(self):
+        """上書き保存の途中経過を記録するジャーナルのベース名"""
+        return f'{self._file_stem}_journal{self._file_extension}'
+
+
+    @property
+    def lock_base_name(self):
+        """ファイルを書き換えるプロセスが、書き換えている間だけ作るロック・ファイルのベース名"""
+        return f'{self._file_stem}.lock'
+
+
 
 class Turn():
     """手番"""
@@ -131,7 +146,28 @@ class Turn():
 
 
 class Move():
-    """指し手"""
+    """指し手
+
+    変更できない（イミュータブルな）オブジェクト。同じ指し手のオブジェクトは１つだけ作って使い回す（インターン）。
+    from_usi() 、 from_src_dst_pro() 、 from_move_obj() 、 rotate() は、作ったことのある指し手なら、辞書を１回引いて同じオブジェクトを返す。
+    指し手の種類は、移動元 88 × 移動先 81 × 成り 2 しか無いので、辞書はそれ以上大きくならない
+    """
+
+
+    __slots__ = ('_srcloc', '_dstsq', '_promoted', '_packed', '_as_usi')
+    """属性の辞書を持たないので、オブジェクトが小さい"""
+
+
+    _packed_to_move_obj = {}
+    """詰めた整数を渡すと、インターンした指し手を返す辞書"""
+
+
+    _usi_to_move_obj = {}
+    """ＵＳＩ形式の指し手の符号を渡すと、インターンした指し手を返す辞書"""
+
+
+    _packed_and_transform_to_move_obj = {}
+    """（詰めた整数、１８０°回転するか、右辺だけ使うか）を渡すと、変形したインターン済みの指し手を返す辞書"""
 
 
     _file_th_str_to_num = {
@@ -212,6 +248,50 @@ class Move():
     """移動元、移動先の２文字目をインデックスへ変換"""
 
 
+    @staticmethod
+    def to_packed(
+            srcloc,
+            dstsq,
+            promoted):
+        """移動元番号、移動先マス番号、成ったか、を１つの整数に詰めます
+
+        Returns
+        -------
+        packed : int
+            移動元番号 | 移動先マス番号 << 7 | 成ったか << 14
+        """
+        return srcloc | (dstsq << 7) | (promoted << 14)
+
+
+    @staticmethod
+    def get_interned(
+            srcloc,
+            dstsq,
+            promoted):
+        """インターンした指し手を返します。まだ無ければ作って覚えます
+
+        Parameters
+        ----------
+        srcloc : int
+            移動元番号
+        dstsq : int
+            移動先マス番号
+        promoted : bool
+            成ったか？
+        """
+        packed = srcloc | (dstsq << 7) | (promoted << 14)
+
+        move_obj = Move._packed_to_move_obj.get(packed)
+        if move_obj is None:
+            move_obj = Move(
+                    srcloc=srcloc,
+                    dstsq=dstsq,
+                    promoted=promoted)
+            Move._packed_to_move_obj[packed] = move_obj
+
+        return move_obj
+
+
     @staticmethod
     def from_usi(move_as_usi):
         """生成
@@ -222,6 +302,10 @@ class Move():
             "7g7f" や "3d3c+"、 "R*5e" のような文字列を想定。 "resign" のような文字列は想定外
         """
 
+        move_obj = Move._usi_to_move_obj.get(move_as_usi)
+        if move_obj is not None:
+            return move_obj
+
         # 移動元番号
         srcloc = SubUsi.code_to_srcloc(
                 code=move_as_usi[0: 2])
@@ -237,10 +321,13 @@ class Move():
         #
         promoted = 4 < len(move_as_usi)
 
-        return Move(
+        move_obj = Move.get_interned(
                 srcloc=srcloc,
                 dstsq=dstsq,
                 promoted=promoted)
+        Move._usi_to_move_obj[move_as_usi] = move_obj
+
+        return move_obj
 
 
     @staticmethod
@@ -291,7 +378,7 @@ class Move():
                     srcloc = SubUsi.flip_srcloc(srcloc)
                     dstsq = SubUsi.flip_srcloc(dstsq)
 
-        return Move(
+        return Move.get_interned(
                 srcloc=srcloc,
                 dstsq=dstsq,
                 promoted=promoted)
@@ -313,12 +400,19 @@ class Move():
             移動元マスを盤の１筋～５筋だけ使うように指し手を揃えるか？
         """
         if shall_white_to_black or use_only_right_side:
-            return Move.from_src_dst_pro(
-                    srcloc=f_strict_move_obj.srcloc,
-                    dstsq=f_strict_move_obj.dstsq,
-                    promoted=f_strict_move_obj.promoted,
-                    is_rotate=shall_white_to_black,
-                    use_only_right_side=use_only_right_side)
+            key = (f_strict_move_obj._packed, shall_white_to_black, use_only_right_side)
+
+            move_obj = Move._packed_and_transform_to_move_obj.get(key)
+            if move_obj is None:
+                move_obj = Move.from_src_dst_pro(
+                        srcloc=f_strict_move_obj.srcloc,
+                        dstsq=f_strict_move_obj.dstsq,
+                        promoted=f_strict_move_obj.promoted,
+                        is_rotate=shall_white_to_black,
+                        use_only_right_side=use_only_right_side)
+                Move._packed_and_transform_to_move_obj[key] = move_obj
+
+            return move_obj
 
         return f_strict_move_obj
 
@@ -342,6 +436,10 @@ class Move():
         self._srcloc = srcloc
         self._dstsq = dstsq
         self._promoted = promoted
+        self._packed = srcloc | (dstsq << 7) | (promoted << 14)
+
+        # ＵＳＩ形式の指し手の符号は、初めて使うときに作って覚えておく
+        self._as_usi = None
 
 
     def dump(self):
@@ -366,23 +464,28 @@ class Move():
         return self._promoted
 
 
+    @property
+    def packed(self):
+        """移動元番号 | 移動先マス番号 << 7 | 成ったか << 14 。指し手ごとに異なる整数"""
+        return self._packed
+
+
     @property
     def as_usi(self):
         """USI形式の指し手の符号。
         "7g7f" や "3d3c+"、 "R*5e" のような文字列を想定。 "resign" のような文字列は想定外
         """
-        return f"{SubUsi.srcloc_to_code(self.srcloc)}{SubUsi.sq_to_code(self.dstsq)}{SubUsi.promotion_to_code(self.promoted)}"
+        if self._as_usi is None:
+            self._as_usi = f"{SubUsi.srcloc_to_code(self.srcloc)}{SubUsi.sq_to_code(self.dstsq)}{SubUsi.promotion_to_code(self.promoted)}"
+
+        return self._as_usi
 
 
     def rotate(self):
         """盤を１８０°回転させたときの指し手を返します"""
-        rot_srcloc = SubUsi.rotate_srcloc(self.srcloc)
-        rot_dstsq = SubUsi.rotate_srcloc(self._dstsq)
-
-        return Move(
-                srcloc=rot_srcloc,
-                dstsq=rot_dstsq,
-                promoted=self.promoted)
+        return Move.from_move_obj(
+                f_strict_move_obj=self,
+                shall_white_to_black=True)
 
 
 class MoveHelper():
@@ -424,60 +527,6 @@ class BoardHelper():
         return board.king_square(board.turn)
 
 
-    @staticmethod
-    def create_counter_move_u_set(
-            board,
-            f_strict_move_obj):
-        """応手の一覧を作成
-
-        Parameters
-        ----------
-        board : Board
-            局面
-        f_strict_move_obj : Move
-            着手
-
-        Returns
-        -------
-        - l_strict_move_u_set
-        - q_strict_move_u_set
-        """
-
-        #
-        # 相手が指せる手の集合
-        # -----------------
-        #
-        #   ヌルムーブをしたいが、 `board.push_pass()` が機能しなかったので、合法手を全部指してみることにする
-        #
-
-        # 敵玉（Lord）の指し手の集合
-        l_strict_move_u_set = set()
-        # 敵玉を除く敵軍の指し手の集合（Quaffer；ゴクゴク飲む人。Pの次の文字Qを頭文字にした単語）
-        q_strict_move_u_set = set()
-
-        # １手指す
-        board.push_usi(f_strict_move_obj.as_usi)
-
-        # 敵玉（L; Lord）の位置を調べる
-        l_sq = BoardHelper.get_king_square(board)
-
-        for strict_counter_move_id in board.legal_moves:
-            strict_counter_move_u = cshogi.move_to_usi(strict_counter_move_id)
-            strict_counter_move_obj = Move.from_usi(strict_counter_move_u)
-
-            # 敵玉の指し手か？
-            if MoveHelper.is_king(l_sq, strict_counter_move_obj):
-                l_strict_move_u_set.add(strict_counter_move_u)
-            # 敵玉を除く敵軍の指し手
-            else:
-                q_strict_move_u_set.add(strict_counter_move_u)
-
-        # １手戻す
-        board.pop()
-
-        return (l_strict_move_u_set, q_strict_move_u_set)
-
-
     @staticmethod
     def get_position_command(
             board):
@@ -593,30 +642,95 @@ class PolicyHelper():
 ########################################
 
 class EvalutionMmTable():
-    """評価値ＭＭテーブル"""
+    """評価値ＭＭテーブル
+
+    評価値テーブルは、１ビットを１関係として８関係ずつ１バイトに詰めたバイト列で持つ。
+    ファイルと同じ並びで、バイトの中は大きな桁から順に並べる（ビッグエンディアン）
+
+    バイト列の代わりに、ファイルをメモリーマップしたものや、評価値テーブル・サーバーの共有メモリーを持つこともできる。
+    読取専用のマップや共有メモリーなら、書込は拒否する
+
+    変更したバイトは、 dirty_page_size バイトごとのページの番号で覚えておく。
+    保存時に、変更したページだけをファイルへ上書きできる
+    """
+
+
+    dirty_page_size = 512
+    """変更を覚えておくページの大きさ（バイト）"""
+
+    _serial_number_counter = itertools.count()
+    """評価値テーブルのオブジェクトに通し番号を振るカウンター。 EvaluationProceduralTable と共通"""
+
+
+    @staticmethod
+    def issue_serial_number():
+        """評価値テーブルのオブジェクトの通し番号を発行します。同じ番号は２度と発行しない"""
+        return next(EvalutionMmTable._serial_number_counter)
 
 
     def __init__(
             self,
             file_name_obj,
             table_as_array,
-            is_file_modified):
+            is_file_modified,
+            header_obj=None,
+            file_identity=None,
+            edit_log_identity=None,
+            shared_table_obj=None):
         """初期化
 
         Parameters
         ----------
         file_name_obj : FileName
             ファイル名オブジェクト
-        table_as_array : []
-            評価値テーブルの配列
+        table_as_array : bytearray or memoryview
+            評価値テーブルの配列。１ビットを１関係として詰めたバイト列。
+            ファイルをメモリーマップしたときは、そのマップ（ memoryview.obj ）の本体部分の memoryview
         is_file_modified : bool
             このテーブルが変更されて、保存されていなければ真
+        header_obj : EvaluationTableHeader
+            ファイルへ保存するときのヘッダー。保存しないなら None でもよい
+        file_identity : tuple
+            読み込んだときのファイルの素性。 EvaluationLib.get_file_identity() を参照。ファイルから読んでいなければ None
+        edit_log_identity : tuple
+            読み込んだときに再生した編集ログの素性。 EvaluationEditLog.get_replay_identity() を参照
+        shared_table_obj : EvaluationSharedTable
+            評価値テーブル・サーバーの共有メモリー。 table_as_array はその本体部分を渡すこと。共有メモリーでなければ None
         """
 
         self._file_name_obj = file_name_obj
+        self._header_obj = header_obj
+        self._file_identity = file_identity
+        self._edit_log_identity = edit_log_identity
+        self._shared_table_obj = shared_table_obj
+
+        # オブジェクトの通し番号。読み直して差し替えたテーブルと、世代番号が同じでも見分ける
+        self._serial_number = EvalutionMmTable.issue_serial_number()
+
+        # このプロセスで変更した回数。共有メモリーなら、共有メモリーの世代番号を使う
+        self._generation = 0
+
+        # メモリーマップや共有メモリーは、そのまま使う
+        if isinstance(table_as_array, memoryview) and isinstance(table_as_array.obj, mmap.mmap):
+            # 読取専用のマップか？
+            self._is_read_only = table_as_array.readonly
+
+        # 書き換えられるように bytearray にしておく
+        else:
+            if not isinstance(table_as_array, bytearray):
+                table_as_array = bytearray(table_as_array)
+
+            self._is_read_only = False
+
         self._table_as_array = table_as_array
         self._is_file_modified = is_file_modified
 
+        # 変更したページの番号
+        self._dirty_page_set = set()
+
+        # 最初から変更されている（ファイルと中身が違う）なら、どのページが違うかは分からない
+        self._is_dirty_page_tracked = not is_file_modified
+
 
     @property
     def file_name_obj(self):
@@ -626,16 +740,195 @@ class EvalutionMmTable():
 
     @property
     def table_as_array(self):
-        """評価値テーブルの配列"""
+        """評価値テーブルの配列。１ビットを１関係として詰めたバイト列"""
         return self._table_as_array
 
 
+    @property
+    def header_obj(self):
+        """ファイルへ保存するときのヘッダー"""
+        return self._header_obj
+
+
     @property
     def is_file_modified(self):
         """このテーブルが変更されて、保存されていなければ真"""
         return self._is_file_modified
 
 
+    @property
+    def dirty_page_set(self):
+        """前回の保存から変更したページの番号の集合"""
+        return self._dirty_page_set
+
+
+    @property
+    def is_dirty_page_tracked(self):
+        """ファイルとの違いが dirty_page_set のページだけなら真。偽ならファイル全体を保存する必要がある"""
+        return self._is_dirty_page_tracked
+
+
+    @property
+    def file_identity(self):
+        """読み込んだとき、または保存したときのファイルの素性。ファイルと中身が一致していると分からなければ None"""
+        return self._file_identity
+
+
+    @property
+    def edit_log_identity(self):
+        """読み込んだときに再生した編集ログの素性"""
+        return self._edit_log_identity
+
+
+    def mark_as_saved(
+            self,
+            file_identity=None):
+        """ファイルへ保存したので、変更の記録を消します
+
+        Parameters
+        ----------
+        file_identity : tuple
+            保存した後のファイルの素性
+        """
+        self._file_identity = file_identity
+        self._is_file_modified = False
+        self._dirty_page_set.clear()
+        self._is_dirty_page_tracked = True
+
+
+    @property
+    def is_procedural(self):
+        """手続き的に生成する評価値テーブル（ EvaluationProceduralTable ）なら真。これは違う"""
+        return False
+
+
+    @property
+    def is_file_mapped(self):
+        """ファイルをメモリーマップしていれば真"""
+        return isinstance(self._table_as_array, memoryview) and self._shared_table_obj is None
+
+
+    @property
+    def is_shared(self):
+        """評価値テーブル・サーバーの共有メモリーを使っていれば真"""
+        return self._shared_table_obj is not None
+
+
+    @property
+    def shared_table_obj(self):
+        """評価値テーブル・サーバーの共有メモリー。使っていなければ None"""
+        return self._shared_table_obj
+
+
+    @property
+    def generation(self):
+        """世代番号。評価値テーブルが変わると増える。
+        共有メモリーなら、学習部（他のプロセス）が変えたときも増える"""
+        if self._shared_table_obj is not None:
+            return self._shared_table_obj.generation
+
+        return self._generation
+
+
+    @property
+    def version(self):
+        """版。（オブジェクトの通し番号, 世代番号）。評価値テーブルが変わるか、読み直して差し替えると変わる。
+        同じ版なら、評価値テーブルの中身も同じ"""
+
+        # 読取専用でメモリーマップしたファイルは、学習部が変更したページを直に上書きすると、中身が変わる。
+        # 学習部はヘッダー（本体の CRC-32 を含む）を最後に書くので、マップしたヘッダーも版に入れる
+        if self._is_read_only and self.is_file_mapped:
+            mapped_file = self._table_as_array.obj
+            return (self._serial_number, self.generation, mapped_file[:len(mapped_file) - len(self._table_as_array)])
+
+        return (self._serial_number, self.generation)
+
+
+    @property
+    def is_read_only(self):
+        """読取専用なら真。書込は拒否する"""
+        return self._is_read_only
+
+
+    def release_file_mapping(self):
+        """ファイルをメモリーマップしていれば、中身をメモリーへコピーしてマップを閉じます
+
+        マップしたままではファイルを置き換えられない（Windows）ので、保存の前に呼び出すこと。
+        共有メモリーはファイルのマップではないので、そのまま使い続ける
+        """
+        if not self.is_file_mapped:
+            return
+
+        mapped_table = self._table_as_array
+        self._table_as_array = bytearray(mapped_table)
+        EvalutionMmTable._close_mapped_table(mapped_table)
+
+
+    def overlay_bit_by_index(
+            self,
+            index,
+            bit):
+        """メモリー上の評価値テーブルだけにビット値を設定します。変更としては記録せず、ファイルへは保存されません
+
+        読取専用のテーブルでも、メモリーへコピーしてから設定します。
+        他のプロセスの編集ログを再生するのに使います
+
+        Parameters
+        ----------
+        index : int
+            ビットのインデックス
+        bit : int
+            0 か 1
+        """
+
+        # 読取専用のマップには書き込めないので、メモリーへ移す
+        if self._is_read_only and self.is_file_mapped:
+            self.release_file_mapping()
+
+        # 読取専用の共有メモリーにも書き込めないので、メモリーへ移して切り離す。以降、学習部の変更は見えない
+        if self._is_read_only and self._shared_table_obj is not None:
+            self._table_as_array = bytearray(self._table_as_array)
+            self._is_read_only = False
+
+            # 切り離した後も世代番号が戻らないように、共有メモリーの世代番号を引き継ぐ
+            self._generation = self._shared_table_obj.generation
+            self._shared_table_obj.close()
+            self._shared_table_obj = None
+
+        byte_index = index // 8
+        left_shift = 7 - index % 8
+
+        if bit == 1:
+            self._table_as_array[byte_index] = BitOpe.stand_at(self._table_as_array[byte_index], left_shift)
+
+        else:
+            self._table_as_array[byte_index] = BitOpe.sit_at(self._table_as_array[byte_index], left_shift)
+
+        # 変更として記録しなくても、中身は変わったので世代番号は進める
+        if self._shared_table_obj is not None:
+            self._shared_table_obj.increment_generation()
+        else:
+            self._generation += 1
+
+
+    def close(self):
+        """ファイルをメモリーマップしていれば、マップを閉じます。共有メモリーなら切り離します。閉じた後はこのテーブルは使えません"""
+        if self.is_file_mapped:
+            EvalutionMmTable._close_mapped_table(self._table_as_array)
+
+        elif self._shared_table_obj is not None:
+            self._shared_table_obj.close()
+
+
+    @staticmethod
+    def _close_mapped_table(
+            mapped_table):
+        """メモリーマップの memoryview を手放してから、マップを閉じます"""
+        mapped_file = mapped_table.obj
+        mapped_table.release()
+        mapped_file.close()
+
+
     def get_bit_by_index(
             self,
             index,
@@ -645,7 +938,7 @@ class EvalutionMmTable():
         Parameters
         ----------
         index : int
-            配列のインデックス
+            ビットのインデックス
 
         Returns
         -------
@@ -685,6 +978,28 @@ class EvalutionMmTable():
         return bit_value
 
 
+    def get_bits_by_index_array(
+            self,
+            index_array):
+        """インデックスの配列を受け取って、ビット値の配列を返します。 get_bit_by_index() を１回の numpy の演算でまとめて行う
+
+        Parameters
+        ----------
+        index_array : numpy.ndarray
+            ビットのインデックスの配列（整数）
+
+        Returns
+        -------
+        bit_array : numpy.ndarray
+            0 か 1 の配列（ numpy.uint8 ）
+        """
+        # バイト列はコピーせずに numpy の配列として見る。取り出した値はコピーなので、ここを抜ければバイト列を手放す
+        byte_array = np.frombuffer(self._table_as_array, dtype=np.uint8)
+
+        # get_bit_by_index() と同じく、大きな桁から数える（ビッグエンディアン）
+        return (byte_array[index_array >> 3] >> (7 - (index_array & 7)).astype(np.uint8)) & np.uint8(1)
+
+
     def set_bit_by_index(
             self,
             f_blackright_o_blackright_index,
@@ -695,7 +1010,7 @@ class EvalutionMmTable():
         Parameters
         ----------
         f_blackright_o_blackright_index : int
-            配列のインデックス。着手、応手ともに先手の視点
+            ビットのインデックス。着手、応手ともに先手の視点
         bit : int
             0 か 1
         is_debug : bool
@@ -709,6 +1024,10 @@ class EvalutionMmTable():
             変更できなかった場合の説明
         """
 
+        # 読取専用のテーブルには書き込まない
+        if self._is_read_only:
+            return (False, f'read only table. file:`{self._file_name_obj.base_name}`')
+
         # ビット・インデックスを、バイトとビットに変換
         bit_index = f_blackright_o_blackright_index % 8
         byte_index = f_blackright_o_blackright_index // 8
@@ -754,6 +1073,14 @@ class EvalutionMmTable():
 
         if is_changed:
             self._is_file_modified = True
+            self._dirty_page_set.add(byte_index // EvalutionMmTable.dirty_page_size)
+
+            # 共有メモリーなら、読む側のプロセスに変わったことを知らせる
+            if self._shared_table_obj is not None:
+                self._shared_table_obj.increment_generation()
+            else:
+                self._generation += 1
+
             return (True, '')
 
         return (False, f'old_byte_value:`0x{old_byte_value:08b}`  left_shift:{left_shift}  bit:{bit}')
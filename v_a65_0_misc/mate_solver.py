@@ -0,0 +1,348 @@
+import cshogi
+
+from v_a65_0_misc.alpha_beta_search import SearchAborted
+
+
+class MateSolver():
+    """詰将棋を解く、ｄｆ－ｐｎ（証明数・反証数を使う深さ優先の探索）
+
+    攻め方は王手だけを指し、受け方は全ての応手を指す。
+    局面ごとに、詰みを示すのにあと何局面を調べればよいか（証明数）と、不詰みを示すのにあと何局面を調べればよいか（反証数）を置換表に覚え、
+    攻め方の局面では証明数の一番小さい指し手を、受け方の局面では反証数の一番小さい指し手を、しきい値を超えるまで読む。
+    打ち歩詰めは cshogi が合法手から除くので、そのまま正しく扱う。
+
+    受け方の局面の証明数は、受け方の応手の数から始める（ df-pn+ ）。応手の少ない王手から読むので、早く、短く詰む。
+
+    同じ読み筋の中で同じ局面に戻れば（千日手。連続王手の千日手も）攻め方の失敗とする。
+    盤上が同じで、攻め方の持ち駒だけが減った局面（受け方の持ち駒だけが増えた局面）に戻ったときも、王手を続けて駒を捨てただけなので、攻め方の失敗とする。
+    千日手と手数の上限で打ち切った不詰みは、読み筋によって変わる（置換表に覚えると、別の読み筋では間違えることがある）。
+    間違えても詰みを不詰みとするだけで、不詰みを詰みとすることはない。
+    手数の上限で打ち切ったときは、 'nomate' ではなく 'timeout' を返す
+    """
+
+
+    infinite_number = 100000000
+    """証明数、反証数の無限大"""
+
+    max_ply = 255
+    """読む手数の上限。攻め方がこれより長く王手を続けても詰まなければ、不詰みとする"""
+
+    node_interval_for_time_check = 256
+    """何局面ごとに、時間切れと中断を確かめるか"""
+
+
+    def __init__(
+            self,
+            board,
+            max_nodes=None,
+            time_manager=None,
+            max_table_size=None):
+        """初期化
+
+        Parameters
+        ----------
+        board : cshogi.Board
+            局面。解いている間は指したり戻したりするが、解き終われば元に戻っている
+        max_nodes : int
+            調べる局面の数の上限。 None なら上限なし
+        time_manager : TimeManager
+            持ち時間の管理。上限の時間を過ぎたら打ち切る。 None なら時間の上限なし
+        max_table_size : int
+            置換表に覚える局面の数の上限。超えたら打ち切る。 None なら上限なし
+        """
+        self._board = board
+        self._max_nodes = max_nodes
+        self._time_manager = time_manager
+        self._max_table_size = max_table_size
+
+        self._nodes = 0
+        self._is_stopped = False
+
+        # 手数の上限で、不詰みとして打ち切ったか？
+        self._is_cut_by_max_ply = False
+
+        # 置換表。キーは局面のハッシュ。値は（証明数, 反証数, 詰みなら詰むまでの手数）
+        self._table = {}
+
+
+    @property
+    def nodes(self):
+        """調べた局面の数"""
+        return self._nodes
+
+
+    @property
+    def table_size(self):
+        """置換表に覚えた局面の数"""
+        return len(self._table)
+
+
+    def stop(self):
+        """解くのを止めます。別スレッドから呼んでもよい。 solve は 'timeout' を返す"""
+        self._is_stopped = True
+
+
+    def solve(
+            self,
+            is_attacker_turn=True):
+        """詰将棋を解きます
+
+        Parameters
+        ----------
+        is_attacker_turn : bool
+            真なら、手番の方が攻め方（王手をかけて詰ませる）。偽なら、手番の方が受け方（どう指しても詰まされるか調べる）
+
+        Returns
+        -------
+        result_str : str
+            'mate' - 詰む
+            'nomate' - 詰まない
+            'timeout' - 局面の数か、時間か、置換表の大きさの上限に達したか、中断したか、手数の上限で打ち切った
+        mate_move_id_list : list<int>
+            詰むなら、詰むまでの指し手（受け方は一番長く逃げる手）。そうでなければ空のリスト。
+            解けた中で一番短い詰みで、一番短い詰みとは限らない
+        """
+        try:
+            self.search_node(
+                    is_or_node=is_attacker_turn,
+                    threshold_pn=MateSolver.infinite_number,
+                    threshold_dn=MateSolver.infinite_number,
+                    ply=0)
+
+        except SearchAborted:
+            return ('timeout', [])
+
+        (pn, _dn, _length) = self._table[self._board.zobrist_hash()]
+
+        if pn == 0:
+            return ('mate', self.create_mate_move_id_list(
+                    is_or_node=is_attacker_turn))
+
+        if self._is_cut_by_max_ply:
+            return ('timeout', [])
+
+        return ('nomate', [])
+
+
+    def generate_move_list(
+            self,
+            is_or_node):
+        """攻め方なら王手の指し手、受け方なら全ての合法手を作ります"""
+        if not is_or_node:
+            return list(self._board.legal_moves)
+
+        # 王手されていなければ、 cshogi が王手だけを作る
+        if not self._board.is_check():
+            return list(self._board.check_moves)
+
+        # 攻め方が王手されていれば、応手のうち王手になるものを選ぶ
+        check_move_list = []
+        for move_id in self._board.legal_moves:
+            self._board.push(move_id)
+            if self._board.is_check():
+                check_move_list.append(move_id)
+            self._board.pop()
+
+        return check_move_list
+
+
+    def count_node(self):
+        """局面を１つ数えます。上限に達したか中断なら SearchAborted を投げる"""
+        self._nodes += 1
+
+        if self._max_nodes is not None and self._max_nodes < self._nodes:
+            raise SearchAborted()
+
+        if self._nodes % MateSolver.node_interval_for_time_check == 0:
+            if self._is_stopped or (self._time_manager is not None and self._time_manager.is_time_up()):
+                self._is_stopped = True
+                raise SearchAborted()
+
+            if self._max_table_size is not None and self._max_table_size < len(self._table):
+                raise SearchAborted()
+
+
+    def search_node(
+            self,
+            is_or_node,
+            threshold_pn,
+            threshold_dn,
+            ply):
+        """証明数か反証数がしきい値以上になるまで読み、置換表に覚えます
+
+        攻め方の局面（ＯＲ節点）の証明数は子の証明数の最小、反証数は子の反証数の和。受け方の局面（ＡＮＤ節点）は逆
+
+        Parameters
+        ----------
+        is_or_node : bool
+            攻め方の局面か？
+        threshold_pn : int
+            証明数のしきい値
+        threshold_dn : int
+            反証数のしきい値
+        ply : int
+            根からの手数
+        """
+        self.count_node()
+
+        infinite_number = MateSolver.infinite_number
+        table = self._table
+        board = self._board
+        hash_key = board.zobrist_hash()
+
+        move_id_list = self.generate_move_list(
+                is_or_node=is_or_node)
+
+        # 指し手が無い。攻め方なら不詰み、受け方なら詰み
+        if len(move_id_list) < 1:
+            if is_or_node:
+                table[hash_key] = (infinite_number, 0, 0)
+            else:
+                table[hash_key] = (0, infinite_number, 0)
+            return
+
+        # 手数の上限に達したら、攻め方の失敗とする
+        if is_or_node and MateSolver.max_ply <= ply:
+            self._is_cut_by_max_ply = True
+            table[hash_key] = (infinite_number, 0, 0)
+            return
+
+        # 子が攻め方の局面なら攻め方の持ち駒が減った局面、受け方の局面なら受け方の持ち駒が増えた局面に戻るのも、攻め方の失敗
+        worse_repetition_state = cshogi.REPETITION_SUPERIOR if is_or_node else cshogi.REPETITION_INFERIOR
+
+        # 子の局面のハッシュは、ここで１回だけ作る。読み筋の中で千日手になる子は None
+        child_hash_list = []
+        for move_id in move_id_list:
+            board.push(move_id)
+            child_hash = board.zobrist_hash()
+
+            # 根より前の局面は見ない
+            repetition_state = board.is_draw(ply + 1)
+            if repetition_state in [cshogi.REPETITION_DRAW, cshogi.REPETITION_WIN, cshogi.REPETITION_LOSE, worse_repetition_state]:
+                child_hash = None
+
+            # 王手をした子は、受け方の応手の数を証明数の初期値にする。応手が無ければ詰み
+            elif is_or_node and child_hash not in table:
+                number_of_evasions = len(board.legal_moves)
+                if 0 < number_of_evasions:
+                    table[child_hash] = (number_of_evasions, 1, 0)
+                else:
+                    table[child_hash] = (0, infinite_number, 0)
+
+            board.pop()
+            child_hash_list.append(child_hash)
+
+        while True:
+            pn = infinite_number if is_or_node else 0
+            dn = 0 if is_or_node else infinite_number
+            length = 0
+
+            # 攻め方なら証明数、受け方なら反証数の、一番小さい子と、２番目に小さい値
+            best_index = 0
+            best_number = infinite_number
+            second_number = infinite_number
+            best_child_pn = 1
+            best_child_dn = 1
+
+            for (index, child_hash) in enumerate(child_hash_list):
+                # 読み筋の中で同じ局面に戻れば、攻め方の失敗
+                if child_hash is None:
+                    (child_pn, child_dn, child_length) = (infinite_number, 0, 0)
+                else:
+                    (child_pn, child_dn, child_length) = table.get(child_hash, (1, 1, 0))
+
+                if is_or_node:
+                    if child_pn == 0 and (pn != 0 or child_length < length):
+                        length = child_length + 1
+
+                    pn = min(pn, child_pn)
+                    dn = min(infinite_number, dn + child_dn)
+                    number = child_pn
+
+                else:
+                    if child_pn == 0 and length < child_length + 1:
+                        length = child_length + 1
+
+                    pn = min(infinite_number, pn + child_pn)
+                    dn = min(dn, child_dn)
+                    number = child_dn
+
+                if number < best_number:
+                    second_number = best_number
+                    best_number = number
+                    best_index = index
+                    best_child_pn = child_pn
+                    best_child_dn = child_dn
+
+                elif number < second_number:
+                    second_number = number
+
+            if threshold_pn <= pn or threshold_dn <= dn:
+                break
+
+            # 一番小さい子を、２番目の子を超えない（超えたら読む子を替える）しきい値で読む
+            if is_or_node:
+                child_threshold_pn = min(threshold_pn, second_number + 1)
+                child_threshold_dn = min(infinite_number, threshold_dn - dn + best_child_dn)
+            else:
+                child_threshold_pn = min(infinite_number, threshold_pn - pn + best_child_pn)
+                child_threshold_dn = min(threshold_dn, second_number + 1)
+
+            board.push(move_id_list[best_index])
+            try:
+                self.search_node(
+                        is_or_node=not is_or_node,
+                        threshold_pn=child_threshold_pn,
+                        threshold_dn=child_threshold_dn,
+                        ply=ply + 1)
+            finally:
+                board.pop()
+
+        # 詰んでいなければ、手数は覚えない
+        table[hash_key] = (pn, dn, length if pn == 0 else 0)
+
+
+    def create_mate_move_id_list(
+            self,
+            is_or_node):
+        """置換表をたどって、詰むまでの指し手を作ります。攻め方は一番短く詰む手、受け方は一番長く逃げる手を選ぶ
+
+        Parameters
+        ----------
+        is_or_node : bool
+            今の局面が、攻め方の局面か？
+        """
+        board = self._board
+        mate_move_id_list = []
+
+        (_pn, _dn, length) = self._table[board.zobrist_hash()]
+
+        for _i in range(0, length):
+            best_move_id = None
+            best_length = None
+
+            for move_id in self.generate_move_list(
+                    is_or_node=is_or_node):
+                board.push(move_id)
+                (child_pn, _child_dn, child_length) = self._table.get(board.zobrist_hash(), (1, 1, 0))
+                board.pop()
+
+                if child_pn != 0:
+                    continue
+
+                if best_move_id is None or (is_or_node and child_length < best_length) or (not is_or_node and best_length < child_length):
+                    best_move_id = move_id
+                    best_length = child_length
+
+            # 置換表が足りなければ、たどれたところまで
+            if best_move_id is None:
+                break
+
+            board.push(best_move_id)
+            mate_move_id_list.append(best_move_id)
+            is_or_node = not is_or_node
+
+        for _move_id in mate_move_id_list:
+            board.pop()
+
+        return mate_move_id_list
@@ -0,0 +1,207 @@
+import threading
+from collections import OrderedDict
+
+
+class PolicyCache():
+    """局面ごとの方策（ランク付けされた指し手一覧と、着手ごとの関係の有りの数と総数）を覚えておくキャッシュ
+
+    学習では、同じ局面を何度も評価する（問題局面のランク付け、プレイアウトで通る局面など）ので、２回目からは数え直さずに済ませる。
+    キーは局面のハッシュ（ board.zobrist_hash() ）と手番。
+    覚えたときの評価値テーブル４つ（ＫＬ、ＫＱ、ＰＬ、ＰＱ）の版（ EvalutionMmTable.version ）も一緒に覚えておき、
+    引くときに版が変わっていれば（ビットを変えたか、読み直して差し替えたら）、その項目は捨てる。
+
+    一杯になったら、一番長く使っていない項目から捨てる（ＬＲＵ）
+    """
+
+
+    def __init__(
+            self,
+            max_size):
+        """初期化
+
+        Parameters
+        ----------
+        max_size : int
+            覚えておく局面の数の上限。 0 なら何も覚えない
+        """
+        self._max_size = max_size
+
+        # キー（局面のハッシュ, 手番）と、項目（評価値テーブルの版, 着手のリスト, 有りの数の配列, 総数の配列, ランク付けされた指し手一覧）
+        self._entry_dictionary = OrderedDict()
+
+        # 探索と読込のスレッドから同時に使われても壊れないようにする
+        self._lock = threading.Lock()
+
+        self._hit_count = 0
+        self._miss_count = 0
+        self._eviction_count = 0
+        self._invalidation_count = 0
+
+
+    @property
+    def max_size(self):
+        """覚えておく局面の数の上限"""
+        return self._max_size
+
+
+    @property
+    def hit_count(self):
+        """引いて、使える項目があった回数"""
+        return self._hit_count
+
+
+    @property
+    def miss_count(self):
+        """引いて、使える項目が無かった回数。版が変わって捨てた回数も含む"""
+        return self._miss_count
+
+
+    @property
+    def eviction_count(self):
+        """一杯になったので捨てた項目の数"""
+        return self._eviction_count
+
+
+    @property
+    def invalidation_count(self):
+        """評価値テーブルの版が変わったので捨てた項目の数"""
+        return self._invalidation_count
+
+
+    def __len__(self):
+        return len(self._entry_dictionary)
+
+
+    @staticmethod
+    def get_key(board):
+        """キャッシュのキー
+
+        Parameters
+        ----------
+        board : Board
+            局面
+
+        Returns
+        -------
+        key : tuple
+            （局面のハッシュ, 手番）
+        """
+        return (board.zobrist_hash(), board.turn)
+
+
+    def get(
+            self,
+            board,
+            table_version_tuple,
+            f_strict_move_id_list):
+        """局面の方策を引きます
+
+        Parameters
+        ----------
+        board : Board
+            局面
+        table_version_tuple : tuple
+            今の評価値テーブル４つの版。 ChoiceBestMove.get_table_version_tuple() を参照
+        f_strict_move_id_list : list<int>
+            数えたい着手のリスト。覚えたときと違えば使えない
+
+        Returns
+        -------
+        (positive_of_relation_array,
+         total_of_relation_array,
+         ranked_strict_move_id_set_list)
+            使える項目が無ければ None
+        """
+        key = PolicyCache.get_key(board)
+
+        with self._lock:
+            entry = self._entry_dictionary.get(key)
+
+            if entry is None:
+                self._miss_count += 1
+                return None
+
+            (entry_table_version_tuple,
+             entry_f_strict_move_id_list,
+             positive_of_relation_array,
+             total_of_relation_array,
+             ranked_strict_move_id_set_list) = entry
+
+            # 評価値テーブルが変わっていれば、もう使えないので捨てる
+            if entry_table_version_tuple != table_version_tuple:
+                del self._entry_dictionary[key]
+                self._invalidation_count += 1
+                self._miss_count += 1
+                return None
+
+            # 数えた着手が違えば使えない（ハッシュの衝突か、合法手の一部だけを渡されたとき）
+            if entry_f_strict_move_id_list != f_strict_move_id_list:
+                self._miss_count += 1
+                return None
+
+            # 最近使ったものとして、後ろへ回す
+            self._entry_dictionary.move_to_end(key)
+            self._hit_count += 1
+
+        # 呼出し元が書き換えても、覚えているものは変わらないように写す
+        return (positive_of_relation_array,
+                total_of_relation_array,
+                [set(ranked_strict_move_id_set) for ranked_strict_move_id_set in ranked_strict_move_id_set_list])
+
+
+    def put(
+            self,
+            board,
+            table_version_tuple,
+            f_strict_move_id_list,
+            positive_of_relation_array,
+            total_of_relation_array,
+            ranked_strict_move_id_set_list):
+        """局面の方策を覚えます
+
+        Parameters
+        ----------
+        board : Board
+            局面
+        table_version_tuple : tuple
+            数えたときの評価値テーブル４つの版
+        f_strict_move_id_list : list<int>
+            数えた着手のリスト
+        positive_of_relation_array : numpy.ndarray
+            着手ごとの、関係が有りの数
+        total_of_relation_array : numpy.ndarray
+            着手ごとの、関係の総数
+        ranked_strict_move_id_set_list : list[set()]
+            ランク付けされた指し手一覧
+        """
+        if self._max_size < 1:
+            return
+
+        key = PolicyCache.get_key(board)
+
+        with self._lock:
+            self._entry_dictionary[key] = (
+                    table_version_tuple,
+                    list(f_strict_move_id_list),
+                    positive_of_relation_array,
+                    total_of_relation_array,
+                    [set(ranked_strict_move_id_set) for ranked_strict_move_id_set in ranked_strict_move_id_set_list])
+            self._entry_dictionary.move_to_end(key)
+
+            # 一杯なら、一番長く使っていないものから捨てる
+            while self._max_size < len(self._entry_dictionary):
+                self._entry_dictionary.popitem(last=False)
+                self._eviction_count += 1
+
+
+    def clear(self):
+        """全ての項目を捨てます。統計の数はそのまま"""
+        with self._lock:
+            self._entry_dictionary.clear()
+
+
+    def get_statistics_str(self):
+        """統計の文字列"""
+        number_of_lookup = self._hit_count + self._miss_count
+        hit_rate = self._hit_count / number_of_lookup if 0 < number_of_lookup else 0.0
+        return f"size:{len(self._entry_dictionary)}/{self._max_size}  hit:{self._hit_count}  miss:{self._miss_count}  hit_rate:{hit_rate:.3f}  eviction:{self._eviction_count}  invalidation:{self._invalidation_count}"
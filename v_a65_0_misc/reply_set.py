@@ -0,0 +1,602 @@
+import cshogi
+import numpy as np
+
+
+class ReplySetEngine():
+    """応手の一覧を、局面ごとに１回だけ作り、着手ごとには差分だけを当てて作る
+
+    当初は、着手ごとに、１手指して、相手の合法手を全部作って、１手戻していた（ 'generate' ）。
+    ここでは、１手パス（ヌルムーブ）した局面で相手の合法手（基本の応手）を１回だけ作り、着手ごとに次の差分を当てる
+
+        - 着手の移動先のマスへの打を除く
+        - 着手の移動先のマスを通り抜けていた、相手の飛び駒の指し手を除く
+        - 着手の移動元のマス（空いた）への打を足す（行き所の無い駒、二歩は除く）
+        - 'approximate' では、取られた駒の指し手も除く
+
+    'exact' は、当初と同じ応手になる。王手、ピン、相手玉の逃げ場の利き、空いたマスを通って伸びる飛び駒、駒を取る手、自玉の指し手など、
+    差分では求められないかもしれない着手は、当初のように１手指して合法手を作る。打ち歩詰めになるかもしれない歩打ちは、１手指して確かめる。
+    'approximate' は、全ての着手に差分だけを当てる。王手、ピン、玉の逃げ場、伸びる飛び駒、取った歩の二歩の解消などは見ないので、当初と少し違う応手になる
+
+    応手は cshogi の指し手の整数の下位16bit（move16）で返す。評価値テーブルのインデックスを引くにはこれで足りる
+    """
+
+
+    mode_list = ['generate', 'exact', 'approximate']
+    """応手の作り方の一覧"""
+
+    _step_offsets_by_piece_type = {
+        cshogi.PAWN: [(0, -1)],
+        cshogi.LANCE: [],
+        cshogi.KNIGHT: [(-1, -2), (1, -2)],
+        cshogi.SILVER: [(-1, -1), (0, -1), (1, -1), (-1, 1), (1, 1)],
+        cshogi.BISHOP: [],
+        cshogi.ROOK: [],
+        cshogi.GOLD: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.KING: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)],
+        cshogi.PROM_PAWN: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_LANCE: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_KNIGHT: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_SILVER: [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_BISHOP: [(0, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_ROOK: [(-1, -1), (1, -1), (-1, 1), (1, 1)],
+    }
+    """駒の種類ごとの、１マスだけ動く（跳ぶ）先。（筋の差, 段の差）。先手から見て、段の差が負なら前"""
+
+    _slide_directions_by_piece_type = {
+        cshogi.LANCE: [(0, -1)],
+        cshogi.BISHOP: [(-1, -1), (1, -1), (-1, 1), (1, 1)],
+        cshogi.ROOK: [(0, -1), (-1, 0), (1, 0), (0, 1)],
+        cshogi.PROM_BISHOP: [(-1, -1), (1, -1), (-1, 1), (1, 1)],
+        cshogi.PROM_ROOK: [(0, -1), (-1, 0), (1, 0), (0, 1)],
+    }
+    """飛び駒の、飛ぶ向き。（筋の差, 段の差）。先手から見て、段の差が負なら前"""
+
+    _all_directions = [(-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+    """８方向"""
+
+    _hand_piece_type_list = [cshogi.PAWN, cshogi.LANCE, cshogi.KNIGHT, cshogi.SILVER, cshogi.GOLD, cshogi.BISHOP, cshogi.ROOK]
+    """持ち駒の並び（ board.pieces_in_hand と同じ）の駒の種類"""
+
+    _step_attack_bits_table = None
+    """［手番］［駒の種類］［マス］を添え字とし、１マスだけ動く（跳ぶ）先のビット集合（マス番号の桁）を値とするリスト"""
+
+    _line_bits_list = None
+    """マスを添え字とし、そのマスから８方向に盤の端まで並ぶマスのビット集合を値とするリスト"""
+
+    _between_array = None
+    """［移動元のマス］［移動先のマス］［マス］を添え字とし、８方向に並ぶ２つのマスの間のマスなら真とする配列"""
+
+    _slider_piece_type_array = None
+    """駒（ board.pieces の値）を添え字とし、飛び駒なら真とする配列"""
+
+
+    @staticmethod
+    def to_file_rank(sq):
+        """マス番号を（筋の番号, 段の番号）にします。どちらも 0 から始まる"""
+        return (sq // 9, sq % 9)
+
+
+    @staticmethod
+    def to_sq(
+            file_index,
+            rank_index):
+        """（筋の番号, 段の番号）をマス番号にします。盤の外なら None"""
+        if 0 <= file_index < 9 and 0 <= rank_index < 9:
+            return file_index * 9 + rank_index
+
+        return None
+
+
+    @staticmethod
+    def to_turn_direction(
+            direction,
+            turn):
+        """先手から見た向きを、手番から見た向きにします（後手なら１８０°回転）"""
+        if turn == cshogi.BLACK:
+            return direction
+
+        return (-direction[0], -direction[1])
+
+
+    @classmethod
+    def get_step_attack_bits_table(clazz):
+        """［手番］［駒の種類］［マス］を添え字とし、１マスだけ動く（跳ぶ）先のビット集合を値とするリストを返します。
+        初回アクセス時はテーブル生成に時間がかかります"""
+
+        # 未生成なら生成
+        if clazz._step_attack_bits_table is None:
+            step_attack_bits_table = []
+
+            for turn in [cshogi.BLACK, cshogi.WHITE]:
+                step_attack_bits_list_list = [[0] * 81 for _ in range(0, 16)]
+
+                for (piece_type, offset_list) in clazz._step_offsets_by_piece_type.items():
+                    for sq in range(0, 81):
+                        (file_index, rank_index) = clazz.to_file_rank(sq)
+                        bits = 0
+
+                        for offset in offset_list:
+                            (file_offset, rank_offset) = clazz.to_turn_direction(offset, turn)
+                            dst_sq = clazz.to_sq(file_index + file_offset, rank_index + rank_offset)
+                            if dst_sq is not None:
+                                bits |= 1 << dst_sq
+
+                        step_attack_bits_list_list[piece_type][sq] = bits
+
+                step_attack_bits_table.append(step_attack_bits_list_list)
+
+            clazz._step_attack_bits_table = step_attack_bits_table
+
+        return clazz._step_attack_bits_table
+
+
+    @classmethod
+    def get_line_bits_list(clazz):
+        """マスを添え字とし、そのマスから８方向に盤の端まで並ぶマスのビット集合を値とするリストを返します"""
+
+        # 未生成なら生成
+        if clazz._line_bits_list is None:
+            line_bits_list = []
+
+            for sq in range(0, 81):
+                (file_index, rank_index) = clazz.to_file_rank(sq)
+                bits = 0
+
+                for (file_offset, rank_offset) in clazz._all_directions:
+                    dst_sq = clazz.to_sq(file_index + file_offset, rank_index + rank_offset)
+                    step = 1
+                    while dst_sq is not None:
+                        bits |= 1 << dst_sq
+                        step += 1
+                        dst_sq = clazz.to_sq(file_index + file_offset * step, rank_index + rank_offset * step)
+
+                line_bits_list.append(bits)
+
+            clazz._line_bits_list = line_bits_list
+
+        return clazz._line_bits_list
+
+
+    @classmethod
+    def get_between_array(clazz):
+        """［移動元のマス］［移動先のマス］［マス］を添え字とし、８方向に並ぶ２つのマスの間のマスなら真とする配列を返します。
+        初回アクセス時はテーブル生成に時間がかかります"""
+
+        # 未生成なら生成
+        if clazz._between_array is None:
+            between_array = np.zeros((81, 81, 81), dtype=bool)
+
+            for src_sq in range(0, 81):
+                for dst_sq in range(0, 81):
+                    between_array[src_sq, dst_sq, clazz.get_between_sq_list(src_sq, dst_sq)] = True
+
+            clazz._between_array = between_array
+
+        return clazz._between_array
+
+
+    @classmethod
+    def get_slider_piece_type_array(clazz):
+        """駒（ board.pieces の値）を添え字とし、飛び駒なら真とする配列を返します"""
+
+        # 未生成なら生成
+        if clazz._slider_piece_type_array is None:
+            clazz._slider_piece_type_array = np.array([(piece & 0xf) in clazz._slide_directions_by_piece_type for piece in range(0, 32)], dtype=bool)
+
+        return clazz._slider_piece_type_array
+
+
+    @staticmethod
+    def is_slider_for_direction(
+            piece_type,
+            direction,
+            turn):
+        """その駒が、その向き（手番から見た向きではなく、盤上の向き）に飛べるなら真"""
+        for slide_direction in ReplySetEngine._slide_directions_by_piece_type.get(piece_type, []):
+            if ReplySetEngine.to_turn_direction(slide_direction, turn) == direction:
+                return True
+
+        return False
+
+
+    @staticmethod
+    def get_between_sq_list(
+            src_sq,
+            dst_sq):
+        """２つのマスが８方向のどれかに並んでいれば、間のマスのリストを返します。並んでいなければ空のリスト"""
+        (src_file_index, src_rank_index) = ReplySetEngine.to_file_rank(src_sq)
+        (dst_file_index, dst_rank_index) = ReplySetEngine.to_file_rank(dst_sq)
+        file_difference = dst_file_index - src_file_index
+        rank_difference = dst_rank_index - src_rank_index
+
+        if not (file_difference == 0 or rank_difference == 0 or abs(file_difference) == abs(rank_difference)):
+            return []
+
+        distance = max(abs(file_difference), abs(rank_difference))
+        file_offset = (file_difference > 0) - (file_difference < 0)
+        rank_offset = (rank_difference > 0) - (rank_difference < 0)
+
+        return [ReplySetEngine.to_sq(src_file_index + file_offset * step, src_rank_index + rank_offset * step) for step in range(1, distance)]
+
+
+    @staticmethod
+    def create_drop_allowed_array_list(
+            pieces,
+            o_turn):
+        """相手が駒を打てるかどうかの配列［持ち駒の並び］［マス］を返します。
+        行き所の無い駒と二歩だけを見る。マスが空いているか、打ち歩詰めかは見ない
+
+        Parameters
+        ----------
+        pieces : list<int>
+            board.pieces
+        o_turn : int
+            相手の手番
+        """
+        rank_index_array = np.arange(0, 81) % 9
+
+        # 相手から見て、奥から何段目か（ 0 から始まる）
+        if o_turn == cshogi.BLACK:
+            depth_array = rank_index_array
+            o_pawn = cshogi.BPAWN
+        else:
+            depth_array = 8 - rank_index_array
+            o_pawn = cshogi.WPAWN
+
+        # 相手の歩がある筋
+        is_nifu_array = np.repeat((np.array(pieces).reshape(9, 9) == o_pawn).any(axis=1), 9)
+
+        drop_allowed_array_list = []
+        for piece_type in ReplySetEngine._hand_piece_type_list:
+            if piece_type == cshogi.PAWN:
+                drop_allowed_array_list.append((0 < depth_array) & ~is_nifu_array)
+            elif piece_type == cshogi.LANCE:
+                drop_allowed_array_list.append(0 < depth_array)
+            elif piece_type == cshogi.KNIGHT:
+                drop_allowed_array_list.append(1 < depth_array)
+            else:
+                drop_allowed_array_list.append(depth_array == depth_array)
+
+        return drop_allowed_array_list
+
+
+    @staticmethod
+    def create_o_move16_array_and_f_position_array_by_generate(
+            board,
+            f_strict_move_id_list):
+        """着手ごとに、１手指して、相手の合法手を全部作って、１手戻して、応手の一覧を作ります（当初の方法）
+
+        Returns
+        -------
+        o_move16_array : numpy.ndarray
+            全ての着手の応手（ move16 ）を続けて並べた配列
+        o_f_position_array : numpy.ndarray
+            その応手が、着手のリストの何番目の着手のものか
+        """
+        o_strict_move_id_list = []
+        o_count_list = []
+
+        for f_strict_move_id in f_strict_move_id_list:
+            board.push(f_strict_move_id)
+            o_start = len(o_strict_move_id_list)
+            o_strict_move_id_list.extend(board.legal_moves)
+            o_count_list.append(len(o_strict_move_id_list) - o_start)
+            board.pop()
+
+        o_move16_array = np.fromiter(o_strict_move_id_list, dtype=np.int64, count=len(o_strict_move_id_list)) & 0xffff
+        o_f_position_array = np.repeat(np.arange(len(f_strict_move_id_list), dtype=np.int64), o_count_list)
+
+        return (o_move16_array, o_f_position_array)
+
+
+    @staticmethod
+    def create_o_move16_array_and_f_position_array(
+            board,
+            f_strict_move_id_list,
+            mode):
+        """全ての着手の応手の一覧を作ります
+
+        Parameters
+        ----------
+        board : Board
+            局面
+        f_strict_move_id_list : list<int>
+            着手のリスト。 cshogi の指し手の整数
+        mode : str
+            'generate', 'exact', 'approximate' のいずれか
+
+        Returns
+        -------
+        o_move16_array : numpy.ndarray
+            全ての着手の応手（ move16 ）を並べた配列。着手の順に並んでいるとは限らない
+        o_f_position_array : numpy.ndarray
+            その応手が、着手のリストの何番目の着手のものか
+        """
+        if mode not in ReplySetEngine.mode_list:
+            raise ValueError(f"[reply set engine > create o move16 array and f position array] unexpected mode:{mode}")
+
+        f_turn = board.turn
+        o_turn = cshogi.WHITE if f_turn == cshogi.BLACK else cshogi.BLACK
+        k_sq = board.king_square(f_turn)
+        l_sq = board.king_square(o_turn)
+
+        # 王手されていればパスできない。玉がいなければ、利きで確かめられない
+        if mode == 'generate' or board.is_check() or 81 <= k_sq or 81 <= l_sq:
+            return ReplySetEngine.create_o_move16_array_and_f_position_array_by_generate(
+                    board=board,
+                    f_strict_move_id_list=f_strict_move_id_list)
+
+        pieces = board.pieces
+        f_size = len(f_strict_move_id_list)
+
+        # 基本の応手。１手パスした局面の相手の合法手
+        board.push_pass()
+        base_strict_move_id_list = list(board.legal_moves)
+        board.pop_pass()
+
+        base_move16_array = np.fromiter(base_strict_move_id_list, dtype=np.int64, count=len(base_strict_move_id_list)) & 0xffff
+        base_src_array = (base_move16_array >> 7) & 0x7f
+        base_dst_array = base_move16_array & 0x7f
+        base_is_drop_array = 81 <= base_src_array
+
+        # 相手の飛び駒の指し手が通り抜けるマス［基本の応手］［マス］
+        base_board_src_array = np.where(base_is_drop_array, 0, base_src_array)
+        is_base_slider_move_array = ~base_is_drop_array & ReplySetEngine.get_slider_piece_type_array()[np.array(pieces)[base_board_src_array]]
+        passing_array = ReplySetEngine.get_between_array()[base_board_src_array, base_dst_array] & is_base_slider_move_array[:, np.newaxis]
+
+        # 打ち歩詰めになるかもしれない歩打ち。相手の歩が自玉に当たるマス
+        (k_file_index, k_rank_index) = ReplySetEngine.to_file_rank(k_sq)
+        uchifuzume_sq = ReplySetEngine.to_sq(k_file_index, k_rank_index + (1 if o_turn == cshogi.BLACK else -1))
+        uchifuzume_move16 = None if uchifuzume_sq is None else uchifuzume_sq | ((80 + cshogi.PAWN) << 7)
+
+        drop_allowed_array_list = ReplySetEngine.create_drop_allowed_array_list(
+                pieces=pieces,
+                o_turn=o_turn)
+        o_hand_list = board.pieces_in_hand[o_turn]
+
+        # 'exact' では、差分で求められる着手かを、１つずつ確かめる
+        if mode == 'exact':
+            # 相手の飛び駒の指し手の移動先。そこが空くと、その先へ伸びる
+            o_slider_dst_bits = 0
+            for dst_sq in set(base_dst_array[is_base_slider_move_array].tolist()):
+                o_slider_dst_bits |= 1 << dst_sq
+
+            (local_f_position_list,
+             generate_f_position_list) = ReplySetEngine.split_f_position_list_by_locality(
+                    board=board,
+                    pieces=pieces,
+                    f_strict_move_id_list=f_strict_move_id_list,
+                    o_slider_dst_bits=o_slider_dst_bits)
+
+            # 打ち歩詰めは、着手ごとに確かめるので、基本の応手からは除く
+            if uchifuzume_move16 is not None:
+                is_base_used_array = base_move16_array != uchifuzume_move16
+            else:
+                is_base_used_array = np.ones(len(base_strict_move_id_list), dtype=bool)
+
+        else:
+            local_f_position_list = list(range(0, f_size))
+            generate_f_position_list = []
+            is_base_used_array = np.ones(len(base_strict_move_id_list), dtype=bool)
+
+        o_move16_array_list = []
+        o_f_position_array_list = []
+
+        if 0 < len(local_f_position_list):
+            local_f_position_array = np.array(local_f_position_list, dtype=np.int64)
+            local_f_move16_array = np.array(f_strict_move_id_list, dtype=np.int64)[local_f_position_array] & 0xffff
+            local_f_src_array = (local_f_move16_array >> 7) & 0x7f
+            local_f_dst_array = local_f_move16_array & 0x7f
+            local_f_is_drop_array = 81 <= local_f_src_array
+
+            # 着手ごとに、基本の応手を使うか［着手］［基本の応手］。
+            # 移動先のマスへの打と、移動先のマスを通り抜ける飛び駒の指し手を除く
+            is_kept_array = (is_base_used_array[np.newaxis, :] &
+                    ~passing_array[:, local_f_dst_array].T &
+                    ~(base_is_drop_array[np.newaxis, :] & (base_dst_array[np.newaxis, :] == local_f_dst_array[:, np.newaxis])))
+
+            # 'approximate' では、取られた駒の指し手も除く
+            if mode == 'approximate':
+                is_kept_array &= base_src_array[np.newaxis, :] != local_f_dst_array[:, np.newaxis]
+
+            (kept_row_array, kept_column_array) = np.nonzero(is_kept_array)
+            o_move16_array_list.append(base_move16_array[kept_column_array])
+            o_f_position_array_list.append(local_f_position_array[kept_row_array])
+
+            # 移動元のマスが空くので、持ち駒を打てる
+            is_board_move_array = ~local_f_is_drop_array
+            vacated_sq_array = np.where(is_board_move_array, local_f_src_array, 0)
+
+            for (hand_index, piece_type) in enumerate(ReplySetEngine._hand_piece_type_list):
+                if o_hand_list[hand_index] < 1:
+                    continue
+
+                is_dropped_array = is_board_move_array & drop_allowed_array_list[hand_index][vacated_sq_array]
+
+                # 打ち歩詰めかもしれない歩打ちは、下で確かめる
+                if mode == 'exact' and piece_type == cshogi.PAWN and uchifuzume_sq is not None:
+                    is_dropped_array &= vacated_sq_array != uchifuzume_sq
+
+                o_move16_array_list.append(vacated_sq_array[is_dropped_array] | ((80 + piece_type) << 7))
+                o_f_position_array_list.append(local_f_position_array[is_dropped_array])
+
+            # 打ち歩詰めかもしれない歩打ちは、１手指して確かめる
+            if (mode == 'exact' and uchifuzume_sq is not None and 0 < o_hand_list[0] and
+                    drop_allowed_array_list[0][uchifuzume_sq]):
+                uchifuzume_f_position_list = []
+
+                for (f_position, f_src_sq, f_dst_sq, f_is_drop) in zip(local_f_position_list, local_f_src_array.tolist(), local_f_dst_array.tolist(), local_f_is_drop_array.tolist()):
+                    is_empty = (pieces[uchifuzume_sq] == 0 and f_dst_sq != uchifuzume_sq) or (not f_is_drop and f_src_sq == uchifuzume_sq)
+
+                    if not is_empty:
+                        continue
+
+                    board.push(f_strict_move_id_list[f_position])
+                    is_legal = board.is_legal(board.move_from_move16(uchifuzume_move16))
+                    board.pop()
+
+                    if is_legal:
+                        uchifuzume_f_position_list.append(f_position)
+
+                o_move16_array_list.append(np.full(len(uchifuzume_f_position_list), uchifuzume_move16, dtype=np.int64))
+                o_f_position_array_list.append(np.array(uchifuzume_f_position_list, dtype=np.int64))
+
+        # 差分で求められない着手は、１手指して合法手を作る
+        if 0 < len(generate_f_position_list):
+            (generated_o_move16_array,
+             generated_o_f_position_array) = ReplySetEngine.create_o_move16_array_and_f_position_array_by_generate(
+                    board=board,
+                    f_strict_move_id_list=[f_strict_move_id_list[f_position] for f_position in generate_f_position_list])
+
+            o_move16_array_list.append(generated_o_move16_array)
+            o_f_position_array_list.append(np.array(generate_f_position_list, dtype=np.int64)[generated_o_f_position_array])
+
+        if len(o_move16_array_list) < 1:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+        return (np.concatenate(o_move16_array_list).astype(np.int64),
+                np.concatenate(o_f_position_array_list).astype(np.int64))
+
+
+    @staticmethod
+    def split_f_position_list_by_locality(
+            board,
+            pieces,
+            f_strict_move_id_list,
+            o_slider_dst_bits):
+        """着手を、差分で応手を求められるもの（局所的なもの）と、１手指して合法手を作るものに分けます
+
+        次のどれかに当たる着手は、差分では求められないかもしれないので、１手指して合法手を作る（控えめに判定する）
+
+            - 駒を取る手、自玉の指し手
+            - 移動元か移動先が、敵玉から８方向に並ぶマスか、敵玉の隣のマス（王手、ピン）
+            - 動かした駒が、動かす前か後に、敵玉の隣のマスに利く（飛び駒なら、並んでいる）か、敵玉に利く
+            - 移動元が、敵玉の隣のマスと自分の飛び駒の間の、最初の駒（空くと利きが通る）
+            - 移動先が、敵玉の隣のマスと自分の飛び駒の間の、空いたマス（塞ぐと利きが止まる）
+            - 移動元に、相手の飛び駒が利いている（空くと、その先へ伸びる）
+
+        Parameters
+        ----------
+        board : Board
+            局面
+        pieces : list<int>
+            board.pieces
+        f_strict_move_id_list : list<int>
+            着手のリスト
+        o_slider_dst_bits : int
+            相手の飛び駒の指し手の移動先のビット集合
+
+        Returns
+        -------
+        local_f_position_list : list<int>
+            差分で求められる着手の、着手のリストでの位置
+        generate_f_position_list : list<int>
+            １手指して合法手を作る着手の、着手のリストでの位置
+        """
+        step_attack_bits_table = ReplySetEngine.get_step_attack_bits_table()
+        line_bits_list = ReplySetEngine.get_line_bits_list()
+
+        f_turn = board.turn
+        o_turn = cshogi.WHITE if f_turn == cshogi.BLACK else cshogi.BLACK
+        k_sq = board.king_square(f_turn)
+        l_sq = board.king_square(o_turn)
+        f_color_bit = 0 if f_turn == cshogi.BLACK else 16
+
+        # 敵玉が逃げられるかもしれない隣のマス（敵の駒があるマスには逃げられない）
+        l_neighbor_bits = 0
+        for sq in range(0, 81):
+            if step_attack_bits_table[o_turn][cshogi.KING][l_sq] & (1 << sq) and (pieces[sq] == 0 or (pieces[sq] & 0x10) == f_color_bit):
+                l_neighbor_bits |= 1 << sq
+
+        guard_bits = line_bits_list[l_sq] | l_neighbor_bits | (1 << l_sq)
+
+        # 敵玉の隣のマスから８方向に歩いて、自分の飛び駒の利きが通るかどうかを変えるマスを探す
+        open_bits = 0
+        block_bits = 0
+
+        for n_sq in range(0, 81):
+            if not (l_neighbor_bits & (1 << n_sq)):
+                continue
+
+            (n_file_index, n_rank_index) = ReplySetEngine.to_file_rank(n_sq)
+
+            for direction in ReplySetEngine._all_directions:
+                # 飛び駒から見ると、逆の向きに飛んで隣のマスに利く
+                reverse_direction = (-direction[0], -direction[1])
+                empty_bits = 0
+                first_sq = None
+                step = 1
+                sq = ReplySetEngine.to_sq(n_file_index + direction[0], n_rank_index + direction[1])
+
+                while sq is not None:
+                    if pieces[sq] == 0:
+                        if first_sq is None:
+                            empty_bits |= 1 << sq
+
+                    elif first_sq is None:
+                        first_sq = sq
+
+                        # 最初の駒が相手の駒なら、自分の指し手では退かせない
+                        if (pieces[sq] & 0x10) != f_color_bit:
+                            break
+
+                        # 最初の駒が自分の飛び駒なら、間の空いたマスを塞ぐと利きが止まる
+                        if ReplySetEngine.is_slider_for_direction(pieces[sq] & 0xf, reverse_direction, f_turn):
+                            block_bits |= empty_bits
+                            break
+
+                    else:
+                        # ２つ目の駒が自分の飛び駒なら、最初の駒が退くと利きが通る
+                        if (pieces[sq] & 0x10) == f_color_bit and ReplySetEngine.is_slider_for_direction(pieces[sq] & 0xf, reverse_direction, f_turn):
+                            open_bits |= 1 << first_sq
+                        break
+
+                    step += 1
+                    sq = ReplySetEngine.to_sq(n_file_index + direction[0] * step, n_rank_index + direction[1] * step)
+
+        slide_piece_type_set = ReplySetEngine._slide_directions_by_piece_type.keys()
+        f_step_attack_bits_list_list = step_attack_bits_table[f_turn]
+        l_attack_target_bits = l_neighbor_bits | (1 << l_sq)
+        src_guard_bits = guard_bits | open_bits | o_slider_dst_bits
+
+        local_f_position_list = []
+        generate_f_position_list = []
+
+        for (f_position, f_strict_move_id) in enumerate(f_strict_move_id_list):
+            dst_sq = f_strict_move_id & 0x7f
+            src_sq = (f_strict_move_id >> 7) & 0x7f
+
+            # 駒を取る手。移動先が、王手、ピン、敵玉の隣、塞ぐと利きが止まるマス
+            if pieces[dst_sq] != 0 or (guard_bits | block_bits) & (1 << dst_sq):
+                generate_f_position_list.append(f_position)
+                continue
+
+            if 81 <= src_sq:
+                # 打
+                after_piece_type = src_sq - 80
+
+            else:
+                # 自玉の指し手。移動元が、王手、ピン、敵玉の隣、空くと利きが通るマス、空くと相手の飛び駒が伸びるマス
+                if src_sq == k_sq or src_guard_bits & (1 << src_sq):
+                    generate_f_position_list.append(f_position)
+                    continue
+
+                before_piece_type = pieces[src_sq] & 0xf
+
+                # 動かす前の駒の利き
+                if (f_step_attack_bits_list_list[before_piece_type][src_sq] & l_neighbor_bits or
+                        (before_piece_type in slide_piece_type_set and line_bits_list[src_sq] & l_neighbor_bits)):
+                    generate_f_position_list.append(f_position)
+                    continue
+
+                after_piece_type = before_piece_type + 8 if (f_strict_move_id >> 14) & 1 else before_piece_type
+
+            # 動かした後の駒の利き
+            if (f_step_attack_bits_list_list[after_piece_type][dst_sq] & l_attack_target_bits or
+                    (after_piece_type in slide_piece_type_set and line_bits_list[dst_sq] & l_neighbor_bits)):
+                generate_f_position_list.append(f_position)
+                continue
+
+            local_f_position_list.append(f_position)
+
+        return (local_f_position_list, generate_f_position_list)
@@ -1,3 +1,6 @@
+import cshogi
+
+
 class SubUsi():
     """ＵＳＩプロトコルのサブルーチン"""
 
@@ -61,6 +64,47 @@ class SubUsi():
     _srcdrop_str_list = ['R*', 'B*', 'G*', 'S*', 'N*', 'L*', 'P*']
 
 
+    _move16_to_usi_dictionary = None
+    """以下のような辞書を get_move16_to_usi_dictionary() 関数の初回使用時に自動生成する。
+    move16 は、 cshogi の指し手の整数の下位16bit
+    {
+        128 : '1b1a',
+        ...
+        16512 : '1b1a+',
+        ...
+        10368 : 'P*1a',
+        ...
+    }
+    """
+
+
+    @classmethod
+    def get_move16_to_usi_dictionary(clazz):
+        """cshogi の指し手の整数の下位16bit（move16）から、ＵＳＩ形式の指し手符号へ変換する辞書を返します。
+        盤上の駒を動かす手（成らず、成り）と、打つ手の全ての組み合わせを含み、指せない手も含みます
+        """
+        if clazz._move16_to_usi_dictionary is None:
+            clazz._move16_to_usi_dictionary = {}
+
+            # 盤上の駒を動かす手。 move16 は、移動先マス、移動元マス << 7、成り << 14
+            for srcsq in range(0,81):
+                for dstsq in range(0,81):
+                    if srcsq == dstsq:
+                        continue
+
+                    for promotion in [0, 1]:
+                        move16 = dstsq | (srcsq << 7) | (promotion << 14)
+                        clazz._move16_to_usi_dictionary[move16] = cshogi.move_to_usi(move16)
+
+            # 打つ手。 cshogi では移動元が 80 + 駒の種類（歩 1 ～ 金 7）
+            for piece_type in range(cshogi.PAWN, cshogi.GOLD + 1):
+                for dstsq in range(0,81):
+                    move16 = dstsq | ((80 + piece_type) << 7)
+                    clazz._move16_to_usi_dictionary[move16] = cshogi.move_to_usi(move16)
+
+        return clazz._move16_to_usi_dictionary
+
+
     @classmethod
     def get_srcdrop_str_list(clazz):
         return clazz._srcdrop_str_list
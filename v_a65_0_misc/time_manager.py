@@ -0,0 +1,206 @@
+import cshogi
+import time
+
+
+class TimeManager():
+    """持ち時間の管理
+
+    go コマンドの引数（ btime, wtime, binc, winc, byoyomi, movetime, infinite 。 go mate の時間も）から、この１手に使う時間を決める。
+
+        - 目安の時間（ optimum ）… 反復深化で、次の深さを始めるかどうかを決める。残り時間を、残りの手数の見込みで割り、加算と秒読みを足す
+        - 上限の時間（ maximum ）… 探索を打ち切る。持ち時間と秒読みを全部使っても、通信の遅れの分（ margin ）は残す
+
+    時間の指定が無い go では、 thinking_milliseconds_without_time_control だけ考える。
+    go ponder では、 ponderhit が来るまで時間の制限は無く、 ponderhit から時間を測り始める
+    """
+
+
+    def __init__(
+            self,
+            turn,
+            cmd_tail,
+            margin_milliseconds,
+            expected_number_of_remaining_moves,
+            thinking_milliseconds_without_time_control):
+        """初期化。ここから時間を測り始める
+
+        Parameters
+        ----------
+        turn : int
+            自分の手番
+        cmd_tail : str
+            go コマンドの引数。例： 'btime 60000 wtime 50000 byoyomi 10000' 、 'mate 5000'
+        margin_milliseconds : int
+            通信の遅れなどに備えて、使わずに残しておくミリ秒
+        expected_number_of_remaining_moves : int
+            自分があと何手指すと見込むか。残り時間をこれで割って、１手の目安にする
+        thinking_milliseconds_without_time_control : int
+            時間の指定が無い go で考えるミリ秒
+        """
+        self._start_seconds = time.perf_counter()
+
+        self._argument_dictionary = TimeManager.parse_go_arguments(cmd_tail)
+
+        if turn == cshogi.BLACK:
+            my_time_milliseconds = self._argument_dictionary.get('btime', 0)
+            increment_milliseconds = self._argument_dictionary.get('binc', 0)
+        else:
+            my_time_milliseconds = self._argument_dictionary.get('wtime', 0)
+            increment_milliseconds = self._argument_dictionary.get('winc', 0)
+
+        byoyomi_milliseconds = self._argument_dictionary.get('byoyomi', 0)
+
+        # 時間の制限が無い
+        self._is_infinite = 'infinite' in self._argument_dictionary
+
+        # 相手の手番で先読みしている。 ponderhit が来たら、自分の手番として時間を測り始める
+        self._is_pondering = 'ponder' in self._argument_dictionary
+
+        if self._is_infinite:
+            optimum_milliseconds = None
+            maximum_milliseconds = None
+
+        # １手に使う時間が決まっている
+        elif 'movetime' in self._argument_dictionary:
+            optimum_milliseconds = max(0, self._argument_dictionary['movetime'] - margin_milliseconds)
+            maximum_milliseconds = optimum_milliseconds
+
+        # 詰将棋を解く時間が決まっている（ go mate infinite は、時間の制限が無い）
+        elif 'mate' in self._argument_dictionary:
+            if self._argument_dictionary['mate'] is True:
+                optimum_milliseconds = None
+                maximum_milliseconds = None
+            else:
+                optimum_milliseconds = max(0, self._argument_dictionary['mate'] - margin_milliseconds)
+                maximum_milliseconds = optimum_milliseconds
+
+        # 時間の指定が無い
+        elif not any(name in self._argument_dictionary for name in ['btime', 'wtime', 'binc', 'winc', 'byoyomi']):
+            optimum_milliseconds = thinking_milliseconds_without_time_control
+            maximum_milliseconds = thinking_milliseconds_without_time_control
+
+        else:
+            # 加算は指した後にもらえるので、今使えるのは持ち時間と秒読みだけ
+            usable_milliseconds = max(0, my_time_milliseconds + byoyomi_milliseconds - margin_milliseconds)
+
+            optimum_milliseconds = min(
+                    usable_milliseconds,
+                    my_time_milliseconds // max(1, expected_number_of_remaining_moves) + increment_milliseconds + byoyomi_milliseconds)
+
+            # 目安を超えても、読み終わりそうなら待つ。ただし持ち時間の残りを使い切らないように
+            maximum_milliseconds = min(
+                    usable_milliseconds,
+                    max(optimum_milliseconds * 3, byoyomi_milliseconds + increment_milliseconds - margin_milliseconds))
+
+        self._optimum_seconds = None if optimum_milliseconds is None else optimum_milliseconds / 1000
+        self._maximum_seconds = None if maximum_milliseconds is None else maximum_milliseconds / 1000
+
+
+    @staticmethod
+    def parse_go_arguments(cmd_tail):
+        """go コマンドの引数を辞書にします。数の引数は int 、 infinite などの数の無い引数は True
+
+        Parameters
+        ----------
+        cmd_tail : str
+            go コマンドの引数
+
+        Returns
+        -------
+        argument_dictionary : dict
+            例： {'btime': 60000, 'wtime': 50000, 'byoyomi': 10000}
+        """
+        argument_dictionary = {}
+        token_list = cmd_tail.split()
+        i = 0
+
+        while i < len(token_list):
+            name = token_list[i]
+
+            if i + 1 < len(token_list) and token_list[i + 1].lstrip('-').isdigit():
+                argument_dictionary[name] = int(token_list[i + 1])
+                i += 2
+            else:
+                argument_dictionary[name] = True
+                i += 1
+
+        return argument_dictionary
+
+
+    @property
+    def argument_dictionary(self):
+        """go コマンドの引数の辞書"""
+        return self._argument_dictionary
+
+
+    @property
+    def is_infinite(self):
+        """時間の制限が無いか？"""
+        return self._is_infinite
+
+
+    @property
+    def is_pondering(self):
+        """先読み中（ ponderhit を待っている）か？"""
+        return self._is_pondering
+
+
+    @property
+    def optimum_seconds(self):
+        """この１手に使う目安の秒。制限が無ければ（先読み中も） None"""
+        if self._is_pondering:
+            return None
+
+        return self._optimum_seconds
+
+
+    @property
+    def maximum_seconds(self):
+        """この１手に使う上限の秒。制限が無ければ（先読み中も） None"""
+        if self._is_pondering:
+            return None
+
+        return self._maximum_seconds
+
+
+    def ponderhit(self):
+        """先読みしていた手を相手が指したので、ここから時間を測り始めます"""
+        self._start_seconds = time.perf_counter()
+        self._is_pondering = False
+
+
+    def get_elapsed_seconds(self):
+        """考え始めてからの秒"""
+        return time.perf_counter() - self._start_seconds
+
+
+    def is_time_up(self):
+        """上限の時間を過ぎたか？"""
+        maximum_seconds = self.maximum_seconds
+        return maximum_seconds is not None and maximum_seconds <= self.get_elapsed_seconds()
+
+
+    def can_start_next_iteration(
+            self,
+            last_iteration_seconds,
+            branching_factor=3.0):
+        """反復深化で、次の深さを始めてよいか？　次の深さは、今の深さの branching_factor 倍かかると見込む
+
+        Parameters
+        ----------
+        last_iteration_seconds : float
+            今の深さにかかった秒
+        branching_factor : float
+            深さを１つ増やすと、何倍の時間がかかると見込むか
+        """
+        optimum_seconds = self.optimum_seconds
+        if optimum_seconds is None:
+            return True
+
+        elapsed_seconds = self.get_elapsed_seconds()
+
+        # 目安を過ぎていれば始めない。目安の中に終わりそうになくても、上限の中に終わりそうなら始める
+        if optimum_seconds <= elapsed_seconds:
+            return False
+
+        return elapsed_seconds + last_iteration_seconds * branching_factor <= self.maximum_seconds
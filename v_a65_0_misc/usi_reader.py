@@ -0,0 +1,111 @@
+import queue
+import threading
+
+
+class UsiCommandReader():
+    """ＵＳＩコマンドの読取り
+
+    標準入力は専用のスレッドで読み続け、読んだコマンドを待ち行列に入れる。ＵＳＩループは待ち行列から１つずつ取り出して行う。
+    ＵＳＩループが時間のかかるコマンド（ playout など）を行っている間も、
+
+        - stop 、 quit … 読んだらすぐに、きふわらべに中断を知らせる（ Kifuwarabe.cancel ）。時間のかかるコマンドは中断を見て、すぐに戻る
+        - isready … 時間のかかるコマンドを行っている間なら、このスレッドが readyok を返す
+
+    コマンドには読んだ順に通し番号を付ける。中断は、 stop より前に読んだコマンドだけに効く
+    """
+
+
+    long_command_set = {'playout', 'selfmatch', 'weaken', 'strengthen'}
+    """時間がかかり、行っている間も isready に答えるコマンド"""
+
+    interrupt_command_set = {'stop', 'quit'}
+    """読んだらすぐに、中断を知らせるコマンド"""
+
+
+    def __init__(
+            self,
+            kifuwarabe,
+            input_function=input):
+        """初期化
+
+        Parameters
+        ----------
+        kifuwarabe : Kifuwarabe
+            きふわらべ
+        input_function : function
+            １行読む関数。テストでは差し替える
+        """
+        self._kifuwarabe = kifuwarabe
+        self._input_function = input_function
+
+        # 読んだコマンド（通し番号, コマンド）の待ち行列
+        self._command_queue = queue.Queue()
+
+        self._serial_number = 0
+
+        # ＵＳＩループが行っているコマンドの名前。行っていなければ None
+        self._running_command_head = None
+
+        self._thread = None
+
+
+    @property
+    def is_running_long_command(self):
+        """ＵＳＩループが、時間のかかるコマンドを行っているか？"""
+        return self._running_command_head in UsiCommandReader.long_command_set
+
+
+    def start(self):
+        """標準入力を読むスレッドを始めます"""
+        self._thread = threading.Thread(
+                target=self.read_loop,
+                daemon=True)
+        self._thread.start()
+
+
+    def read_loop(self):
+        """標準入力を読み続けます。 quit を読むか、入力が終われば止まる"""
+        while True:
+            try:
+                command_str = self._input_function()
+
+            # 入力が閉じられたら、終わる
+            except EOFError:
+                command_str = 'quit'
+
+            self._serial_number += 1
+            head = command_str.split(' ', 1)[0]
+
+            if head in UsiCommandReader.interrupt_command_set:
+                self._kifuwarabe.cancel(
+                        serial_number=self._serial_number)
+
+            # 時間のかかるコマンドを行っている間は、ここで答える
+            elif head == 'isready' and self.is_running_long_command:
+                print('readyok', flush=True)
+                continue
+
+            self._command_queue.put((self._serial_number, command_str))
+
+            if head == 'quit':
+                break
+
+
+    def get(self):
+        """次のコマンドを取り出します。無ければ読むまで待つ
+
+        Returns
+        -------
+        serial_number : int
+            通し番号
+        command_str : str
+            コマンド
+        """
+        (serial_number, command_str) = self._command_queue.get()
+        self._running_command_head = command_str.split(' ', 1)[0]
+        return (serial_number, command_str)
+
+
+    def done(self):
+        """取り出したコマンドを行い終わったことを知らせます"""
+        self._running_command_head = None
@@ -0,0 +1,4 @@
+rem 評価値テーブル・サーバーを開始。将棋エンジン、学習部より先に起動しておく
+rem set PATH=%%PATH%%;C:\Users\muzud\anaconda3
+
+python v_a65_0_main_table_server.py
@@ -1,15 +1,40 @@
+import contextlib
 import cshogi
 import datetime
+import io
+import numpy as np
+import os
+import random
+import tempfile
+import time
 
 # python v_a65_0_test.py
+from     v_a65_0 import Kifuwarabe
 from     v_a65_0_eval.k import EvaluationKMove
+from     v_a65_0_eval.edit_log import EvaluationEditLog
+from     v_a65_0_eval.facade import EvaluationFacade
 from     v_a65_0_eval.kk import EvaluationKkTable
+from     v_a65_0_eval.kp import EvaluationKpTable
+from     v_a65_0_eval.lib import EvaluationLib
+from     v_a65_0_eval.move_index_file import EvaluationMoveIndexFile
 from     v_a65_0_eval.p import EvaluationPMove
+from     v_a65_0_eval.procedural_table import EvaluationProceduralTable
 from     v_a65_0_eval.pk import EvaluationPkTable
+from     v_a65_0_eval.pp import EvaluationPpTable
+from     v_a65_0_eval.shared_table import EvaluationSharedTable
+from     v_a65_0_eval.table_array import EvaluationTableArray
+from     v_a65_0_eval.table_header import EvaluationTableHeader
+from     v_a65_0_learn.config_document import LearnConfigDocument
+from     v_a65_0_misc.alpha_beta_search import AlphaBetaSearch
 from     v_a65_0_misc.bit_ope import BitOpe
+from     v_a65_0_misc.choice_best_move import ChoiceBestMove
 from     v_a65_0_misc.debug import DebugHelper
-from     v_a65_0_misc.lib import Turn, Move
+from     v_a65_0_misc.lib import FileName, Turn, Move, MoveHelper, BoardHelper, EvalutionMmTable
+from     v_a65_0_misc.mate_solver import MateSolver
+from     v_a65_0_misc.policy_cache import PolicyCache
+from     v_a65_0_misc.reply_set import ReplySetEngine
 from     v_a65_0_misc.sub_usi import SubUsi
+from     v_a65_0_misc.time_manager import TimeManager
 
 
 def test_k():
@@ -425,6 +450,1457 @@ def test_lib():
         raise ValueError(f'unexpected error. move_obj.promoted expected:True  actual:`{move_obj.promoted}`')
 
 
+def test_mm_table():
+    # ２バイト、つまり１６関係のテーブル
+    mm_table_obj = EvalutionMmTable(
+            file_name_obj=FileName(
+                    file_stem='test_mm_table',
+                    file_extension='.bin'),
+            table_as_array=bytes([0b1000_0000, 0b0000_0001]),
+            is_file_modified=False)
+
+    # ビッグエンディアン。０番目のビットは、０バイト目の左端
+    for (index, expected) in [(0, 1), (1, 0), (7, 0), (8, 0), (15, 1)]:
+        actual = mm_table_obj.get_bit_by_index(index)
+        if expected != actual:
+            raise ValueError(f"[test mm table] get. index:{index}  expected:{expected}  actual:{actual}")
+
+    # 同じ値を設定しても、変更にはならない
+    (is_changed, _result_comment) = mm_table_obj.set_bit_by_index(0, 1)
+    if is_changed or mm_table_obj.is_file_modified:
+        raise ValueError(f"[test mm table] set same bit. is_changed:{is_changed}  is_file_modified:{mm_table_obj.is_file_modified}")
+
+    (is_changed, _result_comment) = mm_table_obj.set_bit_by_index(9, 1)
+    (is_changed, _result_comment) = mm_table_obj.set_bit_by_index(0, 0)
+    if not is_changed or not mm_table_obj.is_file_modified:
+        raise ValueError(f"[test mm table] set bit. is_changed:{is_changed}  is_file_modified:{mm_table_obj.is_file_modified}")
+
+    # ファイルに書き出すときと同じ並び
+    expected = bytearray([0b0000_0000, 0b0100_0001])
+    if expected != mm_table_obj.table_as_array:
+        raise ValueError(f"[test mm table] table. expected:{expected}  actual:{mm_table_obj.table_as_array}")
+
+    # メモリーマップ
+    file_name_obj = FileName(
+            file_stem=os.path.join(tempfile.gettempdir(), 'test_mm_table'),
+            file_extension='.bin')
+
+    # ヘッダーの無い旧形式のファイル
+    with open(file_name_obj.base_name, 'wb') as f:
+        f.write(expected)
+
+    header_obj = EvaluationTableHeader(
+            kind='kk',
+            turn=cshogi.BLACK,
+            a_move_size=2,
+            b_move_size=8)
+
+    for (table_mode, expected_is_changed) in [('mmap_read', False), ('mmap_copy', True)]:
+        mm_table_obj = EvalutionMmTable(
+                file_name_obj=file_name_obj,
+                table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(
+                        file_name_obj=file_name_obj,
+                        header_obj=header_obj,
+                        table_mode=table_mode),
+                is_file_modified=False)
+
+        if mm_table_obj.get_bit_by_index(9) != 1:
+            raise ValueError(f"[test mm table] {table_mode} get. actual:{mm_table_obj.get_bit_by_index(9)}")
+
+        # 読取専用なら書込は拒否される
+        (is_changed, result_comment) = mm_table_obj.set_bit_by_index(9, 0)
+        if is_changed != expected_is_changed:
+            raise ValueError(f"[test mm table] {table_mode} set. expected:{expected_is_changed}  actual:{is_changed}  comment:{result_comment}")
+
+        mm_table_obj.close()
+
+        # どちらのモードでも、ファイルは変わらない
+        with open(file_name_obj.base_name, 'rb') as f:
+            if f.read() != expected:
+                raise ValueError(f"[test mm table] {table_mode} file changed")
+
+    os.remove(file_name_obj.base_name)
+
+
+def test_journal():
+    page_size = EvalutionMmTable.dirty_page_size
+    file_name_obj = FileName(
+            file_stem=os.path.join(tempfile.gettempdir(), 'test_journal'),
+            file_extension='.bin')
+
+    # ５ページ分のファイル。変更が半分に満たなければ、変更したページだけ上書きする
+    header_obj = EvaluationTableHeader(
+            kind='pp',
+            turn=cshogi.BLACK,
+            a_move_size=page_size * 5,
+            b_move_size=8)
+    EvaluationLib.save_evaluation_table_file(
+            file_name_obj=file_name_obj,
+            table_as_array=bytes(page_size * 5),
+            header_obj=header_obj)
+
+    mm_table_obj = EvalutionMmTable(
+            file_name_obj=file_name_obj,
+            table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj),
+            is_file_modified=False,
+            header_obj=header_obj)
+
+    # ０ページ目と２ページ目を変更
+    mm_table_obj.set_bit_by_index(3, 1)
+    mm_table_obj.set_bit_by_index(page_size * 2 * 8 + 5, 1)
+    if mm_table_obj.dirty_page_set != {0, 2}:
+        raise ValueError(f"[test journal] dirty page set. actual:{mm_table_obj.dirty_page_set}")
+
+    # 他のプロセスが読取専用でマップしているファイル
+    reader_mm_table_obj = EvalutionMmTable(
+            file_name_obj=file_name_obj,
+            table_as_array=EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, table_mode='mmap_read'),
+            is_file_modified=False,
+            header_obj=header_obj)
+    reader_version = reader_mm_table_obj.version
+    file_inode = os.stat(file_name_obj.base_name).st_ino
+
+    # 変更したページだけ上書き
+    EvaluationLib.save_mm_table(mm_table_obj)
+
+    # ファイルは置き換えずに、直に上書きする
+    if os.stat(file_name_obj.base_name).st_ino != file_inode:
+        raise ValueError(f"[test journal] file replaced instead of patched")
+
+    # マップしている側からは、新しい中身と、変わった版が見える
+    if reader_mm_table_obj.table_as_array != mm_table_obj.table_as_array or reader_mm_table_obj.version == reader_version:
+        raise ValueError(f"[test journal] mapped reader not see patch. version before:{reader_version}  after:{reader_mm_table_obj.version}")
+
+    reader_mm_table_obj.close()
+
+    with open(file_name_obj.base_name, 'rb') as f:
+        if f.read()[EvaluationTableHeader.header_size:] != mm_table_obj.table_as_array:
+            raise ValueError(f"[test journal] patched file not match")
+
+    if (os.path.isfile(file_name_obj.journal_base_name) or os.path.isfile(file_name_obj.lock_base_name) or os.path.isfile(file_name_obj.temporary_base_name)
+            or mm_table_obj.is_file_modified or 0 < len(mm_table_obj.dirty_page_set)):
+        raise ValueError(f"[test journal] not cleaned up after save")
+
+    # ジャーナルを書き終えたところで止まったなら、ファイルを書き換えるプロセスの次の読込で反映する
+    mm_table_obj.set_bit_by_index(page_size * 8 + 1, 1)
+    journal_binary = EvaluationLib.build_journal(
+            table_as_array=mm_table_obj.table_as_array,
+            header_obj=header_obj,
+            dirty_page_set=mm_table_obj.dirty_page_set,
+            page_size=page_size)
+
+    with open(file_name_obj.journal_base_name, 'wb') as f:
+        f.write(journal_binary)
+
+    # 本体のページだけ上書きして、ヘッダーを書く前に止まった
+    with open(file_name_obj.base_name, 'r+b') as f:
+        f.seek(EvaluationTableHeader.header_size + page_size)
+        f.write(mm_table_obj.table_as_array[page_size:page_size * 2])
+
+    # 読むだけのプロセスは、ファイルは変えず、読んだ中身にジャーナルを当てる
+    with open(file_name_obj.base_name, 'rb') as f:
+        torn_file_binary = f.read()
+
+    if (EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, table_mode='mmap_read') != mm_table_obj.table_as_array
+            or not os.path.isfile(file_name_obj.journal_base_name)):
+        raise ValueError(f"[test journal] reader not apply journal in memory")
+
+    with open(file_name_obj.base_name, 'rb') as f:
+        if f.read() != torn_file_binary:
+            raise ValueError(f"[test journal] reader changed file")
+
+    if EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, is_journal_recovery=True) != mm_table_obj.table_as_array:
+        raise ValueError(f"[test journal] recovered file not match")
+
+    if os.path.isfile(file_name_obj.journal_base_name) or os.path.isfile(file_name_obj.lock_base_name):
+        raise ValueError(f"[test journal] not cleaned up after recovery")
+
+    # ジャーナルを書いている途中で止まったなら、ファイルは変えない
+    expected = mm_table_obj.table_as_array[:]
+    mm_table_obj.set_bit_by_index(7, 1)
+    journal_binary = EvaluationLib.build_journal(
+            table_as_array=mm_table_obj.table_as_array,
+            header_obj=header_obj,
+            dirty_page_set=mm_table_obj.dirty_page_set,
+            page_size=page_size)
+
+    with open(file_name_obj.journal_base_name, 'wb') as f:
+        f.write(journal_binary[:-1])
+
+    if EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, is_journal_recovery=True) != expected:
+        raise ValueError(f"[test journal] torn journal changed file")
+
+    if os.path.isfile(file_name_obj.journal_base_name):
+        raise ValueError(f"[test journal] torn journal not removed")
+
+    os.remove(file_name_obj.base_name)
+
+
+def test_table_header():
+    file_name_obj = FileName(
+            file_stem=os.path.join(tempfile.gettempdir(), 'test_table_header'),
+            file_extension='.bin')
+
+    header_obj = EvaluationTableHeader(
+            kind='kp',
+            turn=cshogi.WHITE,
+            a_move_size=3,
+            b_move_size=7)
+    table_as_array = bytearray([0b1010_1010, 0b0101_0101, 0b1110_0000])
+
+    EvaluationLib.save_evaluation_table_file(
+            file_name_obj=file_name_obj,
+            table_as_array=table_as_array,
+            header_obj=header_obj)
+
+    # ヘッダーを読み返せる
+    with open(file_name_obj.base_name, 'rb') as f:
+        actual_header_obj = EvaluationTableHeader.from_binary(f.read(EvaluationTableHeader.header_size))
+
+    expected = ('kp', cshogi.WHITE, 3, 7, 'raw', 3, EvaluationTableHeader.compute_crc32(table_as_array))
+    actual = (actual_header_obj.kind, actual_header_obj.turn, actual_header_obj.a_move_size, actual_header_obj.b_move_size, actual_header_obj.codec, actual_header_obj.body_size, actual_header_obj.body_crc32)
+    if expected != actual:
+        raise ValueError(f"[test table header] header. expected:{expected}  actual:{actual}")
+
+    for table_mode in ['memory', 'mmap_read']:
+        actual = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, table_mode=table_mode)
+        if actual != table_as_array:
+            raise ValueError(f"[test table header] {table_mode} read. actual:{bytes(actual)}")
+
+        if table_mode != 'memory':
+            EvalutionMmTable._close_mapped_table(actual)
+
+    # 別の評価値テーブルのファイルは読まない
+    for other_header_obj in [
+            EvaluationTableHeader(kind='pk', turn=cshogi.WHITE, a_move_size=3, b_move_size=7),
+            EvaluationTableHeader(kind='kp', turn=cshogi.BLACK, a_move_size=3, b_move_size=7),
+            EvaluationTableHeader(kind='kp', turn=cshogi.WHITE, a_move_size=7, b_move_size=3)]:
+        try:
+            EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, other_header_obj)
+        except ValueError:
+            pass
+        else:
+            raise ValueError(f"[test table header] other table read. kind:{other_header_obj.kind}  turn:{other_header_obj.turn}")
+
+    # 本体が壊れていれば読まない
+    with open(file_name_obj.base_name, 'r+b') as f:
+        f.seek(EvaluationTableHeader.header_size + 1)
+        f.write(b'\xff')
+
+    for table_mode in ['memory', 'mmap_read']:
+        try:
+            EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, table_mode=table_mode)
+        except ValueError:
+            pass
+        else:
+            raise ValueError(f"[test table header] {table_mode} broken body read")
+
+    # ヘッダーの無い旧形式のファイルは、大きさが合えば読む
+    with open(file_name_obj.base_name, 'wb') as f:
+        f.write(table_as_array)
+
+    actual = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+    if actual != table_as_array:
+        raise ValueError(f"[test table header] legacy read. actual:{bytes(actual)}")
+
+    with open(file_name_obj.base_name, 'wb') as f:
+        f.write(table_as_array + b'\x00')
+
+    try:
+        EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+    except ValueError:
+        pass
+    else:
+        raise ValueError(f"[test table header] legacy wrong size read")
+
+    os.remove(file_name_obj.base_name)
+
+
+def test_table_codec():
+    file_name_obj = FileName(
+            file_stem=os.path.join(tempfile.gettempdir(), 'test_table_codec'),
+            file_extension='.bin')
+
+    # 疎なテーブル
+    table_as_array = bytearray(4096)
+    table_as_array[5] = 0b0010_0000
+    table_as_array[4000] = 0b0000_0011
+
+    for codec in ['zlib', 'lzma']:
+        EvaluationLib.save_evaluation_table_file(
+                file_name_obj=file_name_obj,
+                table_as_array=table_as_array,
+                header_obj=EvaluationTableHeader(kind='pp', turn=cshogi.BLACK, a_move_size=4096, b_move_size=8, codec=codec))
+
+        if EvaluationTableHeader.header_size + len(table_as_array) <= os.path.getsize(file_name_obj.base_name):
+            raise ValueError(f"[test table codec] {codec} not compressed. file size:{os.path.getsize(file_name_obj.base_name)}")
+
+        # 読込では、符号化はファイルのヘッダーに従う。メモリーマップはできないので、メモリーへ展開する
+        for table_mode in ['memory', 'mmap_read']:
+            header_obj = EvaluationTableHeader(kind='pp', turn=cshogi.BLACK, a_move_size=4096, b_move_size=8)
+            actual = EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj, table_mode=table_mode)
+
+            if actual != table_as_array or not isinstance(actual, bytearray):
+                raise ValueError(f"[test table codec] {codec} {table_mode} read not match")
+
+            if header_obj.codec != codec:
+                raise ValueError(f"[test table codec] {codec} {table_mode} header codec. actual:{header_obj.codec}")
+
+        # 保存しても符号化は変わらない。変更したページだけの上書きはせず、ファイル全体を置き換える
+        mm_table_obj = EvalutionMmTable(
+                file_name_obj=file_name_obj,
+                table_as_array=actual,
+                is_file_modified=False,
+                header_obj=header_obj)
+        mm_table_obj.set_bit_by_index(0, 1)
+        EvaluationLib.save_mm_table(mm_table_obj)
+
+        with open(file_name_obj.base_name, 'rb') as f:
+            saved_header_obj = EvaluationTableHeader.from_binary(f.read(EvaluationTableHeader.header_size))
+
+        if saved_header_obj.codec != codec or os.path.isfile(file_name_obj.journal_base_name):
+            raise ValueError(f"[test table codec] {codec} save. codec:{saved_header_obj.codec}")
+
+        if EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj) != mm_table_obj.table_as_array:
+            raise ValueError(f"[test table codec] {codec} saved table not match")
+
+        # 圧縮した本体が壊れていれば読まない
+        with open(file_name_obj.base_name, 'r+b') as f:
+            f.seek(EvaluationTableHeader.header_size + 10)
+            one_byte = f.read(1)
+            f.seek(EvaluationTableHeader.header_size + 10)
+            f.write(bytes([one_byte[0] ^ 0xff]))
+
+        try:
+            EvaluationLib.read_evaluation_table_as_array_from_file(file_name_obj, header_obj)
+        except ValueError:
+            pass
+        else:
+            raise ValueError(f"[test table codec] {codec} broken body read")
+
+    # 符号化を変えて保存し直す
+    header_obj = EvaluationTableHeader(kind='pp', turn=cshogi.BLACK, a_move_size=4096, b_move_size=8, codec='lzma')
+    EvaluationLib.save_evaluation_table_file(file_name_obj, table_as_array, header_obj)
+
+    old_codec = EvaluationLib.convert_evaluation_table_file(file_name_obj, header_obj, codec='raw')
+    if old_codec != 'lzma' or os.path.getsize(file_name_obj.base_name) != EvaluationTableHeader.header_size + len(table_as_array):
+        raise ValueError(f"[test table codec] convert. old codec:{old_codec}  file size:{os.path.getsize(file_name_obj.base_name)}")
+
+    os.remove(file_name_obj.base_name)
+
+
+def test_table_reload():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        # 学習部が保存したファイルを、エンジンが読み込む
+        learner_table_obj = EvaluationKkTable(
+                engine_version_str='test',
+                table_mode='memory')
+        learner_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+        learner_table_obj.save_evaluation_table_file()
+
+        engine_table_obj = EvaluationKkTable(
+                engine_version_str='test',
+                table_mode='mmap_read')
+        engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+        first_mm_table_obj = engine_table_obj.mm_table_obj
+
+        # ファイルが変わっていなければ読み直さない
+        engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK, is_background=True)
+        if engine_table_obj.mm_table_obj is not first_mm_table_obj or engine_table_obj.swap_reloaded_table(is_wait=True):
+            raise ValueError(f"[test table reload] reloaded though not changed")
+
+        # 学習部がファイルを変えたら、別スレッドで読み直す。差し替えるまでは前の評価値テーブルを使う
+        bit = learner_table_obj.mm_table_obj.get_bit_by_index(3)
+        learner_table_obj.mm_table_obj.set_bit_by_index(3, 1 - bit)
+        learner_table_obj.save_evaluation_table_file()
+
+        engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK, is_background=True)
+        if engine_table_obj.mm_table_obj is not first_mm_table_obj:
+            raise ValueError(f"[test table reload] swapped before swap_reloaded_table()")
+
+        if not engine_table_obj.swap_reloaded_table(is_wait=True) or engine_table_obj.mm_table_obj.get_bit_by_index(3) != 1 - bit:
+            raise ValueError(f"[test table reload] not reloaded")
+
+        engine_table_obj.mm_table_obj.close()
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_shared_table():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    # 他の共有メモリーとぶつからない名前にする
+    engine_version_str = f'test{os.getpid()}'
+
+    try:
+        # サーバーが動いていなければ、ファイルを読む
+        engine_table_obj = EvaluationKkTable(
+                engine_version_str=engine_version_str,
+                table_mode='shared_read')
+        engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+        if engine_table_obj.mm_table_obj.is_shared:
+            raise ValueError(f"[test shared table] shared without server")
+
+        engine_table_obj.mm_table_obj.close()
+
+        # サーバー
+        server_table_obj = EvaluationKkTable(
+                engine_version_str=engine_version_str,
+                table_mode='memory')
+        server_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+        server_shared_table_obj = EvaluationSharedTable.create(
+                engine_version_str=engine_version_str,
+                header_obj=server_table_obj.mm_table_obj.header_obj,
+                table_as_array=server_table_obj.mm_table_obj.table_as_array)
+
+        try:
+            # 将棋エンジンと学習部がつなぐ
+            engine_table_obj = EvaluationKkTable(
+                    engine_version_str=engine_version_str,
+                    table_mode='shared_read')
+            engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+
+            learner_table_obj = EvaluationKkTable(
+                    engine_version_str=engine_version_str,
+                    table_mode='shared_write')
+            learner_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+
+            if not engine_table_obj.mm_table_obj.is_shared or not learner_table_obj.mm_table_obj.is_shared:
+                raise ValueError(f"[test shared table] not shared")
+
+            # 将棋エンジンは読取専用
+            (is_changed, result_comment) = engine_table_obj.mm_table_obj.set_bit_by_index(3, 0)
+            if is_changed:
+                raise ValueError(f"[test shared table] read only table changed")
+
+            # 学習部の変更は、読み直さなくても将棋エンジンに見え、世代番号が増える
+            generation = engine_table_obj.mm_table_obj.generation
+            bit = learner_table_obj.mm_table_obj.get_bit_by_index(3)
+            learner_table_obj.mm_table_obj.set_bit_by_index(3, 1 - bit)
+
+            if engine_table_obj.mm_table_obj.get_bit_by_index(3) != 1 - bit:
+                raise ValueError(f"[test shared table] change not visible")
+
+            if engine_table_obj.mm_table_obj.generation != generation + 1:
+                raise ValueError(f"[test shared table] generation. expected:{generation + 1}  actual:{engine_table_obj.mm_table_obj.generation}")
+
+            # 学習部の保存は、ファイルへ書く
+            learner_table_obj.save_evaluation_table_file()
+            actual = EvaluationLib.read_evaluation_table_as_array_from_file(
+                    file_name_obj=learner_table_obj.mm_table_obj.file_name_obj,
+                    header_obj=EvaluationTableHeader(
+                            kind='kk',
+                            turn=cshogi.BLACK,
+                            a_move_size=EvaluationKMove.get_serial_number_size(),
+                            b_move_size=EvaluationKMove.get_serial_number_size()))
+            if actual != bytes(server_shared_table_obj.table_as_array):
+                raise ValueError(f"[test shared table] saved file differs from shared memory")
+
+            # 共有メモリーは、次の対局でも読み直さない
+            mm_table_obj = engine_table_obj.mm_table_obj
+            engine_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+            if engine_table_obj.mm_table_obj is not mm_table_obj:
+                raise ValueError(f"[test shared table] reloaded shared table")
+
+            engine_table_obj.mm_table_obj.close()
+            learner_table_obj.mm_table_obj.close()
+
+        finally:
+            server_shared_table_obj.unlink()
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_table_array():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        table_obj_array = EvaluationTableArray(
+                table_obj_list=[
+                    EvaluationKkTable(
+                            engine_version_str='test',
+                            table_mode='memory'),
+                    EvaluationKkTable(
+                            engine_version_str='test',
+                            table_mode='memory'),
+                ],
+                is_lazy_loading=True)
+
+        if table_obj_array.is_loaded(0) or table_obj_array.is_loaded(1):
+            raise ValueError(f"[test table array] loaded before access")
+
+        # 取り出した手番だけを読み込む
+        table_obj = table_obj_array[Turn.to_index(cshogi.WHITE)]
+        if table_obj.mm_table_obj is None or table_obj.mm_table_obj.header_obj.turn != cshogi.WHITE:
+            raise ValueError(f"[test table array] not loaded on first access")
+
+        if table_obj_array.is_loaded(Turn.to_index(cshogi.BLACK)):
+            raise ValueError(f"[test table array] other turn loaded")
+
+        # ２回目は読み直さない
+        if table_obj_array[Turn.to_index(cshogi.WHITE)].mm_table_obj is not table_obj.mm_table_obj:
+            raise ValueError(f"[test table array] reloaded on second access")
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_procedural_table():
+    # 上書きのファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        table_obj = EvaluationKkTable(
+                engine_version_str='test',
+                table_mode='procedural')
+        table_obj.load_on_usinewgame(turn=cshogi.WHITE)
+        mm_table_obj = table_obj.mm_table_obj
+
+        # 評価値テーブル・ファイルは作らない
+        if os.path.isfile(mm_table_obj.file_name_obj.base_name):
+            raise ValueError(f"[test procedural table] dense file created")
+
+        # まとめて求めた値と、１つずつ求めた値が一致する
+        table_as_array = mm_table_obj.to_table_as_array()
+        for index in range(0, 1000):
+            expected = mm_table_obj.get_bit_by_index(index)
+            actual = (table_as_array[index // 8] >> (7 - index % 8)) & 1
+            if expected != actual:
+                raise ValueError(f"[test procedural table] default bit. index:{index}  expected:{expected}  actual:{actual}")
+
+        # 変えた関係だけを上書きとして持つ。元に戻すと上書きも消える
+        bit_9 = mm_table_obj.get_bit_by_index(9)
+        mm_table_obj.set_bit_by_index(9, 1 - bit_9)
+        bit_10 = mm_table_obj.get_bit_by_index(10)
+        mm_table_obj.set_bit_by_index(10, 1 - bit_10)
+        mm_table_obj.set_bit_by_index(10, bit_10)
+
+        if mm_table_obj.override_dic != {9: 1 - bit_9}:
+            raise ValueError(f"[test procedural table] overrides. actual:{mm_table_obj.override_dic}")
+
+        # 保存して読み直す
+        table_obj.save_evaluation_table_file()
+        table_obj.load_on_usinewgame(turn=cshogi.WHITE)
+        if table_obj.mm_table_obj is not mm_table_obj:
+            raise ValueError(f"[test procedural table] reloaded though not changed")
+
+        reloaded_table_obj = EvaluationKkTable(
+                engine_version_str='test',
+                table_mode='procedural')
+        reloaded_table_obj.load_on_usinewgame(turn=cshogi.WHITE)
+        if reloaded_table_obj.mm_table_obj.override_dic != mm_table_obj.override_dic:
+            raise ValueError(f"[test procedural table] reload. expected:{mm_table_obj.override_dic}  actual:{reloaded_table_obj.mm_table_obj.override_dic}")
+
+        # 密な形式へ書き出しても、同じ値
+        if reloaded_table_obj.mm_table_obj.to_table_as_array()[1] != ((table_as_array[1] ^ 0x40) & 0xFF):
+            raise ValueError(f"[test procedural table] export")
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_move_index():
+    # 指し手の整数から平らなリストを１回引いた値と、指し手オブジェクトを辿って求めた値が一致する
+    board = cshogi.Board()
+
+    for position_sfen in [
+            'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+            'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL w - 1',
+            # 持ち駒をたくさん持った、玉が中央にいる局面
+            '4k4/9/9/9/4K4/9/9/9/9 b RBGSNLP2r2b3g3s3n3l17p 1',
+            '4k4/9/9/9/4K4/9/9/9/9 w 2R2B3G3S3N3L17Prbgsnlp 1',
+            # 成りのある局面
+            'l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL b BGSNPbsp 1']:
+        board.set_sfen(position_sfen)
+        k_sq = BoardHelper.get_king_square(board)
+
+        for move_id in board.legal_moves:
+            move16 = move_id & 0xffff
+            move_obj = Move.from_usi(cshogi.move_to_usi(move_id))
+
+            for shall_white_to_black in [False, True]:
+                blackright_move_obj = Move.from_move_obj(
+                        f_strict_move_obj=move_obj,
+                        shall_white_to_black=shall_white_to_black,
+                        use_only_right_side=True)
+
+                if MoveHelper.is_king(k_sq, move_obj):
+                    expected = EvaluationKMove.get_blackright_index_by_k_move(blackright_move_obj)
+                    actual = EvaluationKMove.get_blackright_index_by_move16(move16, shall_white_to_black)
+
+                else:
+                    expected = EvaluationPMove.get_blackright_index_by_p_move(blackright_move_obj, ignore_error=True)
+                    actual = EvaluationPMove.get_blackright_index_by_move16(move16, shall_white_to_black)
+
+                if expected != actual:
+                    raise ValueError(f"[test move index] sfen:{position_sfen}  move:{move_obj.as_usi}  shall_white_to_black:{shall_white_to_black}  expected:{expected}  actual:{actual}")
+
+    print(f"[{datetime.datetime.now()}] [test move index] ok", flush=True)
+
+
+def test_move_index_file():
+    # 指し手のインデックス・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        file_name_obj = EvaluationMoveIndexFile.get_file_name_obj(
+                engine_version_str='test')
+
+        # ファイルが無ければ作って保存する
+        EvaluationMoveIndexFile.load_or_build(
+                engine_version_str='test')
+
+        if not os.path.isfile(file_name_obj.base_name):
+            raise ValueError(f"[test move index file] file not saved")
+
+        # 読み込んだリストと、作ったリストが一致する
+        (k_move16_to_blackright_index_list_tuple,
+         p_move16_to_blackright_index_list_tuple) = EvaluationMoveIndexFile.read_file(
+                file_name_obj=file_name_obj)
+
+        if k_move16_to_blackright_index_list_tuple != EvaluationKMove.get_move16_to_blackright_index_list_tuple():
+            raise ValueError(f"[test move index file] k lists not match")
+
+        if p_move16_to_blackright_index_list_tuple != EvaluationPMove.get_move16_to_blackright_index_list_tuple():
+            raise ValueError(f"[test move index file] p lists not match")
+
+        # 辞書の CRC-32 が合わなければ読まない
+        with open(file_name_obj.base_name, 'r+b') as f:
+            f.seek(EvaluationMoveIndexFile.header_size - 4)
+            f.write(b'\x00\x00\x00\x00')
+
+        if EvaluationMoveIndexFile.read_file(file_name_obj=file_name_obj) is not None:
+            raise ValueError(f"[test move index file] out of date file was read")
+
+        print(f"[{datetime.datetime.now()}] [test move index file] ok", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def count_relations_one_by_one(
+        kifuwarabe,
+        f_strict_move_id):
+    """着手と全ての応手の関係の有りの数と総数を、指し手オブジェクトを辿って１つずつ数えます。まとめて数えた値を確かめる、遅いが素直な数え方"""
+    board = kifuwarabe.board
+    turn_index = Turn.to_index(board.turn)
+
+    f_strict_move_obj = Move.from_usi(cshogi.move_to_usi(f_strict_move_id))
+    f_blackright_move_obj = Move.from_move_obj(
+            f_strict_move_obj=f_strict_move_obj,
+            shall_white_to_black=board.turn==cshogi.WHITE,
+            use_only_right_side=True)
+    is_king_move = MoveHelper.is_king(BoardHelper.get_king_square(board), f_strict_move_obj)
+
+    # 着手と敵玉の応手は、着手が後手なら１８０°回転する。敵兵の応手は、応手が後手なら１８０°回転する
+    l_shall_white_to_black = board.turn == cshogi.WHITE
+    q_shall_white_to_black = board.turn == cshogi.BLACK
+
+    # 同じ関係は１つと数えるので、インデックスをキーにする
+    relation_index_to_relation_exists_dictionary = {}
+
+    board.push(f_strict_move_id)
+    l_sq = BoardHelper.get_king_square(board)
+    o_strict_move_obj_list = [Move.from_usi(cshogi.move_to_usi(o_strict_move_id)) for o_strict_move_id in board.legal_moves]
+    board.pop()
+
+    for o_strict_move_obj in o_strict_move_obj_list:
+        if MoveHelper.is_king(l_sq, o_strict_move_obj):
+            l_blackright_move_obj = Move.from_move_obj(
+                    f_strict_move_obj=o_strict_move_obj,
+                    shall_white_to_black=l_shall_white_to_black,
+                    use_only_right_side=True)
+
+            if is_king_move:
+                index = EvaluationKkTable.get_black_k_black_l_index(f_blackright_move_obj, l_blackright_move_obj)
+                relation_index_to_relation_exists_dictionary[('kl', index)] = kifuwarabe.evaluation_kl_table_obj_array[turn_index].get_relation_exists_by_index(index)
+            else:
+                index = EvaluationPkTable.get_p_blackright_k_blackright_index(f_blackright_move_obj, l_blackright_move_obj)
+                relation_index_to_relation_exists_dictionary[('pl', index)] = kifuwarabe.evaluation_pl_table_obj_array[turn_index].get_relation_exists_by_index(index)
+
+        else:
+            q_blackright_move_obj = Move.from_move_obj(
+                    f_strict_move_obj=o_strict_move_obj,
+                    shall_white_to_black=q_shall_white_to_black,
+                    use_only_right_side=True)
+
+            if is_king_move:
+                index = EvaluationKpTable.get_blackright_k_blackright_p_index(f_blackright_move_obj, q_blackright_move_obj)
+                relation_index_to_relation_exists_dictionary[('kq', index)] = kifuwarabe.evaluation_kq_table_obj_array[turn_index].get_relation_exists_by_index(index)
+            else:
+                index = EvaluationPpTable.get_blackright_p1_blackright_p2_index(f_blackright_move_obj, q_blackright_move_obj)
+                relation_index_to_relation_exists_dictionary[('pq', index)] = kifuwarabe.evaluation_pq_table_obj_array[turn_index].get_relation_exists_by_index(index)
+
+    return (sum(relation_index_to_relation_exists_dictionary.values()),
+            len(relation_index_to_relation_exists_dictionary))
+
+
+def test_batch():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        # インデックスの配列でまとめて取り出した値と、１つずつ取り出した値が一致する
+        index_array = np.array([0, 1, 7, 8, 9, 1000, EvaluationPMove.get_serial_number_size() * EvaluationKMove.get_serial_number_size() - 1, EvaluationKMove.get_serial_number_size() + 3, EvaluationKMove.get_serial_number_size() + 4, 1000], dtype=np.int64)
+
+        for table_mode in ['memory', 'procedural']:
+            table_obj = EvaluationPkTable(
+                    engine_version_str='test',
+                    table_mode=table_mode)
+            table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+            mm_table_obj = table_obj.mm_table_obj
+
+            # ビットを立てた上書きも混ぜる
+            mm_table_obj.set_bit_by_index(f_blackright_o_blackright_index=EvaluationKMove.get_serial_number_size() + 3, bit=1)
+            mm_table_obj.set_bit_by_index(f_blackright_o_blackright_index=EvaluationKMove.get_serial_number_size() + 4, bit=0)
+
+            bit_array = table_obj.get_relation_exists_array_by_index_array(index_array)
+            for (index, actual) in zip(index_array.tolist(), bit_array.tolist()):
+                expected = mm_table_obj.get_bit_by_index(index)
+                if expected != actual:
+                    raise ValueError(f"[test batch] table_mode:{table_mode}  index:{index}  expected:{expected}  actual:{actual}")
+
+        # 階位をまとめて求めた値と、１つずつ求めた値が一致する
+        for tier_resolution in [2, 3, 7, 10]:
+            total_of_relation_list = [total for total in range(0, 300) for _ in range(0, total + 1)]
+            positive_of_relation_list = [positive for total in range(0, 300) for positive in range(0, total + 1)]
+
+            (ranking_th_array, _) = EvaluationFacade.get_tier_th_array(
+                    positive_of_relation_array=np.array(positive_of_relation_list),
+                    total_of_relation_array=np.array(total_of_relation_list),
+                    tier_resolution=tier_resolution)
+
+            for (positive, total, actual) in zip(positive_of_relation_list, total_of_relation_list, ranking_th_array.tolist()):
+                (expected, _) = EvaluationFacade.get_tier_th(positive, total, tier_resolution)
+                if expected != actual:
+                    raise ValueError(f"[test batch] tier_resolution:{tier_resolution}  positive:{positive}  total:{total}  expected:{expected}  actual:{actual}")
+
+        # 全ての合法手をまとめて数えた値と、１手ずつ数えた値が一致する
+        kifuwarabe = Kifuwarabe(
+                table_mode='memory')
+        kifuwarabe.load_eval_all_tables()
+
+        for position_str in [
+                'startpos',
+                'startpos moves 7g7f',
+                'startpos moves 7g7f 3c3d 8h2b+',
+                'startpos moves 7g7f 3c3d 8h2b+ 3a2b 2g2f 8c8d B*5e 8d8e 5i4h',
+                'sfen l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1',
+                'sfen l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL b BGSNPbsp 1']:
+            kifuwarabe.position(position_str)
+            legal_move_id_list = list(kifuwarabe.board.legal_moves)
+
+            (positive_of_relation_array,
+             total_of_relation_array) = ChoiceBestMove.get_positive_and_total_of_relation_array_by_batch(
+                    f_strict_move_id_list=legal_move_id_list,
+                    kifuwarabe=kifuwarabe)
+
+            expected_ranked_strict_move_id_set_list = [set() for _ in range(0, kifuwarabe.tier_resolution)]
+
+            for (i, move_id) in enumerate(legal_move_id_list):
+                (expected_positive,
+                 expected_total) = count_relations_one_by_one(
+                        kifuwarabe=kifuwarabe,
+                        f_strict_move_id=move_id)
+
+                actual_positive = int(positive_of_relation_array[i])
+                actual_total = int(total_of_relation_array[i])
+
+                if (expected_positive, expected_total) != (actual_positive, actual_total):
+                    raise ValueError(f"[test batch] position:{position_str}  move:{cshogi.move_to_usi(move_id)}  expected:{expected_positive}/{expected_total}  actual:{actual_positive}/{actual_total}")
+
+                # １手の関係の辞書を数えても同じ
+                (f_l_index_to_relation_exists_dictionary,
+                 f_q_index_to_relation_exists_dictionary,
+                 _) = ChoiceBestMove.get_relation_exists_dictionary_tuple(
+                        f_strict_move_id=move_id,
+                        kifuwarabe=kifuwarabe)
+
+                actual_positive = sum(f_l_index_to_relation_exists_dictionary.values()) + sum(f_q_index_to_relation_exists_dictionary.values())
+                actual_total = len(f_l_index_to_relation_exists_dictionary) + len(f_q_index_to_relation_exists_dictionary)
+
+                if (expected_positive, expected_total) != (actual_positive, actual_total):
+                    raise ValueError(f"[test batch] dictionary.  position:{position_str}  move:{cshogi.move_to_usi(move_id)}  expected:{expected_positive}/{expected_total}  actual:{actual_positive}/{actual_total}")
+
+                (ranking_th, _) = EvaluationFacade.get_tier_th(expected_positive, expected_total, kifuwarabe.tier_resolution)
+                expected_ranked_strict_move_id_set_list[ranking_th - 1].add(move_id)
+
+            # 階位に分けた結果も一致する
+            actual_ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_by_batch(
+                    legal_moves=kifuwarabe.board.legal_moves,
+                    kifuwarabe=kifuwarabe)
+
+            if expected_ranked_strict_move_id_set_list != actual_ranked_strict_move_id_set_list:
+                raise ValueError(f"[test batch] position:{position_str}  ranked sets are different")
+
+            # デバッグのときも、同じ数え方をする
+            actual_ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                    legal_moves=kifuwarabe.board.legal_moves,
+                    kifuwarabe=kifuwarabe,
+                    is_debug=True)
+
+            if expected_ranked_strict_move_id_set_list != actual_ranked_strict_move_id_set_list:
+                raise ValueError(f"[test batch] debug.  position:{position_str}  ranked sets are different")
+
+        print(f"[{datetime.datetime.now()}] [test batch] ok", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_policy_cache():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        # 一杯になったら、一番長く使っていないものから捨てる
+        policy_cache = PolicyCache(max_size=2)
+        board_list = []
+        for position_sfen in [
+                'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+                'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL w - 1',
+                'lnsgkgsnl/1r5b1/ppppppppp/9/9/2P6/PP1PPPPPP/1B5R1/LNSGKGSNL w - 2']:
+            board = cshogi.Board(position_sfen)
+            board_list.append(board)
+            policy_cache.put(board, (1,), [1, 2], None, None, [{1}, {2}])
+            # 最初の局面は使ったことにする
+            policy_cache.get(board_list[0], (1,), [1, 2])
+
+        if (policy_cache.get(board_list[1], (1,), [1, 2]) is not None or
+                policy_cache.get(board_list[0], (1,), [1, 2]) is None or
+                policy_cache.eviction_count != 1):
+            raise ValueError(f"[test policy cache] lru.  {policy_cache.get_statistics_str()}")
+
+        # 評価値テーブルの版が変われば捨てる
+        if policy_cache.get(board_list[2], (2,), [1, 2]) is not None or policy_cache.invalidation_count != 1 or len(policy_cache) != 1:
+            raise ValueError(f"[test policy cache] invalidation.  {policy_cache.get_statistics_str()}")
+
+        # 覚えた一覧を書き換えられても、覚えているものは変わらない
+        (_, _, ranked_strict_move_id_set_list) = policy_cache.get(board_list[0], (1,), [1, 2])
+        ranked_strict_move_id_set_list[0].add(3)
+        if policy_cache.get(board_list[0], (1,), [1, 2])[2] != [{1}, {2}]:
+            raise ValueError(f"[test policy cache] copy")
+
+        # ビットを変えると、上書きでも、読み直しでも、評価値テーブルの版が変わる
+        for table_mode in ['memory', 'procedural']:
+            table_obj = EvaluationPkTable(
+                    engine_version_str='test',
+                    table_mode=table_mode)
+            table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+            mm_table_obj = table_obj.mm_table_obj
+            version_list = [mm_table_obj.version]
+
+            bit = mm_table_obj.get_bit_by_index(5)
+            mm_table_obj.set_bit_by_index(f_blackright_o_blackright_index=5, bit=1 - bit)
+            version_list.append(mm_table_obj.version)
+
+            mm_table_obj.overlay_bit_by_index(5, bit)
+            version_list.append(mm_table_obj.version)
+
+            reloaded_table_obj = EvaluationPkTable(
+                    engine_version_str='test',
+                    table_mode=table_mode)
+            reloaded_table_obj.load_on_usinewgame(turn=cshogi.BLACK)
+            version_list.append(reloaded_table_obj.mm_table_obj.version)
+
+            if len(set(version_list)) != len(version_list):
+                raise ValueError(f"[test policy cache] table_mode:{table_mode}  version_list:{version_list}")
+
+        # ２回目は覚えておいたものを使い、評価値テーブルを変えたら数え直す
+        kifuwarabe = Kifuwarabe(
+                table_mode='memory')
+        kifuwarabe.load_eval_all_tables()
+        kifuwarabe.position('startpos moves 7g7f 3c3d')
+
+        first_ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                legal_moves=kifuwarabe.board.legal_moves,
+                kifuwarabe=kifuwarabe)
+        second_ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                legal_moves=kifuwarabe.board.legal_moves,
+                kifuwarabe=kifuwarabe)
+
+        if first_ranked_strict_move_id_set_list != second_ranked_strict_move_id_set_list or kifuwarabe.policy_cache.hit_count != 1:
+            raise ValueError(f"[test policy cache] hit.  {kifuwarabe.policy_cache.get_statistics_str()}")
+
+        (result_str, _) = kifuwarabe.strengthen(cmd_tail='2g2f')
+        if result_str != 'changed':
+            (result_str, _) = kifuwarabe.weaken(cmd_tail='2g2f')
+
+        # strengthen 、 weaken は、着手の関係の有りの数と総数を数え直さずに、覚えておいたものを使う
+        if kifuwarabe.policy_cache.hit_count < 2:
+            raise ValueError(f"[test policy cache] hit in edit.  {kifuwarabe.policy_cache.get_statistics_str()}")
+
+        changed_ranked_strict_move_id_set_list = ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                legal_moves=kifuwarabe.board.legal_moves,
+                kifuwarabe=kifuwarabe)
+
+        if kifuwarabe.policy_cache.invalidation_count != 1:
+            raise ValueError(f"[test policy cache] invalidation after edit.  result_str:{result_str}  {kifuwarabe.policy_cache.get_statistics_str()}")
+
+        # 数え直したものは、覚えずに数えたものと同じ
+        kifuwarabe.policy_cache.clear()
+        if changed_ranked_strict_move_id_set_list != ChoiceBestMove.select_ranked_f_strict_move_id_set_facade(
+                legal_moves=kifuwarabe.board.legal_moves,
+                kifuwarabe=kifuwarabe):
+            raise ValueError(f"[test policy cache] recount")
+
+        print(f"[{datetime.datetime.now()}] [test policy cache] ok  {kifuwarabe.policy_cache.get_statistics_str()}", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_reply_set():
+    def to_sorted_pair_list(o_move16_array, o_f_position_array):
+        return sorted(zip(o_f_position_array.tolist(), o_move16_array.tolist()))
+
+    # 打ち歩詰め、ピン、王手、空き王手、玉の逃げ場を塞ぐ手、二歩、行き所の無い駒が出てくる局面と、ランダムに指し進めた局面
+    board_list = []
+    for position_sfen in [
+            'lnsgkgsnl/1r5b1/ppppppppp/9/9/9/PPPPPPPPP/1B5R1/LNSGKGSNL b - 1',
+            '7lk/9/7G1/9/9/9/9/9/4K4 b P 1',
+            '7lk/9/6G2/9/9/9/9/9/4K4 b P 1',
+            '8k/7p1/7GP/9/9/9/9/9/4K4 w P 1',
+            '4k4/9/4g4/9/4R4/9/4B4/9/4K4 b 2P2L2N 1',
+            '4k4/4s4/9/9/9/9/9/4L4/4K4 w rb 1',
+            'l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL w BGSNPbsp 1',
+            'l6nl/2+R1gsk2/p2p1p1p1/2p1p1p1p/1p7/2P1P1P2/PPS2P2P/1K1G5/LN3G+rNL b BGSNPbsp 1',
+            '6k1l/5g3/5pnp1/6p1p/7P1/9/5PP1P/6SK1/7NL b RB2G2S2N2L10Prbgs 1']:
+        board_list.append(cshogi.Board(position_sfen))
+
+    random.seed(34)
+    for _ in range(0, 200):
+        board = cshogi.Board()
+        for _ in range(0, random.randint(0, 150)):
+            legal_move_id_list = list(board.legal_moves)
+            if len(legal_move_id_list) < 1:
+                break
+            board.push(random.choice(legal_move_id_list))
+        board_list.append(board)
+
+    number_of_approximate_difference = 0
+    number_of_generated = 0
+
+    for board in board_list:
+        legal_move_id_list = list(board.legal_moves)
+        sfen = board.sfen()
+
+        expected = to_sorted_pair_list(*ReplySetEngine.create_o_move16_array_and_f_position_array(
+                board=board,
+                f_strict_move_id_list=legal_move_id_list,
+                mode='generate'))
+
+        # 'exact' は、１手指して合法手を作ったものと一致する
+        actual = to_sorted_pair_list(*ReplySetEngine.create_o_move16_array_and_f_position_array(
+                board=board,
+                f_strict_move_id_list=legal_move_id_list,
+                mode='exact'))
+
+        if expected != actual:
+            raise ValueError(f"[test reply set] sfen:{sfen}  missing:{sorted(set(expected) - set(actual))[:5]}  extra:{sorted(set(actual) - set(expected))[:5]}")
+
+        # 'approximate' は少し違ってよい。着手の位置は範囲に収まる
+        approximate = to_sorted_pair_list(*ReplySetEngine.create_o_move16_array_and_f_position_array(
+                board=board,
+                f_strict_move_id_list=legal_move_id_list,
+                mode='approximate'))
+
+        if any(not (0 <= f_position < len(legal_move_id_list)) for (f_position, _) in approximate):
+            raise ValueError(f"[test reply set] sfen:{sfen}  f position out of range")
+
+        number_of_approximate_difference += len(set(expected) ^ set(approximate))
+        number_of_generated += len(expected)
+
+        # 局面は元に戻っている
+        if board.sfen() != sfen:
+            raise ValueError(f"[test reply set] board is changed.  expected:{sfen}  actual:{board.sfen()}")
+
+    print(f"[{datetime.datetime.now()}] [test reply set] approximate difference rate:{number_of_approximate_difference / number_of_generated:.3f}", flush=True)
+    print(f"[{datetime.datetime.now()}] [test reply set] ok", flush=True)
+
+
+def test_search():
+    # go の引数を読む
+    argument_dictionary = TimeManager.parse_go_arguments('btime 60000 wtime 50000 byoyomi 10000 infinite')
+    if argument_dictionary != {'btime': 60000, 'wtime': 50000, 'byoyomi': 10000, 'infinite': True}:
+        raise ValueError(f"[test search] unexpected arguments:{argument_dictionary}")
+
+    # 秒読みだけなら、通信の遅れの分を残して、秒読みを全部使う
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='btime 0 wtime 0 byoyomi 3000', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if (time_manager.optimum_seconds, time_manager.maximum_seconds) != (2.7, 2.7):
+        raise ValueError(f"[test search] byoyomi.  optimum:{time_manager.optimum_seconds}  maximum:{time_manager.maximum_seconds}")
+
+    # 持ち時間は、残りの手数の見込みで割る。上限は目安の３倍まで。後手なら wtime と winc を使う
+    time_manager = TimeManager(turn=cshogi.WHITE, cmd_tail='btime 1000 wtime 40000 binc 9000 winc 1000', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if (time_manager.optimum_seconds, time_manager.maximum_seconds) != (2.0, 6.0):
+        raise ValueError(f"[test search] increment.  optimum:{time_manager.optimum_seconds}  maximum:{time_manager.maximum_seconds}")
+
+    # 残りが少なければ、使えるだけ
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='btime 200 wtime 40000', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if (time_manager.optimum_seconds, time_manager.maximum_seconds) != (0.0, 0.0):
+        raise ValueError(f"[test search] time trouble.  optimum:{time_manager.optimum_seconds}  maximum:{time_manager.maximum_seconds}")
+
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='infinite', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if not time_manager.is_infinite or time_manager.maximum_seconds is not None:
+        raise ValueError(f"[test search] infinite")
+
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        kifuwarabe = Kifuwarabe(
+                table_mode='memory')
+        kifuwarabe.load_eval_all_tables()
+
+        for (position_str, cmd_tail, expected_move_u_list, expected_score_str) in [
+                # １手詰め
+                ('sfen 7lk/9/7G1/9/9/9/9/9/4K4 b G 1', 'movetime 3000', ['G*2b', 'G*1b'], 'mate 1'),
+                # 詰ませ方が何通りかある
+                ('sfen 8k/6G2/7Pp/9/9/9/9/9/4K4 b G 1', 'movetime 3000', None, 'mate 1'),
+                # タダの飛車を取る
+                ('sfen 4k4/9/9/9/4r4/9/4B4/9/4K4 w - 1', 'movetime 3000', ['5e5g', '5e5g+'], None)]:
+            kifuwarabe.position(position_str)
+            sfen = kifuwarabe.board.sfen()
+
+            time_manager = TimeManager(turn=kifuwarabe.board.turn, cmd_tail=cmd_tail, margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+            search = AlphaBetaSearch(
+                    kifuwarabe=kifuwarabe,
+                    time_manager=time_manager,
+                    max_depth=5)
+            (best_move_id, best_value, pv_list) = search.search()
+            elapsed_seconds = time_manager.get_elapsed_seconds()
+
+            if expected_move_u_list is not None and cshogi.move_to_usi(best_move_id) not in expected_move_u_list:
+                raise ValueError(f"[test search] position:{position_str}  expected:{expected_move_u_list}  actual:{cshogi.move_to_usi(best_move_id)}  pv:{[cshogi.move_to_usi(move_id) for move_id in pv_list]}")
+
+            if expected_score_str is not None and AlphaBetaSearch.to_usi_score_str(best_value) != expected_score_str:
+                raise ValueError(f"[test search] position:{position_str}  expected score:{expected_score_str}  actual:{AlphaBetaSearch.to_usi_score_str(best_value)}")
+
+            # 上限の時間を大きく超えない
+            if time_manager.maximum_seconds + 0.2 < elapsed_seconds:
+                raise ValueError(f"[test search] position:{position_str}  maximum:{time_manager.maximum_seconds}  elapsed:{elapsed_seconds}")
+
+            # 局面は元に戻っている
+            if kifuwarabe.board.sfen() != sfen:
+                raise ValueError(f"[test search] board is changed.  expected:{sfen}  actual:{kifuwarabe.board.sfen()}")
+
+        # 方策の評価値は、関係が全て有りなら +max_policy_value 、半分なら 0 、全て無しなら -max_policy_value
+        for (positive_of_relation, total_of_relation, expected_policy_value) in [
+                (10, 10, AlphaBetaSearch.max_policy_value),
+                (5, 10, 0),
+                (0, 10, -AlphaBetaSearch.max_policy_value),
+                (0, 0, 0)]:
+            policy_value = AlphaBetaSearch.get_policy_value(positive_of_relation, total_of_relation)
+            if policy_value != expected_policy_value:
+                raise ValueError(f"[test search] policy value.  positive:{positive_of_relation}  total:{total_of_relation}  expected:{expected_policy_value}  actual:{policy_value}")
+
+        # 根より下の浅い局面でも方策を数える。２回目の探索は PolicyCache に有るものを使う
+        kifuwarabe.position('startpos')
+        for _ in range(0, 2):
+            hit_count = kifuwarabe.policy_cache.hit_count
+            time_manager = TimeManager(turn=kifuwarabe.board.turn, cmd_tail='infinite', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+            search = AlphaBetaSearch(kifuwarabe=kifuwarabe, time_manager=time_manager, max_depth=2)
+            search.search()
+
+        if search.policy_nodes < 2 or kifuwarabe.policy_cache.hit_count - hit_count < search.policy_nodes:
+            raise ValueError(f"[test search] policy in the tree.  policy nodes:{search.policy_nodes}  cache:{kifuwarabe.policy_cache.get_statistics_str()}")
+
+        # 時間が無くても、階位の良い指し手を返す
+        kifuwarabe.position('startpos')
+        time_manager = TimeManager(turn=kifuwarabe.board.turn, cmd_tail='movetime 0', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+        (best_move_id, _, _) = AlphaBetaSearch(kifuwarabe=kifuwarabe, time_manager=time_manager, max_depth=5).search()
+        if best_move_id not in kifuwarabe.board.legal_moves:
+            raise ValueError(f"[test search] no time.  best move:{best_move_id}")
+
+        print(f"[{datetime.datetime.now()}] [test search] ok", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_ponder():
+    # 先読み中は時間の制限が無く、 ponderhit から時間を測り始める
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='ponder btime 0 wtime 0 byoyomi 1000', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if not time_manager.is_pondering or time_manager.maximum_seconds is not None or time_manager.is_time_up():
+        raise ValueError(f"[test ponder] pondering")
+
+    time_manager.ponderhit()
+    if time_manager.is_pondering or time_manager.maximum_seconds != 0.7:
+        raise ValueError(f"[test ponder] ponderhit.  maximum:{time_manager.maximum_seconds}")
+
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        def get_bestmove_line_list(output_str):
+            return [line for line in output_str.splitlines() if line.startswith('bestmove')]
+
+        def wait_for_search(timeout_seconds):
+            start = time.perf_counter()
+            while kifuwarabe.is_searching():
+                if timeout_seconds < time.perf_counter() - start:
+                    raise ValueError(f"[test ponder] search does not end")
+                time.sleep(0.01)
+
+        # 方策だけで指す深さ 0 の思考も、読み終わったら ponderhit か stop を待つ
+        for search_mode in ['alphabeta', 'policy']:
+            kifuwarabe = Kifuwarabe(
+                    table_mode='memory',
+                    search_mode=search_mode)
+            kifuwarabe.load_eval_all_tables()
+
+            for (go_cmd_tail, release_command, expected_seconds) in [
+                    # 先読みが当たった。 ponderhit から秒読みの分だけ考える
+                    ('ponder btime 0 wtime 0 byoyomi 1000', 'ponderhit', 0.7),
+                    # 先読みが外れた。すぐに、読み終わったところまでの最善手を返す
+                    ('ponder btime 0 wtime 0 byoyomi 1000', 'stop', 0.0),
+                    # 時間の制限が無い
+                    ('infinite', 'stop', 0.0)]:
+                output = io.StringIO()
+
+                with contextlib.redirect_stdout(output):
+                    kifuwarabe.usi_sequence('position startpos moves 7g7f')
+                    kifuwarabe.usi_sequence(f'go {go_cmd_tail}')
+                    time.sleep(0.5)
+
+                    # 先読み中は bestmove を返さない。 isready には答える
+                    kifuwarabe.usi_sequence('isready')
+                    if 0 < len(get_bestmove_line_list(output.getvalue())):
+                        raise ValueError(f"[test ponder] {search_mode}  go:{go_cmd_tail}  bestmove before {release_command}")
+
+                    release_start = time.perf_counter()
+                    kifuwarabe.usi_sequence(release_command)
+                    wait_for_search(timeout_seconds=expected_seconds + 2.0)
+                    release_seconds = time.perf_counter() - release_start
+
+                bestmove_line_list = get_bestmove_line_list(output.getvalue())
+                if len(bestmove_line_list) != 1:
+                    raise ValueError(f"[test ponder] {search_mode}  go:{go_cmd_tail}  bestmove lines:{bestmove_line_list}")
+
+                best_move_str = bestmove_line_list[0].split(' ')[1]
+                if kifuwarabe.board.move_from_usi(best_move_str) not in kifuwarabe.board.legal_moves:
+                    raise ValueError(f"[test ponder] {search_mode}  go:{go_cmd_tail}  illegal bestmove:{bestmove_line_list[0]}")
+
+                if 'readyok' not in output.getvalue():
+                    raise ValueError(f"[test ponder] {search_mode}  go:{go_cmd_tail}  no readyok")
+
+                if expected_seconds + 1.0 < release_seconds:
+                    raise ValueError(f"[test ponder] {search_mode}  go:{go_cmd_tail}  too slow.  seconds:{release_seconds}")
+
+                print(f"[{datetime.datetime.now()}] [test ponder] {search_mode}  go:{go_cmd_tail:38}  {release_command:9}  seconds:{release_seconds:.3f}  `{bestmove_line_list[0]}`", flush=True)
+
+        # 'policy' の、持ち時間の中で読む go も、別スレッドで考えて bestmove を返す
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            kifuwarabe.usi_sequence('position startpos')
+            kifuwarabe.usi_sequence('go btime 0 wtime 0 byoyomi 1000')
+            if kifuwarabe._search_thread is None:
+                raise ValueError(f"[test ponder] {search_mode}  go does not start the search thread")
+
+            wait_for_search(timeout_seconds=2.0)
+
+        if len(get_bestmove_line_list(output.getvalue())) != 1:
+            raise ValueError(f"[test ponder] {search_mode}  go  bestmove lines:{get_bestmove_line_list(output.getvalue())}")
+
+        # 探索中に position が来たら、探索を止めてから行う
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            kifuwarabe.usi_sequence('go infinite')
+            kifuwarabe.usi_sequence('position startpos')
+            if kifuwarabe.is_searching() or len(get_bestmove_line_list(output.getvalue())) != 1:
+                raise ValueError(f"[test ponder] position while searching")
+
+        if kifuwarabe.board.sfen() != cshogi.Board().sfen():
+            raise ValueError(f"[test ponder] position is not set.  sfen:{kifuwarabe.board.sfen()}")
+
+        print(f"[{datetime.datetime.now()}] [test ponder] ok", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_usi_reader():
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        kifuwarabe = Kifuwarabe(
+                table_mode='memory',
+                search_mode='alphabeta')
+        kifuwarabe.load_eval_all_tables()
+
+        def create_input_function(command_and_delay_seconds_list):
+            """コマンドを、間を空けて１行ずつ返す関数。使い切ったら入力が閉じられたことにする"""
+            command_and_delay_seconds_iterator = iter(command_and_delay_seconds_list)
+
+            def input_function():
+                try:
+                    (command_str, delay_seconds) = next(command_and_delay_seconds_iterator)
+                except StopIteration:
+                    raise EOFError()
+
+                time.sleep(delay_seconds)
+                return command_str
+
+            return input_function
+
+        # 時間のかかるプレイアウトの最中に isready と stop が来る。 isready にはすぐ答え、 stop でプレイアウトを止める
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(output):
+            kifuwarabe.usi_loop(
+                    input_function=create_input_function([
+                            ('position startpos', 0.0),
+                            ('playout', 0.0),
+                            ('isready', 0.05),
+                            ('stop', 0.05),
+                            ('quit', 0.1)]))
+        seconds = time.perf_counter() - start
+
+        line_list = output.getvalue().splitlines()
+        playout_result_line_list = [line for line in line_list if line.strip().startswith('# reason:')]
+
+        if playout_result_line_list != ['    # reason:cancelled']:
+            raise ValueError(f"[test usi reader] playout is not cancelled.  lines:{playout_result_line_list}")
+
+        if line_list.index('readyok') > [i for (i, line) in enumerate(line_list) if line.strip().startswith('# reason:')][0]:
+            raise ValueError(f"[test usi reader] readyok is not answered while playout")
+
+        if 3.0 < seconds:
+            raise ValueError(f"[test usi reader] too slow.  seconds:{seconds}")
+
+        # stop より前に読んだコマンドだけを止める。止めた後の strengthen は行う
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            kifuwarabe.usi_loop(
+                    input_function=create_input_function([
+                            ('position startpos', 0.0),
+                            ('go infinite', 0.0),
+                            ('stop', 0.5),
+                            ('strengthen 2g2f', 0.1),
+                            # quit はそれより前のコマンドを止めるので、 strengthen が終わってから送る
+                            ('quit', 1.0)]))
+
+        line_list = output.getvalue().splitlines()
+        bestmove_line_list = [line for line in line_list if line.startswith('bestmove')]
+        strengthen_line_list = [line for line in line_list if line.startswith('[strengthen]')]
+
+        if len(bestmove_line_list) != 1 or 'resign' in bestmove_line_list[0]:
+            raise ValueError(f"[test usi reader] bestmove lines:{bestmove_line_list}")
+
+        if len(strengthen_line_list) != 1 or 'cancelled' in strengthen_line_list[0]:
+            raise ValueError(f"[test usi reader] strengthen lines:{strengthen_line_list}")
+
+        print(f"[{datetime.datetime.now()}] [test usi reader] ok  playout cancelled in {seconds:.3f} seconds", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_mate_solver():
+    for (sfen, max_nodes, expected_result_str, expected_length) in [
+            # １手詰め
+            ('4k4/9/4P4/9/9/9/9/9/4K4 b G 1', 1000, 'mate', 1),
+            ('7lk/9/7G1/9/9/9/9/9/4K4 b G 1', 1000, 'mate', 1),
+            # ３手詰め
+            ('1+B7/6B1L/4n1N2/2p6/gls1k4/5P1p1/+l2rP1N1+n/1lKGG4/6SS1 b RGS8P6p 141', 10000, 'mate', 3),
+            # ５手詰め（３手では詰まない）
+            ('1+L7/4k4/L8/1g1g1B2L/1pp6/4SG3/1+R1Kp3N/9/1N1S5 b RBG2S2NL15P 149', 10000, 'mate', 5),
+            # 後手が攻め方の長手数の詰み
+            ('9/3+B2g2/+r5p1l/4S4/1P2k2n1/6P2/4K2+l1/8s/4G4 w GL8Prbg2s3nl7p 134', 20000, 'mate', None),
+            # 打ち歩詰めしかない
+            ('7lk/9/7G1/9/9/9/9/9/4K4 b P 1', 1000, 'nomate', None),
+            # 銀１枚では詰まない
+            ('4k4/9/9/9/9/9/9/9/4K4 b S 1', 1000, 'nomate', None),
+            # 飛車１枚では王手が続くので、局面の数の上限に達する
+            ('4k4/9/9/9/9/9/9/9/4K4 b R 1', 1000, 'timeout', None)]:
+        board = cshogi.Board(sfen)
+        mate_solver = MateSolver(
+                board=board,
+                max_nodes=max_nodes)
+        (result_str, mate_move_id_list) = mate_solver.solve()
+
+        if result_str != expected_result_str:
+            raise ValueError(f"[test mate solver] sfen:{sfen}  expected:{expected_result_str}  actual:{result_str}  nodes:{mate_solver.nodes}")
+
+        if expected_length is not None and len(mate_move_id_list) != expected_length:
+            raise ValueError(f"[test mate solver] sfen:{sfen}  expected length:{expected_length}  actual:{[cshogi.move_to_usi(move_id) for move_id in mate_move_id_list]}")
+
+        # 局面は元に戻っている
+        if board.sfen() != sfen:
+            raise ValueError(f"[test mate solver] board is changed.  expected:{sfen}  actual:{board.sfen()}")
+
+        # 詰み手順は、攻め方が王手を続けて、詰んで終わる
+        for (ply, move_id) in enumerate(mate_move_id_list):
+            if not board.is_legal(move_id):
+                raise ValueError(f"[test mate solver] sfen:{sfen}  illegal move:{cshogi.move_to_usi(move_id)}")
+
+            board.push(move_id)
+
+            if ply % 2 == 0 and not board.is_check():
+                raise ValueError(f"[test mate solver] sfen:{sfen}  not check:{cshogi.move_to_usi(move_id)}")
+
+        if result_str == 'mate' and not board.is_game_over():
+            raise ValueError(f"[test mate solver] sfen:{sfen}  not mate:{[cshogi.move_to_usi(move_id) for move_id in mate_move_id_list]}")
+
+    # 受け方の手番で解く。３手詰めの初手を指した局面は、どう逃げても詰む
+    board = cshogi.Board('1+B7/6B1L/4n1N2/2p6/gls1k4/5P1p1/+l2rP1N1+n/1lKGG4/6SS1 b RGS8P6p 141')
+    board.push_usi('3b5d+')
+    (result_str, mate_move_id_list) = MateSolver(board=board, max_nodes=10000).solve(
+            is_attacker_turn=False)
+    if (result_str, len(mate_move_id_list)) != ('mate', 2):
+        raise ValueError(f"[test mate solver] defender turn.  result:{result_str}  moves:{[cshogi.move_to_usi(move_id) for move_id in mate_move_id_list]}")
+
+    # 詰んだ局面は、０手で詰み
+    board = cshogi.Board('4k4/9/4P4/9/9/9/9/9/4K4 b G 1')
+    board.push_usi('G*5b')
+    if MateSolver(board=board).solve(is_attacker_turn=False) != ('mate', []):
+        raise ValueError(f"[test mate solver] checkmated")
+
+    # go mate の時間
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='mate 5000', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if (time_manager.optimum_seconds, time_manager.maximum_seconds) != (4.7, 4.7):
+        raise ValueError(f"[test mate solver] go mate.  optimum:{time_manager.optimum_seconds}  maximum:{time_manager.maximum_seconds}")
+
+    time_manager = TimeManager(turn=cshogi.BLACK, cmd_tail='mate infinite', margin_milliseconds=300, expected_number_of_remaining_moves=40, thinking_milliseconds_without_time_control=1000)
+    if not time_manager.is_infinite or time_manager.maximum_seconds is not None:
+        raise ValueError(f"[test mate solver] go mate infinite")
+
+    # 評価値テーブル・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        kifuwarabe = Kifuwarabe(
+                table_mode='memory',
+                search_mode='alphabeta')
+        kifuwarabe.load_eval_all_tables()
+
+        # go mate は checkmate を返し、 go は詰みを読み筋ごと返す
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            kifuwarabe.usi_loop(
+                    input_function=iter([
+                            'position sfen 1+L7/4k4/L8/1g1g1B2L/1pp6/4SG3/1+R1Kp3N/9/1N1S5 b RBG2S2NL15P 149',
+                            'go mate 5000',
+                            'go btime 0 wtime 0 byoyomi 3000',
+                            'position sfen 4k4/9/9/9/9/9/9/9/4K4 b S 1',
+                            'go mate infinite',
+                            'quit']).__next__)
+
+        line_list = output.getvalue().splitlines()
+        checkmate_line_list = [line for line in line_list if line.startswith('checkmate')]
+        bestmove_line_list = [line for line in line_list if line.startswith('bestmove')]
+        score_line_list = [line for line in line_list if 'score mate 5 ' in line]
+
+        if len(checkmate_line_list) != 2 or len(checkmate_line_list[0].split(' ')) != 6 or checkmate_line_list[1] != 'checkmate nomate':
+            raise ValueError(f"[test mate solver] checkmate lines:{checkmate_line_list}")
+
+        if len(bestmove_line_list) != 1 or len(score_line_list) != 1 or bestmove_line_list[0].split(' ')[1] != score_line_list[0].split(' pv ')[1].split(' ')[0]:
+            raise ValueError(f"[test mate solver] bestmove lines:{bestmove_line_list}  score lines:{score_line_list}")
+
+        # 学習設定の詰将棋の局面の数の上限。 mate_solver の表が無い設定ファイルなら 3000
+        for (toml_text, expected_max_nodes) in [
+                ('learn_rate.numerator = 1\nlearn_rate.denominator = 1\nshort_mate_mode.relay_move_number = 27\n', 3000),
+                ('mate_solver.max_nodes = 0\n', 0)]:
+            with open('test_learn_config.toml', 'w', encoding='utf-8') as f:
+                f.write(toml_text)
+
+            learn_config_document = LearnConfigDocument.load_toml(
+                    base_name='test_learn_config.toml',
+                    engine_version_str='test')
+
+            if learn_config_document.mate_solver_max_nodes != expected_max_nodes:
+                raise ValueError(f"[test mate solver] learn config.  expected:{expected_max_nodes}  actual:{learn_config_document.mate_solver_max_nodes}")
+
+        print(f"[{datetime.datetime.now()}] [test mate solver] ok", flush=True)
+
+    finally:
+        os.chdir(current_directory)
+
+
+def test_edit_log():
+    # ログ・ファイルはカレント・ディレクトリーに作られるので、一時フォルダーへ移動する
+    current_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+
+    try:
+        edit_log_obj = EvaluationEditLog(
+                engine_version_str='test',
+                is_writable=True)
+
+        edit_log_obj.append(kind='pp', turn=cshogi.WHITE, index=9, bit=1)
+        edit_log_obj.append(kind='kk', turn=cshogi.BLACK, index=2, bit=1)
+        edit_log_obj.append(kind='pp', turn=cshogi.WHITE, index=9, bit=0)
+        edit_log_obj.append(kind='pp', turn=cshogi.WHITE, index=15, bit=1)
+
+        # 書きかけのレコード
+        with open(edit_log_obj.file_name_obj.base_name, 'ab') as f:
+            f.write(b'\x00\x01')
+
+        expected = [(3, 1, 9, 1), (0, 0, 2, 1), (3, 1, 9, 0), (3, 1, 15, 1)]
+        actual = edit_log_obj.read_record_list()
+        if expected != actual:
+            raise ValueError(f"[test edit log] read. expected:{expected}  actual:{actual}")
+
+        # 再生。後のレコードで上書きされる
+        for is_writable in [True, False]:
+            mm_table_obj = EvalutionMmTable(
+                    file_name_obj=FileName(
+                            file_stem='test_edit_log_table',
+                            file_extension='.bin'),
+                    table_as_array=bytes(2),
+                    is_file_modified=False)
+
+            number_of_records = EvaluationEditLog(
+                    engine_version_str='test',
+                    is_writable=is_writable).replay(
+                            kind='pp',
+                            turn=cshogi.WHITE,
+                            mm_table_obj=mm_table_obj)
+
+            if number_of_records != 3 or mm_table_obj.table_as_array != bytearray([0b0000_0000, 0b0000_0001]):
+                raise ValueError(f"[test edit log] replay. is_writable:{is_writable}  records:{number_of_records}  table:{mm_table_obj.table_as_array}")
+
+            # 再生するだけの側では、変更として記録しない
+            if mm_table_obj.is_file_modified != is_writable:
+                raise ValueError(f"[test edit log] replay. is_writable:{is_writable}  is_file_modified:{mm_table_obj.is_file_modified}")
+
+        # 書きかけのレコードは、追記の前に切り捨てる
+        edit_log_obj = EvaluationEditLog(
+                engine_version_str='test',
+                is_writable=True)
+        edit_log_obj.append(kind='kp', turn=cshogi.BLACK, index=7, bit=1)
+        actual = edit_log_obj.read_record_list()
+        if expected + [(1, 0, 7, 1)] != actual:
+            raise ValueError(f"[test edit log] append after torn record. actual:{actual}")
+
+        # チェックポイントでログは空になる
+        edit_log_obj.checkpoint()
+        if edit_log_obj.read_record_list() != []:
+            raise ValueError(f"[test edit log] checkpoint. actual:{edit_log_obj.read_record_list()}")
+
+    finally:
+        os.chdir(current_directory)
+
+
 def test_move_rotate():
     # １８０°回転
     srcloc_u = "1g"
@@ -487,6 +1963,60 @@ if __name__ == '__main__':
     elif line == 'lib':
         test_lib()
 
+    elif line == 'mm_table':
+        test_mm_table()
+
+    elif line == 'journal':
+        test_journal()
+
+    elif line == 'table_header':
+        test_table_header()
+
+    elif line == 'table_codec':
+        test_table_codec()
+
+    elif line == 'edit_log':
+        test_edit_log()
+
+    elif line == 'table_reload':
+        test_table_reload()
+
+    elif line == 'shared_table':
+        test_shared_table()
+
+    elif line == 'table_array':
+        test_table_array()
+
+    elif line == 'procedural_table':
+        test_procedural_table()
+
+    elif line == 'move_index':
+        test_move_index()
+
+    elif line == 'move_index_file':
+        test_move_index_file()
+
+    elif line == 'batch':
+        test_batch()
+
+    elif line == 'policy_cache':
+        test_policy_cache()
+
+    elif line == 'reply_set':
+        test_reply_set()
+
+    elif line == 'search':
+        test_search()
+
+    elif line == 'ponder':
+        test_ponder()
+
+    elif line == 'usi_reader':
+        test_usi_reader()
+
+    elif line == 'mate_solver':
+        test_mate_solver()
+
     elif line == 'move_rotate':
         test_move_rotate()
 